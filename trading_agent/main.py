@@ -15,7 +15,18 @@ from hyperliquid.utils import constants
 
 from src.agent import TradingAgent
 from src.tools import HyperliquidTools
+from src.candle_store import CandleStore
+from src.market_snapshot import MarketSnapshot
+from src.live_feed import start_live_feed
+from src.scheduler import create_scheduler
+from src.decision_cache import create_decision_cache
+from src.prompt_builder import create_prompt_builder
+from src.indicators import compute_indicators
+from src.market_risk import create_market_risk_model
 from src.risk_manager import RiskManager
+from src.slippage import create_slippage_model
+from src.asset_index import create_asset_index
+from src.transport import create_transport
 
 # 配置日志
 logging.basicConfig(
@@ -53,7 +64,9 @@ def setup_hyperliquid(config: dict):
     
     # 初始化 Info 和 Exchange
     base_url = hl_config.get("base_url", constants.TESTNET_API_URL)
-    info = Info(base_url, skip_ws=True)
+    # WebSocket 行情模式需要开启 Info 的 WebSocket 连接
+    skip_ws = config.get("agent", {}).get("market_feed", "rest") != "websocket"
+    info = Info(base_url, skip_ws=skip_ws)
     exchange = Exchange(account, base_url, account_address=address)
     
     return address, info, exchange
@@ -95,11 +108,18 @@ def main():
     
     # 2. 初始化组件
     address, info, exchange = setup_hyperliquid(config)
+    # Info / Exchange 共用连接池、按请求权重限流和重试
+    transport = create_transport(config, info, exchange)
     llm_client = setup_llm(config)
     
     # 3. 创建工具和风险管理器
-    tools = HyperliquidTools(info, exchange, address)
-    risk_manager = RiskManager(config["risk"])
+    candle_store = CandleStore(config.get("data", {}).get("candle_db", "data/candles.db"))
+    snapshot = MarketSnapshot(info, ttl=config.get("agent", {}).get("snapshot_ttl", 10))
+    tools = HyperliquidTools(info, exchange, address, candle_store=candle_store, snapshot=snapshot,
+                             slippage_model=create_slippage_model(config),
+                             asset_index=create_asset_index(config, info), transport=transport)
+    live_feed = start_live_feed(config, info, address, snapshot)
+    risk_manager = RiskManager(config["risk"], market_risk=create_market_risk_model(config, candle_store, info))
     
     # 显示资金限制信息
     user_state = info.user_state(address)
@@ -127,7 +147,11 @@ def main():
         risk_manager=risk_manager,
         llm_client=llm_client,
         strategy_prompt=strategy_prompt,
-        dry_run=dry_run
+        dry_run=dry_run,
+        async_pipeline=config.get("agent", {}).get("async_pipeline", False),
+        decision_cache=create_decision_cache(config),
+        prompt_builder=create_prompt_builder(config),
+        stream_decisions=config.get("agent", {}).get("stream_decisions", False)
     )
     
     # 5. 运行
@@ -137,22 +161,43 @@ def main():
         logger.info("✅ 完成")
         
     else:  # loop mode
-        logger.info(f"🔄 持续运行模式，检查间隔: {args.interval} 秒")
+        def rsi_indicators(coin):
+            candles = tools.get_candles(coin, "1h", 24) or []
+            return compute_indicators([{"close": float(c["c"])} for c in candles])
+        
+        scheduler = create_scheduler(config, snapshot, address, args.interval, indicator_fn=rsi_indicators)
+        if scheduler:
+            logger.info(f"🔄 事件驱动模式，每 {scheduler.poll_interval:.0f} 秒检查触发条件")
+        else:
+            logger.info(f"🔄 持续运行模式，检查间隔: {args.interval} 秒")
         logger.info("按 Ctrl+C 可随时停止\n")
         
         iteration = 0
+        
+        def run_cycle(reasons=None):
+            nonlocal iteration
+            iteration += 1
+            logger.info(f"【第 {iteration} 轮检查】")
+            agent.run_once()
+        
         try:
-            while True:
-                iteration += 1
-                logger.info(f"【第 {iteration} 轮检查】")
-                result = agent.run_once()
-                logger.info(f"⏱️  等待 {args.interval} 秒后进行下一轮检查...\n")
-                time.sleep(args.interval)
+            if scheduler:
+                scheduler.run_forever(run_cycle)
+            else:
+                while True:
+                    run_cycle()
+                    logger.info(f"⏱️  等待 {args.interval} 秒后进行下一轮检查...\n")
+                    time.sleep(args.interval)
         except KeyboardInterrupt:
             logger.info("\n" + "=" * 60)
             logger.info(f"👋 用户手动停止 (共运行 {iteration} 轮)")
+            if scheduler:
+                scheduler.log_stats()
             logger.info("=" * 60)
     
+    if live_feed:
+        live_feed.stop()
+    
     logger.info("=" * 60)
     logger.info("🏁 Agent 已停止")
     logger.info("=" * 60)
@@ -7,6 +7,7 @@ import logging
 import argparse
 import time
 from pathlib import Path
+from typing import List, Optional
 import eth_account
 from openai import OpenAI
 
@@ -17,26 +18,50 @@ from hyperliquid.utils import constants
 from langgraph.graph import StateGraph, END
 from src.state import TradingState, create_initial_state
 from src.advanced_tools import AdvancedTradingTools
+from src.candle_store import CandleStore
+from src.fill_ledger import FillLedger
+from src.market_snapshot import MarketSnapshot
+from src.live_feed import start_live_feed
+from src.scheduler import create_scheduler
+from src.decision_cache import DecisionCache, create_decision_cache
+from src.prompt_builder import PromptBuilder, create_prompt_builder
+from src.batch_execution import prepare_trade
+from src.async_pipeline import (
+    AsyncGraphRunner,
+    NodeTimer,
+    add_parallel_fetch,
+    async_fetch_advanced_market_node,
+    async_get_account_node
+)
 from src.advanced_nodes import (
     fetch_advanced_market_data_node,
     enhanced_llm_analysis_node,
     execute_advanced_trade_node
 )
 from src.nodes import get_account_status_node, risk_check_node
+from src.market_risk import create_market_risk_model
 from src.risk_manager import RiskManager
+from src.slippage import create_slippage_model
+from src.asset_index import create_asset_index
+from src.market_scanner import MarketScanner, create_market_scanner
+from src.timeframes import create_multi_timeframe
+from src.transport import create_transport, log_transport_stats
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/Users/gaoshuo/Desktop/Fintech_Project/Auto Investment Agent/trading_agent/logs/advanced_trading.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
+def setup_logging():
+    """配置日志（只在命令行入口调用，导入模块时不创建日志文件）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('/Users/gaoshuo/Desktop/Fintech_Project/Auto Investment Agent/trading_agent/logs/advanced_trading.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
 def load_config(config_path: str = "config/config.testnet.json") -> dict:
     """加载配置文件"""
     with open(config_path, 'r') as f:
@@ -59,7 +84,9 @@ def setup_hyperliquid(config: dict):
     logger.info(f"📍 账户地址: {address}")
     
     base_url = hl_config.get("base_url", constants.TESTNET_API_URL)
-    info = Info(base_url, skip_ws=True)
+    # WebSocket 行情模式需要开启 Info 的 WebSocket 连接
+    skip_ws = config.get("agent", {}).get("market_feed", "rest") != "websocket"
+    info = Info(base_url, skip_ws=skip_ws)
     exchange = Exchange(account, base_url, account_address=address)
     
     return address, info, exchange
@@ -87,36 +114,74 @@ class AdvancedTradingAgent:
         risk_manager: RiskManager,
         llm_client,
         strategy_prompt: str,
-        dry_run: bool = True
+        dry_run: bool = True,
+        coins: Optional[List[str]] = None,
+        fetch_workers: int = 8,
+        fetch_timeout: float = 10.0,
+        async_pipeline: bool = False,
+        decision_cache: Optional[DecisionCache] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        stream_decisions: bool = False,
+        scanner: Optional[MarketScanner] = None
     ):
         self.advanced_tools = advanced_tools
         self.risk_manager = risk_manager
         self.llm_client = llm_client
         self.strategy_prompt = strategy_prompt
         self.dry_run = dry_run
+        self.coins = coins
+        self.scanner = scanner
+        self.fetch_workers = fetch_workers
+        self.fetch_timeout = fetch_timeout
+        self.async_pipeline = async_pipeline
+        self.async_runner = AsyncGraphRunner(advanced_tools, fetch_timeout) if async_pipeline else None
+        self.decision_cache = decision_cache
+        self.prompt_builder = prompt_builder
+        self.trade_preparer = (
+            lambda trade, state: prepare_trade(trade, advanced_tools, state, risk_manager)
+        ) if stream_decisions else None
+        self.timer = NodeTimer()
         self.graph = self._build_graph()
     
     def _build_graph(self) -> StateGraph:
         """构建 LangGraph 状态机"""
         workflow = StateGraph(TradingState)
+        timed = self.timer.wrap
         
         # 添加节点
-        workflow.add_node("fetch_market", 
-                         lambda s: fetch_advanced_market_data_node(s, self.advanced_tools))
-        workflow.add_node("get_account", 
-                         lambda s: get_account_status_node(s, self.advanced_tools))
         workflow.add_node("llm_analysis", 
-                         lambda s: enhanced_llm_analysis_node(s, self.llm_client, 
-                                                             self.strategy_prompt, self.advanced_tools))
+                         timed("llm_analysis", lambda s: enhanced_llm_analysis_node(
+                             s, self.llm_client, self.strategy_prompt, self.advanced_tools,
+                             self.decision_cache, self.prompt_builder, self.trade_preparer)))
         workflow.add_node("risk_check", 
-                         lambda s: risk_check_node(s, self.risk_manager))
+                         timed("risk_check", lambda s: risk_check_node(s, self.risk_manager)))
         workflow.add_node("execute", 
-                         lambda s: execute_advanced_trade_node(s, self.advanced_tools, self.dry_run))
+                         timed("execute", lambda s: execute_advanced_trade_node(
+                             s, self.advanced_tools, self.dry_run)))
         
         # 定义流程
-        workflow.set_entry_point("fetch_market")
-        workflow.add_edge("fetch_market", "get_account")
-        workflow.add_edge("get_account", "llm_analysis")
+        if self.async_pipeline:
+            # 行情和账户并行获取，在 llm_analysis 汇合
+            async def fetch_market(s):
+                return await async_fetch_advanced_market_node(
+                    s, self.advanced_tools, self.async_runner.client, self.coins, self.fetch_timeout,
+                    self.scanner)
+            
+            async def get_account(s):
+                return await async_get_account_node(s, self.advanced_tools, self.async_runner.client)
+            
+            add_parallel_fetch(workflow, timed("fetch_market", fetch_market),
+                               timed("get_account", get_account), "llm_analysis")
+        else:
+            workflow.add_node("fetch_market", 
+                             timed("fetch_market", lambda s: fetch_advanced_market_data_node(
+                                 s, self.advanced_tools, self.coins,
+                                 self.fetch_workers, self.fetch_timeout, self.scanner)))
+            workflow.add_node("get_account", 
+                             timed("get_account", lambda s: get_account_status_node(s, self.advanced_tools)))
+            workflow.set_entry_point("fetch_market")
+            workflow.add_edge("fetch_market", "get_account")
+            workflow.add_edge("get_account", "llm_analysis")
         workflow.add_edge("llm_analysis", "risk_check")
         
         # 条件分支（强制交易模式：只要有决策就执行，不管风险检查）
@@ -138,11 +203,19 @@ class AdvancedTradingAgent:
         logger.info("🚀 开始新的高级交易周期")
         logger.info("=" * 60)
         
+        self.advanced_tools.snapshot.new_cycle()
+        self.timer.reset()
+        started = time.perf_counter()
         initial_state = create_initial_state()
-        result = self.graph.invoke(initial_state)
+        if self.async_runner:
+            result = self.async_runner.run(self.graph, initial_state)
+        else:
+            result = self.graph.invoke(initial_state)
         
         self._log_result(result)
+        self.timer.log_summary(time.perf_counter() - started)
         return result
+
     
     def _log_result(self, state: TradingState):
         """记录结果"""
@@ -198,6 +271,10 @@ class AdvancedTradingAgent:
             else:
                 logger.info(f"\n❌ 执行失败: {result.get('message', result.get('error'))}")
         
+        snapshot_stats = self.advanced_tools.snapshot.stats()
+        logger.info(f"📦 行情快照缓存: 命中 {snapshot_stats['hits']}, 未命中 {snapshot_stats['misses']}")
+        log_transport_stats(self.advanced_tools.transport)
+        
         logger.info("=" * 60 + "\n")
 
 
@@ -213,6 +290,7 @@ def main():
     
     # 创建日志目录
     Path("logs").mkdir(exist_ok=True)
+    setup_logging()
     
     logger.info("=" * 70)
     logger.info("🚀 高频交易 Agent 启动 - 激进模式")
@@ -228,16 +306,35 @@ def main():
     # 2. 初始化组件
     print("\n🔧 初始化组件...")
     address, info, exchange = setup_hyperliquid(config)
+    # Info / Exchange 共用连接池、按请求权重限流和重试
+    transport = create_transport(config, info, exchange)
     print(f"   ✅ Hyperliquid 初始化完成 (地址: {address[:10]}...)")
     
     llm_client = setup_llm(config)
     print(f"   ✅ LLM 客户端初始化完成")
     
     # 3. 创建高级工具
-    advanced_tools = AdvancedTradingTools(info, exchange, address)
+    candle_store = CandleStore(config.get("data", {}).get("candle_db", "data/candles.db"))
+    fill_db = config.get("data", {}).get("fill_db", "data/fills.db")
+    advanced_tools = AdvancedTradingTools(
+        info, exchange, address,
+        streaming_indicators=config.get("agent", {}).get("streaming_indicators", True),
+        candle_store=candle_store,
+        snapshot=MarketSnapshot(info, ttl=config.get("agent", {}).get("snapshot_ttl", 10)),
+        scoring=config.get("agent", {}).get("scoring"),
+        slippage_model=create_slippage_model(config),
+        fill_ledger=FillLedger(fill_db) if fill_db else None,
+        asset_index=create_asset_index(config, info),
+        timeframes=create_multi_timeframe(config),
+        transport=transport
+    )
     print(f"   ✅ 高级交易工具创建完成")
     
-    risk_manager = RiskManager(config["risk"])
+    live_feed = start_live_feed(config, info, address, advanced_tools.snapshot)
+    if live_feed:
+        print(f"   ✅ WebSocket 实时行情已启动")
+    
+    risk_manager = RiskManager(config["risk"], market_risk=create_market_risk_model(config, candle_store, info))
     print(f"   ✅ 风险管理器创建完成")
     
     # 显示资金和交易信息
@@ -267,7 +364,15 @@ def main():
         risk_manager=risk_manager,
         llm_client=llm_client,
         strategy_prompt=strategy_prompt,
-        dry_run=dry_run
+        dry_run=dry_run,
+        coins=config.get("agent", {}).get("coins"),
+        fetch_workers=config.get("agent", {}).get("fetch_workers", 8),
+        fetch_timeout=config.get("agent", {}).get("fetch_timeout", 10.0),
+        async_pipeline=config.get("agent", {}).get("async_pipeline", False),
+        decision_cache=create_decision_cache(config),
+        prompt_builder=create_prompt_builder(config),
+        stream_decisions=config.get("agent", {}).get("stream_decisions", False),
+        scanner=create_market_scanner(config)
     )
     
     # 5. 运行
@@ -277,22 +382,43 @@ def main():
         logger.info("✅ 完成")
         
     else:  # loop mode
-        logger.info(f"🔄 持续运行模式，检查间隔: {args.interval} 秒")
+        scheduler = create_scheduler(
+            config, advanced_tools.snapshot, address, args.interval,
+            indicator_fn=lambda coin: advanced_tools.calculate_technical_indicators(
+                advanced_tools.get_candles(coin, "1h", 24))
+        )
+        if scheduler:
+            logger.info(f"🔄 事件驱动模式，每 {scheduler.poll_interval:.0f} 秒检查触发条件")
+        else:
+            logger.info(f"🔄 持续运行模式，检查间隔: {args.interval} 秒")
         logger.info("按 Ctrl+C 可随时停止\n")
         
         iteration = 0
+        
+        def run_cycle(reasons=None):
+            nonlocal iteration
+            iteration += 1
+            logger.info(f"【第 {iteration} 轮高级分析】")
+            agent.run_once()
+        
         try:
-            while True:
-                iteration += 1
-                logger.info(f"【第 {iteration} 轮高级分析】")
-                result = agent.run_once()
-                logger.info(f"⏱️  等待 {args.interval} 秒后进行下一轮检查...\n")
-                time.sleep(args.interval)
+            if scheduler:
+                scheduler.run_forever(run_cycle)
+            else:
+                while True:
+                    run_cycle()
+                    logger.info(f"⏱️  等待 {args.interval} 秒后进行下一轮检查...\n")
+                    time.sleep(args.interval)
         except KeyboardInterrupt:
             logger.info("\n" + "=" * 70)
             logger.info(f"👋 用户手动停止 (共运行 {iteration} 轮)")
+            if scheduler:
+                scheduler.log_stats()
             logger.info("=" * 70)
     
+    if live_feed:
+        live_feed.stop()
+    
     logger.info("=" * 70)
     logger.info("🏁 高级 Agent 已停止")
     logger.info("=" * 70)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+回测入口 - 用本地K线缓存回放历史行情
+
+  规则快速回测（analyze_market_condition 评分，NumPy 向量化）:
+    python main_backtest.py --mode rule --days 365
+
+  Agent 回测（逐根K线调用 LLM，模拟交易所成交）:
+    python main_backtest.py --mode agent --agent portfolio --days 7 --every 4
+
+  评分参数寻优（网格/随机搜索，多进程）:
+    python main_backtest.py --mode sweep --search random --samples 500
+"""
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from openai import OpenAI
+
+from src.backtest import Backtester, load_history, run_rule_backtest, TAKER_FEE
+from src.candle_store import CandleStore
+from src.param_sweep import RANK_METRICS, grid_search, print_results, random_search, run_sweep
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def load_config(config_path: str) -> dict:
+    """加载配置文件"""
+    with open(config_path, 'r') as f:
+        return json.load(f)
+
+
+def load_strategy_prompt(prompt_path: str) -> str:
+    """加载策略提示"""
+    with open(prompt_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def setup_llm(config: dict):
+    """初始化 LLM 客户端"""
+    llm_config = config["llm"]
+    return OpenAI(
+        api_key=llm_config["api_key"],
+        base_url=llm_config.get("base_url", "https://api.openai.com/v1")
+    )
+
+
+def backtest_config(config: dict) -> dict:
+    """
+    回测用配置：关闭会绕过模拟接口的功能（K线缓存、WebSocket、异步流水线），
+    以及模拟接口不支持的功能（多周期只有回测数据的周期、全市场扫描没有 metaAndAssetCtxs），
+    成交账本只保存在内存
+    """
+    config = json.loads(json.dumps(config))
+    agent_config = config.setdefault("agent", {})
+    agent_config.update(market_feed="rest", async_pipeline=False, streaming_indicators=False)
+    for feature in ("timeframes", "scanner"):
+        agent_config[feature] = {**agent_config.get(feature, {}), "enabled": False}
+    config.setdefault("data", {})["candle_db"] = None
+    config["data"]["fill_db"] = ":memory:"
+    return config
+
+
+def create_agent_step(args, config: dict, backtester: Backtester):
+    """创建连接到模拟交易所的 Agent，返回每根K线调用的决策函数"""
+    strategy_prompt = load_strategy_prompt(args.strategy)
+    llm_client = setup_llm(config)
+
+    if args.agent == "portfolio":
+        from main_portfolio import PortfolioTradingAgent
+        agent = PortfolioTradingAgent(
+            backtest_config(config), strategy_prompt, dry_run=False,
+            info=backtester.info, exchange=backtester.exchange,
+            address=backtester.address, llm_client=llm_client
+        )
+        return agent.run_once
+
+    from src.agent import TradingAgent
+    from src.risk_manager import RiskManager
+    from src.tools import HyperliquidTools
+    tools = HyperliquidTools(backtester.info, backtester.exchange, backtester.address)
+    agent = TradingAgent(tools, RiskManager(config["risk"]), llm_client, strategy_prompt, dry_run=False)
+    return agent.run_once
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史K线回测")
+    parser.add_argument('--config', default='config/config.testnet.json', help='配置文件路径')
+    parser.add_argument('--strategy', default='config/portfolio_strategy_prompt.txt', help='策略提示文件路径（agent 模式）')
+    parser.add_argument('--mode', choices=['rule', 'agent', 'sweep'], default='rule',
+                        help='rule=规则快速回测, agent=逐根K线驱动 Agent, sweep=评分参数寻优')
+    parser.add_argument('--agent', choices=['simple', 'portfolio'], default='portfolio', help='agent 模式使用的 Agent')
+    parser.add_argument('--coins', default=None, help='币种列表，逗号分隔（默认缓存中的全部币种）')
+    parser.add_argument('--interval', default='1h', help='K线周期')
+    parser.add_argument('--days', type=int, default=365, help='回测天数')
+    parser.add_argument('--capital', type=float, default=1000.0, help='初始资金')
+    parser.add_argument('--notional', type=float, default=100.0, help='规则模式每个币种的开仓金额')
+    parser.add_argument('--every', type=int, default=1, help='agent 模式每隔多少根K线决策一次')
+    parser.add_argument('--fee', type=float, default=TAKER_FEE, help='手续费率')
+    parser.add_argument('--slippage-bps', type=float, default=2.0, help='滑点（基点）')
+    parser.add_argument('--search', choices=['grid', 'random'], default='grid', help='sweep 模式的搜索方式')
+    parser.add_argument('--samples', type=int, default=200, help='随机搜索的参数组合数量')
+    parser.add_argument('--workers', type=int, default=None, help='sweep 模式的进程数（默认 CPU 核数）')
+    parser.add_argument('--rank-by', choices=list(RANK_METRICS), default='sharpe', help='sweep 结果排序指标')
+    parser.add_argument('--top', type=int, default=10, help='显示前几名')
+    parser.add_argument('--output', default=None, help='结果 JSON 输出路径')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    store = CandleStore(config.get("data", {}).get("candle_db", "data/candles.db"))
+    coins = args.coins.split(",") if args.coins else None
+    start_time = int((datetime.now() - timedelta(days=args.days)).timestamp() * 1000)
+    market = load_history(store, coins, args.interval, start_time)
+    if not market.coins:
+        logger.error("❌ 本地缓存中没有K线数据，请先运行 Agent 积累K线缓存")
+        return
+
+    started = time.perf_counter()
+    if args.mode == "sweep":
+        param_sets = grid_search() if args.search == "grid" else random_search(samples=args.samples)
+        rows = run_sweep(
+            market, param_sets, workers=args.workers, rank_by=args.rank_by,
+            notional=args.notional, initial_capital=args.capital,
+            fee_rate=args.fee, slippage_bps=args.slippage_bps
+        )
+        logger.info(f"⏱️  {len(param_sets)} 组参数耗时 {time.perf_counter() - started:.1f}s")
+        print_results(rows, args.top, args.rank_by)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            logger.info(f"💾 寻优结果已保存: {args.output}")
+        store.close()
+        return
+
+    if args.mode == "rule":
+        result = run_rule_backtest(
+            market, notional=args.notional, initial_capital=args.capital,
+            fee_rate=args.fee, slippage_bps=args.slippage_bps,
+            scoring=config.get("agent", {}).get("scoring")
+        )
+    else:
+        backtester = Backtester(market, args.capital, args.fee, args.slippage_bps)
+        step = create_agent_step(args, config, backtester)
+        result = backtester.run(step, every=args.every)
+    elapsed = time.perf_counter() - started
+
+    result.print_summary(f"回测结果 ({args.mode}, {len(market.coins)} 个币种 × {market.bars} 根K线, 耗时 {elapsed:.1f}s)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result.to_dict(), f, ensure_ascii=False, indent=2)
+        logger.info(f"💾 回测结果已保存: {args.output}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+交易周期基准测试入口 - 模拟交易所 + 模拟 LLM，不需要网络和密钥
+
+  python main_benchmark.py --cycles 50 --output reports/benchmark.json
+  python main_benchmark.py --agents portfolio --api-latency-ms 80 --llm-latency-ms 1500
+  python main_benchmark.py --baseline reports/benchmark.json   # 有回退时退出码为 1
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from src.benchmark import AGENTS, compare_reports, print_report, run_benchmarks
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="交易周期基准测试")
+    parser.add_argument('--agents', default=",".join(AGENTS), help=f'Agent 列表，逗号分隔（{",".join(AGENTS)}）')
+    parser.add_argument('--cycles', type=int, default=30, help='每个 Agent 计时的周期数')
+    parser.add_argument('--warmup', type=int, default=2, help='预热周期数')
+    parser.add_argument('--memory-cycles', type=int, default=5, help='统计内存的周期数（0=不统计）')
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help='模拟交易所每个请求的延迟')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='模拟 LLM 每次调用的延迟')
+    parser.add_argument('--config', default=None, help='配置文件（只使用 risk / agent 部分）')
+    parser.add_argument('--async-pipeline', action='store_true', help='使用异步流水线')
+    parser.add_argument('--output', default=None, help='报告 JSON 输出路径')
+    parser.add_argument('--baseline', default=None, help='基线报告路径，与之对比检测回退')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='回退判定的相对增长阈值')
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, 'r') as f:
+            config = json.load(f)
+    if args.async_pipeline:
+        config.setdefault("agent", {})["async_pipeline"] = True
+
+    report = run_benchmarks(
+        [a for a in args.agents.split(",") if a],
+        cycles=args.cycles, warmup=args.warmup, memory_cycles=args.memory_cycles,
+        api_latency_ms=args.api_latency_ms, llm_latency_ms=args.llm_latency_ms, config=config
+    )
+    print_report(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 报告已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        if regressions:
+            print(f"❌ 发现 {len(regressions)} 项性能回退:")
+            for item in regressions:
+                print(f"   - {item}")
+            sys.exit(1)
+        print("✅ 与基线相比没有性能回退")
+
+
+if __name__ == "__main__":
+    main()
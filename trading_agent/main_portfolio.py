@@ -8,6 +8,7 @@ import logging
 import argparse
 import time
 from datetime import datetime
+from pathlib import Path
 from typing import Dict
 import eth_account
 from openai import OpenAI
@@ -19,23 +20,51 @@ from hyperliquid.utils import constants
 
 from src.state import TradingState
 from src.advanced_tools import AdvancedTradingTools
+from src.candle_store import CandleStore
+from src.fill_ledger import FillLedger
+from src.market_snapshot import MarketSnapshot
+from src.live_feed import start_live_feed
+from src.scheduler import create_scheduler
+from src.async_pipeline import (
+    AsyncGraphRunner,
+    NodeTimer,
+    add_parallel_fetch,
+    async_fetch_advanced_market_node,
+    async_get_account_node
+)
+from src.market_risk import create_market_risk_model
 from src.risk_manager import RiskManager
+from src.slippage import create_slippage_model
+from src.asset_index import create_asset_index
+from src.market_scanner import create_market_scanner
+from src.timeframes import create_multi_timeframe
+from src.transport import create_transport, log_transport_stats
 from src.advanced_nodes import fetch_advanced_market_data_node
 from src.nodes import get_account_status_node
-from src.portfolio_nodes import enhanced_portfolio_analysis_node, execute_portfolio_trades_node
-
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/portfolio_trading.log'),
-        logging.StreamHandler()
-    ]
+from src.decision_cache import create_decision_cache
+from src.prompt_builder import create_prompt_builder
+from src.batch_execution import prepare_trade
+from src.portfolio_nodes import (
+    enhanced_portfolio_analysis_node,
+    execute_portfolio_trades_node,
+    portfolio_risk_node
 )
+
 logger = logging.getLogger(__name__)
 
 
+def setup_logging():
+    """配置日志（只在命令行入口调用，导入模块时不创建日志文件）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('logs/portfolio_trading.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
 def load_config(config_path: str = "config/config.testnet.json") -> dict:
     """加载配置文件"""
     with open(config_path, 'r') as f:
@@ -58,7 +87,9 @@ def setup_hyperliquid(config: dict):
     logger.info(f"📍 账户地址: {address}")
     
     base_url = hl_config.get("base_url", constants.TESTNET_API_URL)
-    info = Info(base_url, skip_ws=True)
+    # WebSocket 行情模式需要开启 Info 的 WebSocket 连接
+    skip_ws = config.get("agent", {}).get("market_feed", "rest") != "websocket"
+    info = Info(base_url, skip_ws=skip_ws)
     exchange = Exchange(account, base_url, account_address=address)
     
     return address, info, exchange
@@ -84,17 +115,59 @@ class PortfolioTradingAgent:
         self,
         config: Dict,
         strategy_prompt: str,
-        dry_run: bool = True
+        dry_run: bool = True,
+        info=None,
+        exchange=None,
+        address: str = None,
+        llm_client=None
     ):
+        """
+        Args:
+            info / exchange / address: 外部提供的交易所接口（如回测的模拟交易所），不传则按配置连接
+            llm_client: 外部提供的 LLM 客户端，不传则按配置创建
+        """
         self.config = config
         self.strategy_prompt = strategy_prompt
         self.dry_run = dry_run
         
         # 初始化组件
-        self.address, self.info, self.exchange = setup_hyperliquid(config)
-        self.llm_client = setup_llm(config)
-        self.advanced_tools = AdvancedTradingTools(self.info, self.exchange, self.address)
-        self.risk_manager = RiskManager(config["risk"])
+        if info is None:
+            self.address, self.info, self.exchange = setup_hyperliquid(config)
+        else:
+            self.address, self.info, self.exchange = address, info, exchange
+        # Info / Exchange 共用连接池、按请求权重限流和重试（回测的模拟客户端不接入）
+        transport = create_transport(config, self.info, self.exchange)
+        self.llm_client = llm_client or setup_llm(config)
+        candle_db = config.get("data", {}).get("candle_db", "data/candles.db")
+        self.candle_store = CandleStore(candle_db) if candle_db else None
+        fill_db = config.get("data", {}).get("fill_db", "data/fills.db")
+        self.advanced_tools = AdvancedTradingTools(
+            self.info, self.exchange, self.address,
+            streaming_indicators=config.get("agent", {}).get("streaming_indicators", True),
+            candle_store=self.candle_store,
+            snapshot=MarketSnapshot(self.info, ttl=config.get("agent", {}).get("snapshot_ttl", 10)),
+            scoring=config.get("agent", {}).get("scoring"),
+            slippage_model=create_slippage_model(config),
+            fill_ledger=FillLedger(fill_db) if fill_db else None,
+            asset_index=create_asset_index(config, self.info),
+            timeframes=create_multi_timeframe(config),
+            transport=transport
+        )
+        self.risk_manager = RiskManager(
+            config["risk"], market_risk=create_market_risk_model(config, self.candle_store, self.info)
+        )
+        self.live_feed = start_live_feed(config, self.info, self.address, self.advanced_tools.snapshot)
+        self.async_pipeline = config.get("agent", {}).get("async_pipeline", False)
+        self.async_runner = AsyncGraphRunner(
+            self.advanced_tools, config.get("agent", {}).get("fetch_timeout", 10.0)
+        ) if self.async_pipeline else None
+        self.decision_cache = create_decision_cache(config)
+        self.prompt_builder = create_prompt_builder(config)
+        self.scanner = create_market_scanner(config)
+        self.trade_preparer = (
+            lambda trade, state: prepare_trade(trade, self.advanced_tools, state, self.risk_manager)
+        ) if config.get("agent", {}).get("stream_decisions", False) else None
+        self.timer = NodeTimer()
         
         # 构建工作流
         self.graph = self.build_graph()
@@ -102,25 +175,49 @@ class PortfolioTradingAgent:
     def build_graph(self):
         """构建 LangGraph 工作流"""
         workflow = StateGraph(TradingState)
+        timed = self.timer.wrap
         
         # 定义节点
-        workflow.add_node("fetch_market",
-                         lambda s: fetch_advanced_market_data_node(s, self.advanced_tools))
-        workflow.add_node("get_account",
-                         lambda s: get_account_status_node(s, self.advanced_tools))
+        agent_config = self.config.get("agent", {})
         workflow.add_node("portfolio_analysis",
-                         lambda s: enhanced_portfolio_analysis_node(
-                             s, self.llm_client, self.strategy_prompt, self.advanced_tools))
+                         timed("portfolio_analysis", lambda s: enhanced_portfolio_analysis_node(
+                             s, self.llm_client, self.strategy_prompt, self.advanced_tools,
+                             self.decision_cache, self.prompt_builder, self.trade_preparer)))
+        workflow.add_node("risk_check",
+                         timed("risk_check", lambda s: portfolio_risk_node(s, self.risk_manager)))
         workflow.add_node("execute_portfolio",
-                         lambda s: execute_portfolio_trades_node(
-                             s, self.advanced_tools, self.dry_run))
+                         timed("execute_portfolio", lambda s: execute_portfolio_trades_node(
+                             s, self.advanced_tools, self.dry_run,
+                             agent_config.get("batch_orders", True))))
         
         # 定义流程
-        workflow.set_entry_point("fetch_market")
-        workflow.add_edge("fetch_market", "get_account")
-        workflow.add_edge("get_account", "portfolio_analysis")
+        if self.async_pipeline:
+            # 行情和账户并行获取，在 portfolio_analysis 汇合
+            async def fetch_market(s):
+                return await async_fetch_advanced_market_node(
+                    s, self.advanced_tools, self.async_runner.client,
+                    agent_config.get("coins"), agent_config.get("fetch_timeout", 10.0), self.scanner)
+            
+            async def get_account(s):
+                return await async_get_account_node(s, self.advanced_tools, self.async_runner.client)
+            
+            add_parallel_fetch(workflow, timed("fetch_market", fetch_market),
+                               timed("get_account", get_account), "portfolio_analysis")
+        else:
+            workflow.add_node("fetch_market",
+                             timed("fetch_market", lambda s: fetch_advanced_market_data_node(
+                                 s, self.advanced_tools,
+                                 agent_config.get("coins"),
+                                 agent_config.get("fetch_workers", 8),
+                                 agent_config.get("fetch_timeout", 10.0),
+                                 self.scanner)))
+            workflow.add_node("get_account",
+                             timed("get_account", lambda s: get_account_status_node(s, self.advanced_tools)))
+            workflow.set_entry_point("fetch_market")
+            workflow.add_edge("fetch_market", "get_account")
+            workflow.add_edge("get_account", "portfolio_analysis")
         
-        # 条件分支：如果有交易决策就执行
+        # 条件分支：组合风控后仍有交易就执行
         def should_execute(s):
             trades = s.get("portfolio_trades", [])
             logger.info(f"🔍 条件判断: portfolio_trades 有 {len(trades)} 个交易")
@@ -131,8 +228,9 @@ class PortfolioTradingAgent:
                 logger.info(f"   → 跳过执行")
                 return "end"
         
+        workflow.add_edge("portfolio_analysis", "risk_check")
         workflow.add_conditional_edges(
-            "portfolio_analysis",
+            "risk_check",
             should_execute,
             {
                 "execute": "execute_portfolio",
@@ -149,6 +247,8 @@ class PortfolioTradingAgent:
             "messages": [],
             "current_prices": {},
             "market_data": {},
+            "market_analysis_data": {},
+            "market_scan": {},
             "account_value": 0,
             "available_balance": 0,
             "positions": [],
@@ -158,9 +258,11 @@ class PortfolioTradingAgent:
             "target_size": 0.0,
             "confidence": 0.0,
             "reasoning": "",
+            "prompt_tokens": {},
             "risk_assessment": {},
             "risk_passed": False,
             "risk_message": "",
+            "prepared_trades": [],
             "execution_result": {},
             "success": False,
             "portfolio_trades": [],
@@ -170,57 +272,94 @@ class PortfolioTradingAgent:
             "iteration": 0
         }
         
-        result = self.graph.invoke(initial_state)
+        self.advanced_tools.snapshot.new_cycle()
+        self.timer.reset()
+        started = time.perf_counter()
+        if self.async_runner:
+            result = self.async_runner.run(self.graph, initial_state)
+        else:
+            result = self.graph.invoke(initial_state)
+        self.timer.log_summary(time.perf_counter() - started)
         return result
+
+    
+    def stop(self):
+        """释放资源（断开 WebSocket 行情）"""
+        if self.live_feed:
+            self.live_feed.stop()
+            self.live_feed = None
+        if self.async_runner:
+            self.async_runner.close()
+            self.async_runner = None
+    
+    def _run_cycle(self, round_num: int):
+        """运行一轮并打印总结"""
+        logger.info(f"【第 {round_num} 轮组合分析】")
+        logger.info("=" * 60)
+        logger.info("🚀 开始新的组合管理周期")
+        logger.info("=" * 60)
+        
+        result = self.run_once()
+        
+        # 打印总结
+        logger.info("")
+        logger.info("=" * 60)
+        logger.info("📋 组合管理周期总结")
+        logger.info("=" * 60)
+        logger.info(f"💰 账户总价值: ${result['account_value']:.2f}")
+        logger.info(f"📊 当前持仓: {len(result['positions'])} 个")
+        
+        snapshot_stats = self.advanced_tools.snapshot.stats()
+        logger.info(f"📦 行情快照缓存: 命中 {snapshot_stats['hits']}, 未命中 {snapshot_stats['misses']}")
+        log_transport_stats(self.advanced_tools.transport)
+        
+        if result.get('portfolio_analysis'):
+            logger.info(f"\n📝 组合分析:\n{result['portfolio_analysis']}")
+        
+        trades = result.get('portfolio_trades', [])
+        if trades:
+            logger.info(f"\n📋 执行了 {len(trades)} 个交易决策")
+            
+            execution_results = result.get('execution_results', [])
+            success_count = sum(1 for r in execution_results if r["result"].get("success"))
+            logger.info(f"✅ 成功: {success_count}/{len(trades)}")
+            logger.info(f"❌ 失败: {len(trades) - success_count}/{len(trades)}")
+        
+        logger.info("=" * 60)
+        logger.info("")
     
     def run_loop(self, interval: int = 60):
-        """持续运行"""
+        """持续运行（固定间隔，或按配置使用事件驱动调度）"""
         round_num = 0
+        scheduler = create_scheduler(
+            self.config, self.advanced_tools.snapshot, self.address, interval,
+            indicator_fn=lambda coin: self.advanced_tools.calculate_technical_indicators(
+                self.advanced_tools.get_candles(coin, "1h", 24))
+        )
+        
+        def run_cycle(reasons=None):
+            nonlocal round_num
+            round_num += 1
+            self._run_cycle(round_num)
         
         try:
-            while True:
-                round_num += 1
-                logger.info(f"【第 {round_num} 轮组合分析】")
-                logger.info("=" * 60)
-                logger.info("🚀 开始新的组合管理周期")
-                logger.info("=" * 60)
-                
-                result = self.run_once()
-                
-                # 打印总结
-                logger.info("")
-                logger.info("=" * 60)
-                logger.info("📋 组合管理周期总结")
-                logger.info("=" * 60)
-                logger.info(f"💰 账户总价值: ${result['account_value']:.2f}")
-                logger.info(f"📊 当前持仓: {len(result['positions'])} 个")
-                
-                if result.get('portfolio_analysis'):
-                    logger.info(f"\n📝 组合分析:\n{result['portfolio_analysis']}")
-                
-                trades = result.get('portfolio_trades', [])
-                if trades:
-                    logger.info(f"\n📋 执行了 {len(trades)} 个交易决策")
-                    
-                    execution_results = result.get('execution_results', [])
-                    success_count = sum(1 for r in execution_results if r["result"].get("success"))
-                    logger.info(f"✅ 成功: {success_count}/{len(trades)}")
-                    logger.info(f"❌ 失败: {len(trades) - success_count}/{len(trades)}")
-                
-                logger.info("=" * 60)
-                logger.info("")
-                logger.info(f"⏱️  等待 {interval} 秒后进行下一轮检查...")
-                logger.info("")
-                
-                time.sleep(interval)
+            if scheduler:
+                scheduler.run_forever(run_cycle)
+            else:
+                while True:
+                    run_cycle()
+                    logger.info(f"⏱️  等待 {interval} 秒后进行下一轮检查...")
+                    logger.info("")
+                    time.sleep(interval)
                 
         except KeyboardInterrupt:
             logger.info("")
             logger.info("=" * 60)
             logger.info("⚠️  接收到中断信号，正在安全退出...")
+            if scheduler:
+                scheduler.log_stats()
             logger.info("=" * 60)
 
-
 def main():
     parser = argparse.ArgumentParser(description="多资产组合交易 Agent")
     parser.add_argument(
@@ -247,6 +386,10 @@ def main():
     
     args = parser.parse_args()
     
+    # 创建日志目录
+    Path("logs").mkdir(exist_ok=True)
+    setup_logging()
+    
     # 启动信息
     logger.info("=" * 70)
     logger.info("🎯 多资产组合交易 Agent 启动")
@@ -294,10 +437,15 @@ def main():
         logger.warning("🔴 真实交易模式：请谨慎！")
     
     # 创建Agent
+    # 复用上面创建的 Info / Exchange / LLM 客户端，不再重复连接
     agent = PortfolioTradingAgent(
         config=config,
         strategy_prompt=strategy_prompt,
-        dry_run=args.dry_run
+        dry_run=args.dry_run,
+        info=info,
+        exchange=exchange,
+        address=address,
+        llm_client=llm_client
     )
     
     # 运行
@@ -333,6 +481,8 @@ def main():
         logger.info("")
         
         agent.run_loop(interval)
+    
+    agent.stop()
 
 
 if __name__ == "__main__":
@@ -1,62 +1,105 @@
 """增强的 LangGraph 节点 - 支持高级交易功能"""
 import logging
+from typing import Callable, Dict, List, Optional
 from src.state import TradingState
 from src.advanced_tools import AdvancedTradingTools
 from src.risk_manager import RiskManager
+from src.parallel import run_per_coin
+from src.decision_cache import llm_completion
+from src.prompt_builder import PromptBuilder
+from src.streaming import ToolCallStream
+from src.batch_execution import find_prepared
+from src.slippage import place_market_open
+from src.asset_index import validate_order
+from src.market_scanner import MarketScanner
 
 logger = logging.getLogger(__name__)
 
+# 决策要求（原样附在提示词末尾，不参与 token 预算裁剪）
+DECISION_INSTRUCTIONS = """⚠️ 重要：你必须每次都做出交易决策！
+- 禁止选择 hold 或观望
+- 必须选择 buy（做多）或 sell（做空）或 close（平仓）
+- 即使信号不明确，也要基于技术指标做出方向性选择
+- 可以用小仓位 + 低杠杆来降低风险，但不能不交易
 
-def fetch_advanced_market_data_node(
-    state: TradingState,
-    advanced_tools: AdvancedTradingTools
-) -> TradingState:
-    """获取增强的市场数据（包括K线和技术指标）"""
-    logger.info("📊 获取高级市场数据...")
-    print("\n🔍 开始获取市场数据...")
-    
-    # 获取基础价格数据
-    try:
-        print("   → 正在获取价格数据...")
-        state["current_prices"] = advanced_tools.info.all_mids()
-        print(f"   ✅ 成功获取 {len(state['current_prices'])} 个币种价格")
-    except Exception as e:
-        print(f"   ❌ 获取价格数据失败: {e}")
-        logger.error(f"获取价格失败: {e}")
-        state["current_prices"] = {}
-        return state
-    
-    # 打印市场概况
+请基于以上数据立即做出交易决策。
+"""
+
+DEFAULT_COINS = ["BTC", "ETH"]
+
+
+def print_market_overview(prices: Dict):
+    """打印市场概况（主要币种价格）"""
     print("\n" + "=" * 70)
     print("📊 市场数据概况")
     print("=" * 70)
-    print(f"总币种数: {len(state['current_prices'])}")
+    print(f"总币种数: {len(prices)}")
     print("\n主要币种价格:")
     for coin in ["BTC", "ETH", "SOL", "AVAX", "MATIC"]:
-        if coin in state["current_prices"]:
+        if coin in prices:
             try:
-                price = float(state["current_prices"][coin])
+                price = float(prices[coin])
                 print(f"  {coin:8s}: ${price:>12,.2f}")
             except (ValueError, TypeError) as e:
-                print(f"  {coin:8s}: {state['current_prices'][coin]}")
+                print(f"  {coin:8s}: {prices[coin]}")
+
+
+def scan_market(
+    advanced_tools: AdvancedTradingTools,
+    scanner: MarketScanner,
+    meta_and_ctxs,
+    coins: List[str],
+    user_state: Dict
+) -> Dict:
+    """
+    全市场扫描（同步和异步获取节点共用）
+
+    Args:
+        meta_and_ctxs: metaAndAssetCtxs 原始响应
+        coins: 配置的关注币种
+        user_state: 账户状态原始响应（持仓币种始终加入候选）
+
+    Returns:
+        MarketScanner.scan 的结果，candidates = 持仓 + 关注币种 + 得分最高的 top_k 个
+    """
+    held = [p["position"]["coin"] for p in user_state.get("assetPositions", [])
+            if float(p["position"]["szi"]) != 0]
+    index = getattr(advanced_tools, "asset_index", None)
+    capped = [asset["coin"] for asset in index.assets() if asset["at_oi_cap"]] if index else []
+    scan = scanner.scan(meta_and_ctxs, include=held + coins, exclude=capped)
+    print(f"\n   🔭 全市场扫描: {scan['universe']} 个合约，{scan['eligible']} 个参与排名")
+    for row in scan["ranked"]:
+        print(f"      {row['coin']:8s} 得分 {row['score']:.2f}  24h {row['change_24h']:>+7.2f}%  "
+              f"成交额 ${row['volume'] / 1e6:>8.1f}M  资金费率 {row['funding'] * 100:+.4f}%")
+    return scan
+
+
+def build_market_analysis(
+    advanced_tools: AdvancedTradingTools,
+    coins: List[str],
+    candles_by_coin: Dict[str, List[Dict]],
+    indicators_by_coin: Dict[str, Dict],
+    errors: Dict[str, str]
+) -> Dict:
+    """
+    根据K线和技术指标生成每个币种的市场分析（同步和异步获取节点共用）
     
-    # 为主要币种获取技术分析数据
-    print("\n   → 开始获取技术指标...")
+    Returns:
+        {币种: {"candles": 最近5根K线, "indicators": 指标, "condition": 市场状况}}
+    """
     market_analysis = {}
-    for coin in ["BTC", "ETH"]:
+    
+    for coin, error in errors.items():
+        print(f"      ❌ {coin} 数据获取失败: {error}")
+    print(f"   ✅ 技术指标计算完成 ({len(indicators_by_coin)}/{len(coins)} 个币种)")
+    
+    for coin, candles in candles_by_coin.items():
         try:
             print(f"   → 分析 {coin}...")
-            
-            # 获取K线
-            candles = advanced_tools.get_candles(coin, "1h", 24)
-            print(f"      ✅ 获取到 {len(candles)} 根K线")
-            
-            # 计算技术指标
-            indicators = advanced_tools.calculate_technical_indicators(candles)
-            print(f"      ✅ 技术指标计算完成")
+            indicators = indicators_by_coin.get(coin, {})
             
             # 市场状况分析
-            condition = advanced_tools.analyze_market_condition(coin)
+            condition = advanced_tools.analyze_market_condition(coin, indicators)
             print(f"      ✅ 市场状况分析完成")
             
             market_analysis[coin] = {
@@ -72,6 +115,9 @@ def fetch_advanced_market_data_node(
             print(f"  EMA(12):      ${indicators.get('ema_12', 0):>12,.2f}")
             print(f"  24h 涨跌:     {indicators.get('price_change_24h', 0):>8.2f}%")
             print(f"  波动率:       {indicators.get('volatility', 0):>8.4f}")
+            for interval, frame in indicators.get("timeframes", {}).items():
+                if frame:
+                    print(f"  {interval:<4} RSI/SMA: {frame.get('rsi_14') or 0:>8.2f}  ${frame.get('sma_20') or 0:>12,.2f}")
             print(f"  趋势:         {condition.get('trend', 'unknown')}")
             print(f"  趋势强度:     {condition.get('strength', 0):>8.2f}")
             
@@ -81,6 +127,86 @@ def fetch_advanced_market_data_node(
             import traceback
             print(f"      详细错误: {traceback.format_exc()}")
     
+    return market_analysis
+
+
+def fetch_advanced_market_data_node(
+    state: TradingState,
+    advanced_tools: AdvancedTradingTools,
+    coins: Optional[List[str]] = None,
+    max_workers: int = 8,
+    timeout: float = 10.0,
+    scanner: Optional[MarketScanner] = None
+) -> TradingState:
+    """
+    获取增强的市场数据（包括K线和技术指标）
+    
+    Args:
+        coins: 需要技术分析的币种池（None 表示 BTC/ETH）
+        max_workers: 并发获取的线程数
+        timeout: 单个币种的超时时间（秒），超时或失败的币种会被跳过
+        scanner: 全市场扫描器，不为 None 时在币种池之外加入持仓币种和扫描选出的币种
+    """
+    logger.info("📊 获取高级市场数据...")
+    print("\n🔍 开始获取市场数据...")
+    
+    # 获取基础价格数据
+    try:
+        print("   → 正在获取价格数据...")
+        state["current_prices"] = advanced_tools.snapshot.all_mids()
+        print(f"   ✅ 成功获取 {len(state['current_prices'])} 个币种价格")
+    except Exception as e:
+        print(f"   ❌ 获取价格数据失败: {e}")
+        logger.error(f"获取价格失败: {e}")
+        state["current_prices"] = {}
+        return state
+    
+    # 打印市场概况
+    print_market_overview(state["current_prices"])
+    
+    # 为币种池并发获取技术分析数据
+    coins = coins or DEFAULT_COINS
+    if scanner is not None:
+        try:
+            # user_state 写入快照，随后的 get_account 节点直接命中
+            state["market_scan"] = scan_market(
+                advanced_tools, scanner, advanced_tools.snapshot.meta_and_asset_ctxs(), list(coins),
+                advanced_tools.snapshot.user_state(advanced_tools.address)
+            )
+            coins = state["market_scan"]["candidates"]
+        except Exception as e:
+            logger.warning(f"市场扫描失败，只分析配置的币种: {e}")
+    print(f"\n   → 开始获取技术指标 ({len(coins)} 个币种, 并发 {max_workers})...")
+    
+    if advanced_tools.timeframes is not None:
+        # 多周期：每个币种一次基础周期K线请求，本地聚合出 1h 和其他周期后批量计算指标
+        fetched, errors = run_per_coin(
+            advanced_tools.get_multi_timeframe_candles,
+            coins, max_workers=max_workers, timeout=timeout
+        )
+        candles_by_coin = {coin: result[0] for coin, result in fetched.items()}
+        indicators_by_coin = advanced_tools.batch_calculate_technical_indicators(
+            candles_by_coin, {coin: result[1] for coin, result in fetched.items()}
+        )
+    elif advanced_tools.streaming_indicators:
+        # 增量模式：每个币种只拉取新K线，O(1) 更新指标
+        fetched, errors = run_per_coin(
+            lambda coin: advanced_tools.get_streaming_indicators(coin, "1h"),
+            coins, max_workers=max_workers, timeout=timeout
+        )
+        candles_by_coin = {coin: result[0] for coin, result in fetched.items()}
+        indicators_by_coin = {coin: result[1] for coin, result in fetched.items()}
+    else:
+        # 并发获取K线，再批量计算技术指标（所有币种一次计算）
+        candles_by_coin, errors = run_per_coin(
+            lambda coin: advanced_tools.get_candles(coin, "1h", 24),
+            coins, max_workers=max_workers, timeout=timeout
+        )
+        indicators_by_coin = advanced_tools.batch_calculate_technical_indicators(candles_by_coin)
+    
+    market_analysis = build_market_analysis(
+        advanced_tools, coins, candles_by_coin, indicators_by_coin, errors
+    )
     state["market_analysis_data"] = market_analysis
     state["messages"].append(f"获取到 {len(state['current_prices'])} 个币种价格和技术分析")
     print("=" * 70 + "\n")
@@ -92,71 +218,28 @@ def enhanced_llm_analysis_node(
     state: TradingState,
     llm_client,
     strategy_prompt: str,
-    advanced_tools: AdvancedTradingTools
+    advanced_tools: AdvancedTradingTools,
+    decision_cache=None,
+    prompt_builder: Optional[PromptBuilder] = None,
+    trade_preparer: Optional[Callable[[Dict, Dict], Dict]] = None
 ) -> TradingState:
-    """增强的 LLM 分析节点 - 包含技术指标和市场分析"""
+    """
+    增强的 LLM 分析节点 - 包含技术指标和市场分析
+
+    可选决策缓存；trade_preparer 不为 None 时流式调用 LLM，决策关键字段一完整就做下单前准备
+    （结果写入 state["prepared_trades"]，见 nodes.llm_analysis_node）
+    """
     logger.info("🤖 LLM 高级分析...")
+    state["prepared_trades"] = []
+    stream = ToolCallStream(
+        lambda trade: state["prepared_trades"].append(trade_preparer(trade, state))
+    ) if trade_preparer else None
     
-    # 构建详细的市场数据（包含技术指标）
-    market_data_str = ""
-    for coin, analysis in state.get("market_analysis_data", {}).items():
-        indicators = analysis.get("indicators", {})
-        condition = analysis.get("condition", {})
-        
-        market_data_str += f"\n{coin} 分析:\n"
-        market_data_str += f"  当前价格: ${indicators.get('current_price', 0):.2f}\n"
-        market_data_str += f"  24h涨跌: {indicators.get('price_change_24h', 0):+.2f}%\n"
-        market_data_str += f"  RSI(14): {indicators.get('rsi_14', 0):.1f}\n"
-        market_data_str += f"  SMA(20): ${indicators.get('sma_20', 0):.2f}\n"
-        market_data_str += f"  波动率: {indicators.get('volatility', 0):.2%}\n"
-        market_data_str += f"  市场趋势: {condition.get('trend', 'unknown')}\n"
-        market_data_str += f"  建议: {condition.get('recommendation', 'hold')}\n"
-        market_data_str += f"  原因: {', '.join(condition.get('reasons', []))}\n"
-    
-    # 获取持仓信息
-    positions_str = ""
-    for pos in state['positions']:
-        positions_str += f"\n  {pos['coin']}: "
-        positions_str += f"数量={pos['size']:.4f}, "
-        positions_str += f"入场价=${pos['entry_price']:.2f}, "
-        positions_str += f"当前价=${pos['current_price']:.2f}, "
-        positions_str += f"盈亏=${pos['unrealized_pnl']:+.2f}, "
-        positions_str += f"杠杆={pos['leverage']}x"
-    
-    if not positions_str:
-        positions_str = "\n  无持仓"
-    
-    # 获取交易历史（最近5笔）
-    trading_history = advanced_tools.get_trading_history(limit=5)
-    history_str = ""
-    for trade in trading_history:
-        history_str += f"\n  {trade['time']}: {trade['side'].upper()} {trade['size']} {trade['coin']} @ ${trade['price']:.2f}"
-    
-    if not history_str:
-        history_str = "\n  暂无交易历史"
-    
-    context = f"""
-=== 市场技术分析 ===
-{market_data_str}
-
-=== 账户状态 ===
-账户价值: ${state['account_value']:.2f}
-可用余额: ${state['available_balance']:.2f}
-
-=== 当前持仓 ===
-{positions_str}
-
-=== 最近交易历史 ===
-{history_str}
-
-⚠️ 重要：你必须每次都做出交易决策！
-- 禁止选择 hold 或观望
-- 必须选择 buy（做多）或 sell（做空）或 close（平仓）
-- 即使信号不明确，也要基于技术指标做出方向性选择
-- 可以用小仓位 + 低杠杆来降低风险，但不能不交易
-
-请基于以上数据立即做出交易决策。
-"""
+    # 构建紧凑的市场数据（技术指标表 + 持仓 + 最近成交）
+    builder = prompt_builder or PromptBuilder()
+    trading_history = advanced_tools.get_trading_history(limit=builder.history_limit)
+    context, state["prompt_tokens"] = builder.build(state, instructions=DECISION_INSTRUCTIONS,
+                                                    history=trading_history)
     
     # 定义增强的 Function Calling 工具
     tools = [
@@ -218,7 +301,8 @@ def enhanced_llm_analysis_node(
     ]
     
     try:
-        response = llm_client.chat.completions.create(
+        response = llm_completion(
+            llm_client, decision_cache, state, stream=stream,
             model="deepseek-chat",
             messages=messages,
             tools=tools,
@@ -363,9 +447,22 @@ def execute_advanced_trade_node(
         state["trading_decision"] = decision
         state["target_size"] = size
     
+    # 流式决策期间已完成的准备：取整后的数量、当前杠杆
+    prepared = find_prepared(state.get("prepared_trades"), decision, coin, size)
+    if prepared:
+        size = prepared["size"]
+    
+    # 本地校验（有资产元数据索引时）：数量取整、杠杆限制在上限内，注定被拒绝的订单不发送
+    check = validate_order(advanced_tools, coin, size, leverage) if decision in ["buy", "sell"] else None
+    rejected = check is not None and not check["ok"]
+    if check is not None and check["ok"]:
+        size, leverage = check["size"], check["leverage"]
+    
     try:
-        # 1. 调整杠杆（如果需要）
-        if leverage > 1 and decision in ["buy", "sell"]:
+        # 1. 调整杠杆（如果需要，已是目标杠杆则跳过）
+        if prepared and prepared["current_leverage"] == leverage:
+            logger.info(f"杠杆已是 {leverage}x，跳过调整")
+        elif leverage > 1 and decision in ["buy", "sell"] and not rejected:
             leverage_result = advanced_tools.adjust_leverage(
                 coin, leverage, is_cross=True, dry_run=dry_run
             )
@@ -375,8 +472,10 @@ def execute_advanced_trade_node(
         if decision in ["buy", "sell"]:
             is_buy = (decision == "buy")
             
+            if rejected:
+                result = {"success": False, "coin": coin, "action": decision, "error": check["error"]}
             # 如果使用止盈止损
-            if use_tpsl:
+            elif use_tpsl:
                 # 确保价格是浮点数
                 current_price = state["current_prices"].get(coin, 0)
                 if isinstance(current_price, str):
@@ -385,7 +484,7 @@ def execute_advanced_trade_node(
                 sl_pct = state.get("stop_loss_pct", 3.0)
                 
                 tp_price, sl_price = advanced_tools.calculate_tpsl_prices(
-                    current_price, is_buy, tp_pct, sl_pct
+                    current_price, is_buy, tp_pct, sl_pct, coin=coin
                 )
                 
                 result = advanced_tools.place_order_with_tpsl(
@@ -410,7 +509,8 @@ def execute_advanced_trade_node(
                     logger.warning(f"[真实] {action} {size} {coin} (无止盈止损)")
                     logger.info(f"📤 发送市价单: {action} {size} {coin}")
                     
-                    order_result = advanced_tools.exchange.market_open(coin, is_buy, size, None, 0.05)
+                    order_result = place_market_open(advanced_tools, coin, is_buy, size)
+                    advanced_tools.snapshot.invalidate("user_state")
                     logger.info(f"📥 交易所响应: {order_result}")
                     
                     # 检查订单状态
@@ -422,10 +522,9 @@ def execute_advanced_trade_node(
                             "error": f"交易所拒绝: {order_result}"
                         }
                     else:
-                        # 检查是否有错误信息（即使status=ok）
-                        statuses = order_result.get("response", {}).get("data", {}).get("statuses", [])
-                        if statuses and any("error" in s for s in statuses):
-                            error_msg = statuses[0].get("error", "未知错误")
+                        # 检查是否有错误信息（即使status=ok；拆单时有子订单成交即已开仓）
+                        error_msg = order_result["error"]
+                        if error_msg and not order_result["filled_size"]:
                             logger.error(f"❌ 订单失败！错误: {error_msg}")
                             result = {
                                 "success": False,
@@ -434,11 +533,17 @@ def execute_advanced_trade_node(
                                 "message": f"交易所错误: {error_msg}"
                             }
                         else:
-                            logger.info(f"✅ 订单成功！")
+                            if error_msg:
+                                logger.warning(f"⚠️  订单部分成交 {order_result['filled_size']}: {error_msg}")
+                            else:
+                                logger.info(f"✅ 订单成功！")
                             result = {
                                 "success": True,
-                                "result": order_result
+                                "result": order_result,
+                                "filled_size": order_result["filled_size"]
                             }
+                            if error_msg:
+                                result["error"] = error_msg
             
             state["execution_result"] = result
             
@@ -450,6 +555,7 @@ def execute_advanced_trade_node(
             else:
                 logger.warning(f"[真实] 平仓 {coin}")
                 result = advanced_tools.exchange.market_close(coin)
+                advanced_tools.snapshot.invalidate("user_state")
                 result = {
                     "success": result.get("status") == "ok",
                     "result": result
@@ -478,14 +584,23 @@ def execute_advanced_trade_node(
             else:
                 print(f"模式:         🔴 真实交易")
                 
-                # 真实交易后，等待并验证持仓
+                # 真实交易后，等待成交回报并验证持仓
                 if decision in ["buy", "sell"]:
                     print("\n📋 验证交易结果...")
-                    import time
-                    time.sleep(2)  # 等待2秒让订单处理
+                    execution_result = state["execution_result"]
+                    order_result = execution_result.get("entry_result") or execution_result.get("result")
+                    fill = advanced_tools.order_tracker.confirm(order_result, expected_size=size)
+                    if fill["filled"]:
+                        partial = f"，部分成交（下单 {size}）" if fill.get("partial") else ""
+                        print(f"   ✅ 确认成交: {coin} {fill['filled_size']:.4f} @ ${fill['avg_price']:,.2f} "
+                              f"(oid {fill['oid']}, {fill['latency'] * 1000:.0f}ms, {fill['source']}{partial})")
+                    else:
+                        reason = fill.get("error") or f"超时，已成交 {fill.get('filled_size', 0):.4f}"
+                        print(f"   ⚠️  未确认成交: {reason}")
                     
                     try:
-                        user_state = advanced_tools.info.user_state(advanced_tools.address)
+                        advanced_tools.snapshot.invalidate("user_state")
+                        user_state = advanced_tools.snapshot.user_state(advanced_tools.address)
                         positions = []
                         for pos in user_state.get("assetPositions", []):
                             if float(pos["position"]["szi"]) != 0:
@@ -3,21 +3,84 @@
 包括：杠杆管理、止盈止损、历史数据分析等
 """
 import logging
+import threading
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 from hyperliquid.info import Info
 from hyperliquid.exchange import Exchange
+from src.asset_index import AssetIndex, validate_order
+from src.candle_store import CandleStore
+from src.fill_ledger import FillLedger
+from src.market_snapshot import MarketSnapshot
+from src.order_tracker import OrderTracker
+from src.slippage import SlippageModel, market_open_outcome, place_market_open
+from src.timeframes import MultiTimeframe, compute_timeframe_indicators
+from src.transport import HyperliquidTransport
+from src.indicators import compute_indicators, compute_indicators_batch, IncrementalIndicators
 
 logger = logging.getLogger(__name__)
 
+# analyze_market_condition 的评分规则（可通过配置 agent.scoring 覆盖，参数寻优见 param_sweep）
+DEFAULT_SCORING = {
+    "rsi_low": 30,        # RSI 低于该值视为超卖
+    "rsi_high": 70,       # RSI 高于该值视为超买
+    "rsi_weight": 15,
+    "change_pct": 3.0,    # 24h 涨跌幅阈值（%）
+    "change_weight": 10,
+    "trend_weight": 5,    # EMA 相对 SMA 的加减分
+    "buy_above": 60,      # 分数高于该值建议买入
+    "sell_below": 40,     # 分数低于该值建议卖出
+}
+
 
 class AdvancedTradingTools:
     """高级交易工具类 - 像人类交易员一样操作"""
     
-    def __init__(self, info: Info, exchange: Exchange, address: str):
+    def __init__(
+        self,
+        info: Info,
+        exchange: Exchange,
+        address: str,
+        streaming_indicators: bool = False,
+        candle_store: Optional[CandleStore] = None,
+        snapshot: Optional[MarketSnapshot] = None,
+        scoring: Optional[Dict] = None,
+        slippage_model: Optional[SlippageModel] = None,
+        fill_ledger: Optional[FillLedger] = None,
+        asset_index: Optional[AssetIndex] = None,
+        timeframes: Optional[MultiTimeframe] = None,
+        transport: Optional[HyperliquidTransport] = None
+    ):
         self.info = info
         self.exchange = exchange
         self.address = address
+        # 本地K线缓存：只向交易所请求缺失的时间段
+        self.candle_store = candle_store
+        # 周期级行情快照：同一周期内 all_mids / user_state 只请求一次
+        self.snapshot = snapshot or MarketSnapshot(info)
+        # 成交确认：WebSocket 推送或增量轮询 user_fills，代替固定等待
+        self.order_tracker = OrderTracker(info, address, self.snapshot)
+        # 市场评分规则参数
+        self.scoring = {**DEFAULT_SCORING, **(scoring or {})}
+        # 订单簿滑点模型：市价单按深度确定滑点上限，必要时拆单（None 表示固定 5%）
+        self.slippage_model = slippage_model
+        # 本地成交账本：交易历史和表现统计增量同步后本地查询（None 表示每次拉取完整 user_fills）
+        self.fill_ledger = fill_ledger
+        # 资产元数据索引：下单前按 szDecimals / maxLeverage / OI cap 本地取整和校验（None 表示交给交易所校验）
+        self.asset_index = asset_index
+        # 多周期：每个币种只拉一条基础周期K线，本地聚合出 1h / 4h / 1d（None 表示只看 1h）
+        self.timeframes = timeframes
+        # 共享 HTTP 层：连接池、按请求权重限流、合并相同请求、抖动重试（None 表示使用 SDK 默认的 Session）
+        self.transport = transport
+        if transport is not None:
+            transport.attach(info, exchange)
+        # 增量指标模式：每个 (币种, 周期) 保存指标状态，每轮只拉取新K线
+        if streaming_indicators and timeframes is not None:
+            logger.warning("⚠️  已启用多周期，增量指标模式不生效：1h 指标由基础周期K线聚合后批量计算")
+            streaming_indicators = False
+        self.streaming_indicators = streaming_indicators
+        self._indicator_states: Dict[Tuple[str, str], IncrementalIndicators] = {}
+        self._indicator_locks: Dict[Tuple[str, str], threading.Lock] = {}
     
     # ===== 历史数据分析 =====
     
@@ -25,7 +88,8 @@ class AdvancedTradingTools:
         self, 
         coin: str, 
         interval: str = "1h",
-        lookback_hours: int = 24
+        lookback_hours: int = 24,
+        start_time: Optional[int] = None
     ) -> List[Dict]:
         """
         获取K线历史数据
@@ -34,6 +98,7 @@ class AdvancedTradingTools:
             coin: 币种名称
             interval: K线周期 - "1m", "5m", "15m", "1h", "4h", "1d"
             lookback_hours: 回看小时数
+            start_time: 起始时间戳(毫秒)，指定时忽略 lookback_hours
             
         Returns:
             [
@@ -49,26 +114,27 @@ class AdvancedTradingTools:
             ]
         """
         try:
-            end_time = int(datetime.now().timestamp() * 1000)
-            start_time = int((datetime.now() - timedelta(hours=lookback_hours)).timestamp() * 1000)
-            
-            candles = self.info.candles_snapshot(
-                name=coin,
-                interval=interval,
-                startTime=start_time,
-                endTime=end_time
-            )
+            now = datetime.now()
+            end_time = int(now.timestamp() * 1000)
+            if start_time is None:
+                start_time = int((now - timedelta(hours=lookback_hours)).timestamp() * 1000)
+            
+            live_candles = self.snapshot.live_candles(coin, interval, start_time)
+            if live_candles is not None:
+                candles = live_candles
+            elif self.candle_store is not None:
+                candles = self.candle_store.get_candles(
+                    self.info, coin, interval, start_time, end_time
+                )
+            else:
+                candles = self.info.candles_snapshot(
+                    name=coin,
+                    interval=interval,
+                    startTime=start_time,
+                    endTime=end_time
+                )
             
-            formatted_candles = []
-            for candle in candles:
-                formatted_candles.append({
-                    "time": candle["t"],
-                    "open": float(candle["o"]),
-                    "high": float(candle["h"]),
-                    "low": float(candle["l"]),
-                    "close": float(candle["c"]),
-                    "volume": float(candle.get("v", 0))
-                })
+            formatted_candles = self.format_candles(candles)
             
             logger.info(f"获取 {coin} K线数据: {len(formatted_candles)} 根，周期 {interval}")
             return formatted_candles
@@ -77,6 +143,21 @@ class AdvancedTradingTools:
             logger.error(f"获取K线数据失败: {e}")
             return []
     
+    @staticmethod
+    def format_candles(candles: List[Dict]) -> List[Dict]:
+        """把 candles_snapshot 原始格式转换为 get_candles 的返回格式"""
+        return [
+            {
+                "time": candle["t"],
+                "open": float(candle["o"]),
+                "high": float(candle["h"]),
+                "low": float(candle["l"]),
+                "close": float(candle["c"]),
+                "volume": float(candle.get("v", 0))
+            }
+            for candle in candles
+        ]
+    
     def get_trading_history(self, limit: int = 50) -> List[Dict]:
         """
         获取交易历史记录
@@ -97,6 +178,15 @@ class AdvancedTradingTools:
                 ...
             ]
         """
+        if self.fill_ledger is not None:
+            try:
+                self.fill_ledger.sync(self.info, self.address)
+            except Exception as e:
+                logger.warning(f"成交账本同步失败，使用本地已有记录: {e}")
+            history = self.fill_ledger.recent(self.address, limit)
+            logger.info(f"获取交易历史: {len(history)} 条记录（本地账本）")
+            return history
+        
         try:
             fills = self.info.user_fills(self.address)
             
@@ -119,12 +209,33 @@ class AdvancedTradingTools:
             logger.error(f"获取交易历史失败: {e}")
             return []
     
-    def calculate_technical_indicators(self, candles: List[Dict]) -> Dict:
+    def get_performance(self) -> Optional[Dict]:
+        """
+        交易表现汇总（需要成交账本）
+        
+        Returns:
+            {"fills", "volume", "fees", "realized_pnl", "net_pnl", "win_rate", ...,
+             "coins": {币种: 按币种汇总}}；未启用成交账本时返回 None
+        """
+        if self.fill_ledger is None:
+            return None
+        try:
+            self.fill_ledger.sync(self.info, self.address)
+        except Exception as e:
+            logger.warning(f"成交账本同步失败，使用本地已有记录: {e}")
+        return {**self.fill_ledger.performance(self.address), "coins": self.fill_ledger.coin_stats(self.address)}
+    
+    def calculate_technical_indicators(
+        self,
+        candles: List[Dict],
+        timeframes: Optional[Dict[str, List[Dict]]] = None
+    ) -> Dict:
         """
         计算技术指标
         
         Args:
             candles: K线数据
+            timeframes: 其他周期的K线 {周期: K线}（见 get_multi_timeframe_candles）
             
         Returns:
             {
@@ -132,83 +243,81 @@ class AdvancedTradingTools:
                 "ema_12": 65100.0,      # 12周期指数移动平均
                 "rsi_14": 55.5,         # 14周期RSI
                 "price_change_24h": 2.5, # 24小时涨跌幅(%)
-                "volatility": 0.015      # 波动率
+                "volatility": 0.015,     # 波动率
+                "timeframes": {"4h": {...}, "1d": {...}}  # 仅传入 timeframes 时
             }
         """
-        if not candles or len(candles) < 20:
-            return {}
+        if timeframes is None:
+            return compute_indicators(candles)
+        return self.batch_calculate_technical_indicators({"_": candles}, {"_": timeframes})["_"]
+    
+    def batch_calculate_technical_indicators(
+        self,
+        candles_by_coin: Dict[str, List[Dict]],
+        timeframes_by_coin: Optional[Dict[str, Dict[str, List[Dict]]]] = None
+    ) -> Dict[str, Dict]:
+        """
+        批量计算多个币种的技术指标（NumPy 矩阵计算）
         
-        try:
-            closes = [c["close"] for c in candles]
-            
-            # 简单移动平均 SMA
-            sma_20 = sum(closes[-20:]) / 20 if len(closes) >= 20 else None
-            
-            # 指数移动平均 EMA
-            def calculate_ema(prices, period):
-                multiplier = 2 / (period + 1)
-                ema = prices[0]
-                for price in prices[1:]:
-                    ema = (price - ema) * multiplier + ema
-                return ema
-            
-            ema_12 = calculate_ema(closes, 12) if len(closes) >= 12 else None
-            
-            # RSI
-            def calculate_rsi(prices, period=14):
-                if len(prices) < period + 1:
-                    return None
-                
-                gains = []
-                losses = []
-                for i in range(1, len(prices)):
-                    change = prices[i] - prices[i-1]
-                    if change > 0:
-                        gains.append(change)
-                        losses.append(0)
-                    else:
-                        gains.append(0)
-                        losses.append(abs(change))
-                
-                avg_gain = sum(gains[-period:]) / period
-                avg_loss = sum(losses[-period:]) / period
-                
-                if avg_loss == 0:
-                    return 100
-                
-                rs = avg_gain / avg_loss
-                rsi = 100 - (100 / (1 + rs))
-                return rsi
+        Args:
+            candles_by_coin: {币种: K线数据}
+            timeframes_by_coin: {币种: {周期: K线}}，每个周期所有币种一次计算
             
-            rsi_14 = calculate_rsi(closes, 14)
+        Returns:
+            {币种: 指标字典}，指标字典格式同 calculate_technical_indicators
+        """
+        results = compute_indicators_batch(candles_by_coin)
+        if timeframes_by_coin:
+            for coin, frames in compute_timeframe_indicators(timeframes_by_coin).items():
+                if results.get(coin):
+                    results[coin]["timeframes"] = frames
+        return results
+    
+    def get_multi_timeframe_candles(self, coin: str) -> Tuple[List[Dict], Dict[str, List[Dict]]]:
+        """
+        一次基础周期K线请求得到所有周期的K线（需要 timeframes 配置）
+        
+        Returns:
+            (主周期 1h 最近 24 小时的K线, {周期: K线})
+        """
+        base = self.get_candles(coin, self.timeframes.base_interval, self.timeframes.lookback_hours)
+        return self.timeframes.split(base, now_ms=int(datetime.now().timestamp() * 1000))
+    
+    def get_streaming_indicators(
+        self,
+        coin: str,
+        interval: str = "1h",
+        seed_lookback_hours: int = 72
+    ) -> Tuple[List[Dict], Dict]:
+        """
+        增量获取技术指标
+        
+        首次调用时用历史K线初始化指标状态，之后只拉取上次之后的新K线，
+        每轮的计算量为 O(新K线数) 而不是 O(窗口长度)。
+        
+        Args:
+            coin: 币种
+            interval: K线周期
+            seed_lookback_hours: 初始化时回看的小时数（更长的历史让 EMA/RSI 更稳定）
             
-            # 24小时涨跌幅
-            if len(closes) >= 24:
-                price_change_24h = ((closes[-1] - closes[-24]) / closes[-24]) * 100
+        Returns:
+            (窗口内的K线, 指标字典)
+        """
+        key = (coin, interval)
+        # 同一 (币种, 周期) 的状态串行更新（并发获取时不同币种互不阻塞）
+        with self._indicator_locks.setdefault(key, threading.Lock()):
+            indicator_state = self._indicator_states.get(key)
+            
+            if indicator_state is None or indicator_state.latest_time is None:
+                indicator_state = IncrementalIndicators(coin, interval)
+                candles = self.get_candles(coin, interval, seed_lookback_hours)
+                self._indicator_states[key] = indicator_state
             else:
-                price_change_24h = ((closes[-1] - closes[0]) / closes[0]) * 100
-            
-            # 波动率（标准差 / 均值）
-            import statistics
-            volatility = statistics.stdev(closes[-20:]) / statistics.mean(closes[-20:]) if len(closes) >= 20 else 0
-            
-            indicators = {
-                "sma_20": round(sma_20, 2) if sma_20 else None,
-                "ema_12": round(ema_12, 2) if ema_12 else None,
-                "rsi_14": round(rsi_14, 2) if rsi_14 else None,
-                "price_change_24h": round(price_change_24h, 2),
-                "volatility": round(volatility, 4),
-                "current_price": closes[-1],
-                "highest_24h": max(closes[-24:]) if len(closes) >= 24 else max(closes),
-                "lowest_24h": min(closes[-24:]) if len(closes) >= 24 else min(closes)
-            }
-            
-            logger.info(f"技术指标计算完成: RSI={rsi_14:.1f}, 涨跌幅={price_change_24h:.2f}%")
-            return indicators
+                candles = self.get_candles(coin, interval, start_time=indicator_state.latest_time)
             
-        except Exception as e:
-            logger.error(f"计算技术指标失败: {e}")
-            return {}
+            committed = indicator_state.update(candles)
+            logger.info(f"{coin} {interval} 增量指标更新: 新确认 {committed} 根K线")
+            return indicator_state.candles(), indicator_state.indicators()
     
     # ===== 杠杆管理 =====
     
@@ -247,6 +356,7 @@ class AdvancedTradingTools:
         try:
             logger.warning(f"[真实] 调整 {coin} 杠杆: {leverage}x ({mode})")
             result = self.exchange.update_leverage(leverage, coin, is_cross)
+            self.snapshot.invalidate("user_state")
             
             return {
                 "success": result.get("status") == "ok",
@@ -295,6 +405,7 @@ class AdvancedTradingTools:
         try:
             logger.warning(f"[真实] {action} {coin} 保证金: ${abs(amount):.2f}")
             result = self.exchange.update_isolated_margin(amount, coin)
+            self.snapshot.invalidate("user_state")
             
             return {
                 "success": result.get("status") == "ok",
@@ -339,6 +450,24 @@ class AdvancedTradingTools:
         """
         action = "买入" if is_buy else "卖出"
         
+        # 本地校验：数量和价格按交易所精度取整，注定被拒绝的订单不发送
+        check = validate_order(self, coin, size)
+        if check is not None:
+            if not check["ok"]:
+                return {
+                    "success": False,
+                    "dry_run": dry_run,
+                    "coin": coin,
+                    "action": action,
+                    "size": size,
+                    "error": check["error"]
+                }
+            size = check["size"]
+            entry_price, take_profit_price, stop_loss_price = (
+                self.asset_index.round_price(coin, price) if price else price
+                for price in (entry_price, take_profit_price, stop_loss_price)
+            )
+        
         if dry_run:
             logger.info(f"[模拟] {action} {size} {coin}")
             if take_profit_price:
@@ -364,7 +493,7 @@ class AdvancedTradingTools:
             if entry_price is None:
                 # 市价单
                 logger.info(f"📤 发送市价单: {action} {size} {coin}")
-                order_result = self.exchange.market_open(coin, is_buy, size)
+                order_result = place_market_open(self, coin, is_buy, size)
                 logger.info(f"📥 交易所响应: {order_result}")
             else:
                 # 限价单
@@ -375,6 +504,8 @@ class AdvancedTradingTools:
                 )
                 logger.info(f"📥 交易所响应: {order_result}")
             
+            self.snapshot.invalidate("user_state")
+            
             # 检查订单状态（需要同时检查status和data.statuses）
             if order_result.get("status") != "ok":
                 logger.error(f"❌ 开仓失败！响应: {order_result}")
@@ -385,10 +516,9 @@ class AdvancedTradingTools:
                     "message": f"交易所拒绝: {order_result}"
                 }
             
-            # 检查是否有错误信息（即使status=ok）
-            statuses = order_result.get("response", {}).get("data", {}).get("statuses", [])
-            if statuses and any("error" in s for s in statuses):
-                error_msg = statuses[0].get("error", "未知错误")
+            # 检查是否有错误信息（即使status=ok；拆单时有子订单成交即已开仓，仍需设置止盈止损）
+            filled_size, error_msg = market_open_outcome(order_result)
+            if error_msg and not filled_size:
                 logger.error(f"❌ 开仓失败！错误: {error_msg}")
                 return {
                     "success": False,
@@ -396,6 +526,8 @@ class AdvancedTradingTools:
                     "result": order_result,
                     "message": f"交易所错误: {error_msg}"
                 }
+            if error_msg:
+                logger.warning(f"⚠️  开仓部分成交 {filled_size}: {error_msg}")
             
             logger.info(f"✅ 开仓成功！订单响应: {order_result}")
             
@@ -454,7 +586,8 @@ class AdvancedTradingTools:
         current_price: float,
         is_buy: bool,
         take_profit_pct: float = 5.0,
-        stop_loss_pct: float = 3.0
+        stop_loss_pct: float = 3.0,
+        coin: Optional[str] = None
     ) -> Tuple[float, float]:
         """
         计算止盈止损价格
@@ -464,6 +597,7 @@ class AdvancedTradingTools:
             is_buy: 是否做多
             take_profit_pct: 止盈百分比
             stop_loss_pct: 止损百分比
+            coin: 币种（有资产元数据索引时按该币种的价格精度取整，否则保留 2 位小数）
             
         Returns:
             (止盈价格, 止损价格)
@@ -477,14 +611,20 @@ class AdvancedTradingTools:
             tp_price = current_price * (1 - take_profit_pct / 100)
             sl_price = current_price * (1 + stop_loss_pct / 100)
         
+        if coin is not None and self.asset_index is not None:
+            return (self.asset_index.round_price(coin, tp_price), self.asset_index.round_price(coin, sl_price))
         return (round(tp_price, 2), round(sl_price, 2))
     
     # ===== 智能分析 =====
     
-    def analyze_market_condition(self, coin: str) -> Dict:
+    def analyze_market_condition(self, coin: str, indicators: Optional[Dict] = None) -> Dict:
         """
         综合市场分析
         
+        Args:
+            coin: 币种
+            indicators: 已计算好的技术指标（传入时不再重复获取K线）
+        
         Returns:
             {
                 "trend": "bullish" | "bearish" | "neutral",
@@ -494,51 +634,53 @@ class AdvancedTradingTools:
             }
         """
         try:
-            # 获取K线数据
-            candles = self.get_candles(coin, "1h", 24)
-            if not candles:
-                return {"trend": "unknown", "recommendation": "hold"}
-            
-            # 计算技术指标
-            indicators = self.calculate_technical_indicators(candles)
+            if indicators is None:
+                # 获取K线数据
+                candles = self.get_candles(coin, "1h", 24)
+                if not candles:
+                    return {"trend": "unknown", "recommendation": "hold"}
+                
+                # 计算技术指标
+                indicators = self.calculate_technical_indicators(candles)
             
             reasons = []
             score = 50  # 中性分数
+            rules = self.scoring
             
             # RSI 分析
             if indicators.get("rsi_14"):
                 rsi = indicators["rsi_14"]
-                if rsi < 30:
-                    score += 15
+                if rsi < rules["rsi_low"]:
+                    score += rules["rsi_weight"]
                     reasons.append(f"RSI超卖({rsi:.1f})")
-                elif rsi > 70:
-                    score -= 15
+                elif rsi > rules["rsi_high"]:
+                    score -= rules["rsi_weight"]
                     reasons.append(f"RSI超买({rsi:.1f})")
             
             # 价格趋势分析
             if indicators.get("price_change_24h"):
                 change = indicators["price_change_24h"]
-                if change > 3:
-                    score += 10
+                if change > rules["change_pct"]:
+                    score += rules["change_weight"]
                     reasons.append(f"24h上涨{change:.1f}%")
-                elif change < -3:
-                    score -= 10
+                elif change < -rules["change_pct"]:
+                    score -= rules["change_weight"]
                     reasons.append(f"24h下跌{abs(change):.1f}%")
             
             # EMA vs SMA
             if indicators.get("ema_12") and indicators.get("sma_20"):
                 if indicators["ema_12"] > indicators["sma_20"]:
-                    score += 5
+                    score += rules["trend_weight"]
                     reasons.append("短期均线上穿长期均线")
                 else:
-                    score -= 5
+                    score -= rules["trend_weight"]
                     reasons.append("短期均线下穿长期均线")
             
             # 判断趋势
-            if score > 60:
+            if score > rules["buy_above"]:
                 trend = "bullish"
                 recommendation = "buy"
-            elif score < 40:
+            elif score < rules["sell_below"]:
                 trend = "bearish"
                 recommendation = "sell"
             else:
@@ -1,5 +1,7 @@
 """LangGraph 交易 Agent 主类"""
 import logging
+import time
+from typing import Optional
 from langgraph.graph import StateGraph, END
 from src.state import TradingState, create_initial_state
 from src.nodes import (
@@ -10,7 +12,18 @@ from src.nodes import (
     execute_trade_node
 )
 from src.tools import HyperliquidTools
+from src.transport import log_transport_stats
 from src.risk_manager import RiskManager
+from src.decision_cache import DecisionCache
+from src.prompt_builder import PromptBuilder
+from src.batch_execution import prepare_trade
+from src.async_pipeline import (
+    AsyncGraphRunner,
+    NodeTimer,
+    add_parallel_fetch,
+    async_fetch_market_node,
+    async_get_account_node
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,35 +37,68 @@ class TradingAgent:
         risk_manager: RiskManager,
         llm_client,
         strategy_prompt: str,
-        dry_run: bool = True
+        dry_run: bool = True,
+        async_pipeline: bool = False,
+        decision_cache: Optional[DecisionCache] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        stream_decisions: bool = False
     ):
+        """
+        Args:
+            async_pipeline: 使用异步流水线（fetch_market 与 get_account 并行）
+            decision_cache: LLM 决策缓存，None 表示每个周期都调用 LLM
+            prompt_builder: 提示词构建器（币种数量、token 预算），None 使用默认设置
+            stream_decisions: 流式解析 LLM 决策，关键字段一完整就开始风控预检和下单准备
+        """
         self.tools = tools
         self.risk_manager = risk_manager
         self.llm_client = llm_client
         self.strategy_prompt = strategy_prompt
         self.dry_run = dry_run
+        self.async_pipeline = async_pipeline
+        self.async_runner = AsyncGraphRunner(tools) if async_pipeline else None
+        self.decision_cache = decision_cache
+        self.prompt_builder = prompt_builder
+        self.trade_preparer = (
+            lambda trade, state: prepare_trade(trade, tools, state, risk_manager)
+        ) if stream_decisions else None
+        self.timer = NodeTimer()
         self.graph = self._build_graph()
     
     def _build_graph(self) -> StateGraph:
         """构建 LangGraph 状态机"""
         workflow = StateGraph(TradingState)
+        timed = self.timer.wrap
         
         # 添加节点
-        workflow.add_node("fetch_market", 
-                         lambda s: fetch_market_data_node(s, self.tools))
-        workflow.add_node("get_account", 
-                         lambda s: get_account_status_node(s, self.tools))
         workflow.add_node("llm_analysis", 
-                         lambda s: llm_analysis_node(s, self.llm_client, self.strategy_prompt))
+                         timed("llm_analysis", lambda s: llm_analysis_node(s, self.llm_client, self.strategy_prompt,
+                                                                        self.decision_cache, self.prompt_builder,
+                                                                        self.trade_preparer)))
         workflow.add_node("risk_check", 
-                         lambda s: risk_check_node(s, self.risk_manager))
+                         timed("risk_check", lambda s: risk_check_node(s, self.risk_manager)))
         workflow.add_node("execute", 
-                         lambda s: execute_trade_node(s, self.tools, self.dry_run))
+                         timed("execute", lambda s: execute_trade_node(s, self.tools, self.dry_run)))
         
         # 定义流程
-        workflow.set_entry_point("fetch_market")
-        workflow.add_edge("fetch_market", "get_account")
-        workflow.add_edge("get_account", "llm_analysis")
+        if self.async_pipeline:
+            # 行情和账户并行获取，在 llm_analysis 汇合
+            async def fetch_market(s):
+                return await async_fetch_market_node(s, self.tools, self.async_runner.client)
+            
+            async def get_account(s):
+                return await async_get_account_node(s, self.tools, self.async_runner.client)
+            
+            add_parallel_fetch(workflow, timed("fetch_market", fetch_market),
+                               timed("get_account", get_account), "llm_analysis")
+        else:
+            workflow.add_node("fetch_market", 
+                             timed("fetch_market", lambda s: fetch_market_data_node(s, self.tools)))
+            workflow.add_node("get_account", 
+                             timed("get_account", lambda s: get_account_status_node(s, self.tools)))
+            workflow.set_entry_point("fetch_market")
+            workflow.add_edge("fetch_market", "get_account")
+            workflow.add_edge("get_account", "llm_analysis")
         workflow.add_edge("llm_analysis", "risk_check")
         
         # 条件分支：风险检查通过才执行
@@ -74,11 +120,19 @@ class TradingAgent:
         logger.info("🚀 开始新的交易周期")
         logger.info("=" * 50)
         
+        self.tools.snapshot.new_cycle()
+        self.timer.reset()
+        started = time.perf_counter()
         initial_state = create_initial_state()
-        result = self.graph.invoke(initial_state)
+        if self.async_runner:
+            result = self.async_runner.run(self.graph, initial_state)
+        else:
+            result = self.graph.invoke(initial_state)
         
         self._log_result(result)
+        self.timer.log_summary(time.perf_counter() - started)
         return result
+
     
     def _log_result(self, state: TradingState):
         """记录结果"""
@@ -110,4 +164,8 @@ class TradingAgent:
         if state.get('execution_result'):
             logger.info(f"\n💼 执行结果: {state['execution_result']}")
         
+        snapshot_stats = self.tools.snapshot.stats()
+        logger.info(f"📦 行情快照缓存: 命中 {snapshot_stats['hits']}, 未命中 {snapshot_stats['misses']}")
+        log_transport_stats(self.tools.transport)
+        
         logger.info("=" * 50 + "\n")
@@ -0,0 +1,250 @@
+"""
+资产元数据索引 - 下单前本地取整和校验
+
+数量小数位、杠杆上限、持仓量上限（OI cap）导致的拒单原先要等交易所返回错误才知道，
+每次都浪费一个签名请求（见 OPEN_INTEREST_CAP_ISSUE.md）。索引启动时从 metaAndAssetCtxs
+加载全部永续合约的元数据和实时上下文，按 refresh_interval 定期刷新：
+- szDecimals: 数量取整；价格按 5 位有效数字、6 - szDecimals 位小数取整
+- maxLeverage: 超过上限的杠杆调整为上限
+- perpsAtOpenInterestCap: 持仓量已达上限的币种只允许减仓
+- markPx / funding / openInterest: 订单价值低于交易所最小值时直接拒绝，并提供给上下文
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MIN_ORDER_VALUE = 10.0  # 交易所最小订单价值（美元），减仓单不受限制
+MAX_PRICE_DECIMALS = 6  # 永续合约价格小数位 = 6 - szDecimals
+PRICE_SIG_FIGS = 5      # 价格最多 5 位有效数字（整数价格不受限制）
+
+
+class AssetIndex:
+    """
+    资产元数据索引
+
+    用法:
+        index = AssetIndex(info, refresh_interval=60)
+        check = index.check_order("ETH", 0.01234, leverage=100)
+        # check["size"] 为取整后的数量，check["leverage"] 为调整后的杠杆，check["ok"] 为 False 时不要下单
+    """
+
+    def __init__(self, info, refresh_interval: float = 60.0, clock=time.monotonic):
+        """
+        Args:
+            info: Hyperliquid Info 实例（回测的 SimulatedInfo 只有 meta，没有实时上下文）
+            refresh_interval: 刷新间隔（秒），查询时发现过期才刷新
+            clock: 单调时钟（测试时替换）
+        """
+        self.info = info
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._assets: Dict[str, Dict] = {}
+        self._loaded_at: Optional[float] = None
+
+        # 统计
+        self.refreshes = 0
+        self.api_requests = 0
+        self.local_rejections = 0
+
+    # ===== 加载 =====
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        重新加载元数据（未过期且不强制时跳过）
+
+        Returns:
+            是否成功加载（失败时保留上一次的数据）
+        """
+        with self._lock:
+            if not force and self._loaded_at is not None and \
+                    self._clock() - self._loaded_at < self.refresh_interval:
+                return True
+            try:
+                if hasattr(self.info, "meta_and_asset_ctxs"):
+                    meta, ctxs = self.info.meta_and_asset_ctxs()
+                else:
+                    meta, ctxs = self.info.meta(), []
+                self.api_requests += 1
+            except Exception as e:
+                logger.warning(f"加载资产元数据失败，沿用上次数据: {e}")
+                self._loaded_at = self._clock()  # 失败也等待一个刷新间隔，避免每次下单都重试
+                return False
+
+            capped = self._open_interest_capped()
+            assets = {}
+            for asset_id, meta_item in enumerate(meta.get("universe", [])):
+                ctx = ctxs[asset_id] if asset_id < len(ctxs) else {}
+                assets[meta_item["name"]] = {
+                    "coin": meta_item["name"],
+                    "asset": asset_id,
+                    "sz_decimals": int(meta_item.get("szDecimals", 0)),
+                    "max_leverage": int(meta_item.get("maxLeverage", 1)),
+                    "only_isolated": bool(meta_item.get("onlyIsolated", False)),
+                    "delisted": bool(meta_item.get("isDelisted", False)),
+                    "at_oi_cap": meta_item["name"] in capped,
+                    "mark_px": _float(ctx.get("markPx")),
+                    "mid_px": _float(ctx.get("midPx")),
+                    "prev_day_px": _float(ctx.get("prevDayPx")),
+                    "funding": _float(ctx.get("funding")),
+                    "open_interest": _float(ctx.get("openInterest")),
+                    "day_volume": _float(ctx.get("dayNtlVlm")),
+                }
+            self._assets = assets
+            self._loaded_at = self._clock()
+            self.refreshes += 1
+        if capped:
+            logger.info(f"📇 资产元数据: {len(assets)} 个币种，持仓量已达上限: {sorted(capped)}")
+        else:
+            logger.info(f"📇 资产元数据: {len(assets)} 个币种")
+        return True
+
+    def _open_interest_capped(self) -> set:
+        """持仓量已达上限的币种（接口不可用时为空）"""
+        if not hasattr(self.info, "post"):
+            return set()
+        try:
+            coins = self.info.post("/info", {"type": "perpsAtOpenInterestCap"})
+            self.api_requests += 1
+            return set(coins or [])
+        except Exception as e:
+            logger.debug(f"查询 perpsAtOpenInterestCap 失败: {e}")
+            return set()
+
+    # ===== 查询 =====
+
+    def get(self, coin: str) -> Optional[Dict]:
+        """
+        单个币种的元数据（过期时先刷新）
+
+        Returns:
+            {"coin", "asset", "sz_decimals", "max_leverage", "only_isolated", "delisted", "at_oi_cap",
+             "mark_px", "mid_px", "prev_day_px", "funding", "open_interest", "day_volume"}；未知币种为 None
+        """
+        self.refresh()
+        with self._lock:
+            return self._assets.get(coin)
+
+    def assets(self) -> List[Dict]:
+        """全部币种的元数据（按交易所资产编号排序）"""
+        self.refresh()
+        with self._lock:
+            return sorted(self._assets.values(), key=lambda asset: asset["asset"])
+
+    def round_size(self, coin: str, size: float) -> float:
+        """数量按 szDecimals 取整（未知币种原样返回）"""
+        asset = self.get(coin)
+        return round(float(size), asset["sz_decimals"]) if asset else float(size)
+
+    def round_price(self, coin: str, price: float) -> float:
+        """价格取整：最多 5 位有效数字、6 - szDecimals 位小数（同 exchange._slippage_price）"""
+        asset = self.get(coin)
+        decimals = MAX_PRICE_DECIMALS - (asset["sz_decimals"] if asset else 0)
+        return round(float(f"{float(price):.{PRICE_SIG_FIGS}g}"), decimals)
+
+    # ===== 校验 =====
+
+    def check_order(
+        self,
+        coin: str,
+        size: float,
+        leverage: Optional[int] = None,
+        reduce_only: bool = False,
+        price: Optional[float] = None
+    ) -> Dict:
+        """
+        下单前本地校验
+
+        Args:
+            leverage: 目标杠杆（None 表示不调整杠杆）
+            reduce_only: 减仓单不受最小价值和持仓量上限限制
+            price: 估算订单价值用的价格（None 时使用标记价格）
+
+        Returns:
+            {"ok": 是否可以下单, "size": 取整后的数量, "leverage": 调整后的杠杆,
+             "error": 拒绝原因 | None, "warnings": [调整说明]}
+        """
+        result = {"ok": True, "size": float(size), "leverage": leverage, "error": None, "warnings": []}
+        asset = self.get(coin)
+        if asset is None:
+            if self._assets:
+                result.update(ok=False, error=f"{coin} 不在交易所的永续合约列表中")
+                self.local_rejections += 1
+            return result
+
+        rounded = round(float(size), asset["sz_decimals"])
+        result["size"] = rounded
+        if rounded != float(size):
+            result["warnings"].append(f"数量 {size} 按 {asset['sz_decimals']} 位小数取整为 {rounded}")
+        if leverage is not None and leverage > asset["max_leverage"]:
+            result["leverage"] = asset["max_leverage"]
+            result["warnings"].append(f"杠杆 {leverage}x 超过 {coin} 上限，调整为 {asset['max_leverage']}x")
+
+        error = None
+        if rounded <= 0:
+            error = f"数量 {size} 按 {asset['sz_decimals']} 位小数取整后为 0"
+        elif not reduce_only and asset["delisted"]:
+            error = f"{coin} 已下架，只能减仓"
+        elif not reduce_only and asset["at_oi_cap"]:
+            error = f"{coin} 持仓量已达上限（open interest cap），只能减仓"
+        elif not reduce_only:
+            px = price or asset["mark_px"]
+            if px and rounded * px < MIN_ORDER_VALUE:
+                error = f"订单价值 ${rounded * px:.2f} 低于交易所最小值 ${MIN_ORDER_VALUE:g}"
+
+        if error:
+            result.update(ok=False, error=error)
+            self.local_rejections += 1
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "assets": len(self._assets),
+                "refreshes": self.refreshes,
+                "api_requests": self.api_requests,
+                "local_rejections": self.local_rejections,
+            }
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+def validate_order(tools, coin: str, size: float, leverage: Optional[int] = None,
+                   reduce_only: bool = False) -> Optional[Dict]:
+    """
+    tools 有 asset_index 时做本地校验（格式同 AssetIndex.check_order），否则返回 None
+
+    Args:
+        tools: HyperliquidTools / AdvancedTradingTools
+    """
+    index: Optional[AssetIndex] = getattr(tools, "asset_index", None)
+    if index is None:
+        return None
+    check = index.check_order(coin, size, leverage=leverage, reduce_only=reduce_only)
+    if not check["ok"]:
+        logger.warning(f"⛔ 本地校验拒绝 {coin} 订单（未发送）: {check['error']}")
+    for warning in check["warnings"]:
+        logger.info(f"📐 {warning}")
+    return check
+
+
+def create_asset_index(config: Dict, info) -> Optional[AssetIndex]:
+    """
+    按 agent.asset_index 配置创建资产元数据索引并立即加载
+
+    {"enabled": true, "refresh_interval": 60}
+
+    Returns:
+        未启用时返回 None（下单前不做本地校验）
+    """
+    settings = config.get("agent", {}).get("asset_index", {})
+    if not settings.get("enabled", False):
+        return None
+    index = AssetIndex(info, refresh_interval=settings.get("refresh_interval", 60.0))
+    index.refresh(force=True)
+    return index
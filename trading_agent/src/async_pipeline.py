@@ -0,0 +1,343 @@
+"""
+异步 LangGraph 流水线
+fetch_market 和 get_account 是互不依赖的 I/O，作为并行分支同时执行（httpx 异步请求），
+在 llm_analysis / portfolio_analysis 之前汇合。每个节点的耗时单独统计。
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from langgraph.graph import START
+
+from src.advanced_nodes import DEFAULT_COINS, build_market_analysis, print_market_overview, scan_market
+from src.candle_store import INTERVAL_MS, page_ranges
+from src.nodes import get_account_status_node
+from src.transport import TokenBucket, request_weight, response_weight
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncInfoClient:
+    """
+    Hyperliquid /info 异步客户端
+
+    同一周期内相同请求并发调用时只发送一次（其余调用等待同一个结果）。
+    底层 httpx.AsyncClient 跨周期复用（连接池），需始终在同一个事件循环中使用。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 10.0,
+        name_to_coin: Optional[Dict[str, str]] = None,
+        limiter: Optional[TokenBucket] = None
+    ):
+        """
+        Args:
+            base_url: API 地址（同 Info.base_url）
+            timeout: 请求超时（秒）
+            name_to_coin: 币种名称映射（同 Info.name_to_coin），None 表示名称即币种
+            limiter: 与同步请求共用的限流器（HyperliquidTransport.limiter），None 表示不限流
+        """
+        self.base_url = base_url
+        self.timeout = timeout
+        self.name_to_coin = name_to_coin or {}
+        self.limiter = limiter
+        self.request_count = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def new_cycle(self):
+        """开始新周期：清空上一周期的请求结果"""
+        self._inflight.clear()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._inflight.clear()
+
+    async def post(self, payload: Dict) -> Any:
+        """POST /info；同一周期内相同 payload 合并为一次请求"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        key = json.dumps(payload, sort_keys=True)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._post(payload))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _post(self, payload: Dict) -> Any:
+        if self.limiter is not None:
+            wait = self.limiter.reserve(request_weight("/info", payload))
+            if wait > 0:
+                await asyncio.sleep(wait)
+        self.request_count += 1
+        response = await self._client.post("/info", json=payload)
+        response.raise_for_status()
+        result = response.json()
+        if self.limiter is not None:
+            self.limiter.charge(response_weight(payload, result))
+        return result
+
+    async def all_mids(self) -> Dict[str, str]:
+        return await self.post({"type": "allMids"})
+
+    async def user_state(self, address: str) -> Dict:
+        return await self.post({"type": "clearinghouseState", "user": address})
+
+    async def meta_and_asset_ctxs(self) -> Any:
+        return await self.post({"type": "metaAndAssetCtxs"})
+
+    async def candles_snapshot(self, coin: str, interval: str, start_time: int, end_time: int) -> List[Dict]:
+        req = {"coin": self.name_to_coin.get(coin, coin), "interval": interval,
+               "startTime": start_time, "endTime": end_time}
+        return await self.post({"type": "candleSnapshot", "req": req})
+
+
+def create_async_client(tools, timeout: float = 10.0) -> AsyncInfoClient:
+    """根据工具类的 Info 实例创建异步客户端（工具类接入了 transport 时共用其限流器）"""
+    transport = getattr(tools, "transport", None)
+    return AsyncInfoClient(
+        tools.info.base_url,
+        timeout=timeout,
+        name_to_coin=getattr(tools.info, "name_to_coin", None),
+        limiter=transport.limiter if transport is not None else None
+    )
+
+
+class AsyncGraphRunner:
+    """
+    在专用事件循环中运行异步状态机
+
+    同步的 run_once 通过 run() 调用；事件循环和 HTTP 客户端跨周期复用。
+    """
+
+    def __init__(self, tools, timeout: float = 10.0):
+        self.loop = asyncio.new_event_loop()
+        self.client = create_async_client(tools, timeout=timeout)
+
+    def run(self, graph, initial_state: Dict) -> Dict:
+        """运行一个周期（阻塞直到完成）"""
+        self.client.new_cycle()
+        return self.loop.run_until_complete(graph.ainvoke(initial_state))
+
+    def close(self):
+        self.loop.run_until_complete(self.client.aclose())
+        self.loop.close()
+
+
+class NodeTimer:
+    """
+    节点耗时统计 - 包装 LangGraph 节点（同步和异步都支持）
+
+    并行分支的耗时之和会大于周期总耗时，差值即并行节省的时间。
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+
+    def reset(self):
+        self.timings = {}
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        """包装节点函数，记录耗时"""
+        if asyncio.iscoroutinefunction(func):
+            async def async_node(state):
+                started = time.perf_counter()
+                try:
+                    return await func(state)
+                finally:
+                    self.timings[name] = time.perf_counter() - started
+            return async_node
+
+        def node(state):
+            started = time.perf_counter()
+            try:
+                return func(state)
+            finally:
+                self.timings[name] = time.perf_counter() - started
+        return node
+
+    def log_summary(self, total_seconds: float):
+        """输出各节点耗时"""
+        if not self.timings:
+            return
+        parts = " | ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.timings.items())
+        saved = sum(self.timings.values()) - total_seconds
+        logger.info(f"⏱️  节点耗时: {parts}")
+        if saved > 0.001:
+            logger.info(f"⏱️  周期总耗时 {total_seconds:.2f}s（并行节省 {saved:.2f}s）")
+        else:
+            logger.info(f"⏱️  周期总耗时 {total_seconds:.2f}s")
+
+
+def add_parallel_fetch(workflow, fetch_node: Callable, account_node: Callable, join: str):
+    """
+    添加并行分支: START → fetch_market / get_account → join
+
+    Args:
+        workflow: StateGraph
+        fetch_node: 异步行情节点
+        account_node: 异步账户节点
+        join: 汇合节点名称（如 "llm_analysis"）
+    """
+    workflow.add_node("fetch_market", fetch_node)
+    workflow.add_node("get_account", account_node)
+    workflow.add_edge(START, "fetch_market")
+    workflow.add_edge(START, "get_account")
+    workflow.add_edge(["fetch_market", "get_account"], join)
+
+
+# ===== 异步节点 =====
+# 并行分支必须只返回自己更新的字段，否则汇合时会与另一分支冲突
+
+async def _all_mids(snapshot, client: AsyncInfoClient) -> Dict[str, str]:
+    """中间价：优先实时行情，否则异步请求并写入快照（后续同步节点命中缓存）"""
+    if snapshot.live_state is not None:
+        mids = snapshot.live_state.get_mids(snapshot.live_max_age)
+        if mids:
+            return mids
+    mids = await client.all_mids()
+    snapshot.prime(("all_mids",), mids)
+    return mids
+
+
+async def async_fetch_market_node(state: Dict, tools, client: AsyncInfoClient) -> Dict:
+    """获取市场数据（fetch_market_data_node 的异步版本）"""
+    logger.info("📊 获取市场数据（异步）...")
+    await _all_mids(tools.snapshot, client)
+    prices = tools.get_all_prices()  # 命中快照缓存
+    return {
+        "current_prices": prices,
+        "timestamp": datetime.now().isoformat(),
+        "messages": [f"获取到 {len(prices)} 个币种价格"],
+    }
+
+
+async def async_get_account_node(state: Dict, tools, client: AsyncInfoClient) -> Dict:
+    """获取账户状态（get_account_status_node 的异步版本）"""
+    try:
+        user_state = await client.user_state(tools.address)
+        tools.snapshot.prime(("user_state", tools.address), user_state)
+    except Exception as e:
+        logger.error(f"异步获取账户状态失败: {e}")
+
+    # 数据已在快照中，复用同步节点的解析和输出
+    scratch = dict(state)
+    scratch["messages"] = []
+    result = get_account_status_node(scratch, tools)
+    return {
+        "account_value": result["account_value"],
+        "available_balance": result["available_balance"],
+        "positions": result["positions"],
+        "messages": result["messages"],
+    }
+
+
+async def async_fetch_advanced_market_node(
+    state: Dict,
+    advanced_tools,
+    client: AsyncInfoClient,
+    coins: Optional[List[str]] = None,
+    timeout: float = 10.0,
+    scanner=None
+) -> Dict:
+    """
+    获取增强的市场数据（fetch_advanced_market_data_node 的异步版本）
+
+    所有币种的K线并发请求，单个币种超时或失败不影响其他币种，指标统一批量计算。
+    有 CandleStore 时只请求本地未覆盖的部分（通常只剩最近一两根K线），其余从本地读取：
+    启用多周期时回看窗口是基础周期的数周（15m × 21 天约 2000 根），只有首个周期需要完整请求。
+    多周期由基础周期K线在本地聚合。
+    有扫描器时先扫描全市场确定币种池（账户状态请求与 get_account 分支合并为一次）。
+    """
+    logger.info("📊 获取高级市场数据（异步）...")
+    print("\n🔍 开始获取市场数据（异步）...")
+
+    coins = coins or DEFAULT_COINS
+    scan = None
+    if scanner is not None:
+        try:
+            meta_and_ctxs, user_state = await asyncio.gather(
+                client.meta_and_asset_ctxs(), client.user_state(advanced_tools.address)
+            )
+            advanced_tools.snapshot.prime(("meta_and_asset_ctxs",), meta_and_ctxs)
+            scan = scan_market(advanced_tools, scanner, meta_and_ctxs, list(coins), user_state)
+            coins = scan["candidates"]
+        except Exception as e:
+            logger.warning(f"市场扫描失败，只分析配置的币种: {e}")
+    # 多周期时请求基础周期K线（超过单次上限时分页并发），本地聚合出 1h 和其他周期
+    frames = advanced_tools.timeframes
+    interval = frames.base_interval if frames else "1h"
+    end_time = int(datetime.now().timestamp() * 1000)
+    start_time = int((datetime.now() - timedelta(hours=frames.lookback_hours if frames else 24)).timestamp() * 1000)
+
+    store = advanced_tools.candle_store
+
+    async def fetch_candles(coin: str) -> List[Dict]:
+        live = advanced_tools.snapshot.live_candles(coin, interval, start_time)
+        if live is not None:
+            return advanced_tools.format_candles(live)
+        # 有本地缓存时只请求未覆盖的时间段
+        ranges = store.missing_ranges(coin, interval, start_time, end_time) if store else [(start_time, end_time)]
+        requests = [page for gap_start, gap_end in ranges for page in page_ranges(interval, gap_start, gap_end)]
+        pages = await asyncio.wait_for(asyncio.gather(*(
+            client.candles_snapshot(coin, interval, page_start, page_end) for page_start, page_end in requests
+        )), timeout)
+        if store is None:
+            return advanced_tools.format_candles([candle for page in pages for candle in page])
+        for (page_start, page_end), page in zip(requests, pages):
+            store.save_page(coin, interval, page_start, page_end, page)
+        aligned = start_time - start_time % INTERVAL_MS[interval]
+        return advanced_tools.format_candles(store.load(coin, interval, aligned, end_time))
+
+    # K线请求与价格请求同时发出
+    candles_task = asyncio.gather(*(fetch_candles(coin) for coin in coins), return_exceptions=True)
+
+    try:
+        prices = await _all_mids(advanced_tools.snapshot, client)
+        print(f"   ✅ 成功获取 {len(prices)} 个币种价格")
+    except Exception as e:
+        print(f"   ❌ 获取价格数据失败: {e}")
+        logger.error(f"获取价格失败: {e}")
+        candles_task.cancel()
+        return {"current_prices": {}}
+
+    print_market_overview(prices)
+
+    print(f"\n   → 开始获取技术指标 ({len(coins)} 个币种, 异步并发)...")
+    fetched = await candles_task
+    candles_by_coin, errors = {}, {}
+    for coin, result in zip(coins, fetched):
+        if isinstance(result, asyncio.TimeoutError):
+            errors[coin] = f"超时 ({timeout:.1f}s)"
+        elif isinstance(result, Exception):
+            errors[coin] = str(result) or type(result).__name__
+        else:
+            candles_by_coin[coin] = result
+
+    timeframes_by_coin = None
+    if frames:
+        split = {coin: frames.split(candles, now_ms=end_time) for coin, candles in candles_by_coin.items()}
+        candles_by_coin = {coin: primary for coin, (primary, _) in split.items()}
+        timeframes_by_coin = {coin: by_interval for coin, (_, by_interval) in split.items()}
+    indicators_by_coin = advanced_tools.batch_calculate_technical_indicators(candles_by_coin, timeframes_by_coin)
+    market_analysis = build_market_analysis(
+        advanced_tools, coins, candles_by_coin, indicators_by_coin, errors
+    )
+    print("=" * 70 + "\n")
+
+    result = {
+        "current_prices": prices,
+        "market_analysis_data": market_analysis,
+        "messages": [f"获取到 {len(prices)} 个币种价格和技术分析"],
+    }
+    if scan is not None:
+        result["market_scan"] = scan
+    return result
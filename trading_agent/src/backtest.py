@@ -0,0 +1,1000 @@
+"""
+回测引擎 - 用本地存储的K线回放行情
+
+两条路径:
+- Agent 回测: SimulatedInfo / SimulatedExchange 替换真实接口，逐根K线驱动
+  TradingAgent / PortfolioTradingAgent 的决策（LLM 照常调用）
+- 规则快速回测: analyze_market_condition 的评分规则用 NumPy 对 (币种 × K线)
+  矩阵一次性计算，一年 1h K线 × 几十个币种几秒内完成
+
+两者输出相同格式的 BacktestResult: 权益曲线、成交记录、逐笔交易盈亏。
+"""
+import logging
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.advanced_tools import DEFAULT_SCORING
+from src.candle_store import INTERVAL_MS
+from src.indicators import (
+    CHANGE_LOOKBACK,
+    EMA_PERIOD,
+    MIN_CANDLES,
+    RSI_PERIOD,
+    SMA_PERIOD,
+    _ema_weights,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKTEST_ADDRESS = "0x000000000000000000000000000000000000b4c7"
+TAKER_FEE = 0.00045  # Hyperliquid 基础吃单费率
+DEFAULT_WINDOW = 24  # analyze_market_condition 使用最近 24 根 1h K线
+
+
+# ===== 历史行情 =====
+
+class HistoricalMarket:
+    """
+    对齐后的历史K线矩阵
+
+    所有币种共用同一时间轴（各币种K线时间的并集），形状为 (币种数, K线数)。
+    上市前的K线为 NaN；上市后缺失的K线用前一根收盘价补齐。
+    """
+
+    def __init__(
+        self,
+        coins: List[str],
+        times: np.ndarray,
+        opens: np.ndarray,
+        highs: np.ndarray,
+        lows: np.ndarray,
+        closes: np.ndarray,
+        volumes: Optional[np.ndarray] = None,
+        interval: str = "1h"
+    ):
+        """
+        Args:
+            coins: 币种列表（行）
+            times: K线开盘时间（毫秒），形状 (K线数,)
+            opens / highs / lows / closes / volumes: 形状 (币种数, K线数)
+            interval: K线周期
+        """
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"不支持的K线周期: {interval}")
+        self.coins = list(coins)
+        self.rows = {coin: row for row, coin in enumerate(self.coins)}
+        self.interval = interval
+        self.step = INTERVAL_MS[interval]
+        self.times = np.asarray(times, dtype=np.int64)
+
+        closes = np.asarray(closes, dtype=np.float64)
+        # 上市后的缺口用前一根收盘价补齐
+        valid = ~np.isnan(closes)
+        index = np.where(valid, np.arange(closes.shape[1]), 0)
+        np.maximum.accumulate(index, axis=1, out=index)
+        filled = np.take_along_axis(closes, index, axis=1)
+        gaps = ~valid & ~np.isnan(filled)
+
+        def fill(values):
+            values = np.array(values, dtype=np.float64)
+            values[gaps] = filled[gaps]
+            return values
+
+        self.close = filled
+        self.open = fill(opens)
+        self.high = fill(highs)
+        self.low = fill(lows)
+        self.volume = np.nan_to_num(np.asarray(volumes, dtype=np.float64)) if volumes is not None \
+            else np.zeros_like(filled)
+
+    @classmethod
+    def from_candles(cls, candles_by_coin: Dict[str, List[Dict]], interval: str = "1h") -> "HistoricalMarket":
+        """
+        由 candles_snapshot 原始格式的K线构建
+
+        Args:
+            candles_by_coin: {币种: [{"t", "o", "h", "l", "c", "v", ...}, ...]}
+        """
+        coins = [coin for coin, candles in candles_by_coin.items() if candles]
+        times = np.unique(np.concatenate([
+            np.array([int(c["t"]) for c in candles_by_coin[coin]], dtype=np.int64) for coin in coins
+        ])) if coins else np.zeros(0, dtype=np.int64)
+
+        shape = (len(coins), len(times))
+        arrays = {key: np.full(shape, np.nan) for key in "ohlcv"}
+        for row, coin in enumerate(coins):
+            candles = candles_by_coin[coin]
+            cols = np.searchsorted(times, [int(c["t"]) for c in candles])
+            for key in "ohlcv":
+                arrays[key][row, cols] = [float(c.get(key, 0)) for c in candles]
+
+        return cls(coins, times, arrays["o"], arrays["h"], arrays["l"], arrays["c"], arrays["v"], interval)
+
+    @property
+    def bars(self) -> int:
+        return len(self.times)
+
+    def close_time(self, index: int) -> int:
+        """第 index 根K线收盘时间（该K线数据完整可用的时刻）"""
+        return int(self.times[index]) + self.step
+
+    def raw_candles(self, coin: str, start: int, end: int) -> List[Dict]:
+        """第 [start, end] 根K线（candles_snapshot 原始格式，跳过上市前的K线）"""
+        row = self.rows[coin]
+        candles = []
+        for i in range(max(start, 0), end + 1):
+            close = self.close[row, i]
+            if math.isnan(close):
+                continue
+            t = int(self.times[i])
+            candles.append({
+                "t": t, "T": t + self.step - 1, "s": coin, "i": self.interval,
+                "o": str(self.open[row, i]), "h": str(self.high[row, i]),
+                "l": str(self.low[row, i]), "c": str(close),
+                "v": str(self.volume[row, i]), "n": 0,
+            })
+        return candles
+
+
+def load_history(
+    candle_store,
+    coins: Optional[List[str]] = None,
+    interval: str = "1h",
+    start_time: int = 0,
+    end_time: Optional[int] = None
+) -> HistoricalMarket:
+    """
+    从本地K线缓存加载回测数据（不请求交易所）
+
+    Args:
+        candle_store: CandleStore 实例
+        coins: 币种列表，None 表示缓存中该周期的全部币种
+        interval: K线周期
+        start_time / end_time: 时间范围（毫秒）
+    """
+    coins = coins or candle_store.coins(interval)
+    candles_by_coin = {coin: candle_store.load(coin, interval, start_time, end_time) for coin in coins}
+    missing = [coin for coin, candles in candles_by_coin.items() if not candles]
+    if missing:
+        logger.warning(f"⚠️ 本地缓存中没有以下币种的 {interval} K线: {missing}")
+    market = HistoricalMarket.from_candles(candles_by_coin, interval)
+    logger.info(f"📚 回测数据: {len(market.coins)} 个币种 × {market.bars} 根 {interval} K线")
+    return market
+
+
+# ===== 模拟交易所 =====
+
+class SimulatedExchange:
+    """
+    模拟交易所（接口同 hyperliquid.exchange.Exchange 中 Agent 用到的部分）
+
+    - 市价单/可成交的 IoC 单在当前K线收盘价成交，加上滑点并收取吃单手续费
+    - 挂单和止盈止损触发单在之后的K线中按最高/最低价撮合
+      （同一根K线同时触发止盈和止损时，保守地按止损处理）
+    - 全仓保证金: 账户价值 = 余额 + 未实现盈亏，开仓需要足够的可用保证金
+    """
+
+    def __init__(
+        self,
+        market: HistoricalMarket,
+        initial_capital: float = 1000.0,
+        fee_rate: float = TAKER_FEE,
+        slippage_bps: float = 2.0
+    ):
+        self.market = market
+        self.initial_capital = initial_capital
+        self.fee_rate = fee_rate
+        self.slippage_bps = slippage_bps
+
+        self.index = 0
+        self.cash = initial_capital
+        self.positions: Dict[str, Dict] = {}  # {币种: {"szi", "entry_px"}}
+        self.leverage: Dict[str, tuple] = {}  # {币种: (杠杆, 是否全仓)}
+        self.orders: Dict[int, Dict] = {}  # 未成交订单
+        self.fills: List[Dict] = []
+        self.trades: List[Dict] = []  # 已完成的交易
+        self.open_trades: Dict[str, Dict] = {}
+        self.total_fees = 0.0
+        self._next_oid = 1
+        self._next_tid = 1
+
+    # ===== 时钟与行情 =====
+
+    @property
+    def now(self) -> int:
+        """当前模拟时间（当前K线收盘时刻，毫秒）"""
+        return self.market.close_time(self.index)
+
+    def mid(self, coin: str) -> Optional[float]:
+        row = self.market.rows.get(coin)
+        if row is None:
+            return None
+        price = self.market.close[row, self.index]
+        return None if math.isnan(price) else float(price)
+
+    def advance(self, index: int):
+        """推进到第 index 根K线：用该K线的最高/最低价撮合挂单和触发单"""
+        self.index = index
+        # 止损优先于止盈和普通挂单
+        pending = sorted(self.orders.values(), key=lambda o: (o.get("tpsl") != "sl", o["oid"]))
+        for order in pending:
+            if order["oid"] not in self.orders:
+                continue
+            row = self.market.rows[order["coin"]]
+            high, low = self.market.high[row, index], self.market.low[row, index]
+            if math.isnan(high) or math.isnan(low):
+                continue
+            price = self._match_price(order, high, low)
+            if price is None:
+                continue
+            del self.orders[order["oid"]]
+            size = order["sz"]
+            if order["reduce_only"]:
+                size = self._reducible(order["coin"], order["is_buy"], size)
+                if size <= 0:
+                    continue
+            self._fill(order["coin"], order["is_buy"], size, price, order["oid"], crossed=order["trigger"])
+
+    def _match_price(self, order: Dict, high: float, low: float) -> Optional[float]:
+        px, is_buy = order["limit_px"], order["is_buy"]
+        if not order["trigger"]:
+            if is_buy and low <= px:
+                return px
+            if not is_buy and high >= px:
+                return px
+            return None
+        trigger = order["trigger_px"]
+        # 买入触发单平空: 止盈在价格下跌时触发，止损在价格上涨时触发；卖出相反
+        falls_to = low <= trigger
+        rises_to = high >= trigger
+        if order["tpsl"] == "tp":
+            hit = falls_to if is_buy else rises_to
+        else:
+            hit = rises_to if is_buy else falls_to
+        if not hit:
+            return None
+        return self._with_slippage(trigger, is_buy)
+
+    def _with_slippage(self, price: float, is_buy: bool) -> float:
+        return price * (1 + self.slippage_bps / 10000 if is_buy else 1 - self.slippage_bps / 10000)
+
+    # ===== 账户 =====
+
+    def _leverage(self, coin: str) -> tuple:
+        return self.leverage.get(coin, (1, True))
+
+    def account(self) -> Dict:
+        """账户汇总 {"account_value", "total_ntl_pos", "total_margin_used", "withdrawable"}"""
+        upnl = ntl = margin = 0.0
+        for coin, position in self.positions.items():
+            px = self.mid(coin) or position["entry_px"]
+            value = abs(position["szi"]) * px
+            upnl += position["szi"] * (px - position["entry_px"])
+            ntl += value
+            margin += value / self._leverage(coin)[0]
+        account_value = self.cash + upnl
+        return {
+            "account_value": account_value,
+            "total_ntl_pos": ntl,
+            "total_margin_used": margin,
+            "withdrawable": max(account_value - margin, 0.0),
+        }
+
+    def equity(self) -> float:
+        return self.account()["account_value"]
+
+    def user_state(self) -> Dict:
+        """格式同 info.user_state"""
+        summary = self.account()
+        asset_positions = []
+        for coin, position in self.positions.items():
+            px = self.mid(coin) or position["entry_px"]
+            leverage, is_cross = self._leverage(coin)
+            value = abs(position["szi"]) * px
+            upnl = position["szi"] * (px - position["entry_px"])
+            margin = value / leverage
+            asset_positions.append({
+                "type": "oneWay",
+                "position": {
+                    "coin": coin,
+                    "szi": str(position["szi"]),
+                    "entryPx": str(position["entry_px"]),
+                    "positionValue": str(value),
+                    "unrealizedPnl": str(upnl),
+                    "returnOnEquity": str(upnl / margin if margin else 0.0),
+                    "leverage": {"type": "cross" if is_cross else "isolated", "value": leverage},
+                    "liquidationPx": None,
+                    "marginUsed": str(margin),
+                    "maxLeverage": 50,
+                },
+            })
+        margin_summary = {
+            "accountValue": str(summary["account_value"]),
+            "totalNtlPos": str(summary["total_ntl_pos"]),
+            "totalRawUsd": str(self.cash),
+            "totalMarginUsed": str(summary["total_margin_used"]),
+        }
+        return {
+            "marginSummary": margin_summary,
+            "crossMarginSummary": dict(margin_summary),
+            "withdrawable": str(summary["withdrawable"]),
+            "assetPositions": asset_positions,
+            "time": self.now,
+        }
+
+    def open_orders(self) -> List[Dict]:
+        """格式同 info.open_orders"""
+        return [
+            {"coin": o["coin"], "oid": o["oid"], "side": "B" if o["is_buy"] else "A",
+             "limitPx": str(o["limit_px"]), "sz": str(o["sz"]), "timestamp": o["timestamp"],
+             "reduceOnly": o["reduce_only"], "isTrigger": o["trigger"]}
+            for o in self.orders.values()
+        ]
+
+    # ===== 下单接口 =====
+
+    def _slippage_price(self, name: str, is_buy: bool, slippage: float, px: Optional[float] = None, cloid=None) -> float:
+        px = px or self.mid(name) or 0.0
+        return round(px * (1 + slippage if is_buy else 1 - slippage), 6)
+
+    def update_leverage(self, leverage: int, name: str, is_cross: bool = True) -> Dict:
+        self.leverage[name] = (int(leverage), is_cross)
+        return {"status": "ok", "response": {"type": "default"}}
+
+    def update_isolated_margin(self, amount: float, name: str) -> Dict:
+        return {"status": "ok", "response": {"type": "default"}}
+
+    def order(self, name: str, is_buy: bool, sz: float, limit_px: float, order_type: Dict,
+              reduce_only: bool = False, cloid=None, builder=None) -> Dict:
+        return self.bulk_orders([{
+            "coin": name, "is_buy": is_buy, "sz": sz, "limit_px": limit_px,
+            "order_type": order_type, "reduce_only": reduce_only,
+        }])
+
+    def bulk_orders(self, order_requests: List[Dict], builder=None, grouping: str = "na") -> Dict:
+        statuses = []
+        for request in order_requests:
+            # 订单组的入场单失败时，止盈止损单一并拒绝
+            if grouping != "na" and statuses and "error" in statuses[0]:
+                statuses.append({"error": "订单组入场单失败"})
+                continue
+            statuses.append(self._place(request))
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def market_open(self, name: str, is_buy: bool, sz: float, px: Optional[float] = None,
+                    slippage: float = 0.05, cloid=None, builder=None) -> Dict:
+        limit_px = self._slippage_price(name, is_buy, slippage, px)
+        return self.order(name, is_buy, sz, limit_px, {"limit": {"tif": "Ioc"}})
+
+    def market_close(self, coin: str, sz: Optional[float] = None, px: Optional[float] = None,
+                     slippage: float = 0.05, cloid=None, builder=None) -> Dict:
+        position = self.positions.get(coin)
+        if position is None:
+            return {"status": "err", "response": f"没有 {coin} 持仓"}
+        is_buy = position["szi"] < 0
+        size = sz or abs(position["szi"])
+        limit_px = self._slippage_price(coin, is_buy, slippage, px)
+        return self.order(coin, is_buy, size, limit_px, {"limit": {"tif": "Ioc"}}, reduce_only=True)
+
+    def cancel(self, name: str, oid: int) -> Dict:
+        return self.bulk_cancel([{"coin": name, "oid": oid}])
+
+    def bulk_cancel(self, cancel_requests: List[Dict]) -> Dict:
+        statuses = []
+        for request in cancel_requests:
+            if self.orders.pop(request["oid"], None) is not None:
+                statuses.append("success")
+            else:
+                statuses.append({"error": "Order was never placed, already canceled, or filled."})
+        return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": statuses}}}
+
+    # ===== 撮合 =====
+
+    def _place(self, request: Dict) -> Dict:
+        coin, is_buy = request["coin"], request["is_buy"]
+        size, limit_px = float(request["sz"]), float(request["limit_px"])
+        mid = self.mid(coin)
+        if mid is None:
+            return {"error": f"{coin} 在 {self.now} 没有行情数据"}
+        if size <= 0:
+            return {"error": "Order has zero size."}
+
+        order_type = request.get("order_type", {"limit": {"tif": "Gtc"}})
+        reduce_only = request.get("reduce_only", False)
+        oid = self._next_oid
+        self._next_oid += 1
+
+        if "trigger" in order_type:
+            trigger = order_type["trigger"]
+            self.orders[oid] = {
+                "oid": oid, "coin": coin, "is_buy": is_buy, "sz": size, "limit_px": limit_px,
+                "reduce_only": reduce_only, "trigger": True, "tpsl": trigger.get("tpsl", "sl"),
+                "trigger_px": float(trigger["triggerPx"]), "timestamp": self.now,
+            }
+            return {"resting": {"oid": oid}}
+
+        if reduce_only:
+            size = self._reducible(coin, is_buy, size)
+            if size <= 0:
+                return {"error": "Reduce only order would increase position."}
+
+        fill_px = self._with_slippage(mid, is_buy)
+        marketable = fill_px <= limit_px if is_buy else fill_px >= limit_px
+        tif = order_type.get("limit", {}).get("tif", "Gtc")
+
+        if not marketable:
+            if tif == "Ioc":
+                return {"error": "Order could not immediately match against any resting orders."}
+            self.orders[oid] = {
+                "oid": oid, "coin": coin, "is_buy": is_buy, "sz": size, "limit_px": limit_px,
+                "reduce_only": reduce_only, "trigger": False, "timestamp": self.now,
+            }
+            return {"resting": {"oid": oid}}
+
+        if not reduce_only and not self._has_margin(coin, is_buy, size, fill_px):
+            return {"error": "Insufficient margin to place order."}
+        self._fill(coin, is_buy, size, fill_px, oid, crossed=True)
+        return {"filled": {"totalSz": str(size), "avgPx": str(fill_px), "oid": oid}}
+
+    def _reducible(self, coin: str, is_buy: bool, size: float) -> float:
+        """减仓单最多可成交的数量"""
+        szi = self.positions.get(coin, {}).get("szi", 0.0)
+        if szi == 0 or (szi > 0) == is_buy:
+            return 0.0
+        return min(size, abs(szi))
+
+    def _has_margin(self, coin: str, is_buy: bool, size: float, px: float) -> bool:
+        szi = self.positions.get(coin, {}).get("szi", 0.0)
+        new_szi = szi + (size if is_buy else -size)
+        added = (abs(new_szi) - abs(szi)) * px
+        if added <= 0:
+            return True
+        return added / self._leverage(coin)[0] <= self.account()["withdrawable"] + 1e-9
+
+    def _fill(self, coin: str, is_buy: bool, size: float, px: float, oid: int, crossed: bool):
+        """成交: 更新持仓、余额、成交记录和交易记录"""
+        position = self.positions.get(coin, {"szi": 0.0, "entry_px": px})
+        start = position["szi"]
+        signed = size if is_buy else -size
+        new = start + signed
+        if abs(new) < 1e-12:
+            new = 0.0
+        fee = size * px * self.fee_rate
+
+        closed = 0.0
+        closed_pnl = 0.0
+        if start != 0 and (start > 0) != is_buy:
+            closed = min(size, abs(start))
+            closed_pnl = closed * (px - position["entry_px"]) * (1 if start > 0 else -1)
+
+        if new == 0:
+            self.positions.pop(coin, None)
+        elif start == 0 or (start > 0) != (new > 0):
+            self.positions[coin] = {"szi": new, "entry_px": px}
+        elif abs(new) > abs(start):
+            entry = (abs(start) * position["entry_px"] + size * px) / abs(new)
+            self.positions[coin] = {"szi": new, "entry_px": entry}
+        else:
+            self.positions[coin] = {"szi": new, "entry_px": position["entry_px"]}
+
+        self.cash += closed_pnl - fee
+        self.total_fees += fee
+
+        if start == 0:
+            direction = "Open Long" if is_buy else "Open Short"
+        elif new != 0 and (start > 0) != (new > 0):
+            direction = "Short > Long" if is_buy else "Long > Short"
+        elif (start > 0) == is_buy:
+            direction = "Open Long" if is_buy else "Open Short"
+        else:
+            direction = "Close Short" if is_buy else "Close Long"
+
+        tid = self._next_tid
+        self._next_tid += 1
+        self.fills.append({
+            "coin": coin, "px": str(px), "sz": str(size), "side": "B" if is_buy else "A",
+            "time": self.now, "startPosition": str(start), "dir": direction,
+            "closedPnl": str(closed_pnl), "hash": f"0x{tid:064x}", "oid": oid,
+            "crossed": crossed, "fee": str(fee), "tid": tid,
+        })
+        self._record_trade(coin, start, new, size, closed, closed_pnl, px, fee)
+
+        # 持仓归零后撤销该币种的减仓单（止盈止损）
+        if new == 0:
+            for stale in [o for o in self.orders.values() if o["coin"] == coin and o["reduce_only"]]:
+                del self.orders[stale["oid"]]
+
+    def _record_trade(self, coin, start, new, size, closed, closed_pnl, px, fee):
+        """逐笔交易记录: 从开仓到仓位归零（或反手）算一笔"""
+        trade = self.open_trades.get(coin)
+        opened = size - closed
+        close_fee = fee * closed / size if size else 0.0
+        if trade is not None and closed > 0:
+            trade["pnl"] += closed_pnl - close_fee
+            trade["fees"] += close_fee
+            if new == 0 or (start > 0) != (new > 0):
+                trade.update(exit_time=self.now, exit_price=px, bars=self._bars_since(trade["entry_time"]))
+                self.trades.append(trade)
+                del self.open_trades[coin]
+                trade = None
+        if opened > 1e-12:
+            open_fee = fee - close_fee
+            if trade is None:
+                self.open_trades[coin] = {
+                    "coin": coin, "side": "long" if new > 0 else "short",
+                    "entry_time": self.now, "entry_price": px, "size": opened,
+                    "exit_time": None, "exit_price": None, "pnl": -open_fee, "fees": open_fee, "bars": 0,
+                }
+            else:
+                trade["entry_price"] = (trade["size"] * trade["entry_price"] + opened * px) / (trade["size"] + opened)
+                trade["size"] += opened
+                trade["pnl"] -= open_fee
+                trade["fees"] += open_fee
+
+    def _bars_since(self, time_ms: int) -> int:
+        return int((self.now - time_ms) // self.market.step)
+
+    def all_trades(self) -> List[Dict]:
+        """已完成的交易 + 未平仓交易（按当前价格计算浮动盈亏）"""
+        trades = list(self.trades)
+        for coin, trade in self.open_trades.items():
+            position = self.positions.get(coin)
+            px = self.mid(coin)
+            if position is None or px is None:
+                continue
+            open_trade = dict(trade)
+            open_trade.update(
+                exit_price=px, bars=self._bars_since(trade["entry_time"]), open=True,
+                pnl=trade["pnl"] + position["szi"] * (px - position["entry_px"]),
+            )
+            trades.append(open_trade)
+        return trades
+
+
+class SimulatedInfo:
+    """
+    模拟 Info（接口同 hyperliquid.info.Info 中 Agent 用到的部分）
+
+    只返回当前模拟时间之前的数据。工具类按真实时钟计算的K线时间窗口
+    （如最近 24 小时）会整体平移到模拟时间，窗口长度不变。
+    """
+
+    def __init__(self, exchange: SimulatedExchange):
+        self.exchange = exchange
+        self.market = exchange.market
+        self.base_url = None
+        self.name_to_coin = {coin: coin for coin in self.market.coins}
+
+    def all_mids(self) -> Dict[str, str]:
+        closes = self.market.close[:, self.exchange.index]
+        return {coin: str(closes[row]) for coin, row in self.market.rows.items() if not math.isnan(closes[row])}
+
+    def user_state(self, address: str) -> Dict:
+        return self.exchange.user_state()
+
+    def open_orders(self, address: str) -> List[Dict]:
+        return self.exchange.open_orders()
+
+    def frontend_open_orders(self, address: str) -> List[Dict]:
+        return self.exchange.open_orders()
+
+    def meta(self) -> Dict:
+        return {"universe": [{"name": coin, "szDecimals": 4, "maxLeverage": 50} for coin in self.market.coins]}
+
+    def candles_snapshot(self, name: str, interval: str, startTime: int, endTime: int) -> List[Dict]:
+        if interval != self.market.interval:
+            raise ValueError(f"回测数据周期为 {self.market.interval}，不支持 {interval}")
+        if name not in self.market.rows:
+            return []
+        now = self.exchange.now
+        if endTime > now:
+            startTime -= endTime - now
+            endTime = now
+        times = self.market.times
+        first = int(np.searchsorted(times, startTime, side="left"))
+        last = min(int(np.searchsorted(times, endTime, side="right")) - 1, self.exchange.index)
+        return self.market.raw_candles(name, first, last)
+
+    def l2_snapshot(self, name: str) -> Dict:
+        """合成订单簿: 中间价两侧各一档（价差 = 滑点），深度足够大"""
+        mid = self.exchange.mid(name)
+        if mid is None:
+            return {"coin": name, "time": self.exchange.now, "levels": [[], []]}
+        half = mid * self.exchange.slippage_bps / 10000
+        return {
+            "coin": name, "time": self.exchange.now,
+            "levels": [
+                [{"px": str(mid - half), "sz": "1000000", "n": 1}],
+                [{"px": str(mid + half), "sz": "1000000", "n": 1}],
+            ],
+        }
+
+    def user_fills(self, address: str) -> List[Dict]:
+        return list(reversed(self.exchange.fills))
+
+    def user_fills_by_time(self, address: str, start_time: int, end_time: Optional[int] = None,
+                           aggregate_by_time: bool = False) -> List[Dict]:
+        return [
+            f for f in self.exchange.fills
+            if f["time"] >= start_time and (end_time is None or f["time"] <= end_time)
+        ]
+
+
+# ===== 回测结果 =====
+
+class BacktestResult:
+    """回测结果: 权益曲线、成交记录、逐笔交易盈亏"""
+
+    def __init__(
+        self,
+        times: np.ndarray,
+        equity: np.ndarray,
+        fills: List[Dict],
+        trades: List[Dict],
+        initial_capital: float,
+        step: int,
+        total_fees: float = 0.0
+    ):
+        self.times = np.asarray(times, dtype=np.int64)
+        self.equity = np.asarray(equity, dtype=np.float64)
+        self.fills = fills
+        self.trades = trades
+        self.initial_capital = initial_capital
+        self.step = step
+        self.total_fees = total_fees
+
+    def summary(self) -> Dict:
+        """
+        汇总指标
+
+        Returns:
+            {"final_equity", "total_return_pct", "max_drawdown_pct", "sharpe",
+             "fills", "trades", "win_rate", "total_fees"}
+        """
+        final = float(self.equity[-1]) if len(self.equity) else self.initial_capital
+        peak = np.maximum.accumulate(self.equity) if len(self.equity) else np.zeros(0)
+        drawdown = float(((peak - self.equity) / peak).max()) if len(peak) else 0.0
+
+        returns = np.diff(self.equity) / self.equity[:-1] if len(self.equity) > 1 else np.zeros(0)
+        bars_per_year = 365 * 86_400_000 / self.step
+        std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+        sharpe = float(returns.mean() / std * math.sqrt(bars_per_year)) if std > 0 else 0.0
+
+        closed = [t for t in self.trades if not t.get("open")]
+        wins = sum(1 for t in closed if t["pnl"] > 0)
+        return {
+            "final_equity": final,
+            "total_return_pct": (final / self.initial_capital - 1) * 100,
+            "max_drawdown_pct": drawdown * 100,
+            "sharpe": sharpe,
+            "fills": len(self.fills),
+            "trades": len(closed),
+            "win_rate": wins / len(closed) if closed else 0.0,
+            "total_fees": self.total_fees,
+        }
+
+    def to_dict(self) -> Dict:
+        """可序列化为 JSON 的完整结果"""
+        return {
+            "summary": self.summary(),
+            "equity_curve": [[int(t), float(v)] for t, v in zip(self.times, self.equity)],
+            "fills": self.fills,
+            "trades": self.trades,
+        }
+
+    def print_summary(self, title: str = "回测结果"):
+        s = self.summary()
+        print("\n" + "=" * 70)
+        print(f"📈 {title}")
+        print("=" * 70)
+        print(f"初始资金:     ${self.initial_capital:,.2f}")
+        print(f"最终权益:     ${s['final_equity']:,.2f} ({s['total_return_pct']:+.2f}%)")
+        print(f"最大回撤:     {s['max_drawdown_pct']:.2f}%")
+        print(f"夏普比率:     {s['sharpe']:.2f}")
+        print(f"成交笔数:     {s['fills']}")
+        print(f"交易笔数:     {s['trades']} (胜率 {s['win_rate'] * 100:.1f}%)")
+        print(f"手续费:       ${s['total_fees']:,.2f}")
+        print("=" * 70 + "\n")
+
+
+# ===== Agent 回测 =====
+
+class Backtester:
+    """
+    逐根K线驱动 Agent 决策
+
+    用法:
+        backtester = Backtester(market)
+        tools = HyperliquidTools(backtester.info, backtester.exchange, backtester.address)
+        agent = TradingAgent(tools, risk_manager, llm_client, prompt, dry_run=False)
+        result = backtester.run(agent.run_once, every=4)
+
+    Agent 必须以 dry_run=False 运行（订单发往模拟交易所），且不要使用 CandleStore、
+    WebSocket 行情和异步流水线（它们会绕过模拟接口）。
+    """
+
+    def __init__(
+        self,
+        market: HistoricalMarket,
+        initial_capital: float = 1000.0,
+        fee_rate: float = TAKER_FEE,
+        slippage_bps: float = 2.0,
+        address: str = BACKTEST_ADDRESS
+    ):
+        self.market = market
+        self.address = address
+        self.exchange = SimulatedExchange(market, initial_capital, fee_rate, slippage_bps)
+        self.info = SimulatedInfo(self.exchange)
+
+    def run(
+        self,
+        step: Callable[[], Any],
+        every: int = 1,
+        warmup: int = DEFAULT_WINDOW,
+        start: Optional[int] = None,
+        end: Optional[int] = None
+    ) -> BacktestResult:
+        """
+        回放K线
+
+        每根K线: 先用该K线撮合挂单/触发单，再（每 every 根）在收盘时调用 step()，最后记录权益。
+
+        Args:
+            step: 一次决策（如 agent.run_once）
+            every: 每隔多少根K线决策一次
+            warmup: 第一次决策前需要的K线数量
+            start / end: K线下标范围（默认全部）
+        """
+        first = max(start if start is not None else 0, warmup - 1)
+        last = min(end if end is not None else self.market.bars - 1, self.market.bars - 1)
+        if first > last:
+            raise ValueError(f"K线数量不足: {self.market.bars} 根，需要至少 {warmup} 根")
+
+        decisions = 0
+        equity = np.zeros(last - first + 1)
+        for k, index in enumerate(range(first, last + 1)):
+            self.exchange.advance(index)
+            if k % every == 0:
+                try:
+                    step()
+                except Exception as e:
+                    logger.error(f"第 {index} 根K线决策失败: {e}")
+                decisions += 1
+            equity[k] = self.exchange.equity()
+
+        logger.info(f"✅ 回测完成: {last - first + 1} 根K线, {decisions} 次决策, {len(self.exchange.fills)} 笔成交")
+        return BacktestResult(
+            self.market.times[first:last + 1] + self.market.step,
+            equity,
+            list(self.exchange.fills),
+            self.exchange.all_trades(),
+            self.exchange.initial_capital,
+            self.market.step,
+            self.exchange.total_fees,
+        )
+
+
+# ===== 规则快速回测（NumPy） =====
+
+def rule_indicators(closes: np.ndarray, window: int = DEFAULT_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    评分用到的指标矩阵（与评分参数无关，参数寻优时只需计算一次）
+
+    第 i 根K线的指标只使用第 i-window+1..i 根K线（与 Agent 在该K线收盘时看到的数据一致），
+    并与逐个币种计算时一样保留两位小数。
+
+    Args:
+        closes: 收盘价矩阵 (币种数, K线数)
+        window: 每次评分使用的K线数量（>= 20）
+
+    Returns:
+        {"sma_20", "ema_12", "rsi_14", "price_change_24h": (币种数, K线数) 数组,
+         "valid": 数据完整的位置}
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    coins, bars = closes.shape
+    result = {key: np.full((coins, bars), np.nan) for key in ("sma_20", "ema_12", "rsi_14", "price_change_24h")}
+    result["valid"] = np.zeros((coins, bars), dtype=bool)
+    if window < MIN_CANDLES or bars < window:
+        return result
+
+    windows = sliding_window_view(closes, window, axis=1)  # (币种数, K线数-window+1, window)
+    sma = windows[..., -SMA_PERIOD:].mean(axis=-1)
+    ema = windows @ _ema_weights(window, EMA_PERIOD)
+    changes = np.diff(windows[..., -(RSI_PERIOD + 1):], axis=-1)
+    avg_gain = np.clip(changes, 0, None).mean(axis=-1)
+    avg_loss = np.clip(-changes, 0, None).mean(axis=-1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+        base = windows[..., -CHANGE_LOOKBACK] if window >= CHANGE_LOOKBACK else windows[..., 0]
+        change = (windows[..., -1] - base) / base * 100
+
+    for key, values in (("sma_20", sma), ("ema_12", ema), ("rsi_14", rsi), ("price_change_24h", change)):
+        result[key][:, window - 1:] = np.round(values, 2)
+    result["valid"][:, window - 1:] = ~np.isnan(windows).any(axis=-1)
+    return result
+
+
+def score_indicators(indicators: Dict[str, np.ndarray], scoring: Optional[Dict] = None) -> np.ndarray:
+    """
+    按评分规则计算分数（规则同 analyze_market_condition）
+
+    Args:
+        indicators: rule_indicators 的返回值
+        scoring: 评分参数（缺省项使用 DEFAULT_SCORING）
+
+    Returns:
+        分数矩阵 (币种数, K线数)，数据不足的位置为 NaN
+    """
+    rules = {**DEFAULT_SCORING, **(scoring or {})}
+    rsi, change = indicators["rsi_14"], indicators["price_change_24h"]
+    ema, sma = indicators["ema_12"], indicators["sma_20"]
+
+    with np.errstate(invalid="ignore"):
+        score = np.full(rsi.shape, 50.0)
+        score += np.where((rsi != 0) & (rsi < rules["rsi_low"]), rules["rsi_weight"], 0)
+        score -= np.where((rsi != 0) & ~(rsi < rules["rsi_low"]) & (rsi > rules["rsi_high"]), rules["rsi_weight"], 0)
+        score += np.where(change > rules["change_pct"], rules["change_weight"], 0)
+        score -= np.where(~(change > rules["change_pct"]) & (change < -rules["change_pct"]), rules["change_weight"], 0)
+        score += np.where((ema != 0) & (sma != 0), np.where(ema > sma, rules["trend_weight"], -rules["trend_weight"]), 0)
+    score[~indicators["valid"]] = np.nan
+    return score
+
+
+def rule_scores(closes: np.ndarray, window: int = DEFAULT_WINDOW, scoring: Optional[Dict] = None) -> np.ndarray:
+    """analyze_market_condition 评分规则的矩阵版本（rule_indicators + score_indicators）"""
+    return score_indicators(rule_indicators(closes, window), scoring)
+
+
+def rule_signals(scores: np.ndarray, scoring: Optional[Dict] = None) -> np.ndarray:
+    """分数 → 建议: 1=buy (> buy_above), -1=sell (< sell_below), 0=hold"""
+    rules = {**DEFAULT_SCORING, **(scoring or {})}
+    with np.errstate(invalid="ignore"):
+        return np.where(scores > rules["buy_above"], 1,
+                        np.where(scores < rules["sell_below"], -1, 0)).astype(np.int8)
+
+
+def simulate_signals(
+    close: np.ndarray,
+    signals: np.ndarray,
+    notional: float = 100.0,
+    fee_rate: float = TAKER_FEE,
+    slippage_bps: float = 2.0
+) -> Dict[str, np.ndarray]:
+    """
+    按信号持仓（全部向量化）
+
+    buy 做多、sell 做空（每次开仓名义价值 notional），hold 维持原仓位；
+    方向改变时在信号K线收盘价反手。成交价、手续费与 SimulatedExchange 一致。
+
+    Returns:
+        {"units": 持仓数量, "delta": 成交数量, "fill_px": 成交价, "fees": 手续费,
+         "price": 收盘价（NaN 置 0）, "pnl": 每根K线的组合盈亏 (K线数,)}
+    """
+    coins, bars = close.shape
+
+    # hold 维持上一个方向
+    cols = np.where(signals != 0, np.arange(bars), 0)
+    np.maximum.accumulate(cols, axis=1, out=cols)
+    direction = np.take_along_axis(signals, cols, axis=1)
+    direction[:, 0] = signals[:, 0]
+
+    # 方向改变时按当时价格确定持仓数量，之后保持不变
+    changed = np.diff(direction, axis=1, prepend=0) != 0
+    price = np.nan_to_num(close)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        target = np.where(changed & (price > 0), direction * notional / price, 0.0)
+    cols = np.where(changed, np.arange(bars), 0)
+    np.maximum.accumulate(cols, axis=1, out=cols)
+    units = np.where(direction != 0, np.take_along_axis(target, cols, axis=1), 0.0)
+
+    delta = np.diff(units, axis=1, prepend=0.0)
+    fill_px = price * (1 + np.sign(delta) * slippage_bps / 10000)
+    fees = np.abs(delta) * fill_px * fee_rate
+
+    # 权益变化 = 持仓市值变化 - 成交现金流 - 手续费
+    value = (units * price).sum(axis=0)
+    cash_flow = (delta * fill_px + fees).sum(axis=0)
+    pnl = np.diff(value, prepend=0.0) - cash_flow
+    return {"units": units, "delta": delta, "fill_px": fill_px, "fees": fees, "price": price, "pnl": pnl}
+
+
+def closed_trade_pnls(sim: Dict[str, np.ndarray], fee_rate: float = TAKER_FEE) -> np.ndarray:
+    """已平仓交易的盈亏（向量化，不生成交易记录）"""
+    units, delta, fill_px = sim["units"], sim["delta"], sim["fill_px"]
+    rows, cols = np.nonzero(delta)  # 按行排序
+    held = units[rows, cols]
+    same_row = np.zeros(len(rows), dtype=bool)
+    same_row[:-1] = rows[1:] == rows[:-1]
+    closed = (held != 0) & same_row
+    entry_idx = np.flatnonzero(closed)
+    exit_idx = entry_idx + 1
+    held = held[entry_idx]
+    entry_px = fill_px[rows[entry_idx], cols[entry_idx]]
+    exit_px = fill_px[rows[exit_idx], cols[exit_idx]]
+    fees = np.abs(held) * (entry_px + exit_px) * fee_rate
+    return held * (exit_px - entry_px) - fees
+
+
+def run_rule_backtest(
+    market: HistoricalMarket,
+    notional: float = 100.0,
+    initial_capital: float = 1000.0,
+    fee_rate: float = TAKER_FEE,
+    slippage_bps: float = 2.0,
+    window: int = DEFAULT_WINDOW,
+    scoring: Optional[Dict] = None
+) -> BacktestResult:
+    """
+    规则策略快速回测（全部向量化）
+
+    策略: buy 建议做多、sell 建议做空（每次开仓名义价值 notional），hold 维持原仓位；
+    方向改变时在信号K线收盘价反手。成交价、手续费与 SimulatedExchange 一致，
+    但不检查保证金（所有币种同时持仓时名义价值可以超过初始资金）。
+
+    Args:
+        market: 历史行情
+        notional: 每个币种的开仓名义价值（USDC）
+        initial_capital: 初始资金
+        fee_rate: 手续费率
+        slippage_bps: 滑点（基点）
+        window: 评分使用的K线数量
+        scoring: 评分参数（缺省项使用 DEFAULT_SCORING）
+    """
+    signals = rule_signals(rule_scores(market.close, window, scoring), scoring)
+    sim = simulate_signals(market.close, signals, notional, fee_rate, slippage_bps)
+    equity = initial_capital + np.cumsum(sim["pnl"])
+
+    fills, trades = _rule_fills_and_trades(market, sim["units"], sim["delta"], sim["fill_px"], sim["fees"], sim["price"])
+    start = max(window - 1, 0)
+    logger.info(f"⚡ 规则快速回测: {len(market.coins)} 个币种 × {market.bars} 根K线, {len(fills)} 笔成交")
+    return BacktestResult(
+        market.times[start:] + market.step, equity[start:], fills, trades,
+        initial_capital, market.step, float(sim["fees"].sum()),
+    )
+
+
+def _rule_fills_and_trades(market, units, delta, fill_px, fees, price):
+    """由持仓变化生成成交记录和逐笔交易（只遍历成交点）"""
+    fills, trades = [], []
+    close_times = market.times + market.step
+    last = units.shape[1] - 1
+    for row, coin in enumerate(market.coins):
+        cols = np.flatnonzero(delta[row])
+        for n, col in enumerate(cols):
+            size = float(delta[row, col])
+            px = float(fill_px[row, col])
+            start = float(units[row, col - 1]) if col > 0 else 0.0
+            fills.append({
+                "coin": coin, "px": str(px), "sz": str(abs(size)), "side": "B" if size > 0 else "A",
+                "time": int(close_times[col]), "startPosition": str(start),
+                "fee": str(float(fees[row, col])),
+            })
+
+            held = float(units[row, col])
+            if held == 0:
+                continue
+            # 持仓从 col 保持到下一次变化（或回测结束）
+            exit_col = int(cols[n + 1]) if n + 1 < len(cols) else None
+            entry_fee = abs(held) * px * (fees[row, col] / (abs(size) * px))
+            if exit_col is not None:
+                exit_px = float(fill_px[row, exit_col])
+                exit_fee = float(fees[row, exit_col]) * abs(held) / abs(float(delta[row, exit_col]))
+            else:
+                exit_px = float(price[row, last])
+                exit_fee = 0.0
+            trades.append({
+                "coin": coin, "side": "long" if held > 0 else "short",
+                "entry_time": int(close_times[col]), "entry_price": px, "size": abs(held),
+                "exit_time": int(close_times[exit_col]) if exit_col is not None else None,
+                "exit_price": exit_px,
+                "pnl": held * (exit_px - px) - entry_fee - exit_fee,
+                "fees": entry_fee + exit_fee,
+                "bars": (exit_col if exit_col is not None else last) - col,
+                **({} if exit_col is not None else {"open": True}),
+            })
+    fills.sort(key=lambda f: f["time"])
+    return fills, trades
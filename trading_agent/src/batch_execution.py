@@ -0,0 +1,335 @@
+"""
+批量下单 - 组合交易合并为尽量少的签名请求
+
+- 平仓和普通开仓合并为一次 bulk_orders
+- 带止盈止损的开仓：入场单 + 止盈单 + 止损单作为一个 normalTpsl 订单组提交
+- 被平仓币种的遗留挂单（旧止盈止损）一次 bulk_cancel 撤销
+- 杠杆只在与当前持仓杠杆不同时才调整（交易所没有批量调整杠杆的接口）；调整失败的开仓不提交
+- 启用滑点模型时，每个订单的保护价按订单簿估计；需要拆单的普通开仓单独逐笔提交
+
+prepare_trade 是与下单解耦的准备步骤（数量按 szDecimals 取整、查询当前杠杆、风控预检），
+流式决策时在 LLM 还在输出的过程中对每个已完整的交易提前执行。
+"""
+import logging
+from typing import Dict, List, Optional
+
+from src.asset_index import MAX_PRICE_DECIMALS, PRICE_SIG_FIGS
+from src.slippage import DEFAULT_SLIPPAGE, place_market_open
+
+logger = logging.getLogger(__name__)
+
+
+def _order_statuses(response: Dict) -> List:
+    """bulk_orders 响应中的订单状态列表（与提交顺序一致）"""
+    if not isinstance(response, dict) or response.get("status") != "ok":
+        return []
+    return response.get("response", {}).get("data", {}).get("statuses", [])
+
+
+def _status_error(status) -> Optional[str]:
+    if isinstance(status, dict) and "error" in status:
+        return status["error"]
+    return None
+
+
+def _single_order_response(response: Dict, status) -> Dict:
+    """把批量响应拆成单个订单的响应（格式同 exchange.order 的返回值）"""
+    return {"status": response.get("status"), "response": {"type": "order", "data": {"statuses": [status]}}}
+
+
+def _batch_error(response) -> str:
+    if isinstance(response, dict) and response.get("status") != "ok":
+        return str(response.get("response", response))
+    return "交易所未返回订单状态"
+
+
+def round_size(info, coin: str, size: float) -> float:
+    """数量按币种的 szDecimals 取整（元数据缺失时原样返回）"""
+    try:
+        decimals = info.asset_to_sz_decimals[info.name_to_asset(coin)]
+    except Exception:
+        return size
+    return round(float(size), decimals)
+
+
+def round_price(tools, coin: str, price: float) -> float:
+    """价格按交易所规则取整（有资产元数据索引时使用索引，否则按 info 的 szDecimals）"""
+    index = getattr(tools, "asset_index", None)
+    if index is not None:
+        return index.round_price(coin, price)
+    try:
+        decimals = tools.info.asset_to_sz_decimals[tools.info.name_to_asset(coin)]
+    except Exception:
+        decimals = 0
+    return round(float(f"{float(price):.{PRICE_SIG_FIGS}g}"), MAX_PRICE_DECIMALS - decimals)
+
+
+def leverage_error(result: Dict) -> Optional[str]:
+    """adjust_leverage 的结果：失败时返回原因"""
+    if result.get("success"):
+        return None
+    response = result.get("result")
+    reason = result.get("error") or (response.get("response") if isinstance(response, dict) else response)
+    return f"调整杠杆失败: {reason}"
+
+
+def prepare_trade(trade: Dict, tools, state: Dict, risk_manager=None) -> Dict:
+    """
+    下单前准备（不产生任何交易所写操作）
+
+    Args:
+        trade: 交易决策 {"decision", "coin", "size", ...}
+        tools: HyperliquidTools / AdvancedTradingTools（使用其 info 与周期快照）
+        state: 交易状态（account_value / positions / current_prices）
+        risk_manager: 不为 None 时做风控预检
+
+    Returns:
+        {"trade": {"decision", "coin", "size"}, "size": 取整后的数量,
+         "current_leverage": 当前持仓杠杆（无持仓为 None）, "risk": 风控结果 | None}
+    """
+    decision, coin = trade.get("decision"), trade.get("coin")
+    size = trade.get("size") or 0.0
+    rounded = round_size(tools.info, coin, size) if size else size
+
+    user_state = tools.snapshot.user_state(tools.address)
+    position = next((p["position"] for p in user_state.get("assetPositions", [])
+                     if p["position"]["coin"] == coin), None)
+    current_leverage = position.get("leverage", {}).get("value") if position else None
+    if decision == "close":
+        tools.snapshot.open_orders(tools.address)  # 预热，平仓时需要撤销遗留挂单
+
+    risk = None
+    if risk_manager is not None and decision in ("buy", "sell", "hold", "close"):
+        risk = risk_manager.check_trading_decision(
+            decision=decision, coin=coin, size=rounded,
+            account_value=state.get("account_value", 0), positions=state.get("positions", []),
+            current_price=float(state.get("current_prices", {}).get(coin, 0) or 0)
+        )
+    return {
+        "trade": {"decision": decision, "coin": coin, "size": size},
+        "size": rounded,
+        "current_leverage": current_leverage,
+        "risk": risk,
+    }
+
+
+def find_prepared(prepared_trades: Optional[List[Dict]], decision: str, coin: str, size: float) -> Optional[Dict]:
+    """在 prepare_trade 的结果中查找与决策一致的一项"""
+    for prepared in prepared_trades or []:
+        if prepared["trade"] == {"decision": decision, "coin": coin, "size": size}:
+            return prepared
+    return None
+
+
+def execute_trades_batch(trades: List[Dict], advanced_tools, current_prices: Dict,
+                         prepared_trades: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    批量执行组合交易（真实下单）
+
+    Args:
+        trades: portfolio_trades 列表
+        advanced_tools: AdvancedTradingTools 实例
+        current_prices: 当前价格 {币种: 价格}
+        prepared_trades: prepare_trade 的结果（流式决策时提前完成），有则直接使用取整后的数量
+
+    Returns:
+        每个交易的执行结果（顺序与 trades 一致），格式同逐笔执行:
+        - 平仓/普通开仓: {"success", "coin", "action", "result" | "error"}
+        - 止盈止损开仓: {"success", "dry_run", "coin", "action", "size",
+                        "entry_result", "tp_result", "sl_result"}
+    """
+    exchange = advanced_tools.exchange
+    snapshot = advanced_tools.snapshot
+    results: List[Optional[Dict]] = [None] * len(trades)
+
+    user_state = snapshot.user_state(advanced_tools.address)
+    positions = {
+        p["position"]["coin"]: p["position"]
+        for p in user_state.get("assetPositions", [])
+        if float(p["position"]["szi"]) != 0
+    }
+
+    slippage_model = getattr(advanced_tools, "slippage_model", None)
+
+    def market_price(coin: str, is_buy: bool, slippage: float = DEFAULT_SLIPPAGE) -> float:
+        mid = float(current_prices.get(coin) or snapshot.price(coin))
+        return round_price(advanced_tools, coin, mid * (1 + slippage if is_buy else 1 - slippage))
+
+    def plan(coin: str, is_buy: bool, size: float) -> Optional[Dict]:
+        return slippage_model.plan_for(advanced_tools, coin, is_buy, size) if slippage_model else None
+
+    # 1. 撤销被平仓币种的遗留挂单
+    close_coins = {t["coin"] for t in trades if t["decision"] == "close"}
+    if close_coins:
+        try:
+            cancels = [
+                {"coin": order["coin"], "oid": order["oid"]}
+                for order in snapshot.open_orders(advanced_tools.address)
+                if order["coin"] in close_coins
+            ]
+            if cancels:
+                cancel_result = exchange.bulk_cancel(cancels)
+                logger.info(f"🧹 批量撤单 {len(cancels)} 个: {cancel_result.get('status')}")
+        except Exception as e:
+            logger.error(f"批量撤单失败: {e}")
+
+    # 2. 调整杠杆（已是目标杠杆则跳过）；调整失败的开仓不提交，避免按原杠杆成交
+    for i, trade in enumerate(trades):
+        leverage = trade.get("leverage", 1)
+        if trade["decision"] not in ["buy", "sell"] or leverage <= 1:
+            continue
+        current = positions.get(trade["coin"], {}).get("leverage", {}).get("value")
+        if current != leverage:
+            result = advanced_tools.adjust_leverage(trade["coin"], leverage, is_cross=True, dry_run=False)
+            error = leverage_error(result)
+            if error:
+                logger.error(f"{trade['coin']} {error}，不提交该订单")
+                results[i] = {"success": False, "coin": trade["coin"], "action": trade["decision"], "error": error}
+
+    # 3. 组装订单
+    plain_orders, plain_index = [], []
+    split_orders = []  # 冲击过大、需要拆成子订单逐笔提交的普通开仓 [(序号, 数量)]
+    tpsl_groups = []
+    for i, trade in enumerate(trades):
+        decision, coin = trade["decision"], trade["coin"]
+        if results[i] is not None:
+            continue
+        try:
+            if decision == "close":
+                position = positions.get(coin)
+                if position is None:
+                    results[i] = {"success": False, "coin": coin, "action": "close", "error": f"没有 {coin} 持仓"}
+                    continue
+                size = float(position["szi"])
+                is_buy = size < 0
+                # 平仓不拆单，也不因深度不足放弃：只按订单簿收紧保护价
+                close_plan = plan(coin, is_buy, abs(size))
+                plain_orders.append({
+                    "coin": coin, "is_buy": is_buy, "sz": abs(size),
+                    "limit_px": market_price(coin, is_buy, close_plan["slippage"] if close_plan else DEFAULT_SLIPPAGE),
+                    "order_type": {"limit": {"tif": "Ioc"}}, "reduce_only": True,
+                })
+                plain_index.append(i)
+
+            elif decision in ["buy", "sell"]:
+                is_buy = decision == "buy"
+                size = trade.get("size", 0.001)
+                prepared = find_prepared(prepared_trades, decision, coin, size)
+                size = prepared["size"] if prepared else round_size(advanced_tools.info, coin, size)
+                entry_plan = plan(coin, is_buy, size)
+                if entry_plan and not entry_plan["fillable"]:
+                    results[i] = {"success": False, "coin": coin, "action": decision, "error": entry_plan["reason"]}
+                    continue
+                entry = {
+                    "coin": coin, "is_buy": is_buy, "sz": size,
+                    "limit_px": market_price(coin, is_buy, entry_plan["slippage"] if entry_plan else DEFAULT_SLIPPAGE),
+                    "order_type": {"limit": {"tif": "Ioc"}}, "reduce_only": False,
+                }
+                if not trade.get("use_tpsl", False):
+                    if entry_plan and len(entry_plan["children"]) > 1:
+                        split_orders.append((i, size))
+                    else:
+                        plain_orders.append(entry)
+                        plain_index.append(i)
+                    continue
+
+                tp_price, sl_price = advanced_tools.calculate_tpsl_prices(
+                    float(current_prices.get(coin, 0)), is_buy,
+                    trade.get("take_profit_pct", 3.0), trade.get("stop_loss_pct", 1.5), coin=coin
+                )
+                group = [entry]
+                for kind, price in (("tp", tp_price), ("sl", sl_price)):
+                    group.append({
+                        "coin": coin, "is_buy": not is_buy, "sz": size, "limit_px": price,
+                        "order_type": {"trigger": {"triggerPx": price, "isMarket": True, "tpsl": kind}},
+                        "reduce_only": True,
+                    })
+                tpsl_groups.append((i, group))
+
+            else:
+                results[i] = {"success": False, "coin": coin, "action": decision, "error": f"未知决策: {decision}"}
+        except Exception as e:
+            logger.error(f"组装 {coin} {decision} 订单失败: {e}")
+            results[i] = {"success": False, "coin": coin, "action": decision, "error": str(e)}
+
+    # 4. 平仓 + 普通开仓：一次提交
+    if plain_orders:
+        logger.warning(f"[真实] 批量提交 {len(plain_orders)} 个订单")
+        try:
+            response = exchange.bulk_orders(plain_orders)
+            statuses = _order_statuses(response)
+        except Exception as e:
+            logger.error(f"批量下单失败: {e}")
+            response, statuses = {"status": "err", "response": str(e)}, []
+
+        for n, i in enumerate(plain_index):
+            trade = trades[i]
+            result = {"coin": trade["coin"], "action": trade["decision"]}
+            if n >= len(statuses):
+                result.update(success=False, error=_batch_error(response))
+            elif _status_error(statuses[n]):
+                result.update(success=False, error=_status_error(statuses[n]))
+            else:
+                result.update(success=True, result=_single_order_response(response, statuses[n]))
+            results[i] = result
+
+    # 5. 需要拆单的普通开仓：子订单逐笔提交
+    split_requests = 0
+    for i, size in split_orders:
+        trade = trades[i]
+        result = {"coin": trade["coin"], "action": trade["decision"]}
+        try:
+            response = place_market_open(advanced_tools, trade["coin"], trade["decision"] == "buy", size)
+            split_requests += len(response["plan"]["children"]) if response.get("plan") else 1
+            if not _order_statuses(response):
+                result.update(success=False, error=_batch_error(response))
+            elif response["filled_size"] > 0 or not response["error"]:
+                result.update(success=True, result=response, filled_size=response["filled_size"])
+                if response["error"]:
+                    # 前面的子订单已成交即已开仓，后续子订单的错误单独返回
+                    result["error"] = response["error"]
+            else:
+                result.update(success=False, error=response["error"], result=response)
+        except Exception as e:
+            logger.error(f"{trade['coin']} 拆单下单失败: {e}")
+            result.update(success=False, error=str(e))
+        results[i] = result
+
+    # 6. 止盈止损开仓：每个交易一个订单组
+    for i, group in tpsl_groups:
+        trade = trades[i]
+        entry = group[0]
+        action = "买入" if entry["is_buy"] else "卖出"
+        logger.warning(f"[真实] {action} {entry['sz']} {trade['coin']} with TP/SL (订单组)")
+        try:
+            response = exchange.bulk_orders(group, grouping="normalTpsl")
+            statuses = _order_statuses(response)
+        except Exception as e:
+            logger.error(f"止盈止损订单组提交失败: {e}")
+            response, statuses = {"status": "err", "response": str(e)}, []
+
+        if not statuses:
+            results[i] = {"success": False, "coin": trade["coin"], "action": action,
+                          "error": _batch_error(response), "result": response}
+            continue
+        error = _status_error(statuses[0])
+        if error:
+            results[i] = {"success": False, "coin": trade["coin"], "action": action,
+                          "error": error, "result": response}
+            continue
+        split = [_single_order_response(response, status) for status in statuses]
+        results[i] = {
+            "success": True,
+            "dry_run": False,
+            "coin": trade["coin"],
+            "action": action,
+            "size": entry["sz"],
+            "entry_result": split[0],
+            "tp_result": split[1] if len(split) > 1 else None,
+            "sl_result": split[2] if len(split) > 2 else None,
+        }
+
+    snapshot.invalidate("user_state", "open_orders")
+    request_count = len(tpsl_groups) + (1 if plain_orders else 0) + split_requests
+    logger.info(f"📦 批量执行完成: {len(trades)} 个交易, {request_count} 次下单请求")
+    return results
@@ -0,0 +1,456 @@
+"""
+交易周期基准测试 - 在模拟交易所和模拟 LLM 上反复运行 Agent 的 run_once
+
+交易所使用 FakeHyperliquidServer（真实 SDK 走本地 HTTP），LLM 使用 StubLLM
+（按工具名返回固定决策，可配置延迟）。每个周期记录:
+- 各 LangGraph 节点耗时（来自 Agent 的 NodeTimer）和周期总耗时
+- 交易所 API 调用次数（按请求类型）
+- 内存分配峰值和周期间保留的内存（tracemalloc，单独一轮测量）
+
+输出可机器读取的 JSON 报告；compare_reports 与基线报告对比，找出性能回退。
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.decision_cache import create_decision_cache
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.prompt_builder import create_prompt_builder, estimate_tokens
+from src.slippage import create_slippage_model
+from src.asset_index import create_asset_index
+from src.market_scanner import create_market_scanner
+from src.timeframes import create_multi_timeframe
+from src.transport import create_transport
+
+logger = logging.getLogger(__name__)
+
+AGENTS = ["simple", "advanced", "portfolio"]
+PERCENTILES = (50, 95, 99)
+
+# 基准测试使用的风控/Agent 配置（不需要密钥，可用 --config 覆盖 risk/agent 部分）
+BENCHMARK_CONFIG = {
+    "risk": {
+        "max_usable_capital": 1000,
+        "max_position_size": 0.5,
+        "max_total_exposure": 2.0,
+        "max_single_trade_value": 500,
+        "min_account_value": 10,
+        "allowed_coins": [],
+        "max_leverage": 5,
+        "enable_execution": True,
+    },
+    "agent": {
+        "coins": ["BTC", "ETH", "SOL", "AVAX"],
+        "streaming_indicators": True,
+        "snapshot_ttl": 10,
+        "fetch_workers": 8,
+        "fetch_timeout": 10,
+        "market_feed": "rest",
+        "async_pipeline": False,
+        "batch_orders": True,
+    },
+    "data": {"candle_db": ":memory:", "fill_db": ":memory:"},
+}
+
+
+# ===== 模拟 LLM =====
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class StubLLM:
+    """
+    模拟 OpenAI 客户端（只实现 chat.completions.create）
+
+    按请求中的工具名返回确定性的决策（开仓和平仓交替），
+    并记录调用次数和提示词长度。stream=True 时按分片流式输出工具参数。
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.prompt_chars: List[int] = []
+        self.prompt_tokens: List[int] = []
+        self._lock = threading.Lock()
+        self.chat = _Namespace(completions=_Namespace(create=self.create))
+
+    def create(self, model: str = "", messages: Optional[List[Dict]] = None, tools: Optional[List[Dict]] = None,
+               stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            turn = self.calls
+            self.prompt_chars.append(sum(len(m.get("content") or "") for m in messages or []))
+            self.prompt_tokens.append(sum(estimate_tokens(m.get("content") or "") for m in messages or []))
+        if self.latency_ms and not stream:
+            time.sleep(self.latency_ms / 1000)
+
+        name = tools[0]["function"]["name"] if tools else ""
+        # 开仓和平仓交替，平仓时总有持仓
+        decision = ["buy", "close", "sell", "close"][(turn - 1) % 4]
+        if name == "make_portfolio_decisions":
+            arguments = {
+                "portfolio_analysis": "基准测试组合",
+                "trades": [
+                    {"decision": decision, "coin": "ETH", "size": 0.01, "leverage": 2, "use_tpsl": True,
+                     "take_profit_pct": 3.0, "stop_loss_pct": 1.5, "reasoning": "基准测试", "confidence": 0.7},
+                    {"decision": "buy", "coin": "SOL", "size": 0.2, "leverage": 2, "use_tpsl": False,
+                     "reasoning": "基准测试", "confidence": 0.6},
+                ],
+            }
+        elif name == "make_advanced_trading_decision":
+            arguments = {"decision": decision, "coin": "ETH", "size": 0.01, "leverage": 2, "use_tpsl": True,
+                         "take_profit_pct": 3.0, "stop_loss_pct": 1.5, "reasoning": "基准测试", "confidence": 0.7}
+        else:
+            arguments = {"decision": "buy" if turn % 2 else "sell", "coin": "ETH", "size": 0.01,
+                         "reasoning": "基准测试", "confidence": 0.7}
+
+        arguments = json.dumps(arguments, ensure_ascii=False)
+        if stream:
+            return self._stream(turn, name, arguments)
+        tool_call = _Namespace(id=f"call_{turn}", type="function",
+                               function=_Namespace(name=name, arguments=arguments))
+        message = _Namespace(content=None, tool_calls=[tool_call] if name else None)
+        return _Namespace(choices=[_Namespace(message=message, finish_reason="tool_calls")])
+
+
+    def _stream(self, turn: int, name: str, arguments: str, chunk_chars: int = 16):
+        """流式输出：参数按 chunk_chars 切片，延迟均匀分布在各个分片之间"""
+        pieces = [arguments[i:i + chunk_chars] for i in range(0, len(arguments), chunk_chars)]
+        for n, piece in enumerate(pieces):
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000 / len(pieces))
+            function = _Namespace(name=name if n == 0 else None, arguments=piece)
+            call = _Namespace(index=0, id=f"call_{turn}" if n == 0 else None, type="function", function=function)
+            delta = _Namespace(content=None, tool_calls=[call])
+            yield _Namespace(choices=[_Namespace(delta=delta, finish_reason=None)])
+
+
+# ===== Agent 构建 =====
+
+def benchmark_config(config: Optional[Dict] = None) -> Dict:
+    """基准测试配置：以 BENCHMARK_CONFIG 为底，合并 config 中的 risk / agent 设置"""
+    merged = json.loads(json.dumps(BENCHMARK_CONFIG))
+    for section in ("risk", "agent"):
+        merged[section].update((config or {}).get(section, {}))
+    # WebSocket 行情会绕开 REST 接口，基准测试中固定使用 REST
+    merged["agent"]["market_feed"] = "rest"
+    merged["risk"]["enable_execution"] = True
+    return merged
+
+
+def _connect(server: FakeHyperliquidServer):
+    import eth_account
+    from hyperliquid.exchange import Exchange
+    from hyperliquid.info import Info
+
+    wallet = eth_account.Account.from_key("0x" + "42" * 32)
+    info = Info(server.base_url, skip_ws=True)
+    exchange = Exchange(wallet, server.base_url, account_address=server.address)
+    return info, exchange
+
+
+def build_agent(kind: str, server: FakeHyperliquidServer, llm_client, config: Dict,
+                strategy_prompt: str = "你是一个交易助手。"):
+    """
+    创建连接到模拟服务器的 Agent
+
+    Args:
+        kind: "simple"（TradingAgent）/ "advanced"（main_advanced）/ "portfolio"（main_portfolio）
+
+    Returns:
+        (agent, 周期开始前需要调用的 tools)
+    """
+    info, exchange = _connect(server)
+    agent_config = config["agent"]
+    # 组合 Agent 在内部按配置接入 transport
+    transport = create_transport(config, info, exchange) if kind != "portfolio" else None
+
+    if kind == "simple":
+        from src.agent import TradingAgent
+        from src.risk_manager import RiskManager
+        from src.tools import HyperliquidTools
+        tools = HyperliquidTools(info, exchange, server.address, slippage_model=create_slippage_model(config),
+                                 asset_index=create_asset_index(config, info), transport=transport)
+        agent = TradingAgent(tools, RiskManager(config["risk"]), llm_client, strategy_prompt, dry_run=False,
+                             async_pipeline=agent_config.get("async_pipeline", False),
+                             decision_cache=create_decision_cache(config),
+                             prompt_builder=create_prompt_builder(config),
+                             stream_decisions=agent_config.get("stream_decisions", False))
+        return agent, tools
+
+    if kind == "advanced":
+        from main_advanced import AdvancedTradingAgent
+        from src.advanced_tools import AdvancedTradingTools
+        from src.candle_store import CandleStore
+        from src.fill_ledger import FillLedger
+        from src.market_snapshot import MarketSnapshot
+        from src.risk_manager import RiskManager
+        from src.market_risk import create_market_risk_model
+        candle_db = config.get("data", {}).get("candle_db")
+        candle_store = CandleStore(candle_db) if candle_db else None
+        fill_db = config.get("data", {}).get("fill_db")
+        tools = AdvancedTradingTools(
+            info, exchange, server.address,
+            streaming_indicators=agent_config.get("streaming_indicators", True),
+            candle_store=candle_store,
+            snapshot=MarketSnapshot(info, ttl=agent_config.get("snapshot_ttl", 10)),
+            scoring=agent_config.get("scoring"),
+            slippage_model=create_slippage_model(config),
+            fill_ledger=FillLedger(fill_db) if fill_db else None,
+            asset_index=create_asset_index(config, info),
+            timeframes=create_multi_timeframe(config),
+            transport=transport
+        )
+        agent = AdvancedTradingAgent(
+            tools, RiskManager(config["risk"], market_risk=create_market_risk_model(config, candle_store, info)),
+            llm_client, strategy_prompt, dry_run=False,
+            coins=agent_config.get("coins"), fetch_workers=agent_config.get("fetch_workers", 8),
+            fetch_timeout=agent_config.get("fetch_timeout", 10.0),
+            async_pipeline=agent_config.get("async_pipeline", False),
+            decision_cache=create_decision_cache(config),
+            prompt_builder=create_prompt_builder(config),
+            stream_decisions=agent_config.get("stream_decisions", False),
+            scanner=create_market_scanner(config)
+        )
+        return agent, tools
+
+    if kind == "portfolio":
+        from main_portfolio import PortfolioTradingAgent
+        agent = PortfolioTradingAgent(config, strategy_prompt, dry_run=False, info=info, exchange=exchange,
+                                      address=server.address, llm_client=llm_client)
+        return agent, agent.advanced_tools
+
+    raise ValueError(f"未知的 Agent 类型: {kind}（可选 {AGENTS}）")
+
+
+# ===== 统计 =====
+
+def latency_stats(samples_ms: List[float]) -> Dict:
+    """耗时分布 {"count", "mean", "p50", "p95", "p99", "max"}（毫秒）"""
+    if not samples_ms:
+        return {"count": 0}
+    values = np.asarray(samples_ms, dtype=np.float64)
+    stats = {"count": int(len(values)), "mean": round(float(values.mean()), 3)}
+    for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f"p{q}"] = round(float(value), 3)
+    stats["max"] = round(float(values.max()), 3)
+    return stats
+
+
+def run_agent_benchmark(
+    kind: str,
+    cycles: int = 20,
+    warmup: int = 2,
+    config: Optional[Dict] = None,
+    api_latency_ms: float = 0.0,
+    llm_latency_ms: float = 0.0,
+    memory_cycles: int = 5,
+    bars_per_cycle: int = 1,
+    seed: int = 0,
+    quiet: bool = True
+) -> Dict:
+    """
+    对一种 Agent 运行基准测试
+
+    tracemalloc 会让 Python 代码慢数倍，所以耗时和内存分两轮测量：
+    先跑 cycles 个周期计时，再开启 tracemalloc 跑 memory_cycles 个周期统计内存。
+
+    Args:
+        kind: Agent 类型（见 AGENTS）
+        cycles: 计时的周期数
+        warmup: 预热周期数（不计入统计，用于填充K线缓存和增量指标）
+        config: 配置（risk / agent 部分会覆盖 BENCHMARK_CONFIG）
+        api_latency_ms: 模拟服务器每个请求的延迟
+        llm_latency_ms: 模拟 LLM 每次调用的延迟
+        memory_cycles: 统计内存的周期数，0 表示不统计
+        bars_per_cycle: 每个周期之间推进的 1m K线数
+        quiet: 屏蔽节点打印到 stdout 的输出
+
+    Returns:
+        {"cycles", "cycle_ms", "nodes": {节点: 耗时分布}, "api_calls", "llm", "memory"}
+    """
+    config = benchmark_config(config)
+    server = FakeHyperliquidServer(seed=seed, latency_ms=api_latency_ms,
+                                   coins=sorted(set(config["agent"].get("coins") or []) | {"BTC", "ETH", "SOL"}))
+    server.start()
+    llm = StubLLM(llm_latency_ms)
+    node_samples: Dict[str, List[float]] = {}
+    cycle_samples: List[float] = []
+    api_per_cycle: List[Dict[str, int]] = []
+    peaks: List[int] = []
+    retained = 0
+    agent = None
+
+    def run_cycle() -> float:
+        server.advance(bars_per_cycle)
+        server.reset_stats()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO() if quiet else sys.stdout):
+            agent.run_once()
+        return (time.perf_counter() - started) * 1000
+
+    try:
+        agent, _ = build_agent(kind, server, llm, config)
+        for _ in range(warmup):
+            run_cycle()
+        prompt_offset = len(llm.prompt_chars)
+
+        for _ in range(cycles):
+            cycle_samples.append(run_cycle())
+            for name, seconds in agent.timer.timings.items():
+                node_samples.setdefault(name, []).append(seconds * 1000)
+            api_per_cycle.append(server.stats()["by_type"])
+        prompts = llm.prompt_chars[prompt_offset:]
+        prompt_tokens = llm.prompt_tokens[prompt_offset:]
+
+        if memory_cycles:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            for _ in range(memory_cycles):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                run_cycle()
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if agent is not None and hasattr(agent, "stop"):
+            agent.stop()
+        server.stop()
+
+    by_type: Dict[str, float] = {}
+    for counts in api_per_cycle:
+        for request_type, count in counts.items():
+            by_type[request_type] = by_type.get(request_type, 0) + count
+    measured = max(len(api_per_cycle), 1)
+
+    report = {
+        "cycles": len(cycle_samples),
+        "cycle_ms": latency_stats(cycle_samples),
+        "nodes": {name: latency_stats(samples) for name, samples in node_samples.items()},
+        "api_calls": {
+            "per_cycle": round(sum(by_type.values()) / measured, 2),
+            "by_type": {k: round(v / measured, 2) for k, v in sorted(by_type.items())},
+        },
+        "llm": {
+            "calls_per_cycle": round(len(prompts) / measured, 2),
+            "prompt_chars_mean": round(float(np.mean(prompts)), 1) if prompts else 0.0,
+            "prompt_tokens_mean": round(float(np.mean(prompt_tokens)), 1) if prompt_tokens else 0.0,
+        },
+    }
+    if memory_cycles:
+        report["memory"] = {
+            "cycles": len(peaks),
+            "peak_kb": latency_stats([p / 1024 for p in peaks]),
+            "retained_kb": round(retained / 1024, 1),
+        }
+    return report
+
+
+def run_benchmarks(agents: Optional[List[str]] = None, **kwargs) -> Dict:
+    """
+    依次对多种 Agent 运行基准测试
+
+    Returns:
+        完整报告 {"generated_at", "environment", "settings", "agents": {名称: run_agent_benchmark 结果}}
+    """
+    agents = agents or AGENTS
+    report = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "settings": {
+            **{k: v for k, v in kwargs.items() if k not in ("config", "quiet")},
+            "async_pipeline": benchmark_config(kwargs.get("config"))["agent"]["async_pipeline"],
+        },
+        "agents": {},
+    }
+    for kind in agents:
+        logger.info(f"⏱️  基准测试: {kind} Agent")
+        report["agents"][kind] = run_agent_benchmark(kind, **kwargs)
+    return report
+
+
+# ===== 回退检测 =====
+
+def compare_reports(
+    baseline: Dict,
+    current: Dict,
+    tolerance: float = 0.25,
+    min_delta_ms: float = 2.0
+) -> List[str]:
+    """
+    与基线报告对比
+
+    Args:
+        tolerance: 允许的相对增长（0.25 = 25%）
+        min_delta_ms: 耗时增长小于该值时忽略（避免毫秒级抖动误报）
+
+    Returns:
+        回退描述列表（空列表表示没有回退）
+    """
+    regressions = []
+
+    def check_ms(label: str, old: Dict, new: Dict, key: str = "p95"):
+        if key not in old or key not in new:
+            return
+        if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] >= min_delta_ms:
+            regressions.append(f"{label} {key}: {old[key]:.1f}ms → {new[key]:.1f}ms")
+
+    for kind, new in current.get("agents", {}).items():
+        old = baseline.get("agents", {}).get(kind)
+        if not old:
+            continue
+        check_ms(f"{kind} 周期", old["cycle_ms"], new["cycle_ms"])
+        for node, stats in new.get("nodes", {}).items():
+            if node in old.get("nodes", {}):
+                check_ms(f"{kind}.{node}", old["nodes"][node], stats)
+
+        old_calls, new_calls = old["api_calls"]["per_cycle"], new["api_calls"]["per_cycle"]
+        if new_calls > old_calls:
+            regressions.append(f"{kind} API 调用: {old_calls:g} → {new_calls:g} 次/周期")
+
+        old_mem = old.get("memory", {}).get("peak_kb", {})
+        new_mem = new.get("memory", {}).get("peak_kb", {})
+        if "p50" in old_mem and "p50" in new_mem and new_mem["p50"] > old_mem["p50"] * (1 + tolerance):
+            regressions.append(f"{kind} 内存峰值 p50: {old_mem['p50']:.0f}KB → {new_mem['p50']:.0f}KB")
+    return regressions
+
+
+def print_report(report: Dict):
+    """打印报告摘要"""
+    print("\n" + "=" * 70)
+    print(f"⏱️  交易周期基准测试 ({report['generated_at']})")
+    print("=" * 70)
+    for kind, result in report["agents"].items():
+        cycle = result["cycle_ms"]
+        print(f"\n🤖 {kind} Agent: {result['cycles']} 个周期, "
+              f"周期 p50 {cycle.get('p50', 0):.1f}ms / p95 {cycle.get('p95', 0):.1f}ms / p99 {cycle.get('p99', 0):.1f}ms")
+        print(f"   {'节点':<22}{'p50':>10}{'p95':>10}{'p99':>10}")
+        for node, stats in result["nodes"].items():
+            print(f"   {node:<22}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+        calls = ", ".join(f"{k} {v:g}" for k, v in result["api_calls"]["by_type"].items())
+        print(f"   📡 API 调用 {result['api_calls']['per_cycle']:g} 次/周期: {calls}")
+        print(f"   🧠 LLM {result['llm']['calls_per_cycle']:g} 次/周期, 提示词平均 {result['llm']['prompt_chars_mean']:.0f} 字符"
+              f" / ~{result['llm'].get('prompt_tokens_mean', 0):.0f} tokens")
+        if "memory" in result:
+            memory = result["memory"]
+            print(f"   💾 内存峰值 p50 {memory['peak_kb'].get('p50', 0):.0f}KB, 保留增长 {memory['retained_kb']:.0f}KB")
+    print("=" * 70 + "\n")
@@ -0,0 +1,290 @@
+"""
+本地K线存储 - SQLite 持久化缓存
+按 (币种, 周期) 保存K线，每次只向交易所请求缺失的时间段
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+}
+
+# candles_snapshot 单次最多返回的K线数量
+MAX_CANDLES_PER_REQUEST = 5000
+
+
+def page_ranges(interval: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """把 [start, end] 按单次请求上限切分为多段（每段最多 MAX_CANDLES_PER_REQUEST 根K线）"""
+    page_span = MAX_CANDLES_PER_REQUEST * INTERVAL_MS[interval]
+    return [(page_start, min(page_start + page_span - 1, end)) for page_start in range(start, end + 1, page_span)]
+
+
+class CandleStore:
+    """
+    K线本地缓存
+
+    candles 表保存K线，coverage 表记录已从交易所完整拉取过的时间段。
+    查询时只拉取未覆盖的时间段；未收盘的K线不计入覆盖范围，下次会重新拉取。
+    """
+
+    def __init__(self, db_path: str = "data/candles.db"):
+        """
+        Args:
+            db_path: SQLite 文件路径，":memory:" 表示仅内存缓存
+        """
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS candles (
+                coin TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                t INTEGER NOT NULL,
+                close_time INTEGER NOT NULL,
+                open REAL NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL,
+                close REAL NOT NULL,
+                volume REAL NOT NULL,
+                trades INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (coin, interval, t)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS coverage (
+                coin TEXT NOT NULL,
+                interval TEXT NOT NULL,
+                start_ms INTEGER NOT NULL,
+                end_ms INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_coverage ON coverage (coin, interval);
+        """)
+        self._conn.commit()
+
+        # 统计
+        self.api_requests = 0
+        self.local_candles_served = 0
+
+    # ===== 查询 =====
+
+    def get_candles(
+        self,
+        info,
+        coin: str,
+        interval: str,
+        start_time: int,
+        end_time: int
+    ) -> List[Dict]:
+        """
+        获取K线：缺失部分从交易所拉取并写入缓存，其余从本地读取
+
+        Args:
+            info: Hyperliquid Info 实例（只在需要补齐时调用）
+            coin: 币种
+            interval: K线周期
+            start_time: 起始时间戳(毫秒)
+            end_time: 结束时间戳(毫秒)
+
+        Returns:
+            candles_snapshot 原始格式的K线列表（按时间升序）:
+            [{"t": ..., "T": ..., "s": coin, "i": interval,
+              "o": ..., "h": ..., "l": ..., "c": ..., "v": ..., "n": ...}, ...]
+        """
+        step = INTERVAL_MS.get(interval)
+        if step is None:
+            raise ValueError(f"不支持的K线周期: {interval}")
+
+        # 对齐到K线起始时间
+        start_time = start_time - start_time % step
+
+        with self._lock:
+            missing = self._missing_ranges(coin, interval, start_time, end_time)
+
+        fetched = 0
+        for gap_start, gap_end in missing:
+            fetched += self._fetch_range(info, coin, interval, gap_start, gap_end, step)
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t, close_time, open, high, low, close, volume, trades FROM candles "
+                "WHERE coin = ? AND interval = ? AND t >= ? AND t <= ? ORDER BY t",
+                (coin, interval, start_time, end_time)
+            ).fetchall()
+
+        self.local_candles_served += max(len(rows) - fetched, 0)
+        if missing:
+            logger.info(f"{coin} {interval} K线缓存: 补齐 {len(missing)} 段缺口 ({fetched} 根), 共 {len(rows)} 根")
+
+        return [
+            {
+                "t": t, "T": close_time, "s": coin, "i": interval,
+                "o": o, "h": h, "l": l, "c": c, "v": v, "n": n
+            }
+            for t, close_time, o, h, l, c, v, n in rows
+        ]
+
+    def load(self, coin: str, interval: str, start_time: int = 0, end_time: Optional[int] = None) -> List[Dict]:
+        """
+        只读取本地已存储的K线（不请求交易所），用于回测等离线场景
+
+        Returns:
+            格式同 get_candles
+        """
+        end_time = end_time if end_time is not None else 2 ** 62
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t, close_time, open, high, low, close, volume, trades FROM candles "
+                "WHERE coin = ? AND interval = ? AND t >= ? AND t <= ? ORDER BY t",
+                (coin, interval, start_time, end_time)
+            ).fetchall()
+        return [
+            {
+                "t": t, "T": close_time, "s": coin, "i": interval,
+                "o": o, "h": h, "l": l, "c": c, "v": v, "n": n
+            }
+            for t, close_time, o, h, l, c, v, n in rows
+        ]
+
+    def coins(self, interval: str) -> List[str]:
+        """本地已存储该周期K线的币种"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT coin FROM candles WHERE interval = ? ORDER BY coin", (interval,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest_time(self, coin: str, interval: str) -> Optional[int]:
+        """本地缓存中最新一根K线的时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(t) FROM candles WHERE coin = ? AND interval = ?",
+                (coin, interval)
+            ).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM candles").fetchone()[0]
+        return {
+            "stored_candles": total,
+            "api_requests": self.api_requests,
+            "local_candles_served": self.local_candles_served,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ===== 覆盖范围 =====
+
+    def _coverage(self, coin: str, interval: str) -> List[Tuple[int, int]]:
+        rows = self._conn.execute(
+            "SELECT start_ms, end_ms FROM coverage WHERE coin = ? AND interval = ? ORDER BY start_ms",
+            (coin, interval)
+        ).fetchall()
+        return [(s, e) for s, e in rows]
+
+    def missing_ranges(self, coin: str, interval: str, start_time: int, end_time: int) -> List[Tuple[int, int]]:
+        """[start_time, end_time] 中需要向交易所请求的时间段（起点按K线周期对齐）"""
+        start_time -= start_time % INTERVAL_MS[interval]
+        with self._lock:
+            return self._missing_ranges(coin, interval, start_time, end_time)
+
+    def _missing_ranges(self, coin: str, interval: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """计算 [start, end] 中尚未覆盖的时间段"""
+        missing = []
+        cursor = start
+        for cov_start, cov_end in self._coverage(coin, interval):
+            if cov_end < cursor:
+                continue
+            if cov_start > end:
+                break
+            if cov_start > cursor:
+                missing.append((cursor, cov_start - 1))
+            cursor = max(cursor, cov_end + 1)
+            if cursor > end:
+                break
+        if cursor <= end:
+            missing.append((cursor, end))
+        return missing
+
+    def _add_coverage(self, coin: str, interval: str, start: int, end: int):
+        """记录新覆盖的时间段，并与相邻/重叠的时间段合并"""
+        if end < start:
+            return
+        merged_start, merged_end = start, end
+        for cov_start, cov_end in self._coverage(coin, interval):
+            if cov_end + 1 >= start and cov_start - 1 <= end:
+                merged_start = min(merged_start, cov_start)
+                merged_end = max(merged_end, cov_end)
+        self._conn.execute(
+            "DELETE FROM coverage WHERE coin = ? AND interval = ? AND end_ms + 1 >= ? AND start_ms - 1 <= ?",
+            (coin, interval, start, end)
+        )
+        self._conn.execute(
+            "INSERT INTO coverage (coin, interval, start_ms, end_ms) VALUES (?, ?, ?, ?)",
+            (coin, interval, merged_start, merged_end)
+        )
+
+    # ===== 拉取 =====
+
+    def _fetch_range(self, info, coin: str, interval: str, start: int, end: int, step: int) -> int:
+        """从交易所拉取一段K线（超过单次上限时分页），返回拉取到的数量"""
+        fetched = 0
+        for page_start, page_end in page_ranges(interval, start, end):
+            candles = info.candles_snapshot(coin, interval, page_start, page_end)
+            self.save_page(coin, interval, page_start, page_end, candles)
+            fetched += len(candles)
+        return fetched
+
+    def save_page(self, coin: str, interval: str, start: int, end: int, candles: List[Dict]):
+        """
+        写入一次 candles_snapshot 请求的结果，并把 [start, end] 记为已覆盖
+
+        供自行发送请求的调用方（如异步流水线）使用；未收盘的K线只写入数据，不计入覆盖范围。
+        请求范围包含最近一个周期时，交易所可能还没生成最新收盘的K线：
+        覆盖范围只记到返回的最后一根已收盘K线，空页不记覆盖，下次重新请求。
+        """
+        step = INTERVAL_MS[interval]
+        now = int(time.time() * 1000)
+        covered_end = min(end, now)
+        if covered_end >= now - step:
+            closed = [int(c["t"]) for c in candles if int(c["T"]) < now]
+            covered_end = min(covered_end, max(closed) + step - 1) if closed else start - 1
+
+        with self._lock:
+            self.api_requests += 1
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO candles "
+                "(coin, interval, t, close_time, open, high, low, close, volume, trades) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        coin, interval, int(c["t"]), int(c["T"]),
+                        float(c["o"]), float(c["h"]), float(c["l"]), float(c["c"]),
+                        float(c.get("v", 0)), int(c.get("n", 0))
+                    )
+                    for c in candles
+                ]
+            )
+            self._add_coverage(coin, interval, start, covered_end)
+            self._conn.commit()
@@ -0,0 +1,298 @@
+"""
+LLM 决策缓存 - 行情、指标、持仓几乎没变时复用最近的决策，跳过 LLM 调用
+
+缓存键是量化后的市场指纹（价格按百分比分桶、RSI/涨跌幅分桶、持仓方向与数量分桶、
+账户价值分桶）加上系统提示词和工具定义的哈希。决策保存在 SQLite 中，重启后仍然有效，
+超过 TTL 的条目失效，超过容量时按最近使用时间（LRU）淘汰。
+
+默认关闭，通过配置 agent.decision_cache.enabled 开启。
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from src.streaming import ToolCallStream, tool_call_response
+
+logger = logging.getLogger(__name__)
+
+# 量化粒度（越粗命中率越高，决策也越"迟钝"）
+DEFAULT_QUANTIZATION = {
+    "price_step_pct": 0.5,     # 价格每 0.5% 一个桶
+    "rsi_step": 5,             # RSI 每 5 一个桶
+    "change_step_pct": 1.0,    # 24h 涨跌幅每 1% 一个桶
+    "size_step_pct": 5.0,      # 持仓数量每 5% 一个桶
+    "account_step_pct": 5.0,   # 账户价值每 5% 一个桶
+}
+
+
+def log_bucket(value: float, step_pct: float) -> Optional[int]:
+    """按相对变化分桶：相邻桶的边界相差 step_pct%"""
+    value = abs(float(value or 0))
+    if value <= 0:
+        return None
+    return int(math.floor(math.log(value) / math.log1p(step_pct / 100)))
+
+
+def linear_bucket(value, step: float) -> Optional[int]:
+    if value is None:
+        return None
+    return int(math.floor(float(value) / step))
+
+
+def market_fingerprint(
+    state: Dict,
+    coins: Optional[Iterable[str]] = None,
+    quantization: Optional[Dict] = None
+) -> Dict:
+    """
+    从 TradingState 提取量化后的市场指纹
+
+    Args:
+        state: 交易状态（current_prices / market_analysis_data / positions / account_value）
+        coins: 参与指纹的币种；None 表示有技术分析的币种 + 持仓币种（没有时用 BTC/ETH）
+        quantization: 量化粒度（见 DEFAULT_QUANTIZATION）
+
+    Returns:
+        可 JSON 序列化的指纹
+    """
+    q = {**DEFAULT_QUANTIZATION, **(quantization or {})}
+    analysis = state.get("market_analysis_data") or {}
+    positions = state.get("positions") or []
+    if coins is None:
+        coins = set(analysis) | {pos["coin"] for pos in positions} or {"BTC", "ETH"}
+    prices = state.get("current_prices") or {}
+
+    market = {}
+    for coin in sorted(coins):
+        indicators = analysis.get(coin, {}).get("indicators", {})
+        entry = {"px": log_bucket(prices.get(coin) or indicators.get("current_price", 0), q["price_step_pct"])}
+        if coin in analysis:
+            condition = analysis[coin].get("condition", {})
+            entry.update({
+                "rsi": linear_bucket(indicators.get("rsi_14"), q["rsi_step"]),
+                "chg": linear_bucket(indicators.get("price_change_24h"), q["change_step_pct"]),
+                "trend": condition.get("trend"),
+                "rec": condition.get("recommendation"),
+            })
+        market[coin] = entry
+
+    return {
+        "market": market,
+        "positions": sorted(
+            [pos["coin"], 1 if pos["size"] > 0 else -1, log_bucket(pos["size"], q["size_step_pct"]),
+             pos.get("leverage")]
+            for pos in positions
+        ),
+        "account": log_bucket(state.get("account_value", 0), q["account_step_pct"]),
+    }
+
+
+class DecisionCache:
+    """
+    磁盘持久化的 LLM 决策缓存（TTL + LRU）
+
+    用法（在决策节点中替换 llm_client.chat.completions.create）:
+        response = cache.completion(llm_client, fingerprint, model=..., messages=..., tools=...)
+    """
+
+    def __init__(
+        self,
+        db_path: str = "data/decisions.db",
+        ttl: float = 300.0,
+        max_entries: int = 500,
+        quantization: Optional[Dict] = None
+    ):
+        """
+        Args:
+            db_path: SQLite 文件路径，":memory:" 表示仅内存缓存
+            ttl: 决策有效期（秒）
+            max_entries: 最多保存的决策数量
+            quantization: 指纹量化粒度（见 DEFAULT_QUANTIZATION）
+        """
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.quantization = {**DEFAULT_QUANTIZATION, **(quantization or {})}
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS decisions (
+                key TEXT PRIMARY KEY,
+                arguments TEXT NOT NULL,
+                tool TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_decisions_last_used ON decisions (last_used);
+        """)
+        self._conn.commit()
+
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    # ===== 键 =====
+
+    def fingerprint(self, state: Dict, coins: Optional[Iterable[str]] = None) -> Dict:
+        """按本缓存的量化粒度计算市场指纹"""
+        return market_fingerprint(state, coins, self.quantization)
+
+    @staticmethod
+    def make_key(fingerprint: Dict, request: Dict) -> str:
+        """指纹 + 系统提示词 + 工具定义 + 模型 → 缓存键"""
+        system = [m.get("content", "") for m in request.get("messages", []) if m.get("role") == "system"]
+        payload = {
+            "fingerprint": fingerprint,
+            "system": hashlib.sha256("\n".join(system).encode()).hexdigest(),
+            "tools": request.get("tools"),
+            "model": request.get("model"),
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+    # ===== 读写 =====
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取未过期的决策
+
+        Returns:
+            {"arguments": 工具参数 JSON 字符串, "tool": 工具名, "age": 秒}；未命中返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT arguments, tool, created FROM decisions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            arguments, tool, created = row
+            if now - created > self.ttl:
+                self._conn.execute("DELETE FROM decisions WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE decisions SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        return {"arguments": arguments, "tool": tool, "age": now - created}
+
+    def put(self, key: str, arguments: str, tool: str):
+        """保存决策，超过容量时淘汰最久未使用的条目"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions (key, arguments, tool, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, arguments, tool, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+            if count > self.max_entries:
+                removed = self._conn.execute(
+                    "DELETE FROM decisions WHERE key IN "
+                    "(SELECT key FROM decisions ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+                self.evicted += removed
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM decisions")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """缓存统计"""
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+        return {
+            "stored": stored,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ===== LLM 调用 =====
+
+    def completion(self, llm_client, fingerprint: Dict, stream: Optional[ToolCallStream] = None, **request):
+        """
+        带缓存的 chat.completions.create
+
+        命中时返回结构相同的响应（choices[0].message.tool_calls[0].function.arguments），
+        决策节点的解析逻辑无需改动；未命中时调用 LLM，只缓存 Function Calling 的结果。
+        stream 不为 None 时流式调用，命中时把缓存的参数一次性交给 stream 的回调。
+        """
+        key = self.make_key(fingerprint, request)
+        cached = self.get(key)
+        if cached is not None:
+            logger.info(f"🗄️  决策缓存命中（{cached['age']:.0f}s 前的 {cached['tool']} 决策），跳过 LLM 调用")
+            if stream is not None:
+                stream.replay(cached["arguments"])
+            return tool_call_response(cached["tool"], cached["arguments"])
+
+        if stream is not None:
+            response = stream.create(llm_client, **request)
+        else:
+            response = llm_client.chat.completions.create(**request)
+        message = response.choices[0].message
+        if message.tool_calls:
+            function = message.tool_calls[0].function
+            self.put(key, function.arguments, function.name)
+        return response
+
+
+def create_decision_cache(config: Dict) -> Optional[DecisionCache]:
+    """
+    按配置创建决策缓存（agent.decision_cache.enabled = true）
+
+    Returns:
+        DecisionCache；未开启返回 None
+    """
+    cache_config = config.get("agent", {}).get("decision_cache") or {}
+    if not cache_config.get("enabled", False):
+        return None
+    cache = DecisionCache(
+        cache_config.get("path", "data/decisions.db"),
+        ttl=cache_config.get("ttl", 300),
+        max_entries=cache_config.get("max_entries", 500),
+        quantization=cache_config.get("quantization")
+    )
+    logger.info(f"🗄️  LLM 决策缓存已开启: {cache.db_path} (TTL {cache.ttl:.0f}s, 最多 {cache.max_entries} 条)")
+    return cache
+
+
+def llm_completion(llm_client, decision_cache: Optional[DecisionCache], fingerprint_state: Dict,
+                   coins: Optional[Iterable[str]] = None, stream: Optional[ToolCallStream] = None, **request):
+    """
+    决策节点调用 LLM 的统一入口：有缓存时走缓存，否则直接调用
+
+    Args:
+        fingerprint_state: 用于计算市场指纹的交易状态
+        coins: 参与指纹的币种（见 market_fingerprint）
+        stream: 流式解析器（见 src.streaming），None 表示等待完整响应
+    """
+    if decision_cache is not None:
+        fingerprint = decision_cache.fingerprint(fingerprint_state, coins)
+        return decision_cache.completion(llm_client, fingerprint, stream, **request)
+    if stream is not None:
+        return stream.create(llm_client, **request)
+    return llm_client.chat.completions.create(**request)
@@ -0,0 +1,433 @@
+"""
+本地模拟 Hyperliquid HTTP 服务器（离线集成测试和压测用）
+
+实现 SDK 用到的 POST /info 和 POST /exchange 接口，真实的 Info / Exchange 对象
+只需把 base_url 指向本服务器即可使用（签名不校验）。行情、账户和撮合复用回测的
+HistoricalMarket / SimulatedExchange / SimulatedInfo：
+
+- 行情: 按种子生成的确定性价格路径（几何布朗运动），也可以传入任意 HistoricalMarket
+- 时钟: 默认冻结，advance() 手动推进；speed > 0 时按真实时间推进
+- 故障注入: 固定/抖动延迟、按概率或按次数返回 429/5xx
+- 持仓量上限: set_open_interest_cap() 后增加仓位的订单按交易所的错误信息拒绝
+"""
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+
+from src.backtest import BACKTEST_ADDRESS, HistoricalMarket, SimulatedExchange, SimulatedInfo
+from src.candle_store import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COINS = ["BTC", "ETH", "SOL", "AVAX", "ARB", "DOGE"]
+
+# 生成价格路径的起始价格（其他币种从 10 开始）
+BASE_PRICES = {
+    "BTC": 65000.0, "ETH": 3200.0, "SOL": 150.0, "BNB": 580.0, "AVAX": 30.0, "LINK": 14.0,
+    "OP": 1.8, "ARB": 0.8, "XRP": 0.55, "DOGE": 0.15,
+}
+
+
+def sz_decimals_for(price: float) -> int:
+    """按价格量级给出数量精度（与 Hyperliquid 主流币种的 szDecimals 接近）"""
+    if price >= 10_000:
+        return 5
+    if price >= 1_000:
+        return 4
+    if price >= 10:
+        return 2
+    if price >= 1:
+        return 1
+    return 0
+
+
+def synthetic_market(
+    coins: Optional[List[str]] = None,
+    bars: int = 4 * 1440,
+    interval: str = "1m",
+    seed: int = 0,
+    annual_volatility: float = 0.6,
+    end_time: Optional[int] = None
+) -> HistoricalMarket:
+    """
+    生成确定性的合成行情（同样的参数总是得到同样的价格路径）
+
+    Args:
+        coins: 币种列表
+        bars: K线数量
+        interval: K线周期
+        seed: 随机种子
+        annual_volatility: 年化波动率
+        end_time: 最后一根K线的收盘时间（毫秒），默认当前时间向下取整
+
+    Returns:
+        HistoricalMarket
+    """
+    coins = coins or DEFAULT_COINS
+    step = INTERVAL_MS[interval]
+    end_time = end_time if end_time is not None else int(time.time() * 1000) // step * step
+    times = end_time - step * np.arange(bars, 0, -1, dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    sigma = annual_volatility * math.sqrt(step / (365 * 86_400_000))
+    start = np.array([BASE_PRICES.get(coin, 10.0) for coin in coins])[:, None]
+    returns = rng.normal(-0.5 * sigma ** 2, sigma, (len(coins), bars))
+    closes = start * np.exp(np.cumsum(returns, axis=1))
+    opens = np.concatenate([start, closes[:, :-1]], axis=1)
+    wick = np.abs(rng.normal(0, sigma / 2, (2, len(coins), bars)))
+    highs = np.maximum(opens, closes) * (1 + wick[0])
+    lows = np.minimum(opens, closes) * (1 - wick[1])
+    volumes = np.round(rng.lognormal(3, 1, (len(coins), bars)), 2)
+    return HistoricalMarket(coins, times, opens, highs, lows, closes, volumes, interval)
+
+
+class FakeHyperliquidServer:
+    """
+    模拟 Hyperliquid REST 服务器
+
+    用法:
+        server = FakeHyperliquidServer(seed=42, latency_ms=20).start()
+        info = Info(server.base_url, skip_ws=True)
+        exchange = Exchange(wallet, server.base_url, account_address=address)
+        ...
+        server.advance(60)          # 推进 60 根K线
+        server.fail_next(2, 429)    # 接下来两个请求返回 429
+        server.stop()
+
+    只模拟一个账户: 所有地址查询返回同一个账户，订单不校验签名。
+    """
+
+    def __init__(
+        self,
+        market: Optional[HistoricalMarket] = None,
+        coins: Optional[List[str]] = None,
+        seed: int = 0,
+        interval: str = "1m",
+        history_bars: int = 4 * 1440,
+        future_bars: int = 1440,
+        initial_capital: float = 1000.0,
+        slippage_bps: float = 2.0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        error_types: Optional[Set[str]] = None,
+        speed: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        """
+        Args:
+            market: 回放的行情；None 时按 coins/seed/interval 生成合成行情
+            history_bars: 合成行情中当前时刻之前的K线数量
+            future_bars: 合成行情中可供 advance() 推进的K线数量
+            initial_capital: 模拟账户初始资金
+            slippage_bps: 市价成交滑点（基点）
+            latency_ms / jitter_ms: 每个请求的固定延迟和随机抖动（毫秒）
+            error_rate: 随机返回错误的概率
+            error_status: 随机错误的 HTTP 状态码（429 或 5xx）
+            error_types: 只对这些请求类型注入错误（如 {"allMids", "order"}），None 表示全部
+            speed: 时钟速度（模拟毫秒 / 真实毫秒），0 表示冻结，只能手动 advance()
+        """
+        if market is None:
+            # 让"当前"K线的收盘时间等于真实当前时间，工具按真实时钟计算的K线窗口直接命中
+            step = INTERVAL_MS[interval]
+            end_time = int(time.time() * 1000) // step * step + future_bars * step
+            market = synthetic_market(coins, history_bars + future_bars, interval, seed, end_time=end_time)
+            start_index = history_bars - 1
+        else:
+            start_index = 0
+        self.market = market
+        self.exchange = SimulatedExchange(market, initial_capital, slippage_bps=slippage_bps)
+        self.info = SimulatedInfo(self.exchange)
+        self.exchange.advance(start_index)
+        self._start_index = start_index
+
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.error_types = set(error_types) if error_types else None
+        self.speed = speed
+        self._rng = random.Random(seed)
+        self._forced_errors: List[tuple] = []  # [(状态码, 请求类型或 None)]
+        self._open_interest_capped: Set[str] = set()
+        self._clock_started = time.monotonic()
+
+        self._meta = {"universe": [
+            {"name": coin, "szDecimals": sz_decimals_for(float(np.nanmax(market.close[row]))),
+             "maxLeverage": 50 if coin in ("BTC", "ETH") else 20}
+            for coin, row in market.rows.items()
+        ]}
+        self._asset_coins = [asset["name"] for asset in self._meta["universe"]]
+
+        self._lock = threading.RLock()
+        self.request_counts: Counter = Counter()
+        self.injected_errors = 0
+        outer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和响应体分两次写入，不关闭 Nagle 会触发延迟确认（每个请求多等约 40ms）
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                outer._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        ThreadingHTTPServer.allow_reuse_address = True
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def address(self) -> str:
+        return BACKTEST_ADDRESS
+
+    def start(self) -> "FakeHyperliquidServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"🧪 模拟 Hyperliquid 服务器: {self.base_url} ({len(self.market.coins)} 个币种)")
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread = None
+        self._server.server_close()
+
+    # ===== 控制接口 =====
+
+    def advance(self, bars: int = 1) -> int:
+        """手动推进时钟 bars 根K线（撮合挂单和触发单），返回当前K线序号"""
+        with self._lock:
+            index = min(self.exchange.index + bars, self.market.bars - 1)
+            for i in range(self.exchange.index + 1, index + 1):
+                self.exchange.advance(i)
+            return self.exchange.index
+
+    def fail_next(self, count: int = 1, status: int = 500, request_type: Optional[str] = None):
+        """让接下来 count 个（指定类型的）请求返回 status"""
+        with self._lock:
+            self._forced_errors.extend([(status, request_type)] * count)
+
+    def set_open_interest_cap(self, *coins: str):
+        """设置持仓量已达上限的币种：perpsAtOpenInterestCap 返回这些币种，增加仓位的订单被拒绝"""
+        with self._lock:
+            self._open_interest_capped = set(coins)
+
+    def mids(self) -> Dict[str, float]:
+        """当前中间价"""
+        with self._lock:
+            return {coin: float(px) for coin, px in self.info.all_mids().items()}
+
+    def stats(self) -> Dict:
+        """请求统计 {"total", "by_type", "injected_errors", "index"}"""
+        with self._lock:
+            return {
+                "total": sum(self.request_counts.values()),
+                "by_type": dict(self.request_counts),
+                "injected_errors": self.injected_errors,
+                "index": self.exchange.index,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.request_counts.clear()
+            self.injected_errors = 0
+
+    # ===== 请求处理 =====
+
+    def _handle(self, handler: BaseHTTPRequestHandler):
+        length = int(handler.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(handler.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._respond(handler, 400, {"code": 400, "msg": "Invalid JSON", "data": None})
+
+        endpoint = handler.path.rstrip("/")
+        if endpoint == "/info":
+            request_type = payload.get("type", "")
+        elif endpoint == "/exchange":
+            request_type = payload.get("action", {}).get("type", "")
+        else:
+            return self._respond(handler, 404, {"code": 404, "msg": f"Unknown path {handler.path}", "data": None})
+
+        delay = self.latency_ms + (self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        with self._lock:
+            self.request_counts[request_type] += 1
+            status = self._injected_error(request_type)
+            if status is not None:
+                self.injected_errors += 1
+            else:
+                self._sync_clock()
+                try:
+                    body = self._info(payload) if endpoint == "/info" else self._exchange(payload["action"])
+                except (KeyError, ValueError, TypeError, IndexError) as e:
+                    logger.warning(f"⚠️ 模拟服务器无法处理 {request_type}: {e}")
+                    status, body = 422, {"code": 422, "msg": f"Failed to deserialize: {e}", "data": None}
+                else:
+                    status = 200
+
+        if status == 429:
+            body = {"code": 429, "msg": "Too many requests", "data": None}
+        elif status >= 500:
+            body = {"error": "Internal server error"}
+        elif status != 200 and status != 422:
+            body = {"code": status, "msg": "Injected error", "data": None}
+        self._respond(handler, status, body)
+
+    def _respond(self, handler: BaseHTTPRequestHandler, status: int, body):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _injected_error(self, request_type: str) -> Optional[int]:
+        for i, (status, only_type) in enumerate(self._forced_errors):
+            if only_type is None or only_type == request_type:
+                del self._forced_errors[i]
+                return status
+        if self.error_rate and (self.error_types is None or request_type in self.error_types):
+            if self._rng.random() < self.error_rate:
+                return self.error_status
+        return None
+
+    def _sync_clock(self):
+        """speed > 0 时按真实经过的时间推进K线"""
+        if self.speed <= 0:
+            return
+        elapsed_ms = (time.monotonic() - self._clock_started) * 1000 * self.speed
+        target = min(self._start_index + int(elapsed_ms // self.market.step), self.market.bars - 1)
+        for i in range(self.exchange.index + 1, target + 1):
+            self.exchange.advance(i)
+
+    def _info(self, payload: Dict):
+        request_type = payload["type"]
+        if request_type == "meta":
+            return self._meta
+        if request_type == "spotMeta":
+            return {"universe": [], "tokens": []}
+        if request_type == "metaAndAssetCtxs":
+            return [self._meta, self._asset_ctxs()]
+        if request_type == "perpsAtOpenInterestCap":
+            return sorted(self._open_interest_capped)
+        if request_type == "allMids":
+            return self.info.all_mids()
+        if request_type == "clearinghouseState":
+            return self.exchange.user_state()
+        if request_type in ("openOrders", "frontendOpenOrders"):
+            return self.exchange.open_orders()
+        if request_type == "l2Book":
+            return self.info.l2_snapshot(payload["coin"])
+        if request_type == "candleSnapshot":
+            req = payload["req"]
+            return self._candles(req["coin"], req["interval"], int(req["startTime"]), int(req["endTime"]))
+        if request_type == "userFills":
+            return self.info.user_fills(payload["user"])
+        if request_type == "userFillsByTime":
+            return self.info.user_fills_by_time(payload["user"], payload["startTime"], payload.get("endTime"))
+        raise ValueError(f"不支持的 info 请求: {request_type}")
+
+    def _exchange(self, action: Dict) -> Dict:
+        action_type = action["type"]
+        if action_type == "order":
+            requests = []
+            for wire in action["orders"]:
+                order_type = dict(wire["t"])
+                if "trigger" in order_type:
+                    order_type["trigger"] = {**order_type["trigger"], "triggerPx": float(order_type["trigger"]["triggerPx"])}
+                requests.append({
+                    "coin": self._asset_coins[wire["a"]], "is_buy": wire["b"], "sz": float(wire["s"]),
+                    "limit_px": float(wire["p"]), "order_type": order_type, "reduce_only": wire["r"],
+                })
+            grouping = action.get("grouping", "na")
+            capped = {i for i, request in enumerate(requests)
+                      if request["coin"] in self._open_interest_capped and not request["reduce_only"]}
+            if not capped:
+                return self.exchange.bulk_orders(requests, grouping=grouping)
+            # 持仓量已达上限：增加仓位的订单被拒绝（订单组整组拒绝），其余订单正常撮合
+            if grouping != "na":
+                capped = set(range(len(requests)))
+            allowed = [request for i, request in enumerate(requests) if i not in capped]
+            filled = iter(self.exchange.bulk_orders(allowed, grouping=grouping)["response"]["data"]["statuses"]
+                          if allowed else [])
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": [
+                {"error": "Cannot increase position when open interest is at cap. "
+                          f"asset={self._asset_coins.index(request['coin'])}"}
+                if i in capped else next(filled)
+                for i, request in enumerate(requests)
+            ]}}}
+        if action_type == "cancel":
+            return self.exchange.bulk_cancel([
+                {"coin": self._asset_coins[cancel["a"]], "oid": cancel["o"]} for cancel in action["cancels"]
+            ])
+        if action_type == "updateLeverage":
+            return self.exchange.update_leverage(action["leverage"], self._asset_coins[action["asset"]],
+                                                 action["isCross"])
+        if action_type == "updateIsolatedMargin":
+            return self.exchange.update_isolated_margin(action["ntli"] / 1e6, self._asset_coins[action["asset"]])
+        return {"status": "err", "response": f"Unsupported action: {action_type}"}
+
+    def _candles(self, coin: str, interval: str, start: int, end: int) -> List[Dict]:
+        """原始周期直接返回；更大的周期由原始K线聚合（最后一根可能未收盘）"""
+        if interval == self.market.interval:
+            return self.info.candles_snapshot(coin, interval, start, end)
+        step = INTERVAL_MS.get(interval)
+        if step is None or step % self.market.step:
+            raise ValueError(f"无法由 {self.market.interval} K线生成 {interval} K线")
+        start -= start % step
+        base = self.info.candles_snapshot(coin, self.market.interval, start, end)
+        if not base:
+            return []
+        times = np.array([c["t"] for c in base], dtype=np.int64)
+        values = {key: np.array([float(c[key]) for c in base]) for key in "ohlcv"}
+        buckets, first = np.unique(times // step, return_index=True)
+        last = np.append(first[1:], len(base)) - 1
+        highs = np.maximum.reduceat(values["h"], first)
+        lows = np.minimum.reduceat(values["l"], first)
+        volumes = np.add.reduceat(values["v"], first)
+        return [
+            {"t": int(bucket * step), "T": int(bucket * step + step - 1), "s": coin, "i": interval,
+             "o": str(values["o"][i]), "h": str(high), "l": str(low), "c": str(values["c"][j]),
+             "v": str(volume), "n": int(j - i + 1)}
+            for bucket, i, j, high, low, volume in zip(buckets, first, last, highs, lows, volumes)
+        ]
+
+    def _asset_ctxs(self) -> List[Dict]:
+        """metaAndAssetCtxs 的资产上下文（由当前价格和最近 24 小时K线推算）"""
+        index = self.exchange.index
+        day_ago = max(index - 86_400_000 // self.market.step, 0)
+        ctxs = []
+        for coin in self._asset_coins:
+            row = self.market.rows[coin]
+            px = self.market.close[row, index]
+            prev = self.market.close[row, day_ago]
+            volume = float(np.nansum(self.market.volume[row, day_ago + 1:index + 1] *
+                                     self.market.close[row, day_ago + 1:index + 1]))
+            ctxs.append({
+                "markPx": str(px), "midPx": str(px), "oraclePx": str(px), "prevDayPx": str(prev),
+                "dayNtlVlm": str(volume), "funding": "0.0000125", "openInterest": str(round(1_000_000 / px, 4)),
+                "premium": "0.0", "impactPxs": [str(px * 0.9999), str(px * 1.0001)],
+            })
+        return ctxs
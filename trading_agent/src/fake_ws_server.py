@@ -0,0 +1,205 @@
+"""
+本地模拟 WebSocket 服务器（仅用于测试）
+实现 Hyperliquid /ws 的订阅协议，可以主动推送 allMids / candle / l2Book / userFills 消息，
+让 SDK 的 Info(skip_ws=False) 和 LiveMarketFeed 在无网络环境下测试
+"""
+import base64
+import hashlib
+import json
+import logging
+import socket
+import socketserver
+import struct
+import threading
+from typing import Dict, List, Optional
+
+from hyperliquid.websocket_manager import subscription_to_identifier, ws_msg_to_identifier
+
+logger = logging.getLogger(__name__)
+
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        data += chunk
+    return data
+
+
+def _read_frame(sock: socket.socket):
+    """读取一个客户端帧，返回 (opcode, payload)"""
+    first, second = _recv_exact(sock, 2)
+    opcode = first & 0x0F
+    masked = second & 0x80
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", _recv_exact(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", _recv_exact(sock, 8))[0]
+    mask = _recv_exact(sock, 4) if masked else b"\x00\x00\x00\x00"
+    payload = bytearray(_recv_exact(sock, length))
+    for i in range(length):
+        payload[i] ^= mask[i % 4]
+    return opcode, bytes(payload)
+
+
+def _encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """编码服务端帧（不加掩码）"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack(">H", length)
+    else:
+        header += bytes([127]) + struct.pack(">Q", length)
+    return header + payload
+
+
+class _ClientConnection:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.subscriptions: set = set()
+        self.send_lock = threading.Lock()
+
+    def send_json(self, message: Dict):
+        with self.send_lock:
+            self.sock.sendall(_encode_frame(json.dumps(message).encode()))
+
+
+class FakeWebsocketServer:
+    """
+    模拟 Hyperliquid WebSocket 服务器
+
+    用法:
+        server = FakeWebsocketServer()
+        server.start()
+        info = Info(server.base_url, skip_ws=False, meta=..., spot_meta=...)
+        ...
+        server.publish("allMids", {"mids": {"BTC": "65000"}})
+        server.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._clients: List[_ClientConnection] = []
+        self._clients_lock = threading.Lock()
+        self.received: List[Dict] = []
+        outer = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                outer._handle(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeWebsocketServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._clients_lock:
+            for client in self._clients:
+                try:
+                    client.sock.close()
+                except OSError:
+                    pass
+            self._clients = []
+        self._server.shutdown()
+        self._server.server_close()
+
+    def subscription_count(self) -> int:
+        with self._clients_lock:
+            return sum(len(c.subscriptions) for c in self._clients)
+
+    def publish(self, channel: str, data) -> int:
+        """
+        向订阅了对应数据流的客户端推送消息
+
+        Returns:
+            收到消息的客户端数量
+        """
+        message = {"channel": channel, "data": data}
+        identifier = ws_msg_to_identifier(message)
+        sent = 0
+        with self._clients_lock:
+            clients = list(self._clients)
+        for client in clients:
+            if identifier in client.subscriptions:
+                try:
+                    client.send_json(message)
+                    sent += 1
+                except OSError:
+                    pass
+        return sent
+
+    # ===== 连接处理 =====
+
+    def _handle(self, sock: socket.socket):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            request += chunk
+        headers = {}
+        for line in request.decode(errors="ignore").split("\r\n")[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(
+            hashlib.sha1((headers.get("sec-websocket-key", "") + _WS_GUID).encode()).digest()
+        ).decode()
+        sock.sendall(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+
+        client = _ClientConnection(sock)
+        with self._clients_lock:
+            self._clients.append(client)
+
+        try:
+            while True:
+                opcode, payload = _read_frame(sock)
+                if opcode == 0x8:  # close
+                    break
+                if opcode == 0x9:  # ping
+                    with client.send_lock:
+                        sock.sendall(_encode_frame(payload, opcode=0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+                self._on_message(client, json.loads(payload))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            with self._clients_lock:
+                if client in self._clients:
+                    self._clients.remove(client)
+
+    def _on_message(self, client: _ClientConnection, message: Dict):
+        self.received.append(message)
+        method = message.get("method")
+        if method == "ping":
+            client.send_json({"channel": "pong"})
+        elif method == "subscribe":
+            subscription = message["subscription"]
+            client.subscriptions.add(subscription_to_identifier(subscription))
+            client.send_json({"channel": "subscriptionResponse", "data": message})
+        elif method == "unsubscribe":
+            client.subscriptions.discard(subscription_to_identifier(message["subscription"]))
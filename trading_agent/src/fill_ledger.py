@@ -0,0 +1,248 @@
+"""
+本地成交账本 - SQLite 持久化 userFills，按游标增量同步
+
+原先 get_trading_history 每次调用都下载完整的 user_fills 再截取前 N 条，
+成交越多请求越大。账本只请求上次同步之后的成交（user_fills_by_time），
+并在写入时维护每个币种的已实现盈亏、手续费和成交额汇总：
+- 最近成交、按币种汇总、整体表现都是本地查询
+- 同一毫秒内的多笔成交靠主键去重，游标停在最新成交时间
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# user_fills_by_time 单次最多返回的成交数量
+MAX_FILLS_PER_REQUEST = 2000
+
+
+class FillLedger:
+    """
+    成交账本
+
+    fills 表保存原始成交，coin_stats 表保存按 (地址, 币种) 累计的汇总，
+    sync_state 表记录每个地址的同步游标。
+    """
+
+    def __init__(self, db_path: str = "data/fills.db"):
+        """
+        Args:
+            db_path: SQLite 文件路径，":memory:" 表示仅内存
+        """
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS fills (
+                address TEXT NOT NULL,
+                fill_key TEXT NOT NULL,
+                time INTEGER NOT NULL,
+                coin TEXT NOT NULL,
+                side TEXT NOT NULL,
+                px REAL NOT NULL,
+                sz REAL NOT NULL,
+                fee REAL NOT NULL DEFAULT 0,
+                closed_pnl REAL NOT NULL DEFAULT 0,
+                dir TEXT,
+                oid INTEGER,
+                PRIMARY KEY (address, fill_key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_fills_time ON fills (address, time);
+            CREATE TABLE IF NOT EXISTS coin_stats (
+                address TEXT NOT NULL,
+                coin TEXT NOT NULL,
+                fills INTEGER NOT NULL DEFAULT 0,
+                volume REAL NOT NULL DEFAULT 0,
+                bought REAL NOT NULL DEFAULT 0,
+                sold REAL NOT NULL DEFAULT 0,
+                fees REAL NOT NULL DEFAULT 0,
+                realized_pnl REAL NOT NULL DEFAULT 0,
+                wins INTEGER NOT NULL DEFAULT 0,
+                losses INTEGER NOT NULL DEFAULT 0,
+                first_time INTEGER,
+                last_time INTEGER,
+                PRIMARY KEY (address, coin)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS sync_state (
+                address TEXT PRIMARY KEY,
+                cursor INTEGER NOT NULL
+            );
+        """)
+        self._conn.commit()
+
+        # 统计
+        self.api_requests = 0
+        self.fills_fetched = 0
+
+    # ===== 写入 =====
+
+    @staticmethod
+    def _fill_key(fill: Dict) -> str:
+        if fill.get("tid") is not None:
+            return f"t{fill['tid']}"
+        return f"{fill.get('hash')}:{fill.get('oid')}:{fill.get('time')}:{fill.get('sz')}:{fill.get('px')}"
+
+    def _insert(self, address: str, fills: List[Dict]) -> int:
+        """写入成交并更新汇总（已存在的成交跳过），返回新增数量"""
+        added = 0
+        for fill in fills:
+            px, sz = float(fill["px"]), float(fill["sz"])
+            fee, closed_pnl = float(fill.get("fee", 0) or 0), float(fill.get("closedPnl", 0) or 0)
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO fills (address, fill_key, time, coin, side, px, sz, fee, closed_pnl, dir, oid) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (address, self._fill_key(fill), int(fill["time"]), fill["coin"], fill["side"], px, sz,
+                 fee, closed_pnl, fill.get("dir"), fill.get("oid"))
+            )
+            if cursor.rowcount == 0:
+                continue
+            added += 1
+            is_buy = fill["side"] == "B"
+            self._conn.execute(
+                "INSERT INTO coin_stats (address, coin, fills, volume, bought, sold, fees, realized_pnl, "
+                "wins, losses, first_time, last_time) VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (address, coin) DO UPDATE SET "
+                "fills = fills + 1, volume = volume + excluded.volume, bought = bought + excluded.bought, "
+                "sold = sold + excluded.sold, fees = fees + excluded.fees, "
+                "realized_pnl = realized_pnl + excluded.realized_pnl, "
+                "wins = wins + excluded.wins, losses = losses + excluded.losses, "
+                "first_time = MIN(first_time, excluded.first_time), last_time = MAX(last_time, excluded.last_time)",
+                (address, fill["coin"], px * sz, sz if is_buy else 0.0, 0.0 if is_buy else sz, fee, closed_pnl,
+                 int(closed_pnl > 0), int(closed_pnl < 0), int(fill["time"]), int(fill["time"]))
+            )
+        return added
+
+    def record_fills(self, address: str, fills: List[Dict]) -> int:
+        """
+        写入成交（WebSocket 推送或外部拉取的结果），不移动同步游标
+
+        Returns:
+            新增的成交数量
+        """
+        with self._lock:
+            added = self._insert(address, fills)
+            self._conn.commit()
+        return added
+
+    def sync(self, info, address: str) -> int:
+        """
+        增量同步：只请求游标之后的成交（超过单次上限时分页）
+
+        Args:
+            info: Hyperliquid Info 实例
+            address: 账户地址
+
+        Returns:
+            新增的成交数量
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT cursor FROM sync_state WHERE address = ?", (address,)).fetchone()
+        cursor = row[0] if row else 0
+
+        added = 0
+        while True:
+            fills = info.user_fills_by_time(address, cursor) or []
+            self.api_requests += 1
+            self.fills_fetched += len(fills)
+            if not fills:
+                break
+            newest = max(int(fill["time"]) for fill in fills)
+            with self._lock:
+                new = self._insert(address, fills)
+                # 游标停在最新成交时间（同一毫秒可能还有成交，靠主键去重）
+                self._conn.execute(
+                    "INSERT INTO sync_state (address, cursor) VALUES (?, ?) "
+                    "ON CONFLICT (address) DO UPDATE SET cursor = MAX(cursor, excluded.cursor)",
+                    (address, newest)
+                )
+                self._conn.commit()
+            added += new
+            # 不足一页、或整页都在同一毫秒（无法再前进）时结束
+            if len(fills) < MAX_FILLS_PER_REQUEST or newest == cursor or new == 0:
+                break
+            cursor = newest
+
+        if added:
+            logger.info(f"成交账本: 新增 {added} 笔成交")
+        return added
+
+    # ===== 查询 =====
+
+    def recent(self, address: str, limit: int = 50, coin: Optional[str] = None) -> List[Dict]:
+        """
+        最近成交（新的在前），格式同 get_trading_history
+
+        Returns:
+            [{"time": "2024-01-01 12:00:00", "coin", "side", "size", "price", "fee", "closed_pnl"}, ...]
+        """
+        query = "SELECT time, coin, side, sz, px, fee, closed_pnl FROM fills WHERE address = ?"
+        params: list = [address]
+        if coin is not None:
+            query += " AND coin = ?"
+            params.append(coin)
+        query += " ORDER BY time DESC, fill_key DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {
+                "time": datetime.fromtimestamp(t / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+                "coin": c, "side": side, "size": sz, "price": px, "fee": fee, "closed_pnl": pnl,
+            }
+            for t, c, side, sz, px, fee, pnl in rows
+        ]
+
+    def coin_stats(self, address: str) -> Dict[str, Dict]:
+        """
+        按币种汇总
+
+        Returns:
+            {币种: {"fills", "volume", "bought", "sold", "fees", "realized_pnl", "net_pnl",
+                    "wins", "losses", "first_time", "last_time"}}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT coin, fills, volume, bought, sold, fees, realized_pnl, wins, losses, first_time, last_time "
+                "FROM coin_stats WHERE address = ? ORDER BY volume DESC", (address,)
+            ).fetchall()
+        return {
+            coin: {
+                "fills": n, "volume": volume, "bought": bought, "sold": sold, "fees": fees,
+                "realized_pnl": pnl, "net_pnl": pnl - fees, "wins": wins, "losses": losses,
+                "first_time": first, "last_time": last,
+            }
+            for coin, n, volume, bought, sold, fees, pnl, wins, losses, first, last in rows
+        }
+
+    def performance(self, address: str) -> Dict:
+        """
+        整体表现（由 coin_stats 汇总，不扫描成交表）
+
+        Returns:
+            {"fills", "volume", "fees", "realized_pnl", "net_pnl", "wins", "losses", "win_rate",
+             "best_coin", "worst_coin"}
+        """
+        stats = self.coin_stats(address)
+        totals = {key: sum(s[key] for s in stats.values())
+                  for key in ("fills", "volume", "fees", "realized_pnl", "net_pnl", "wins", "losses")}
+        closed = totals["wins"] + totals["losses"]
+        totals["win_rate"] = totals["wins"] / closed if closed else 0.0
+        ranked = sorted(stats, key=lambda coin: stats[coin]["net_pnl"])
+        totals["best_coin"] = ranked[-1] if ranked else None
+        totals["worst_coin"] = ranked[0] if ranked else None
+        return totals
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stored = self._conn.execute("SELECT COUNT(*) FROM fills").fetchone()[0]
+        return {"stored_fills": stored, "api_requests": self.api_requests, "fills_fetched": self.fills_fetched}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
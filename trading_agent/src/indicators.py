@@ -0,0 +1,292 @@
+"""
+技术指标计算引擎 - 基于 NumPy 的批量计算
+一次调用即可为 (币种 × K线) 矩阵计算 SMA/EMA/RSI/波动率/高低点
+"""
+import copy
+import logging
+import math
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SMA_PERIOD = 20
+EMA_PERIOD = 12
+RSI_PERIOD = 14
+VOLATILITY_PERIOD = 20
+CHANGE_LOOKBACK = 24
+MIN_CANDLES = 20
+
+
+def _ema_weights(length: int, period: int) -> np.ndarray:
+    """
+    EMA 的闭式权重（以第一根收盘价为初始值）
+
+    ema_n = (1-a)^(n-1) * x_0 + sum_{i>=1} a * (1-a)^(n-1-i) * x_i
+    """
+    alpha = 2 / (period + 1)
+    powers = (1 - alpha) ** np.arange(length - 1, -1, -1, dtype=np.float64)
+    weights = alpha * powers
+    weights[0] = powers[0]
+    return weights
+
+
+def compute_indicator_matrix(closes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    对等长收盘价矩阵批量计算技术指标
+
+    Args:
+        closes: 形状为 (币种数, K线数) 的收盘价矩阵，K线数 >= 20
+
+    Returns:
+        {指标名: 形状为 (币种数,) 的数组}
+    """
+    closes = np.asarray(closes, dtype=np.float64)
+    n = closes.shape[1]
+
+    # 简单移动平均 SMA
+    window = closes[:, -SMA_PERIOD:]
+    sma = window.mean(axis=1)
+
+    # 指数移动平均 EMA（矩阵乘权重向量，无需逐根循环）
+    ema = closes @ _ema_weights(n, EMA_PERIOD)
+
+    # RSI（最近14根的平均涨跌幅）
+    changes = np.diff(closes[:, -(RSI_PERIOD + 1):], axis=1)
+    avg_gain = np.clip(changes, 0, None).mean(axis=1)
+    avg_loss = np.clip(-changes, 0, None).mean(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+
+    # 24小时涨跌幅（不足24根时以第一根为基准）
+    base = closes[:, -CHANGE_LOOKBACK] if n >= CHANGE_LOOKBACK else closes[:, 0]
+    change = (closes[:, -1] - base) / base * 100
+
+    # 波动率（样本标准差 / 均值）
+    vol_window = closes[:, -VOLATILITY_PERIOD:]
+    volatility = vol_window.std(axis=1, ddof=1) / vol_window.mean(axis=1)
+
+    recent = closes[:, -CHANGE_LOOKBACK:]
+    return {
+        "sma_20": sma,
+        "ema_12": ema,
+        "rsi_14": rsi,
+        "price_change_24h": change,
+        "volatility": volatility,
+        "current_price": closes[:, -1],
+        "highest_24h": recent.max(axis=1),
+        "lowest_24h": recent.min(axis=1),
+    }
+
+
+def _format_row(matrix: Dict[str, np.ndarray], row: int) -> Dict:
+    """把矩阵中的一行转换为 calculate_technical_indicators 的返回格式"""
+    sma = float(matrix["sma_20"][row])
+    ema = float(matrix["ema_12"][row])
+    rsi = float(matrix["rsi_14"][row])
+    return {
+        "sma_20": round(sma, 2) if sma else None,
+        "ema_12": round(ema, 2) if ema else None,
+        "rsi_14": round(rsi, 2) if rsi else None,
+        "price_change_24h": round(float(matrix["price_change_24h"][row]), 2),
+        "volatility": round(float(matrix["volatility"][row]), 4),
+        "current_price": float(matrix["current_price"][row]),
+        "highest_24h": float(matrix["highest_24h"][row]),
+        "lowest_24h": float(matrix["lowest_24h"][row]),
+    }
+
+
+def compute_indicators_batch(candles_by_coin: Dict[str, List[Dict]]) -> Dict[str, Dict]:
+    """
+    批量计算多个币种的技术指标
+
+    K线数量相同的币种合并为一个矩阵一次计算，K线不足20根的币种返回空字典。
+
+    Args:
+        candles_by_coin: {币种: K线列表}，K线格式同 AdvancedTradingTools.get_candles
+
+    Returns:
+        {币种: 指标字典}，指标字典格式同 calculate_technical_indicators
+    """
+    results: Dict[str, Dict] = {}
+    groups: Dict[int, List[str]] = {}
+
+    for coin, candles in candles_by_coin.items():
+        if not candles or len(candles) < MIN_CANDLES:
+            results[coin] = {}
+            continue
+        groups.setdefault(len(candles), []).append(coin)
+
+    for length, coins in groups.items():
+        try:
+            closes = np.array(
+                [[c["close"] for c in candles_by_coin[coin]] for coin in coins],
+                dtype=np.float64
+            )
+            matrix = compute_indicator_matrix(closes)
+            for row, coin in enumerate(coins):
+                results[coin] = _format_row(matrix, row)
+        except Exception as e:
+            logger.error(f"批量计算技术指标失败 ({length} 根K线, {len(coins)} 个币种): {e}")
+            for coin in coins:
+                results[coin] = {}
+
+    logger.info(f"批量技术指标计算完成: {sum(1 for v in results.values() if v)}/{len(results)} 个币种")
+    return results
+
+
+def compute_indicators(candles: List[Dict]) -> Dict:
+    """计算单个币种的技术指标（compute_indicators_batch 的单币种版本）"""
+    return compute_indicators_batch({"_": candles})["_"]
+
+
+class IncrementalIndicators:
+    """
+    增量（流式）技术指标状态 - 每个 (币种, 周期) 一个实例
+
+    保存 EMA、Wilder RSI 平均涨跌幅、滚动窗口的和与平方和，
+    每根新K线以 O(1) 更新，无需重新扫描整个窗口。
+
+    最新一根K线通常尚未收盘，作为"待定K线"保存而不计入状态，
+    下次更新时用收盘后的版本替换。
+    """
+
+    def __init__(self, coin: str, interval: str = "1h"):
+        self.coin = coin
+        self.interval = interval
+        self.count = 0  # 已确认的K线数量
+        self.last_time = None  # 已确认的最后一根K线时间
+        self.pending = None  # 未收盘的最新K线
+
+        self._ema = None
+        self._prev_close = None
+        self._avg_gain = 0.0
+        self._avg_loss = 0.0
+        self._rsi_changes = 0
+
+        # 滚动窗口（相对首个价格的偏移量，减少平方和的数值误差）
+        self._shift = None
+        self._window = deque(maxlen=VOLATILITY_PERIOD)
+        self._sum = 0.0
+        self._sum_sq = 0.0
+
+        self.recent_candles = deque(maxlen=CHANGE_LOOKBACK)
+
+    @property
+    def latest_time(self):
+        """已接收的最新K线时间（包括未收盘K线），用于增量拉取"""
+        if self.pending is not None:
+            return self.pending["time"]
+        return self.last_time
+
+    def update(self, candles: List[Dict]) -> int:
+        """
+        接收K线，只处理比已确认状态更新的部分
+
+        Args:
+            candles: 按时间升序的K线列表（可以与已处理的K线重叠）
+
+        Returns:
+            新确认的K线数量
+        """
+        new_candles = [
+            c for c in candles
+            if self.last_time is None or c["time"] > self.last_time
+        ]
+        if not new_candles:
+            return 0
+
+        for candle in new_candles[:-1]:
+            self._commit(candle)
+        self.pending = new_candles[-1]
+        return len(new_candles) - 1
+
+    def _commit(self, candle: Dict):
+        """把一根已收盘的K线计入状态"""
+        close = candle["close"]
+        self.count += 1
+        self.last_time = candle["time"]
+
+        # EMA（以第一根收盘价为初始值）
+        if self._ema is None:
+            self._ema = close
+        else:
+            alpha = 2 / (EMA_PERIOD + 1)
+            self._ema = (close - self._ema) * alpha + self._ema
+
+        # Wilder RSI：前14个变化取简单平均，之后指数平滑
+        if self._prev_close is not None:
+            change = close - self._prev_close
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self._rsi_changes += 1
+            if self._rsi_changes <= RSI_PERIOD:
+                self._avg_gain += gain / RSI_PERIOD
+                self._avg_loss += loss / RSI_PERIOD
+            else:
+                self._avg_gain = (self._avg_gain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+                self._avg_loss = (self._avg_loss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+        self._prev_close = close
+
+        # 滚动和 / 平方和
+        if self._shift is None:
+            self._shift = close
+        value = close - self._shift
+        if len(self._window) == self._window.maxlen:
+            old = self._window[0]
+            self._sum -= old
+            self._sum_sq -= old * old
+        self._window.append(value)
+        self._sum += value
+        self._sum_sq += value * value
+
+        self.recent_candles.append(candle)
+
+    def indicators(self) -> Dict:
+        """
+        当前指标（包含未收盘K线的临时更新）
+
+        Returns:
+            格式同 calculate_technical_indicators；K线不足20根时返回空字典
+        """
+        state = self
+        if self.pending is not None:
+            state = copy.copy(self)
+            state._window = deque(self._window, maxlen=VOLATILITY_PERIOD)
+            state.recent_candles = deque(self.recent_candles, maxlen=CHANGE_LOOKBACK)
+            state._commit(self.pending)
+
+        if state.count < MIN_CANDLES:
+            return {}
+
+        n = len(state._window)
+        mean = state._sum / n
+        variance = max((state._sum_sq - state._sum * mean) / (n - 1), 0.0)
+        sma = mean + state._shift
+
+        if state._avg_loss == 0:
+            rsi = 100.0
+        else:
+            rsi = 100 - 100 / (1 + state._avg_gain / state._avg_loss)
+
+        closes = [c["close"] for c in state.recent_candles]
+        change = (closes[-1] - closes[0]) / closes[0] * 100
+
+        return {
+            "sma_20": round(sma, 2) if sma else None,
+            "ema_12": round(state._ema, 2) if state._ema else None,
+            "rsi_14": round(rsi, 2) if rsi else None,
+            "price_change_24h": round(change, 2),
+            "volatility": round(math.sqrt(variance) / sma, 4),
+            "current_price": closes[-1],
+            "highest_24h": max(closes),
+            "lowest_24h": min(closes),
+        }
+
+    def candles(self) -> List[Dict]:
+        """窗口内的K线（包含未收盘K线）"""
+        candles = list(self.recent_candles)
+        if self.pending is not None:
+            candles.append(self.pending)
+        return candles[-CHANGE_LOOKBACK:]
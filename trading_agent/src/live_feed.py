@@ -0,0 +1,253 @@
+"""
+WebSocket 实时行情 - 订阅 allMids / candle / l2Book / userFills
+维护内存中的实时市场状态，供 LangGraph 节点（通过 MarketSnapshot）读取
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from src.candle_store import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+
+class LiveMarketState:
+    """
+    实时市场状态（线程安全）
+
+    由 WebSocket 回调线程写入，交易节点读取。
+    每类数据记录最后更新时间，读取方可以判断数据是否新鲜。
+    """
+
+    def __init__(self, max_candles: int = 500, max_fills: int = 1000):
+        self._lock = threading.Lock()
+        self.mids: Dict[str, str] = {}
+        self.books: Dict[str, Dict] = {}
+        self.candles: Dict[tuple, Dict[int, Dict]] = {}
+        self.fills = deque(maxlen=max_fills)
+        self.max_candles = max_candles
+
+        self.mids_updated_at: Optional[float] = None
+        self.book_updated_at: Dict[str, float] = {}
+        self.candle_updated_at: Dict[tuple, float] = {}
+        self.message_counts: Dict[str, int] = {}
+
+        self._fill_listeners: List[Callable[[Dict], None]] = []
+
+    # ===== WebSocket 回调 =====
+
+    def on_all_mids(self, msg: Dict):
+        """allMids: {"channel": "allMids", "data": {"mids": {"BTC": "65000.0", ...}}}"""
+        with self._lock:
+            self.mids.update(msg["data"]["mids"])
+            self.mids_updated_at = time.monotonic()
+            self._count("allMids")
+
+    def on_l2_book(self, msg: Dict):
+        """l2Book: {"channel": "l2Book", "data": {"coin": "BTC", "levels": [[bids], [asks]], "time": ...}}"""
+        book = msg["data"]
+        with self._lock:
+            self.books[book["coin"]] = book
+            self.book_updated_at[book["coin"]] = time.monotonic()
+            self._count("l2Book")
+
+    def on_candle(self, msg: Dict):
+        """candle: {"channel": "candle", "data": {"t", "T", "s", "i", "o", "c", "h", "l", "v", "n"}}"""
+        candle = msg["data"]
+        key = (candle["s"], candle["i"])
+        with self._lock:
+            series = self.candles.setdefault(key, {})
+            series[int(candle["t"])] = candle
+            if len(series) > self.max_candles:
+                del series[min(series)]
+            self.candle_updated_at[key] = time.monotonic()
+            self._count("candle")
+
+    def on_user_fills(self, msg: Dict):
+        """userFills: {"channel": "userFills", "data": {"user": ..., "isSnapshot": bool, "fills": [...]}}"""
+        data = msg["data"]
+        fills = data.get("fills", [])
+        with self._lock:
+            self.fills.extend(fills)
+            self._count("userFills")
+            listeners = list(self._fill_listeners)
+
+        # 快照是历史成交，不通知监听者
+        if data.get("isSnapshot"):
+            return
+        for fill in fills:
+            for listener in listeners:
+                try:
+                    listener(fill)
+                except Exception as e:
+                    logger.error(f"成交回调失败: {e}")
+
+    def _count(self, channel: str):
+        self.message_counts[channel] = self.message_counts.get(channel, 0) + 1
+
+    # ===== 读取 =====
+
+    def get_mids(self, max_age: float) -> Optional[Dict[str, str]]:
+        """最新中间价；超过 max_age 秒未更新则返回 None"""
+        with self._lock:
+            if self.mids_updated_at is None or time.monotonic() - self.mids_updated_at > max_age:
+                return None
+            return dict(self.mids)
+
+    def get_book(self, coin: str, max_age: float) -> Optional[Dict]:
+        """最新 L2 订单簿（格式同 info.l2_snapshot）；过期返回 None"""
+        with self._lock:
+            updated_at = self.book_updated_at.get(coin)
+            if updated_at is None or time.monotonic() - updated_at > max_age:
+                return None
+            return self.books[coin]
+
+    def get_candles(self, coin: str, interval: str, start_time: int, max_age: float) -> Optional[List[Dict]]:
+        """
+        从 start_time 起的实时K线（candles_snapshot 原始格式）
+
+        只有当实时数据完整覆盖 start_time 且 max_age 秒内有更新时才返回，否则返回 None（调用方回退到 REST）
+        """
+        step = INTERVAL_MS.get(interval)
+        if step:
+            start_time -= start_time % step
+        with self._lock:
+            updated_at = self.candle_updated_at.get((coin, interval))
+            if updated_at is None or time.monotonic() - updated_at > max_age:
+                return None
+            series = self.candles.get((coin, interval))
+            if not series or min(series) > start_time:
+                return None
+            return [series[t] for t in sorted(series) if t >= start_time]
+
+    def get_fills(self, oid: Optional[int] = None) -> List[Dict]:
+        """已收到的成交（可按订单号过滤）"""
+        with self._lock:
+            return [f for f in self.fills if oid is None or f.get("oid") == oid]
+
+    def add_fill_listener(self, listener: Callable[[Dict], None]):
+        """注册成交回调（每笔新成交调用一次）"""
+        with self._lock:
+            self._fill_listeners.append(listener)
+
+    def remove_fill_listener(self, listener: Callable[[Dict], None]):
+        with self._lock:
+            if listener in self._fill_listeners:
+                self._fill_listeners.remove(listener)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "messages": dict(self.message_counts),
+                "coins_with_mids": len(self.mids),
+                "books": len(self.books),
+                "candle_series": len(self.candles),
+                "fills": len(self.fills),
+            }
+
+
+class LiveMarketFeed:
+    """
+    WebSocket 行情订阅管理
+
+    使用 SDK 的 Info.subscribe（需要以 skip_ws=False 创建 Info）
+    """
+
+    def __init__(
+        self,
+        info,
+        address: Optional[str] = None,
+        coins: Optional[List[str]] = None,
+        intervals: Optional[List[str]] = None,
+        subscribe_books: bool = True,
+        state: Optional[LiveMarketState] = None
+    ):
+        """
+        Args:
+            info: Hyperliquid Info 实例（skip_ws=False）
+            address: 账户地址（订阅成交，None 表示不订阅）
+            coins: 订阅K线和订单簿的币种
+            intervals: 订阅的K线周期
+            subscribe_books: 是否订阅 L2 订单簿
+            state: 实时状态（None 则新建）
+        """
+        self.info = info
+        self.address = address
+        self.coins = coins or ["BTC", "ETH"]
+        self.intervals = intervals or ["1h"]
+        self.subscribe_books = subscribe_books
+        self.state = state or LiveMarketState()
+        self._subscriptions: List[tuple] = []
+
+    def start(self) -> LiveMarketState:
+        """订阅所有数据流"""
+        self._subscribe({"type": "allMids"}, self.state.on_all_mids)
+        for coin in self.coins:
+            for interval in self.intervals:
+                self._subscribe({"type": "candle", "coin": coin, "interval": interval}, self.state.on_candle)
+            if self.subscribe_books:
+                self._subscribe({"type": "l2Book", "coin": coin}, self.state.on_l2_book)
+        if self.address:
+            self._subscribe({"type": "userFills", "user": self.address}, self.state.on_user_fills)
+
+        logger.info(f"📡 WebSocket 订阅完成: {len(self._subscriptions)} 个数据流 ({', '.join(self.coins)})")
+        return self.state
+
+    def stop(self):
+        """取消订阅并断开 WebSocket"""
+        for subscription, subscription_id in self._subscriptions:
+            try:
+                self.info.unsubscribe(subscription, subscription_id)
+            except Exception as e:
+                logger.debug(f"取消订阅失败 {subscription}: {e}")
+        self._subscriptions = []
+        try:
+            self.info.disconnect_websocket()
+        except Exception as e:
+            logger.debug(f"断开 WebSocket 失败: {e}")
+        logger.info("📡 WebSocket 已断开")
+
+    def wait_until_ready(self, timeout: float = 10.0) -> bool:
+        """等待首个 allMids 推送到达"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.state.mids_updated_at is not None:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def _subscribe(self, subscription: Dict, callback: Callable[[Dict], None]):
+        subscription_id = self.info.subscribe(dict(subscription), callback)
+        self._subscriptions.append((subscription, subscription_id))
+
+
+def start_live_feed(config: Dict, info, address: str, snapshot) -> Optional[LiveMarketFeed]:
+    """
+    按配置启动实时行情（agent.market_feed = "websocket"），并接入 MarketSnapshot
+
+    Args:
+        config: 完整配置
+        info: Hyperliquid Info 实例（skip_ws=False）
+        address: 账户地址
+        snapshot: MarketSnapshot 实例
+
+    Returns:
+        LiveMarketFeed；REST 模式返回 None
+    """
+    agent_config = config.get("agent", {})
+    if agent_config.get("market_feed", "rest") != "websocket":
+        return None
+
+    feed = LiveMarketFeed(
+        info,
+        address=address,
+        coins=agent_config.get("coins") or ["BTC", "ETH"],
+        intervals=agent_config.get("feed_intervals", ["1h"])
+    )
+    feed.start()
+    snapshot.attach_live_state(feed.state)
+    if not feed.wait_until_ready(timeout=agent_config.get("feed_ready_timeout", 10)):
+        logger.warning("⚠️  WebSocket 行情尚未就绪，暂时回退到 REST")
+    return feed
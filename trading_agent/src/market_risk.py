@@ -0,0 +1,374 @@
+"""
+市场风险模型 - 基于本地K线历史的组合 VaR / ES
+
+从 CandleStore 读取持仓币种和候选币种的收盘价，按时间对齐后计算对数收益率，
+在滚动窗口内维护收益率的一阶和与外积和（协方差矩阵的充分统计量）：
+- 每根新K线只做一次 O(K²) 的增量更新（加入新收益率行、移出最旧的行）
+- 币种集合扩大时才完整重建；不再需要且没有新K线的币种直接删去对应的行列
+
+组合风险（当前持仓 + 拟执行交易）同时给出：
+- 参数法 VaR / ES（正态假设，σ = sqrt(wᵀΣw)）
+- 历史模拟法 VaR / ES（窗口内每根K线的组合盈亏）
+"""
+import logging
+import time
+from collections import deque
+from statistics import NormalDist
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.candle_store import INTERVAL_MS
+
+logger = logging.getLogger(__name__)
+
+# 组合 VaR 占账户价值的比例 → 风险等级
+RISK_LEVELS = ((0.02, "low", "风险可控"), (0.05, "medium", "谨慎交易"), (float("inf"), "high", "降低仓位"))
+
+
+class MarketRiskModel:
+    """
+    收益率协方差缓存 + 组合 VaR / ES
+
+    用法:
+        model = MarketRiskModel(candle_store, info, interval="1h", window=168)
+        risk = model.assess(positions, current_prices, account_value, trades)
+    """
+
+    def __init__(
+        self,
+        candle_store=None,
+        info=None,
+        interval: str = "1h",
+        window: int = 168,
+        confidence: float = 0.95,
+        horizon_bars: int = 1,
+        min_observations: int = 20
+    ):
+        """
+        Args:
+            candle_store: 本地K线缓存（None 表示只使用 update() 写入的K线）
+            info: Hyperliquid Info 实例；提供时经 CandleStore 向交易所补齐新收盘的K线（首次为一个窗口）
+            interval: K线周期
+            window: 协方差窗口（收益率数量）
+            confidence: VaR 置信度
+            horizon_bars: 持有期（K线数量，按 sqrt(h) 放大）
+            min_observations: 计算 VaR 所需的最少收益率数量
+        """
+        if interval not in INTERVAL_MS:
+            raise ValueError(f"不支持的K线周期: {interval}")
+        self.candle_store = candle_store
+        self.info = info
+        self.interval = interval
+        self.window = window
+        self.confidence = confidence
+        self.horizon_bars = horizon_bars
+        self.min_observations = min_observations
+
+        self._closes: Dict[str, Dict[int, float]] = {}
+        self._loaded: Dict[str, int] = {}
+
+        # 协方差状态（列 = self._coins）
+        self._coins: List[str] = []
+        self._rows: deque = deque()
+        self._sum = np.zeros(0)
+        self._outer = np.zeros((0, 0))
+        self._last_t: Optional[int] = None
+        self._last_closes = np.zeros(0)
+
+        # 统计
+        self.full_rebuilds = 0
+        self.incremental_updates = 0
+
+    # ===== 数据 =====
+
+    def update(self, candles_by_coin: Dict[str, List[Dict]]):
+        """
+        写入K线（candles_snapshot 格式），未收盘的K线忽略
+
+        Args:
+            candles_by_coin: {币种: K线列表}
+        """
+        now = int(time.time() * 1000)
+        keep = 2 * (self.window + 1)
+        for coin, candles in candles_by_coin.items():
+            series = self._closes.setdefault(coin, {})
+            for candle in candles:
+                if int(candle["T"]) < now:
+                    series[int(candle["t"])] = float(candle["c"])
+            if len(series) > keep:
+                for t in sorted(series)[:-keep]:
+                    del series[t]
+            if series:
+                self._loaded[coin] = max(series)
+
+    def sync(self, coins: Iterable[str]):
+        """
+        读取各币种新收盘的K线（只读取上次之后的部分）
+
+        有 info 时经 CandleStore 向交易所补齐（只请求缺失的已收盘K线），否则只读取本地缓存。
+        """
+        if self.candle_store is None:
+            return
+        step = INTERVAL_MS[self.interval]
+        # 最新一根已收盘K线的结束时间（未收盘的K线不请求）
+        closed = int(time.time() * 1000) // step * step - 1
+        fresh = {}
+        for coin in coins:
+            last = self._loaded.get(coin)
+            start = last + step if last is not None else closed + 1 - (self.window + 1) * step
+            try:
+                if self.info is not None:
+                    if start <= closed:
+                        fresh[coin] = self.candle_store.get_candles(self.info, coin, self.interval, start, closed)
+                else:
+                    fresh[coin] = self.candle_store.load(coin, self.interval, start)
+            except Exception as e:
+                logger.warning(f"读取 {coin} K线失败: {e}")
+        self.update(fresh)
+
+    # ===== 协方差 =====
+
+    def _common_times(self, coins: List[str]) -> List[int]:
+        times = set(self._closes.get(coins[0], {}))
+        for coin in coins[1:]:
+            times &= set(self._closes.get(coin, {}))
+        return sorted(times)
+
+    def _push(self, row: np.ndarray):
+        self._rows.append(row)
+        self._sum += row
+        self._outer += np.outer(row, row)
+        if len(self._rows) > self.window:
+            old = self._rows.popleft()
+            self._sum -= old
+            self._outer -= np.outer(old, old)
+
+    def _rebuild(self, coins: List[str]):
+        """按新的币种集合完整重建窗口"""
+        self._coins = coins
+        k = len(coins)
+        self._rows = deque()
+        self._sum = np.zeros(k)
+        self._outer = np.zeros((k, k))
+        self._last_t = None
+        self._last_closes = np.zeros(k)
+        if not coins:
+            return
+        times = self._common_times(coins)[-(self.window + 1):]
+        if not times:
+            return
+        closes = np.array([[self._closes[coin][t] for coin in coins] for t in times])
+        returns = np.diff(np.log(closes), axis=0)
+        self._rows = deque(returns)
+        self._sum = returns.sum(axis=0)
+        self._outer = returns.T @ returns
+        self._last_t = times[-1]
+        self._last_closes = closes[-1]
+        self.full_rebuilds += 1
+
+    def _drop(self, coins: List[str]):
+        """删去不再需要的币种对应的行列（协方差子矩阵仍然有效，无需重建）"""
+        keep = [i for i, coin in enumerate(self._coins) if coin not in coins]
+        self._coins = [self._coins[i] for i in keep]
+        self._rows = deque(row[keep] for row in self._rows)
+        self._sum = self._sum[keep]
+        self._outer = self._outer[np.ix_(keep, keep)]
+        self._last_closes = self._last_closes[keep]
+
+    def _advance(self):
+        """加入上次之后新对齐的K线（每根一次增量更新）"""
+        if not self._coins or self._last_t is None:
+            return
+        for t in self._common_times(self._coins):
+            if t <= self._last_t:
+                continue
+            closes = np.array([self._closes[coin][t] for coin in self._coins])
+            self._push(np.log(closes / self._last_closes))
+            self._last_t, self._last_closes = t, closes
+            self.incremental_updates += 1
+
+    def covariance(self, coins: Iterable[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        协方差矩阵（每根K线的对数收益率）
+
+        Args:
+            coins: 需要的币种；历史不足的币种不包含在结果中
+
+        Returns:
+            (币种列表, 协方差矩阵 K×K, 窗口内收益率矩阵 N×K)
+        """
+        coins = list(dict.fromkeys(coins))
+        self.sync(coins)
+        usable = [c for c in coins if len(self._closes.get(c, {})) > self.min_observations]
+        if usable:
+            # 不再需要的币种（如已平仓）不再同步K线，保留其列会让对齐的时间停止前进
+            latest = min(max(self._closes[c]) for c in usable)
+            stale = [c for c in self._coins if c not in usable and max(self._closes.get(c) or [0]) < latest]
+            if stale:
+                self._drop(stale)
+        if not set(usable) <= set(self._coins):
+            # 保留已有的列，避免币种集合来回切换时反复重建
+            self._rebuild(list(dict.fromkeys(self._coins + usable)))
+        else:
+            self._advance()
+
+        columns = [self._coins.index(c) for c in usable]
+        n = len(self._rows)
+        if n < 2 or not columns:
+            return usable, np.zeros((len(usable), len(usable))), np.zeros((n, len(usable)))
+        mean = self._sum / n
+        cov = (self._outer - n * np.outer(mean, mean)) / (n - 1)
+        returns = np.array(self._rows)[:, columns]
+        return usable, cov[np.ix_(columns, columns)], returns
+
+    # ===== 组合风险 =====
+
+    def assess(
+        self,
+        positions: List[Dict],
+        current_prices: Dict[str, float],
+        account_value: float,
+        trades: Optional[List[Dict]] = None
+    ) -> Dict:
+        """
+        评估当前持仓 + 拟执行交易的组合风险
+
+        Args:
+            positions: 当前持仓（get_positions 的返回值）
+            current_prices: 当前价格
+            account_value: 账户价值（VaR 比例的分母）
+            trades: 拟执行的交易 [{"decision", "coin", "size"}, ...]
+
+        Returns:
+            {
+                "available": 是否有足够历史,
+                "risk_level": "low" / "medium" / "high", "volatility": 组合每根K线波动率, "recommendation",
+                "confidence", "horizon_bars", "observations", "coins", "missing",
+                "parametric": {"var", "es"}, "historical": {"var", "es"},  # 美元
+                "var_pct": VaR / 账户价值（取两种方法较大者）, "var_pct_before": 交易前,
+                "contributions": {币种: 参数法 VaR 贡献占比}, "max_correlation": {"pair", "value"}
+            }
+        """
+        def price(coin: str) -> float:
+            return float(current_prices.get(coin) or 0)
+
+        before: Dict[str, float] = {}
+        for pos in positions:
+            before[pos["coin"]] = before.get(pos["coin"], 0.0) + pos["size"] * (price(pos["coin"]) or pos["current_price"])
+        after = dict(before)
+        for trade in trades or []:
+            coin, decision = trade.get("coin"), trade.get("decision")
+            if decision == "close":
+                after[coin] = 0.0
+            elif decision in ("buy", "sell"):
+                sign = 1.0 if decision == "buy" else -1.0
+                after[coin] = after.get(coin, 0.0) + sign * abs(float(trade.get("size") or 0)) * price(coin)
+
+        wanted = [coin for coin in dict.fromkeys(list(before) + list(after)) if before.get(coin) or after.get(coin)]
+        result = {
+            "available": False, "risk_level": "unknown", "volatility": None, "recommendation": "历史数据不足",
+            "confidence": self.confidence, "horizon_bars": self.horizon_bars, "observations": 0,
+            "coins": [], "missing": wanted,
+        }
+        if not wanted:
+            result.update(available=True, risk_level="low", volatility=0.0, recommendation="无持仓",
+                          parametric={"var": 0.0, "es": 0.0}, historical={"var": 0.0, "es": 0.0},
+                          var_pct=0.0, var_pct_before=0.0, contributions={}, max_correlation=None)
+            return result
+
+        coins, cov, returns = self.covariance(wanted)
+        result.update(observations=len(returns), coins=coins, missing=[c for c in wanted if c not in coins])
+        if len(returns) < self.min_observations:
+            return result
+
+        w_before = np.array([before.get(coin, 0.0) for coin in coins])
+        w_after = np.array([after.get(coin, 0.0) for coin in coins])
+        scale = np.sqrt(self.horizon_bars)
+        normal = NormalDist()
+        z = normal.inv_cdf(self.confidence)
+        simple_returns = np.expm1(returns)
+
+        def book_risk(w: np.ndarray) -> Tuple[float, float, float, float, float]:
+            sigma = float(np.sqrt(max(w @ cov @ w, 0.0))) * scale
+            losses = -(simple_returns @ w) * scale
+            hist_var = float(np.quantile(losses, self.confidence))
+            tail = losses[losses >= hist_var]
+            hist_es = float(tail.mean()) if len(tail) else hist_var
+            return sigma, z * sigma, sigma * normal.pdf(z) / (1 - self.confidence), hist_var, hist_es
+
+        sigma, var_p, es_p, var_h, es_h = book_risk(w_after)
+        _, var_p0, _, var_h0, _ = book_risk(w_before)
+
+        def pct(value: float) -> float:
+            return round(value / account_value, 6) if account_value > 0 else 0.0
+
+        var_pct = pct(max(var_p, var_h))
+        level, recommendation = next((lv, rec) for limit, lv, rec in RISK_LEVELS if var_pct < limit)
+
+        # 参数法 VaR 的成分贡献：w_i (Σw)_i / wᵀΣw
+        variance = float(w_after @ cov @ w_after)
+        contributions = {}
+        if variance > 0:
+            shares = w_after * (cov @ w_after) / variance
+            contributions = {coin: round(float(s), 4) for coin, s, w in zip(coins, shares, w_after) if w}
+
+        max_correlation = None
+        held = [i for i, coin in enumerate(coins) if w_after[i]]
+        if len(held) > 1:
+            vol = np.sqrt(np.diag(cov)[held])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                corr = cov[np.ix_(held, held)] / np.outer(vol, vol)
+            np.fill_diagonal(corr, np.nan)
+            if not np.isnan(corr).all():
+                i, j = np.unravel_index(np.nanargmax(np.abs(corr)), corr.shape)
+                max_correlation = {"pair": [coins[held[i]], coins[held[j]]], "value": round(float(corr[i, j]), 4)}
+
+        gross = float(np.abs(w_after).sum())
+        result.update(
+            available=True,
+            risk_level=level,
+            volatility=round(sigma / gross, 6) if gross > 0 else 0.0,
+            recommendation=recommendation,
+            parametric={"var": round(var_p, 2), "es": round(es_p, 2)},
+            historical={"var": round(var_h, 2), "es": round(es_h, 2)},
+            var_pct=var_pct,
+            var_pct_before=pct(max(var_p0, var_h0)),
+            contributions=contributions,
+            max_correlation=max_correlation,
+        )
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "coins": len(self._coins),
+            "observations": len(self._rows),
+            "full_rebuilds": self.full_rebuilds,
+            "incremental_updates": self.incremental_updates,
+        }
+
+
+def create_market_risk_model(config: Dict, candle_store, info=None) -> Optional[MarketRiskModel]:
+    """
+    按 risk.market_risk 配置创建市场风险模型
+
+    {"enabled": true, "interval": "1h", "window": 168, "confidence": 0.95,
+     "horizon_bars": 1, "min_observations": 20, "max_var_pct": 0.05}
+
+    Returns:
+        未启用或没有K线缓存时返回 None
+    """
+    settings = config.get("risk", {}).get("market_risk", {})
+    if not settings.get("enabled", False) or candle_store is None:
+        return None
+    model = MarketRiskModel(
+        candle_store,
+        info,
+        interval=settings.get("interval", "1h"),
+        window=settings.get("window", 168),
+        confidence=settings.get("confidence", 0.95),
+        horizon_bars=settings.get("horizon_bars", 1),
+        min_observations=settings.get("min_observations", 20),
+    )
+    logger.info(f"📉 市场风险模型: {model.interval} × {model.window}，VaR 置信度 {model.confidence:.0%}")
+    return model
@@ -0,0 +1,180 @@
+"""
+全市场扫描 - 一次 metaAndAssetCtxs 请求为全部永续合约排名，只把前 K 个交给后续分析
+
+原先只分析配置的几个币种（默认 BTC/ETH），提示词却说可以交易任何币种。
+逐个币种拉 K线再筛选需要 N 次请求，全部写进提示词又太长。扫描器用一次请求拿到
+全市场的资产上下文，在 NumPy 中向量化计算四个因子的百分位排名并加权：
+- momentum: 24h 涨跌幅绝对值（做多做空都是机会）
+- volume: 24h 成交额（对数）
+- funding: 资金费率绝对值（拥挤程度）
+- volatility: 相邻两次扫描标记价格的已实现波动（历史不足时用 24h 涨跌幅代替）
+成交额过低、已下架、持仓量已达上限的币种不参与排名。
+"""
+import logging
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {"momentum": 0.35, "volume": 0.3, "funding": 0.15, "volatility": 0.2}
+
+
+def percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """百分位排名（0 = 最小，1 = 最大；只有一个值时为 1）"""
+    n = len(values)
+    if n <= 1:
+        return np.ones(n)
+    ranks = np.empty(n)
+    ranks[np.argsort(values, kind="stable")] = np.arange(n)
+    return ranks / (n - 1)
+
+
+def parse_asset_ctxs(meta_and_ctxs) -> Dict[str, np.ndarray]:
+    """
+    metaAndAssetCtxs 响应 → 按资产编号排列的数组
+
+    Returns:
+        {"coins": 币种数组, "mark", "prev_day", "volume", "funding", "open_interest", "delisted"}
+    """
+    meta, ctxs = meta_and_ctxs
+    universe = meta.get("universe", [])[:len(ctxs)]
+
+    def column(key: str) -> np.ndarray:
+        return np.array([float(ctx.get(key) or 0.0) for ctx in ctxs[:len(universe)]], dtype=np.float64)
+
+    return {
+        "coins": np.array([asset["name"] for asset in universe]),
+        "mark": column("markPx"),
+        "prev_day": column("prevDayPx"),
+        "volume": column("dayNtlVlm"),
+        "funding": column("funding"),
+        "open_interest": column("openInterest"),
+        "delisted": np.array([bool(asset.get("isDelisted", False)) for asset in universe]),
+    }
+
+
+class MarketScanner:
+    """
+    市场扫描器
+
+    用法:
+        scanner = MarketScanner(top_k=6)
+        scan = scanner.scan(info.meta_and_asset_ctxs())
+        coins = scan["candidates"]  # 只为这些币种拉K线、写入提示词
+    """
+
+    def __init__(
+        self,
+        top_k: int = 6,
+        min_day_volume: float = 1_000_000.0,
+        weights: Optional[Dict[str, float]] = None,
+        allowed_coins: Optional[List[str]] = None,
+        history: int = 24
+    ):
+        """
+        Args:
+            top_k: 每次选出的币种数（不含必选币种）
+            min_day_volume: 参与排名的最低 24h 成交额（美元）
+            weights: 因子权重，默认 DEFAULT_WEIGHTS
+            allowed_coins: 只在这些币种中选择（空表示全部，同 risk.allowed_coins）
+            history: 保留最近多少次扫描的标记价格用于计算波动
+        """
+        self.top_k = top_k
+        self.min_day_volume = min_day_volume
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.allowed_coins = set(allowed_coins or [])
+        self._marks: deque = deque(maxlen=max(history, 2))
+        self._universe: Optional[tuple] = None
+        self.scans = 0
+
+    def _volatility(self, coins: np.ndarray, mark: np.ndarray) -> Optional[np.ndarray]:
+        """相邻扫描之间的对数收益标准差（币种列表变化时重新积累）"""
+        universe = tuple(coins.tolist())
+        if universe != self._universe:
+            self._marks.clear()
+            self._universe = universe
+        self._marks.append(mark)
+        if len(self._marks) < 3:
+            return None
+        history = np.vstack(self._marks)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = np.diff(np.log(np.where(history > 0, history, np.nan)), axis=0)
+        return np.nan_to_num(np.nanstd(returns, axis=0))
+
+    def scan(self, meta_and_ctxs, include: Iterable[str] = (), exclude: Iterable[str] = ()) -> Dict:
+        """
+        为全市场排名并选出候选币种
+
+        Args:
+            meta_and_ctxs: info.meta_and_asset_ctxs() 的原始响应
+            include: 必选币种（持仓、配置的关注币种），排在候选列表最前面，不占 top_k 名额
+            exclude: 不参与排名的币种（如持仓量已达上限）
+
+        Returns:
+            {"universe": 合约总数, "eligible": 参与排名的数量, "candidates": [币种],
+             "ranked": [{"coin", "px", "change_24h", "volume", "funding", "open_interest", "volatility", "score"}]}
+        """
+        table = parse_asset_ctxs(meta_and_ctxs)
+        coins, mark = table["coins"], table["mark"]
+        volatility = self._volatility(coins, mark)
+        self.scans += 1
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = np.where(table["prev_day"] > 0, mark / table["prev_day"] - 1, 0.0)
+        include = list(dict.fromkeys(include))
+        eligible = (mark > 0) & ~table["delisted"] & (table["volume"] >= self.min_day_volume)
+        eligible &= ~np.isin(coins, list(set(exclude) | set(include)))
+        if self.allowed_coins:
+            eligible &= np.isin(coins, list(self.allowed_coins))
+
+        index = np.flatnonzero(eligible)
+        factors = {
+            "momentum": np.abs(change[index]),
+            "volume": np.log1p(table["volume"][index]),
+            "funding": np.abs(table["funding"][index]),
+            "volatility": volatility[index] if volatility is not None else np.abs(change[index]),
+        }
+        score = sum(self.weights[name] * percentile_ranks(values) for name, values in factors.items())
+        score = score / sum(self.weights.values()) if len(index) else np.zeros(0)
+
+        k = min(self.top_k, len(index))
+        top = np.argpartition(-score, k - 1)[:k] if k else np.zeros(0, dtype=int)
+        top = top[np.argsort(-score[top], kind="stable")]
+        ranked = [
+            {
+                "coin": str(coins[i]), "px": float(mark[i]), "change_24h": round(float(change[i]) * 100, 2),
+                "volume": float(table["volume"][i]), "funding": float(table["funding"][i]),
+                "open_interest": float(table["open_interest"][i] * mark[i]),
+                "volatility": float(volatility[i]) if volatility is not None else None,
+                "score": round(float(s), 3),
+            }
+            for i, s in zip(index[top], score[top])
+        ]
+        candidates = include + [row["coin"] for row in ranked]
+        logger.info(
+            f"🔭 市场扫描: {len(coins)} 个合约，{len(index)} 个参与排名，"
+            f"选出 {', '.join(row['coin'] for row in ranked) or '无'}"
+        )
+        return {"universe": int(len(coins)), "eligible": int(len(index)), "candidates": candidates, "ranked": ranked}
+
+
+def create_market_scanner(config: Dict) -> Optional[MarketScanner]:
+    """
+    按 agent.scanner 配置创建市场扫描器
+
+    {"enabled": true, "top_k": 6, "min_day_volume": 1000000, "weights": {"momentum": 0.35, ...}}
+
+    Returns:
+        未启用时返回 None（只分析 agent.coins）
+    """
+    settings = config.get("agent", {}).get("scanner", {})
+    if not settings.get("enabled", False):
+        return None
+    return MarketScanner(
+        top_k=settings.get("top_k", 6),
+        min_day_volume=settings.get("min_day_volume", 1_000_000.0),
+        weights=settings.get("weights"),
+        allowed_coins=config.get("risk", {}).get("allowed_coins"),
+    )
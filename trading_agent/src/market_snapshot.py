@@ -0,0 +1,187 @@
+"""
+周期级行情快照缓存
+同一交易周期内，每个上游接口（all_mids / user_state / l2_snapshot ...）最多请求一次
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MarketSnapshot:
+    """
+    行情快照 - HyperliquidTools 和 AdvancedTradingTools 共享
+
+    - 每个周期开始时调用 new_cycle() 清空缓存
+    - 缓存项超过 TTL 自动失效（防止单个周期内 LLM 耗时过长导致数据过旧）
+    - 同一请求并发调用时只会真正请求一次（其余线程等待结果）
+    - 下单等会改变账户状态的操作之后，调用 invalidate("user_state")
+    - 接入 WebSocket 实时状态后，all_mids / l2_snapshot / K线优先读取实时数据
+    """
+
+    def __init__(self, info, ttl: float = 10.0, live_max_age: float = 5.0):
+        """
+        Args:
+            info: Hyperliquid Info 实例
+            ttl: 缓存有效期（秒）
+            live_max_age: 实时数据超过该秒数未更新则视为过期，回退到 REST
+        """
+        self.info = info
+        self.ttl = ttl
+        self.cycle = 0
+        self.live_state = None
+        self.live_max_age = live_max_age
+        self.live_hits = 0
+
+        self._cache: Dict[Hashable, tuple] = {}
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self._endpoint_stats: Dict[str, Dict[str, int]] = {}
+
+    # ===== 周期管理 =====
+
+    def new_cycle(self):
+        """开始新的交易周期：清空缓存，重置本周期计数"""
+        with self._lock:
+            self._cache.clear()
+            self.cycle += 1
+            self.hits = 0
+            self.misses = 0
+            self.live_hits = 0
+            self._endpoint_stats = {}
+
+    def attach_live_state(self, live_state):
+        """
+        接入 WebSocket 实时状态（LiveMarketState）
+
+        收到新成交时自动使 user_state 缓存失效。
+        """
+        self.live_state = live_state
+        live_state.add_fill_listener(lambda fill: self.invalidate("user_state", "open_orders"))
+
+    def invalidate(self, *endpoints: str):
+        """
+        使指定接口的缓存失效（不传参数则全部失效）
+
+        Args:
+            endpoints: 接口名，如 "user_state", "all_mids"
+        """
+        with self._lock:
+            if not endpoints:
+                self._cache.clear()
+                return
+            for key in list(self._cache):
+                if key[0] in endpoints:
+                    del self._cache[key]
+
+    def prime(self, key: tuple, value: Any):
+        """
+        写入外部获取的数据（如异步流水线通过 httpx 获取的结果），计为一次未命中
+
+        Args:
+            key: 缓存键，与接口方法一致，如 ("all_mids",), ("user_state", address)
+            value: 接口原始返回值
+        """
+        with self._lock:
+            self._cache[key] = (time.monotonic(), value)
+            self.misses += 1
+            self._endpoint_stats.setdefault(key[0], {"hits": 0, "misses": 0})["misses"] += 1
+
+    def stats(self) -> Dict:
+        """
+        命中统计
+
+        Returns:
+            {"cycle": 3, "hits": 5, "misses": 2, "endpoints": {"all_mids": {"hits": 3, "misses": 1}, ...}}
+        """
+        with self._lock:
+            return {
+                "cycle": self.cycle,
+                "hits": self.hits,
+                "misses": self.misses,
+                "live_hits": self.live_hits,
+                "endpoints": {k: dict(v) for k, v in self._endpoint_stats.items()},
+            }
+
+    # ===== 缓存的接口 =====
+
+    def all_mids(self) -> Dict[str, str]:
+        """所有币种中间价（原始格式）"""
+        if self.live_state is not None:
+            mids = self.live_state.get_mids(self.live_max_age)
+            if mids:
+                self._count_live()
+                return mids
+        return self._memoize(("all_mids",), self.info.all_mids)
+
+    def user_state(self, address: str) -> Dict:
+        """账户状态（原始格式）"""
+        return self._memoize(("user_state", address), lambda: self.info.user_state(address))
+
+    def l2_snapshot(self, coin: str) -> Dict:
+        """L2 订单簿"""
+        if self.live_state is not None:
+            book = self.live_state.get_book(coin, self.live_max_age)
+            if book is not None:
+                self._count_live()
+                return book
+        return self._memoize(("l2_snapshot", coin), lambda: self.info.l2_snapshot(coin))
+
+    def meta_and_asset_ctxs(self) -> Any:
+        """资产元数据和实时上下文"""
+        return self._memoize(("meta_and_asset_ctxs",), self.info.meta_and_asset_ctxs)
+
+    def open_orders(self, address: str) -> Any:
+        """未成交订单"""
+        return self._memoize(("open_orders", address), lambda: self.info.open_orders(address))
+
+    def price(self, coin: str) -> Optional[float]:
+        """单个币种价格（从缓存的 all_mids 中读取）"""
+        price = self.all_mids().get(coin)
+        return float(price) if price is not None else None
+
+    def live_candles(self, coin: str, interval: str, start_time: int) -> Optional[List[Dict]]:
+        """
+        实时K线（candles_snapshot 原始格式）
+
+        未接入实时状态、实时数据未覆盖 start_time 或已过期时返回 None
+        """
+        if self.live_state is None:
+            return None
+        candles = self.live_state.get_candles(coin, interval, start_time, self.live_max_age)
+        if candles is not None:
+            self._count_live()
+        return candles
+
+    # ===== 内部 =====
+
+    def _count_live(self):
+        with self._lock:
+            self.live_hits += 1
+
+    def _memoize(self, key: tuple, fetch: Callable[[], Any]) -> Any:
+        endpoint = key[0]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 同一个 key 串行化，保证并发请求只打到上游一次
+        with key_lock:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None and time.monotonic() - cached[0] < self.ttl:
+                    self.hits += 1
+                    self._endpoint_stats.setdefault(endpoint, {"hits": 0, "misses": 0})["hits"] += 1
+                    return cached[1]
+
+            value = fetch()
+
+            with self._lock:
+                self._cache[key] = (time.monotonic(), value)
+                self.misses += 1
+                self._endpoint_stats.setdefault(endpoint, {"hits": 0, "misses": 0})["misses"] += 1
+            return value
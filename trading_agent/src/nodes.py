@@ -1,9 +1,14 @@
 """LangGraph 节点实现"""
 import logging
 from datetime import datetime
+from typing import Callable, Dict, Optional
 from src.state import TradingState
 from src.tools import HyperliquidTools
 from src.risk_manager import RiskManager
+from src.decision_cache import llm_completion
+from src.prompt_builder import PromptBuilder
+from src.streaming import ToolCallStream
+from src.batch_execution import find_prepared
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +35,7 @@ def get_account_status_node(state: TradingState, tools) -> TradingState:
         # 检查是否是 AdvancedTradingTools
         if hasattr(tools, 'info') and hasattr(tools, 'address'):
             # 使用 AdvancedTradingTools
-            user_state = tools.info.user_state(tools.address)
+            user_state = tools.snapshot.user_state(tools.address)
             account_value = float(user_state["marginSummary"]["accountValue"])
             # 计算可用余额（总价值减去仓位价值）
             total_ntl_pos = float(user_state["marginSummary"]["totalNtlPos"])
@@ -107,28 +112,33 @@ def get_account_status_node(state: TradingState, tools) -> TradingState:
     return state
 
 
-def llm_analysis_node(state: TradingState, llm_client, strategy_prompt: str) -> TradingState:
-    """LLM 分析决策"""
+def llm_analysis_node(
+    state: TradingState,
+    llm_client,
+    strategy_prompt: str,
+    decision_cache=None,
+    prompt_builder: Optional[PromptBuilder] = None,
+    trade_preparer: Optional[Callable[[Dict, Dict], Dict]] = None
+) -> TradingState:
+    """
+    LLM 分析决策
+
+    Args:
+        decision_cache: 不为 None 时，市场状态几乎没变则复用缓存的决策
+        prompt_builder: 提示词构建器，None 使用默认设置
+        trade_preparer: 不为 None 时流式调用 LLM，决策关键字段一完整就调用
+                        trade_preparer(决策, state) 做下单前准备，结果写入 state["prepared_trades"]
+    """
     logger.info("🤖 LLM 分析市场...")
+    state["prepared_trades"] = []
+    stream = ToolCallStream(
+        lambda trade: state["prepared_trades"].append(trade_preparer(trade, state))
+    ) if trade_preparer else None
     
-    # 构建详细的市场数据
-    prices_str = "\n".join([f"  {coin}: ${price:.2f}" for coin, price in state['current_prices'].items()])
-    positions_str = "\n".join([
-        f"  {pos['coin']}: 数量={pos['size']:.4f}, 入场价=${pos['entry_price']:.2f}, 盈亏=${pos['unrealized_pnl']:.2f}"
-        for pos in state['positions']
-    ]) if state['positions'] else "  无持仓"
-    
-    context = f"""
-当前市场价格:
-{prices_str}
-
-账户价值: ${state['account_value']:.2f}
-
-当前持仓:
-{positions_str}
-
-请分析市场并给出交易决策。
-"""
+    # 构建紧凑的市场数据（持仓币种 + 关注币种，而不是全部中间价）
+    context, state["prompt_tokens"] = (prompt_builder or PromptBuilder()).build(
+        state, instructions="请分析市场并给出交易决策。"
+    )
     
     # 定义 Function Calling 工具
     tools = [
@@ -174,7 +184,8 @@ def llm_analysis_node(state: TradingState, llm_client, strategy_prompt: str) ->
     ]
     
     try:
-        response = llm_client.chat.completions.create(
+        response = llm_completion(
+            llm_client, decision_cache, state, stream=stream,
             model="deepseek-chat",
             messages=messages,
             tools=tools,
@@ -246,14 +257,34 @@ def risk_check_node(state: TradingState, risk_manager: RiskManager) -> TradingSt
     if isinstance(current_price, str):
         current_price = float(current_price)
     
-    result = risk_manager.check_trading_decision(
-        decision=state["trading_decision"],
-        coin=state["target_coin"],
-        size=state["target_size"],
-        account_value=state["account_value"],
-        positions=state["positions"],
-        current_price=current_price
-    )
+    prepared = find_prepared(state.get("prepared_trades"), state["trading_decision"],
+                             state["target_coin"], state["target_size"])
+    if prepared and prepared["risk"] is not None:
+        # LLM 流式输出期间已完成预检
+        result = prepared["risk"]
+        logger.info("⚡ 使用流式预检的风控结果")
+    else:
+        result = risk_manager.check_trading_decision(
+            decision=state["trading_decision"],
+            coin=state["target_coin"],
+            size=state["target_size"],
+            account_value=state["account_value"],
+            positions=state["positions"],
+            current_price=current_price
+        )
+    
+    if result["passed"] and risk_manager.market_risk is not None and state["trading_decision"] != "hold":
+        # 组合 VaR：当前持仓 + 本次交易
+        market = risk_manager.assess_market_risk(state, trades=[{
+            "decision": state["trading_decision"], "coin": state["target_coin"], "size": state["target_size"]
+        }])
+        result = {**result, "market_risk": market}
+        if market["available"]:
+            logger.info(f"📉 组合 VaR({market['confidence']:.0%}): 参数法 ${market['parametric']['var']:.2f} / "
+                        f"历史法 ${market['historical']['var']:.2f}（{market['var_pct']:.2%}），"
+                        f"ES ${market['historical']['es']:.2f}")
+        if market["blocked_reason"]:
+            result.update(passed=False, message="组合 VaR 超限", blocked_reason=market["blocked_reason"])
     
     state["risk_assessment"] = result
     state["risk_passed"] = result["passed"]
@@ -277,16 +308,18 @@ def execute_trade_node(state: TradingState, tools: HyperliquidTools, dry_run: bo
         return state
     
     decision = state["trading_decision"]
+    prepared = find_prepared(state.get("prepared_trades"), decision, state["target_coin"], state["target_size"])
+    size = prepared["size"] if prepared else state["target_size"]
     
     if decision == "hold":
         state["execution_result"] = {"success": True, "message": "持有，无需操作"}
     elif decision == "buy":
         state["execution_result"] = tools.place_market_order(
-            state["target_coin"], True, state["target_size"], dry_run=dry_run
+            state["target_coin"], True, size, dry_run=dry_run
         )
     elif decision == "sell":
         state["execution_result"] = tools.place_market_order(
-            state["target_coin"], False, state["target_size"], dry_run=dry_run
+            state["target_coin"], False, size, dry_run=dry_run
         )
     elif decision == "close":
         state["execution_result"] = tools.close_position(state["target_coin"], dry_run=dry_run)
@@ -0,0 +1,217 @@
+"""
+订单成交跟踪 - 用订单返回的 oid 关联成交事件
+接入 WebSocket 时等待 userFills 推送，否则按游标增量轮询 user_fills_by_time
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def order_statuses(order_result: Dict) -> List[Tuple[Optional[int], Dict]]:
+    """
+    解析下单响应中的订单状态
+
+    Returns:
+        [(oid, status), ...]，oid 为 None 表示下单失败或等待触发
+    """
+    if not isinstance(order_result, dict) or order_result.get("status") != "ok":
+        return []
+    statuses = order_result.get("response", {}).get("data", {}).get("statuses", [])
+    parsed = []
+    for status in statuses:
+        oid = None
+        if isinstance(status, dict):
+            for key in ("filled", "resting"):
+                if key in status:
+                    oid = status[key].get("oid")
+        parsed.append((oid, status))
+    return parsed
+
+
+class OrderTracker:
+    """
+    订单成交跟踪
+
+    - 下单响应中的成交（IoC 市价单、拆单的各子订单）直接累计，没有挂单时立即返回
+    - 有挂单时等待其 oid 的成交事件，直到累计成交量达到下单数量或超时
+    - 成交来源: WebSocket 推送（MarketSnapshot 已接入实时行情时），
+      或 user_fills_by_time 增量轮询（只拉取游标之后的成交）
+    """
+
+    def __init__(self, info, address: str, snapshot=None, poll_interval: float = 0.25):
+        """
+        Args:
+            info: Hyperliquid Info 实例
+            address: 账户地址
+            snapshot: MarketSnapshot（用于读取其接入的实时成交）
+            poll_interval: 轮询间隔（秒）
+        """
+        self.info = info
+        self.address = address
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval
+
+        self._fills_by_oid: Dict[int, List[Dict]] = {}
+        self._seen = set()
+        self._cursor = int(time.time() * 1000) - 5000
+        self._condition = threading.Condition()
+        self._listening_to = None
+        self.poll_count = 0
+
+    # ===== 成交事件 =====
+
+    def _live_state(self):
+        return getattr(self.snapshot, "live_state", None) if self.snapshot is not None else None
+
+    def _ensure_listener(self):
+        live_state = self._live_state()
+        if live_state is not None and self._listening_to is not live_state:
+            live_state.add_fill_listener(self.record_fill)
+            self._listening_to = live_state
+        return live_state
+
+    def record_fill(self, fill: Dict):
+        """记录一笔成交（WebSocket 回调或轮询结果）"""
+        key = (fill.get("tid"), fill.get("hash"), fill.get("oid"), fill.get("time"), fill.get("sz"))
+        with self._condition:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            self._fills_by_oid.setdefault(fill.get("oid"), []).append(fill)
+            self._condition.notify_all()
+
+    def poll(self) -> int:
+        """
+        增量拉取游标之后的成交
+
+        Returns:
+            拉取到的成交数量
+        """
+        self.poll_count += 1
+        fills = self.info.user_fills_by_time(self.address, self._cursor) or []
+        for fill in fills:
+            self.record_fill(fill)
+            # 游标停在最新成交时间（同一毫秒可能还有成交，靠去重处理）
+            self._cursor = max(self._cursor, int(fill.get("time", self._cursor)))
+        return len(fills)
+
+    def fills_for(self, oid: int) -> List[Dict]:
+        with self._condition:
+            return list(self._fills_by_oid.get(oid, []))
+
+    # ===== 等待成交 =====
+
+    def wait_for_fill(self, oid: int, expected_size: Optional[float] = None, timeout: float = 5.0) -> Dict:
+        """
+        等待订单成交
+
+        Args:
+            oid: 订单号
+            expected_size: 下单数量（None 表示收到任意成交即返回）
+            timeout: 超时时间（秒）
+
+        Returns:
+            {"filled": bool, "oid": oid, "filled_size": 0.01, "avg_price": 65000.0,
+             "fills": [...], "latency": 0.12, "source": "websocket" | "poll"}
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        live_state = self._ensure_listener()
+        source = "websocket" if live_state is not None else "poll"
+
+        if live_state is not None:
+            # 开始等待前已经到达的推送
+            for fill in live_state.get_fills(oid):
+                self.record_fill(fill)
+
+        while True:
+            summary = self._summarize(oid, expected_size)
+            if summary["filled"]:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if live_state is not None:
+                with self._condition:
+                    self._condition.wait(timeout=remaining)
+            else:
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"拉取成交失败: {e}")
+                if not self._summarize(oid, expected_size)["filled"]:
+                    time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+        summary["latency"] = time.monotonic() - started
+        summary["source"] = source
+        return summary
+
+    def confirm(self, order_result: Dict, expected_size: Optional[float] = None, timeout: float = 5.0) -> Dict:
+        """
+        确认下单响应中所有订单（包括拆单的子订单）的成交
+
+        响应中已成交（filled）的数量直接累计：IoC 订单未成交的部分已被撤销，不再等待；
+        只有挂单（resting）才等待成交事件，直到累计成交达到下单数量或超时。
+
+        Returns:
+            同 wait_for_fill，另含 "oids": 所有订单号、"partial": 成交数量小于下单数量；
+            有任何成交即 filled=True。下单失败时 {"filled": False, "error": ...}
+        """
+        filled_size, notional, oids, resting, errors = 0.0, 0.0, [], [], []
+        for oid, status in order_statuses(order_result):
+            if oid is None:
+                errors.append(status.get("error", str(status)) if isinstance(status, dict) else str(status))
+            elif "filled" in status:
+                size = float(status["filled"].get("totalSz", 0))
+                filled_size += size
+                notional += size * float(status["filled"].get("avgPx", 0))
+                oids.append(oid)
+            else:
+                resting.append(oid)
+        if not oids and not resting:
+            return {"filled": False, "error": errors[0] if errors else "下单失败，无订单状态"}
+
+        started = time.monotonic()
+        fills, source = [], "response"
+        for oid in resting:
+            # 多个挂单时无法区分各自的数量，只等待任意成交
+            remaining = None
+            if expected_size is not None and len(resting) == 1:
+                remaining = max(expected_size - filled_size, 0.0)
+            waited = self.wait_for_fill(oid, remaining, max(timeout - (time.monotonic() - started), 0.0))
+            filled_size += waited["filled_size"]
+            notional += waited["filled_size"] * waited["avg_price"]
+            fills.extend(waited["fills"])
+            source = waited["source"]
+            oids.append(oid)
+
+        return {
+            "filled": filled_size > 0,
+            "partial": expected_size is not None and 0 < filled_size < expected_size * (1 - 1e-9),
+            "oid": oids[0],
+            "oids": oids,
+            "filled_size": filled_size,
+            "avg_price": notional / filled_size if filled_size else 0.0,
+            "fills": fills,
+            "latency": time.monotonic() - started,
+            "source": source,
+        }
+
+    def _summarize(self, oid: int, expected_size: Optional[float]) -> Dict:
+        fills = self.fills_for(oid)
+        size = sum(float(f["sz"]) for f in fills)
+        notional = sum(float(f["sz"]) * float(f["px"]) for f in fills)
+        if expected_size is None:
+            filled = bool(fills)
+        else:
+            filled = size >= expected_size * (1 - 1e-9)
+        return {
+            "filled": filled,
+            "oid": oid,
+            "filled_size": size,
+            "avg_price": notional / size if size else 0.0,
+            "fills": fills,
+        }
@@ -0,0 +1,82 @@
+"""
+并发执行工具 - 多币种数据获取
+有界线程池 + 单币种超时 + 部分失败容忍
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def run_per_coin(
+    func: Callable[[str], Any],
+    coins: Iterable[str],
+    max_workers: int = 8,
+    timeout: float = 10.0
+) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    对每个币种并发执行 func(coin)
+
+    单个币种失败或超时不影响其他币种。超时从该币种真正开始执行时计时，
+    排队等待线程的时间不计入。
+
+    Args:
+        func: 对单个币种执行的函数
+        coins: 币种列表
+        max_workers: 最大并发线程数
+        timeout: 单个币种的超时时间（秒）
+
+    Returns:
+        (成功结果 {币种: 返回值}, 失败原因 {币种: 错误信息})
+    """
+    coins = list(dict.fromkeys(coins))
+    results: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    if not coins:
+        return results, errors
+
+    started: Dict[str, float] = {}
+
+    def task(coin: str):
+        started[coin] = time.monotonic()
+        return func(coin)
+
+    workers = max(1, min(max_workers, len(coins)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coin-fetch")
+    # 总体截止时间：防止线程全部卡在已超时的任务上导致排队任务永远不开始
+    overall_deadline = time.monotonic() + timeout * (-(-len(coins) // workers) + 1)
+    futures = {executor.submit(task, coin): coin for coin in coins}
+    pending = set(futures)
+
+    try:
+        while pending:
+            # 等到最早可能超时的时刻，或有任务完成
+            now = time.monotonic()
+            deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+            next_deadline = min(deadlines + [overall_deadline])
+            wait_for = max(next_deadline - now, 0.01)
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                coin = futures[future]
+                try:
+                    results[coin] = future.result()
+                except Exception as e:
+                    logger.error(f"{coin} 数据获取失败: {e}")
+                    errors[coin] = str(e)
+
+            now = time.monotonic()
+            for future in list(pending):
+                coin = futures[future]
+                if (coin in started and now - started[coin] >= timeout) or now >= overall_deadline:
+                    logger.error(f"{coin} 数据获取超时 ({timeout:.1f}s)")
+                    errors[coin] = f"超时 ({timeout:.1f}s)"
+                    future.cancel()
+                    pending.discard(future)
+    finally:
+        # 不等待超时线程结束，尚未开始的任务直接取消
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results, errors
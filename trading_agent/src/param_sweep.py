@@ -0,0 +1,241 @@
+"""
+评分规则参数寻优 - 对 analyze_market_condition 的阈值做网格/随机搜索
+
+指标矩阵只计算一次，放入共享内存；进程池中的每个进程直接映射这些数组，
+只对各自分到的参数组合计算分数、信号和回测指标（不调用 LLM）。
+"""
+import itertools
+import logging
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.advanced_tools import DEFAULT_SCORING
+from src.backtest import (
+    DEFAULT_WINDOW,
+    TAKER_FEE,
+    HistoricalMarket,
+    closed_trade_pnls,
+    rule_indicators,
+    rule_signals,
+    score_indicators,
+    simulate_signals,
+)
+
+logger = logging.getLogger(__name__)
+
+# 默认搜索空间（每个参数的候选值）
+DEFAULT_GRID = {
+    "rsi_low": [20, 25, 30, 35],
+    "rsi_high": [65, 70, 75, 80],
+    "change_pct": [2.0, 3.0, 4.0, 5.0],
+    "trend_weight": [0, 5, 10],
+    "buy_above": [55, 60, 65],
+    "sell_below": [35, 40, 45],
+}
+
+# 排序指标（True 表示越大越好）
+RANK_METRICS = {
+    "sharpe": True,
+    "total_return_pct": True,
+    "max_drawdown_pct": False,
+    "win_rate": True,
+}
+
+
+def grid_search(param_grid: Optional[Dict[str, List]] = None) -> List[Dict]:
+    """网格搜索：所有候选值的组合"""
+    param_grid = param_grid or DEFAULT_GRID
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[k] for k in keys))]
+
+
+def random_search(param_space: Optional[Dict] = None, samples: int = 200, seed: int = 0) -> List[Dict]:
+    """
+    随机搜索
+
+    Args:
+        param_space: {参数: 候选值列表 或 (下限, 上限)}；上下限都是整数时取整数
+        samples: 参数组合数量
+        seed: 随机种子
+    """
+    param_space = param_space or DEFAULT_GRID
+    rng = random.Random(seed)
+    param_sets = []
+    for _ in range(samples):
+        params = {}
+        for key, space in param_space.items():
+            if isinstance(space, tuple):
+                low, high = space
+                if isinstance(low, int) and isinstance(high, int):
+                    params[key] = rng.randint(low, high)
+                else:
+                    params[key] = round(rng.uniform(low, high), 2)
+            else:
+                params[key] = rng.choice(list(space))
+        param_sets.append(params)
+    return param_sets
+
+
+# ===== 共享内存 =====
+
+def _share_arrays(arrays: Dict[str, np.ndarray]) -> Tuple[Dict, List[shared_memory.SharedMemory]]:
+    """把数组复制到共享内存，返回 (描述 {名称: (共享内存名, 形状, 类型)}, 共享内存句柄)"""
+    spec, blocks = {}, []
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        spec[name] = (block.name, array.shape, array.dtype.str)
+        blocks.append(block)
+    return spec, blocks
+
+
+def _attach_arrays(spec: Dict) -> Tuple[Dict[str, np.ndarray], List[shared_memory.SharedMemory]]:
+    """映射共享内存中的数组（不复制）"""
+    arrays, blocks = {}, []
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+    return arrays, blocks
+
+
+_worker: Dict = {}
+
+
+def _init_worker(spec: Dict, settings: Dict):
+    arrays, blocks = _attach_arrays(spec)
+    _worker.update(arrays=arrays, blocks=blocks, settings=settings)
+
+
+def _evaluate_in_worker(params: Dict) -> Dict:
+    return evaluate_params(_worker["arrays"], params, **_worker["settings"])
+
+
+# ===== 评估 =====
+
+def evaluate_params(
+    arrays: Dict[str, np.ndarray],
+    params: Dict,
+    notional: float = 100.0,
+    initial_capital: float = 1000.0,
+    fee_rate: float = TAKER_FEE,
+    slippage_bps: float = 2.0,
+    start: int = DEFAULT_WINDOW - 1,
+    step: int = 3_600_000
+) -> Dict:
+    """
+    用一组评分参数回测
+
+    Args:
+        arrays: {"close": 收盘价矩阵, 以及 rule_indicators 返回的指标矩阵}
+        params: 评分参数（缺省项使用 DEFAULT_SCORING）
+
+    Returns:
+        {"total_return_pct", "max_drawdown_pct", "sharpe", "trades", "win_rate", "total_fees"}
+    """
+    scoring = {**DEFAULT_SCORING, **params}
+    signals = rule_signals(score_indicators(arrays, scoring), scoring)
+    sim = simulate_signals(arrays["close"], signals, notional, fee_rate, slippage_bps)
+
+    equity = (initial_capital + np.cumsum(sim["pnl"]))[start:]
+    peak = np.maximum.accumulate(equity)
+    returns = np.diff(equity) / equity[:-1]
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    bars_per_year = 365 * 86_400_000 / step
+    pnls = closed_trade_pnls(sim, fee_rate)
+    return {
+        "total_return_pct": float((equity[-1] / initial_capital - 1) * 100),
+        "max_drawdown_pct": float(((peak - equity) / peak).max() * 100),
+        "sharpe": float(returns.mean() / std * math.sqrt(bars_per_year)) if std > 0 else 0.0,
+        "trades": int(len(pnls)),
+        "win_rate": float((pnls > 0).mean()) if len(pnls) else 0.0,
+        "total_fees": float(sim["fees"].sum()),
+    }
+
+
+def run_sweep(
+    market: HistoricalMarket,
+    param_sets: List[Dict],
+    workers: Optional[int] = None,
+    rank_by: str = "sharpe",
+    window: int = DEFAULT_WINDOW,
+    notional: float = 100.0,
+    initial_capital: float = 1000.0,
+    fee_rate: float = TAKER_FEE,
+    slippage_bps: float = 2.0
+) -> List[Dict]:
+    """
+    并行评估参数组合
+
+    Args:
+        market: 历史行情
+        param_sets: 参数组合列表（grid_search / random_search 的返回值）
+        workers: 进程数，默认 CPU 核数；1 表示在当前进程中顺序执行
+        rank_by: 排序指标（见 RANK_METRICS）
+        window: 评分使用的K线数量
+
+    Returns:
+        按 rank_by 排序的结果表 [{"rank", 参数..., 指标...}, ...]
+    """
+    if rank_by not in RANK_METRICS:
+        raise ValueError(f"不支持的排序指标: {rank_by}（可选 {list(RANK_METRICS)}）")
+
+    # 指标只计算一次
+    arrays = {"close": market.close, **rule_indicators(market.close, window)}
+    settings = {
+        "notional": notional, "initial_capital": initial_capital, "fee_rate": fee_rate,
+        "slippage_bps": slippage_bps, "start": window - 1, "step": market.step,
+    }
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(len(param_sets), 1))
+    logger.info(f"🔬 参数寻优: {len(param_sets)} 组参数, {len(market.coins)} 个币种 × {market.bars} 根K线, {workers} 个进程")
+
+    if workers == 1:
+        metrics = [evaluate_params(arrays, params, **settings) for params in param_sets]
+    else:
+        spec, blocks = _share_arrays(arrays)
+        try:
+            chunksize = max(1, len(param_sets) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(spec, settings)) as pool:
+                metrics = list(pool.map(_evaluate_in_worker, param_sets, chunksize=chunksize))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    rows = [{**params, **result} for params, result in zip(param_sets, metrics)]
+    rows.sort(key=lambda row: row[rank_by], reverse=RANK_METRICS[rank_by])
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+    return rows
+
+
+def print_results(rows: List[Dict], top: int = 10, rank_by: str = "sharpe"):
+    """打印排名表"""
+    if not rows:
+        print("   (没有结果)")
+        return
+    param_keys = [k for k in DEFAULT_SCORING if any(k in row for row in rows)]
+    metric_keys = ["sharpe", "total_return_pct", "max_drawdown_pct", "trades", "win_rate"]
+    headers = ["#"] + param_keys + metric_keys
+    widths = [max(len(h), 8) for h in headers]
+
+    print("\n" + "=" * 70)
+    print(f"🏆 参数寻优结果（按 {rank_by} 排序，前 {min(top, len(rows))} / {len(rows)}）")
+    print("=" * 70)
+    print("  ".join(h.rjust(w) for h, w in zip(headers, widths)))
+    for row in rows[:top]:
+        cells = [str(row["rank"])]
+        cells += [f"{row[k]:g}" if k in row else "-" for k in param_keys]
+        cells += [f"{row['sharpe']:.2f}", f"{row['total_return_pct']:+.2f}", f"{row['max_drawdown_pct']:.2f}",
+                  str(row["trades"]), f"{row['win_rate'] * 100:.1f}%"]
+        print("  ".join(c.rjust(w) for c, w in zip(cells, widths)))
+    print("=" * 70 + "\n")
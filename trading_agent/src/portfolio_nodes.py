@@ -4,76 +4,58 @@
 """
 import logging
 import json
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 from src.state import TradingState
 from src.advanced_tools import AdvancedTradingTools
+from src.risk_manager import RiskManager
+from src.batch_execution import execute_trades_batch, leverage_error
+from src.decision_cache import llm_completion
+from src.prompt_builder import PromptBuilder
+from src.streaming import ToolCallStream
+from src.slippage import place_market_open
+from src.asset_index import validate_order
 
 logger = logging.getLogger(__name__)
 
+# 决策要求（原样附在提示词末尾，不参与 token 预算裁剪）
+PORTFOLIO_INSTRUCTIONS = """作为多资产组合管理者，请分析当前情况并做出2-4个交易决策：
+1. 检查现有持仓是否需要调整（止盈/止损/加仓）
+2. 扫描市场寻找新机会
+3. 考虑资金分散和风险对冲
+4. 返回具体的交易列表
+
+记住：你是自由的交易专家，可以交易任何币种，同时管理多个持仓。
+"""
+
 
 def enhanced_portfolio_analysis_node(
     state: TradingState,
     llm_client,
     strategy_prompt: str,
-    advanced_tools: AdvancedTradingTools
+    advanced_tools: AdvancedTradingTools,
+    decision_cache=None,
+    prompt_builder: Optional[PromptBuilder] = None,
+    trade_preparer: Optional[Callable[[Dict, Dict], Dict]] = None
 ) -> TradingState:
     """
     增强的组合分析节点 - 支持多资产决策
+
+    decision_cache 不为 None 时，市场状态几乎没变则复用缓存的决策；
+    trade_preparer 不为 None 时流式调用 LLM，trades 中每个交易一输出完整就做下单前准备，
+    结果写入 state["prepared_trades"]
     """
     logger.info("🤖 组合分析...")
+    state["prepared_trades"] = []
+    stream = ToolCallStream(
+        lambda trade: state["prepared_trades"].append(trade_preparer(trade, state)), array_key="trades"
+    ) if trade_preparer else None
     
-    # 构建市场数据
-    market_data_str = ""
-    for coin, data in state.get("market_analysis", {}).items():
-        indicators = data.get("indicators", {})
-        condition = data.get("condition", {})
-        
-        market_data_str += f"\n{coin}:\n"
-        market_data_str += f"  价格: ${indicators.get('current_price', 0):.2f}\n"
-        market_data_str += f"  RSI(14): {indicators.get('rsi_14', 0):.2f}\n"
-        market_data_str += f"  24h涨跌: {indicators.get('price_change_24h', 0):+.2f}%\n"
-        market_data_str += f"  趋势: {condition.get('trend', 'unknown')}\n"
-    
-    # 构建持仓信息
-    positions_str = ""
-    total_position_value = 0
-    for pos in state['positions']:
-        pos_value = abs(pos['size'] * pos['current_price'])
-        total_position_value += pos_value
-        positions_str += f"\n  {pos['coin']}: "
-        positions_str += f"{'多' if pos['size'] > 0 else '空'} {abs(pos['size']):.4f}, "
-        positions_str += f"价值${pos_value:.2f}, "
-        positions_str += f"盈亏${pos['unrealized_pnl']:+.2f}, "
-        positions_str += f"杠杆{pos['leverage']}x"
-    
-    if not positions_str:
-        positions_str = "\n  无持仓"
-    
-    # 计算可用资金
-    available_for_new_positions = state['available_balance']
-    
-    context = f"""
-=== 市场数据 ===
-{market_data_str}
-
-=== 账户状态 ===
-总价值: ${state['account_value']:.2f}
-可用余额: ${state['available_balance']:.2f}
-持仓总数: {len(state['positions'])}
-持仓总价值: ${total_position_value:.2f}
-可用于新仓: ${available_for_new_positions:.2f}
-
-=== 当前持仓 ===
-{positions_str}
-
-作为多资产组合管理者，请分析当前情况并做出2-4个交易决策：
-1. 检查现有持仓是否需要调整（止盈/止损/加仓）
-2. 扫描市场寻找新机会
-3. 考虑资金分散和风险对冲
-4. 返回具体的交易列表
-
-记住：你是自由的交易专家，可以交易任何币种，同时管理多个持仓。
-"""
+    # 构建紧凑的市场数据（技术指标表 + 账户 + 持仓）
+    total_position_value = sum(abs(pos['size'] * pos['current_price']) for pos in state['positions'])
+    context, state["prompt_tokens"] = (prompt_builder or PromptBuilder()).build(
+        state, instructions=PORTFOLIO_INSTRUCTIONS,
+        account_extra={"positions": len(state['positions']), "exposure": f"{total_position_value:.2f}"}
+    )
     
     # 定义多交易决策工具
     tools = [
@@ -152,7 +134,8 @@ def enhanced_portfolio_analysis_node(
             {"role": "user", "content": context}
         ]
         
-        response = llm_client.chat.completions.create(
+        response = llm_completion(
+            llm_client, decision_cache, state, stream=stream,
             model="deepseek-chat",
             messages=messages,
             tools=tools,
@@ -170,6 +153,10 @@ def enhanced_portfolio_analysis_node(
             # 存储所有交易决策
             state["portfolio_trades"] = trades
             state["portfolio_analysis"] = portfolio_analysis
+            for prepared in state["prepared_trades"]:
+                risk = prepared["risk"]
+                if risk and not risk["passed"]:
+                    logger.warning(f"⚠️  {prepared['trade']['coin']} 风控预检未通过: {risk.get('blocked_reason', risk['message'])}")
             
             # 调试：确认设置成功
             logger.info(f"🔍 已设置 portfolio_trades: {len(trades)} 个交易")
@@ -229,13 +216,73 @@ def enhanced_portfolio_analysis_node(
     return state
 
 
+def portfolio_risk_node(state: TradingState, risk_manager: RiskManager) -> TradingState:
+    """
+    组合风控节点 - 所有交易与现有持仓一起评估（RiskManager.check_portfolio_trades）
+
+    被拒绝的交易从 portfolio_trades 中移除，被裁剪的交易使用调整后的数量和杠杆
+    """
+    trades = state.get("portfolio_trades", [])
+    if not trades:
+        return state
+    logger.info("⚠️  组合风控检查...")
+
+    assessment = risk_manager.check_portfolio_trades(
+        trades, state["positions"], state["account_value"], state["current_prices"]
+    )
+    approved = []
+    for trade, result in zip(trades, assessment["results"]):
+        label = f"{trade.get('decision', '?').upper()} {trade.get('coin')}"
+        if result["action"] == "reject":
+            logger.warning(f"   ❌ 拒绝 {label}: {result['blocked_reason']}")
+            continue
+        if result["action"] == "trim":
+            logger.warning(f"   ✂️  裁剪 {label}: {'; '.join(result['warnings'])}")
+            trade = {**trade, "leverage": result["leverage"]}
+            if trade.get("decision") != "close":
+                trade["size"] = result["size"]
+        else:
+            logger.info(f"   ✅ 接受 {label}")
+        approved.append(trade)
+
+    if approved and risk_manager.market_risk is not None:
+        # 组合 VaR：当前持仓 + 通过检查的交易；超限时只保留平仓
+        market = risk_manager.assess_market_risk(state, trades=approved)
+        assessment["market_risk"] = market
+        if market["available"]:
+            logger.info(f"📉 组合 VaR({market['confidence']:.0%}): 参数法 ${market['parametric']['var']:.2f} / "
+                        f"历史法 ${market['historical']['var']:.2f}（{market['var_pct']:.2%}），"
+                        f"ES ${market['historical']['es']:.2f}")
+        if market["blocked_reason"]:
+            logger.warning(f"   ❌ {market['blocked_reason']}，只执行平仓交易")
+            approved = [trade for trade in approved if trade.get("decision") == "close"]
+
+    exposure = assessment["exposure"]
+    counts = {action: sum(r["action"] == action for r in assessment["results"]) for action in ("accept", "trim", "reject")}
+    state["portfolio_trades"] = approved
+    state["risk_assessment"] = assessment
+    state["risk_passed"] = bool(approved)
+    state["risk_message"] = f"接受 {counts['accept']} / 裁剪 {counts['trim']} / 拒绝 {counts['reject']}"
+    if assessment.get("market_risk", {}).get("blocked_reason"):
+        state["risk_message"] += "（VaR 超限，只平仓）"
+    logger.info(
+        f"📊 组合风控: {state['risk_message']}，总敞口 ${exposure['gross_before']:.2f} → ${exposure['gross_after']:.2f}"
+        f"（资金 ${exposure['capital']:.2f}），杠杆 {exposure['leverage_after']:.2f}x"
+    )
+    return state
+
+
 def execute_portfolio_trades_node(
     state: TradingState,
     advanced_tools: AdvancedTradingTools,
-    dry_run: bool = True
+    dry_run: bool = True,
+    batch: bool = True
 ) -> TradingState:
     """
     执行多个交易决策
+    
+    Args:
+        batch: 真实下单时使用批量提交（execute_trades_batch），False 则逐笔执行
     """
     logger.info("💰 执行组合交易...")
     
@@ -255,104 +302,156 @@ def execute_portfolio_trades_node(
     print("🔄 开始执行组合交易")
     print("=" * 70)
     
-    for i, trade in enumerate(trades, 1):
-        decision = trade["decision"]
-        coin = trade["coin"]
+    # 本地校验（有资产元数据索引时）：杠杆限制在上限内，注定被拒绝的开仓不发送
+    trades = list(trades)
+    rejected = {}
+    checked_sizes = {}
+    for i, trade in enumerate(trades):
+        if trade["decision"] not in ["buy", "sell"]:
+            continue
+        check = validate_order(advanced_tools, trade["coin"], trade.get("size", 0.001), trade.get("leverage", 1))
+        if check is None:
+            continue
+        if not check["ok"]:
+            rejected[i] = {"success": False, "coin": trade["coin"], "action": trade["decision"],
+                           "error": check["error"]}
+            continue
+        checked_sizes[i] = check["size"]
+        if check["leverage"] != trade.get("leverage", 1):
+            trades[i] = {**trade, "leverage": check["leverage"]}
+    
+    if batch and not dry_run:
+        # 批量提交：平仓+普通开仓一次请求，止盈止损开仓每笔一个订单组
+        submit = [{**trade, "size": checked_sizes[i]} if i in checked_sizes else trade
+                  for i, trade in enumerate(trades) if i not in rejected]
+        batch_results = iter(execute_trades_batch(submit, advanced_tools, state["current_prices"],
+                                                  state.get("prepared_trades")) if submit else [])
+        results = [{"trade": trade, "result": rejected[i] if i in rejected else next(batch_results)}
+                   for i, trade in enumerate(trades)]
+        for i, r in enumerate(results, 1):
+            trade = r["trade"]
+            print(f"\n[{i}/{len(trades)}] 执行: {trade['decision'].upper()} {trade['coin']}")
+            if r["result"].get("success") and r["result"].get("error"):
+                print(f"   ⚠️  部分成交 {r['result'].get('filled_size')}: {r['result']['error']}")
+            elif r["result"].get("success"):
+                print(f"   ✅ 成功")
+            else:
+                print(f"   ❌ 失败: {r['result'].get('error', '未知错误')}")
+    else:
+        for i, trade in enumerate(trades, 1):
+            decision = trade["decision"]
+            coin = trade["coin"]
         
-        print(f"\n[{i}/{len(trades)}] 执行: {decision.upper()} {coin}")
+            print(f"\n[{i}/{len(trades)}] 执行: {decision.upper()} {coin}")
+            
+            if i - 1 in rejected:
+                print(f"   ❌ 失败: {rejected[i - 1]['error']}")
+                results.append({"trade": trade, "result": rejected[i - 1]})
+                continue
         
-        try:
-            if decision == "close":
-                # 平仓
-                if dry_run:
-                    result = {"success": True, "dry_run": True, "coin": coin, "action": "close"}
-                    logger.info(f"[模拟] 平仓 {coin}")
-                else:
-                    logger.warning(f"[真实] 平仓 {coin}")
-                    # 实际平仓逻辑
-                    close_result = advanced_tools.exchange.market_close(coin)
-                    result = {
-                        "success": close_result.get("status") == "ok",
-                        "coin": coin,
-                        "action": "close",
-                        "result": close_result
-                    }
+            try:
+                if decision == "close":
+                    # 平仓
+                    if dry_run:
+                        result = {"success": True, "dry_run": True, "coin": coin, "action": "close"}
+                        logger.info(f"[模拟] 平仓 {coin}")
+                    else:
+                        logger.warning(f"[真实] 平仓 {coin}")
+                        # 实际平仓逻辑
+                        close_result = advanced_tools.exchange.market_close(coin)
+                        advanced_tools.snapshot.invalidate("user_state")
+                        result = {
+                            "success": close_result.get("status") == "ok",
+                            "coin": coin,
+                            "action": "close",
+                            "result": close_result
+                        }
             
-            elif decision in ["buy", "sell"]:
-                # 开仓
-                size = trade.get("size", 0.001)
-                leverage = trade.get("leverage", 1)
-                use_tpsl = trade.get("use_tpsl", False)
-                is_buy = (decision == "buy")
+                elif decision in ["buy", "sell"]:
+                    # 开仓
+                    size = checked_sizes.get(i - 1, trade.get("size", 0.001))
+                    leverage = trade.get("leverage", 1)
+                    use_tpsl = trade.get("use_tpsl", False)
+                    is_buy = (decision == "buy")
                 
-                # 设置杠杆
-                if leverage > 1 and not dry_run:
-                    advanced_tools.adjust_leverage(coin, leverage, is_cross=True, dry_run=dry_run)
+                    # 设置杠杆（失败时不下单，避免按原杠杆成交）
+                    if leverage > 1 and not dry_run:
+                        leverage_result = advanced_tools.adjust_leverage(coin, leverage, is_cross=True, dry_run=dry_run)
+                        error = leverage_error(leverage_result)
+                        if error:
+                            print(f"   ❌ 失败: {error}")
+                            results.append({"trade": trade, "result": {
+                                "success": False, "coin": coin, "action": decision, "error": error}})
+                            continue
                 
-                if use_tpsl:
-                    # 带止盈止损
-                    current_price = state["current_prices"].get(coin, 0)
-                    if isinstance(current_price, str):
-                        current_price = float(current_price)
+                    if use_tpsl:
+                        # 带止盈止损
+                        current_price = state["current_prices"].get(coin, 0)
+                        if isinstance(current_price, str):
+                            current_price = float(current_price)
                     
-                    tp_pct = trade.get("take_profit_pct", 3.0)
-                    sl_pct = trade.get("stop_loss_pct", 1.5)
+                        tp_pct = trade.get("take_profit_pct", 3.0)
+                        sl_pct = trade.get("stop_loss_pct", 1.5)
                     
-                    tp_price, sl_price = advanced_tools.calculate_tpsl_prices(
-                        current_price, is_buy, tp_pct, sl_pct
-                    )
+                        tp_price, sl_price = advanced_tools.calculate_tpsl_prices(
+                            current_price, is_buy, tp_pct, sl_pct, coin=coin
+                        )
                     
-                    result = advanced_tools.place_order_with_tpsl(
-                        coin=coin,
-                        is_buy=is_buy,
-                        size=size,
-                        take_profit_price=tp_price,
-                        stop_loss_price=sl_price,
-                        dry_run=dry_run
-                    )
-                else:
-                    # 普通市价单
-                    if dry_run:
-                        result = {"success": True, "dry_run": True, "coin": coin, "action": decision}
+                        result = advanced_tools.place_order_with_tpsl(
+                            coin=coin,
+                            is_buy=is_buy,
+                            size=size,
+                            take_profit_price=tp_price,
+                            stop_loss_price=sl_price,
+                            dry_run=dry_run
+                        )
                     else:
-                        order_result = advanced_tools.exchange.market_open(coin, is_buy, size, None, 0.05)
-                        
-                        # 检查错误
-                        statuses = order_result.get("response", {}).get("data", {}).get("statuses", [])
-                        if statuses and any("error" in s for s in statuses):
-                            error_msg = statuses[0].get("error", "未知错误")
-                            result = {
-                                "success": False,
-                                "coin": coin,
-                                "action": decision,
-                                "error": error_msg
-                            }
+                        # 普通市价单
+                        if dry_run:
+                            result = {"success": True, "dry_run": True, "coin": coin, "action": decision}
                         else:
-                            result = {
-                                "success": True,
-                                "coin": coin,
-                                "action": decision,
-                                "result": order_result
-                            }
+                            order_result = place_market_open(advanced_tools, coin, is_buy, size)
+                            advanced_tools.snapshot.invalidate("user_state")
+                        
+                            # 检查错误（拆单时有子订单成交即已开仓，错误单独返回）
+                            if order_result["filled_size"] == 0 and order_result["error"]:
+                                result = {
+                                    "success": False,
+                                    "coin": coin,
+                                    "action": decision,
+                                    "error": order_result["error"]
+                                }
+                            else:
+                                result = {
+                                    "success": True,
+                                    "coin": coin,
+                                    "action": decision,
+                                    "filled_size": order_result["filled_size"],
+                                    "result": order_result
+                                }
+                                if order_result["error"]:
+                                    result["error"] = order_result["error"]
             
-            # 打印结果
-            if result.get("success"):
-                print(f"   ✅ 成功")
-            else:
-                print(f"   ❌ 失败: {result.get('error', '未知错误')}")
+                # 打印结果
+                if result.get("success") and result.get("error"):
+                    print(f"   ⚠️  部分成交 {result.get('filled_size')}: {result['error']}")
+                elif result.get("success"):
+                    print(f"   ✅ 成功")
+                else:
+                    print(f"   ❌ 失败: {result.get('error', '未知错误')}")
             
-            results.append({
-                "trade": trade,
-                "result": result
-            })
+                results.append({
+                    "trade": trade,
+                    "result": result
+                })
             
-        except Exception as e:
-            logger.error(f"执行 {coin} {decision} 失败: {e}")
-            print(f"   ❌ 异常: {e}")
-            results.append({
-                "trade": trade,
-                "result": {"success": False, "error": str(e)}
-            })
+            except Exception as e:
+                logger.error(f"执行 {coin} {decision} 失败: {e}")
+                print(f"   ❌ 异常: {e}")
+                results.append({
+                    "trade": trade,
+                    "result": {"success": False, "error": str(e)}
+                })
     
     print("\n" + "=" * 70)
     print("📊 执行汇总")
@@ -0,0 +1,266 @@
+"""
+紧凑提示词构建 - 用表格代替逐行叙述，按 token 预算控制 LLM 输入长度
+
+- 币种选择：持仓币种（始终保留）→ 配置的关注币种 → 全市场扫描排名 → 24h 涨跌幅最大的币种，最多 max_coins 个
+- 市场 / 持仓 / 成交历史渲染为 "|" 分隔的表格，价格只保留 6 位有效数字
+- 有多周期指标（agent.timeframes）时，市场表每个周期加 RSI 和价格相对 SMA20 的偏离两列
+- 超出 token 预算时先减少市场表的币种，再减少成交历史
+- 每个分段的 token 数（近似值）随提示词一起返回，写入 state["prompt_tokens"]
+"""
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFERRED_COINS = ["BTC", "ETH"]
+
+# 非 ASCII 字符（中文、全角符号、emoji）大致每个字符 1 个 token，ASCII 大致 4 个字符 1 个 token
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def estimate_tokens(text: str) -> int:
+    """近似估算 token 数（不依赖具体模型的分词器）"""
+    if not text:
+        return 0
+    non_ascii = len(_NON_ASCII.findall(text))
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+
+def fmt_num(value, digits: int = 6) -> str:
+    """有效数字格式化：61406.09 → 61406.1，0.000123456 → 0.000123456"""
+    if value is None:
+        return "-"
+    return f"{float(value):.{digits}g}"
+
+
+def render_table(columns: List[str], rows: List[List]) -> str:
+    """渲染 "|" 分隔的紧凑表格（第一行为表头）"""
+    lines = ["|".join(columns)]
+    for row in rows:
+        lines.append("|".join("-" if cell is None or cell == "" else str(cell) for cell in row))
+    return "\n".join(lines)
+
+
+def select_coins(
+    prices: Dict[str, float],
+    analysis: Optional[Dict] = None,
+    positions: Optional[List[Dict]] = None,
+    max_coins: int = 8,
+    preferred: Optional[List[str]] = None,
+    ranked: Optional[List[str]] = None
+) -> List[str]:
+    """
+    选择写入提示词的币种（按优先级排序）
+
+    Args:
+        prices: 全部中间价
+        analysis: 技术分析数据 {coin: {"indicators": ..., "condition": ...}}
+        positions: 当前持仓（持仓币种始终保留，不受 max_coins 限制）
+        max_coins: 最多币种数
+        preferred: 关注币种（默认 BTC/ETH）
+        ranked: 全市场扫描选出的币种（按得分排序）
+
+    Returns:
+        币种列表，持仓币种在前，其余按 关注币种 → 扫描排名 → 24h 涨跌幅绝对值 排序
+    """
+    analysis = analysis or {}
+    held = [pos["coin"] for pos in positions or []]
+    candidates = [coin for coin in (preferred or DEFAULT_PREFERRED_COINS) if coin in prices or coin in analysis]
+    movers = sorted(
+        (coin for coin in analysis if "indicators" in analysis[coin]),
+        key=lambda coin: -abs(analysis[coin]["indicators"].get("price_change_24h") or 0)
+    )
+    selected = list(dict.fromkeys(held))
+    ranked = [coin for coin in ranked or [] if coin in prices or coin in analysis]
+    for coin in candidates + ranked + movers:
+        if len(selected) >= max(max_coins, len(held)):
+            break
+        if coin not in selected:
+            selected.append(coin)
+    return selected
+
+
+class PromptBuilder:
+    """
+    紧凑提示词构建器
+
+    用法:
+        builder = PromptBuilder(max_coins=8, token_budget=1500)
+        context, tokens = builder.build(state, instructions="请做出交易决策。", history=trades)
+    """
+
+    def __init__(
+        self,
+        max_coins: int = 8,
+        token_budget: int = 1500,
+        preferred_coins: Optional[List[str]] = None,
+        history_limit: int = 5
+    ):
+        """
+        Args:
+            max_coins: 市场表最多币种数（持仓币种不受限制）
+            token_budget: 用户消息的 token 预算（近似值）
+            preferred_coins: 关注币种，优先于涨跌幅排名（默认 BTC/ETH）
+            history_limit: 成交历史最多条数
+        """
+        self.max_coins = max_coins
+        self.token_budget = token_budget
+        self.preferred_coins = preferred_coins or DEFAULT_PREFERRED_COINS
+        self.history_limit = history_limit
+
+    # ===== 分段 =====
+
+    @staticmethod
+    def market_section(state: Dict, coins: List[str]) -> str:
+        """
+        市场表：有技术分析的币种带指标列，否则只有价格
+        有多周期指标时加各周期 RSI 和价格相对 SMA20 的偏离，有全市场扫描时加成交额和资金费率列
+        """
+        analysis = state.get("market_analysis_data") or {}
+        prices = state.get("current_prices") or {}
+        if not any(coin in analysis for coin in coins):
+            return render_table(["coin", "px"], [[coin, fmt_num(prices.get(coin))] for coin in coins])
+        scan = state.get("market_scan") or {}
+        scanned = {row["coin"]: row for row in scan.get("ranked", [])}
+        intervals = list(dict.fromkeys(
+            interval for coin in coins
+            for interval in analysis.get(coin, {}).get("indicators", {}).get("timeframes", {})
+        ))
+
+        rows = []
+        for coin in coins:
+            indicators = analysis.get(coin, {}).get("indicators", {})
+            condition = analysis.get(coin, {}).get("condition", {})
+            change = indicators.get("price_change_24h")
+            volatility = indicators.get("volatility")
+            rows.append([
+                coin,
+                fmt_num(indicators.get("current_price") or prices.get(coin)),
+                f"{change:+.2f}" if change is not None else None,
+                f"{indicators['rsi_14']:.1f}" if indicators.get("rsi_14") is not None else None,
+                fmt_num(indicators.get("sma_20")) if indicators.get("sma_20") else None,
+                f"{volatility * 100:.2f}" if volatility is not None else None,
+                condition.get("trend"),
+                condition.get("recommendation"),
+            ])
+            for interval in intervals:
+                frame = indicators.get("timeframes", {}).get(interval) or {}
+                trend = (frame["current_price"] / frame["sma_20"] - 1) * 100 if frame.get("sma_20") else None
+                rows[-1] += [f"{frame['rsi_14']:.1f}" if frame.get("rsi_14") is not None else None,
+                             f"{trend:+.2f}" if trend is not None else None]
+            if scan:
+                row = scanned.get(coin)
+                rows[-1] += [fmt_num(row["volume"] / 1e6, 3), f"{row['funding'] * 100:+.4f}"] if row else [None, None]
+        columns = ["coin", "px", "chg24h%", "rsi14", "sma20", "vol%", "trend", "rec"]
+        columns += [column for interval in intervals for column in (f"rsi14@{interval}", f"px/sma20@{interval}%")]
+        if not scan:
+            return render_table(columns, rows)
+        header = f"扫描 {scan['universe']} 个合约，{scan['eligible']} 个参与排名"
+        return header + "\n" + render_table(columns + ["vlm24h$M", "fund%"], rows)
+
+    @staticmethod
+    def positions_section(positions: List[Dict]) -> str:
+        if not positions:
+            return "无持仓"
+        rows = [
+            [pos["coin"], "long" if pos["size"] > 0 else "short", fmt_num(abs(pos["size"])),
+             fmt_num(pos.get("entry_price")), fmt_num(pos.get("current_price")),
+             f"{pos.get('unrealized_pnl', 0):+.2f}", fmt_num(pos.get("leverage"), 3)]
+            for pos in positions
+        ]
+        return render_table(["coin", "side", "size", "entry", "px", "pnl", "lev"], rows)
+
+    @staticmethod
+    def account_section(state: Dict, extra: Optional[Dict] = None) -> str:
+        fields = {
+            "value": f"{state.get('account_value', 0):.2f}",
+            "avail": f"{state.get('available_balance', 0):.2f}",
+            **(extra or {}),
+        }
+        return " ".join(f"{key}={value}" for key, value in fields.items())
+
+    @staticmethod
+    def history_section(trades: List[Dict]) -> str:
+        if not trades:
+            return "暂无交易历史"
+        rows = [
+            [trade["time"][5:16], trade["side"], fmt_num(trade["size"]), trade["coin"], fmt_num(trade["price"])]
+            for trade in trades
+        ]
+        return render_table(["time", "side", "size", "coin", "px"], rows)
+
+    # ===== 组装 =====
+
+    def build(
+        self,
+        state: Dict,
+        instructions: str = "",
+        history: Optional[List[Dict]] = None,
+        account_extra: Optional[Dict] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        组装用户消息
+
+        Args:
+            state: 交易状态（current_prices / market_analysis_data / positions / account_value ...）
+            instructions: 决策要求（原样保留，不参与裁剪）
+            history: 最近成交（get_trading_history 的返回值），None 表示不加入该分段
+            account_extra: 账户分段的额外字段
+
+        Returns:
+            (提示词, 各分段 token 数 {"market", "account", "positions", "history", "instructions", "total"})
+        """
+        coins = select_coins(
+            state.get("current_prices") or {}, state.get("market_analysis_data"),
+            state.get("positions"), self.max_coins, self.preferred_coins,
+            [row["coin"] for row in (state.get("market_scan") or {}).get("ranked", [])]
+        )
+        held = len({pos["coin"] for pos in state.get("positions") or []})
+        history = (history or [])[:self.history_limit] if history is not None else None
+
+        while True:
+            sections = [
+                ("市场", self.market_section(state, coins)),
+                ("账户", self.account_section(state, account_extra)),
+                ("持仓", self.positions_section(state.get("positions") or [])),
+            ]
+            if history is not None:
+                sections.append(("最近成交", self.history_section(history)))
+            text = "\n\n".join(f"[{name}]\n{body}" for name, body in sections)
+            if instructions:
+                text += "\n\n" + instructions.strip()
+            total = estimate_tokens(text)
+            if total <= self.token_budget:
+                break
+            # 超出预算：先裁剪市场表（保留持仓币种），再裁剪成交历史
+            if len(coins) > max(held, 1):
+                coins = coins[:-1]
+            elif history:
+                history = history[:-1]
+            else:
+                logger.warning(f"⚠️  提示词约 {total} tokens，裁剪后仍超出预算 {self.token_budget}")
+                break
+
+        keys = {"市场": "market", "账户": "account", "持仓": "positions", "最近成交": "history"}
+        tokens = {keys[name]: estimate_tokens(body) for name, body in sections}
+        tokens["instructions"] = estimate_tokens(instructions)
+        tokens["total"] = total
+        logger.info(
+            f"📏 提示词约 {total} tokens（{len(coins)} 个币种）: "
+            + ", ".join(f"{name} {count}" for name, count in tokens.items() if name != "total")
+        )
+        return text, tokens
+
+
+def create_prompt_builder(config: Dict) -> PromptBuilder:
+    """按配置创建提示词构建器（agent.prompt，关注币种默认取 agent.coins）"""
+    agent_config = config.get("agent", {})
+    prompt_config = agent_config.get("prompt") or {}
+    return PromptBuilder(
+        max_coins=prompt_config.get("max_coins", 8),
+        token_budget=prompt_config.get("token_budget", 1500),
+        preferred_coins=prompt_config.get("preferred_coins") or agent_config.get("coins"),
+        history_limit=prompt_config.get("history_limit", 5)
+    )
@@ -3,7 +3,9 @@
 对 LLM 的决策进行风险检查和限制
 """
 import logging
-from typing import Dict, List, Literal
+from typing import Dict, List, Literal, Optional
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -11,11 +13,12 @@ logger = logging.getLogger(__name__)
 class RiskManager:
     """风险管理器"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, market_risk=None):
         """
         初始化风险管理器
         
         Args:
+            market_risk: 市场风险模型（MarketRiskModel，None 表示不计算 VaR）
             config: 风险配置
                 {
                     "max_usable_capital": 100,  # Agent最多可使用的资金（USDC）
@@ -25,6 +28,8 @@ class RiskManager:
                     "min_account_value": 100,  # 最小账户价值
                     "allowed_coins": ["BTC", "ETH"],  # 允许交易的币种
                     "max_leverage": 3,  # 最大杠杆
+                    "min_trade_value": 10,  # 组合风控裁剪后的最小交易金额（低于则拒绝）
+                    "market_risk": {"enabled": True, "max_var_pct": 0.05},  # 组合 VaR 上限（占账户价值）
                     "enable_execution": False  # 是否允许真实交易
                 }
         """
@@ -36,7 +41,10 @@ class RiskManager:
         self.min_account_value = config.get("min_account_value", 100)
         self.allowed_coins = config.get("allowed_coins", ["BTC", "ETH"])
         self.max_leverage = config.get("max_leverage", 3)
+        self.min_trade_value = config.get("min_trade_value", 10)
         self.enable_execution = config.get("enable_execution", False)
+        self.market_risk = market_risk
+        self.max_var_pct = config.get("market_risk", {}).get("max_var_pct")
     
     def get_effective_capital(self, actual_account_value: float) -> float:
         """
@@ -183,6 +191,165 @@ class RiskManager:
             "blocked_reason": None
         }
     
+    def check_portfolio_trades(
+        self,
+        trades: List[Dict],
+        positions: List[Dict],
+        account_value: float,
+        current_prices: Dict[str, float]
+    ) -> Dict:
+        """
+        批量检查组合交易：所有交易与现有持仓一起评估
+
+        以币种为索引建立敞口向量（持仓名义价值 + 各交易的名义价值变化），
+        向量化计算交易后的总敞口、净敞口、杠杆和单币种集中度：
+        1. 静态规则不通过（决策无效、白名单、无价格、无持仓平仓、账户价值过低）→ 拒绝
+        2. 开仓金额超过单笔上限 → 裁剪到上限
+        3. 交易后单币种敞口超过 max_position_size → 按比例裁剪增加该币种敞口的交易
+        4. 交易后总敞口超过 max_total_exposure → 按比例裁剪所有增加敞口的交易
+        5. 裁剪后金额低于 min_trade_value → 拒绝
+        6. 杠杆超过 max_leverage → 裁剪到 max_leverage
+
+        Args:
+            trades: 组合交易 [{"decision", "coin", "size", "leverage", ...}, ...]
+            positions: 当前持仓（get_positions 的返回值）
+            account_value: 账户总价值
+            current_prices: 当前价格 {币种: 价格}
+
+        Returns:
+            {
+                "results": [  # 与 trades 顺序一致
+                    {"action": "accept" | "trim" | "reject", "size": 调整后数量, "leverage": 调整后杠杆,
+                     "passed", "message", "warnings", "blocked_reason"}, ...
+                ],
+                "exposure": {"capital", "gross_before", "gross_after", "net_before", "net_after",
+                             "leverage_before", "leverage_after", "concentration": {币种: 敞口/资金}}
+            }
+        """
+        capital = self.get_effective_capital(account_value)
+        n = len(trades)
+
+        # 币种索引与敞口向量（名义价值，多为正、空为负）
+        coins = list(dict.fromkeys([pos["coin"] for pos in positions] + [t.get("coin") for t in trades]))
+        index = {coin: i for i, coin in enumerate(coins)}
+        position_prices = {pos["coin"]: pos.get("current_price", 0) for pos in positions}
+        prices = np.array([float(current_prices.get(coin) or position_prices.get(coin) or 0) for coin in coins])
+        units = np.zeros(len(coins))
+        for pos in positions:
+            units[index[pos["coin"]]] += pos["size"]
+        base = units * prices
+
+        coin_idx = np.array([index[t.get("coin")] for t in trades], dtype=int)
+        decisions = np.array([t.get("decision") for t in trades], dtype=object)
+        px = prices[coin_idx] if n else np.zeros(0)
+        is_close = decisions == "close"
+        sign = np.where(decisions == "buy", 1.0, np.where(decisions == "sell", -1.0, 0.0))
+        sign[is_close] = -np.sign(units[coin_idx[is_close]])
+        size = np.array([abs(float(t.get("size") or 0)) for t in trades])
+        size[is_close] = np.abs(units[coin_idx[is_close]])
+
+        # 1. 静态规则
+        blocked: List = [None] * n
+        for i, trade in enumerate(trades):
+            decision, coin = trade.get("decision"), trade.get("coin")
+            if decision not in ("buy", "sell", "close"):
+                blocked[i] = f"未知决策: {decision}"
+            elif capital < self.min_account_value:
+                blocked[i] = f"账户价值 ${account_value:.2f} 低于最小要求 ${self.min_account_value}"
+            elif decision == "close" and units[coin_idx[i]] == 0:
+                blocked[i] = f"当前没有 {coin} 的持仓"
+            elif decision != "close" and self.allowed_coins and coin not in self.allowed_coins:
+                blocked[i] = f"{coin} 不在允许交易的币种列表中: {self.allowed_coins}"
+            elif decision != "close" and not px[i] > 0:
+                blocked[i] = f"没有 {coin} 的价格"
+            elif decision != "close" and size[i] <= 0:
+                blocked[i] = "交易数量为 0"
+        rejected = np.array([reason is not None for reason in blocked], dtype=bool)
+        opening = ~is_close & ~rejected
+
+        # 2. 单笔金额上限
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cap_units = np.where(px > 0, self.max_single_trade_value / px, 0.0)
+        trimmed_size = np.where(opening, np.minimum(size, cap_units), size)
+        delta = np.where(rejected, 0.0, sign * trimmed_size * px)
+
+        # 3. 单币种集中度：只裁剪与交易后敞口同向的开仓
+        post = base.copy()
+        np.add.at(post, coin_idx, delta)
+        increasing = opening & (np.sign(delta) == np.sign(post[coin_idx])) & (delta != 0)
+        increase_by_coin = np.zeros(len(coins))
+        np.add.at(increase_by_coin, coin_idx[increasing], np.abs(delta[increasing]))
+        excess = np.maximum(np.abs(post) - self.max_position_size * capital, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            coin_factor = np.where(increase_by_coin > 0, np.clip(1 - excess / increase_by_coin, 0, 1), 1.0)
+        scale = np.ones(n)
+        scale[increasing] = coin_factor[coin_idx[increasing]]
+        delta = delta * scale
+
+        # 4. 总敞口
+        post = base.copy()
+        np.add.at(post, coin_idx, delta)
+        gross_excess = np.abs(post).sum() - self.max_total_exposure * capital
+        total_increase = np.abs(delta[increasing]).sum()
+        if gross_excess > 0 and total_increase > 0:
+            gross_factor = max(0.0, 1 - gross_excess / total_increase)
+            scale[increasing] *= gross_factor
+            delta[increasing] *= gross_factor
+            post = base.copy()
+            np.add.at(post, coin_idx, delta)
+        final_size = trimmed_size * scale
+
+        # 5. 裁剪后金额过小的开仓 → 拒绝，不计入交易后敞口
+        too_small = opening & (final_size * px < self.min_trade_value)
+        for i in np.flatnonzero(too_small):
+            blocked[i] = (f"裁剪后金额 ${final_size[i] * px[i]:.2f} 低于最小交易金额 ${self.min_trade_value}"
+                          f"（单币种上限 {self.max_position_size:.0%}，总敞口上限 {self.max_total_exposure:.0%}）")
+        if too_small.any():
+            delta[too_small] = 0.0
+            post = base.copy()
+            np.add.at(post, coin_idx, delta)
+
+        # 6. 杠杆上限，组装结果
+        results = []
+        for i, trade in enumerate(trades):
+            leverage = trade.get("leverage", 1) or 1
+            if blocked[i] is not None:
+                results.append({"action": "reject", "size": 0.0, "leverage": leverage, "passed": False,
+                                "message": "组合风控拒绝", "warnings": [], "blocked_reason": blocked[i]})
+                continue
+
+            warnings = []
+            if opening[i] and final_size[i] < size[i] * (1 - 1e-9):
+                warnings.append(f"数量 {size[i]:g} → {final_size[i]:.6g}（金额 ${final_size[i] * px[i]:.2f}）")
+            if leverage > self.max_leverage:
+                warnings.append(f"杠杆 {leverage}x → {self.max_leverage}x")
+                leverage = self.max_leverage
+            results.append({
+                "action": "trim" if warnings else "accept",
+                "size": float(final_size[i]),
+                "leverage": leverage,
+                "passed": True,
+                "message": "组合风控裁剪" if warnings else "组合风控通过",
+                "warnings": warnings,
+                "blocked_reason": None,
+            })
+
+        def ratio(value: float) -> float:
+            return float(value / capital) if capital > 0 else 0.0
+
+        after = np.abs(post)
+        exposure = {
+            "capital": capital,
+            "gross_before": round(float(np.abs(base).sum()), 2),
+            "gross_after": round(float(after.sum()), 2),
+            "net_before": round(float(base.sum()), 2),
+            "net_after": round(float(post.sum()), 2),
+            "leverage_before": round(float(np.abs(base).sum() / account_value), 4) if account_value > 0 else 0.0,
+            "leverage_after": round(float(after.sum() / account_value), 4) if account_value > 0 else 0.0,
+            "concentration": {coins[i]: round(ratio(after[i]), 4) for i in np.argsort(-after) if after[i] > 0},
+        }
+        return {"results": results, "exposure": exposure}
+    
     def get_safe_position_size(self, coin: str, account_value: float, current_price: float) -> float:
         """
         计算安全的仓位大小（基于有效可用资金）
@@ -207,21 +374,39 @@ class RiskManager:
         else:
             return round(safe_size, 1)
     
-    def assess_market_risk(self, market_data: Dict) -> Dict:
+    def assess_market_risk(self, market_data: Dict, trades: Optional[List[Dict]] = None) -> Dict:
         """
-        评估市场风险
+        评估市场风险：当前持仓 + 拟执行交易的组合 VaR / ES
         
         Args:
-            market_data: 市场数据
+            market_data: 市场数据（含 positions / current_prices / account_value，即 TradingState）
+            trades: 拟执行的交易 [{"decision", "coin", "size"}, ...]
             
         Returns:
-            风险评估结果
+            风险评估结果（MarketRiskModel.assess 的返回值），另含:
+            "blocked_reason": 交易使 VaR 超过 max_var_pct 且高于交易前时的拒绝原因，否则为 None
         """
-        # 简化版本：后续可以加入更复杂的风险指标
-        # 如波动率、成交量、资金费率等
+        if self.market_risk is None:
+            return {
+                "available": False,
+                "risk_level": "medium",
+                "volatility": "unknown",
+                "recommendation": "谨慎交易",
+                "blocked_reason": None
+            }
         
-        return {
-            "risk_level": "medium",
-            "volatility": "unknown",
-            "recommendation": "谨慎交易"
-        }
+        result = self.market_risk.assess(
+            market_data.get("positions", []),
+            market_data.get("current_prices", {}),
+            market_data.get("account_value", 0),
+            trades
+        )
+        result["blocked_reason"] = None
+        # 只拒绝增加风险的交易：已超限时仍允许减仓
+        if (self.max_var_pct is not None and result["available"]
+                and result["var_pct"] > self.max_var_pct and result["var_pct"] > result["var_pct_before"]):
+            result["blocked_reason"] = (
+                f"组合 VaR {result['var_pct']:.2%} 超过限制 {self.max_var_pct:.2%}"
+                f"（交易前 {result['var_pct_before']:.2%}，置信度 {result['confidence']:.0%}）"
+            )
+        return result
@@ -0,0 +1,342 @@
+"""
+事件驱动调度器 - 只在市场状态明显变化时运行交易周期
+替代固定间隔的 sleep 循环，减少不必要的 LLM 调用
+
+触发条件:
+- 价格相对上次运行变动超过阈值
+- RSI 穿越超买/超卖区间
+- 新成交（WebSocket userFills）
+- 持仓变化（止盈止损触发、强平等）
+- 超过最大空闲时间（兜底）
+"""
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EventScheduler:
+    """
+    事件驱动调度器
+
+    每 poll_interval 秒检查一次触发条件（只读行情，不调用 LLM），
+    有触发时才运行完整交易周期。
+
+    统计与固定间隔循环（baseline_interval）对比:
+    - skipped_cycles: 固定循环会运行、但本调度器跳过的周期数
+    - compute_saved: 跳过周期节省的运行时间（按平均周期耗时估算）
+    - reaction_saved: 事件触发后比固定循环提前响应的时间
+    """
+
+    def __init__(
+        self,
+        snapshot,
+        address: Optional[str] = None,
+        coins: Optional[List[str]] = None,
+        indicator_fn: Optional[Callable[[str], Dict]] = None,
+        price_move_pct: float = 0.01,
+        rsi_low: float = 30.0,
+        rsi_high: float = 70.0,
+        max_idle: float = 900.0,
+        poll_interval: float = 10.0,
+        indicator_interval: float = 60.0,
+        baseline_interval: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        wall_clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            snapshot: MarketSnapshot 实例（价格、账户状态；接入实时行情时监听成交）
+            address: 账户地址（用于检测持仓变化）
+            coins: 监控的币种
+            indicator_fn: coin -> 技术指标字典（含 "rsi_14"），None 则不检测 RSI
+            price_move_pct: 价格变动触发阈值（0.01 = 1%）
+            rsi_low: RSI 超卖线
+            rsi_high: RSI 超买线
+            max_idle: 最长空闲时间（秒），超过后无论如何运行一次
+            poll_interval: 触发条件检查间隔（秒）
+            indicator_interval: RSI 检查间隔（秒），指标计算比价格检查更贵
+            baseline_interval: 对比用的固定循环间隔（秒）
+            clock / sleep: 单调时钟和等待函数（测试时可替换）
+            wall_clock: 与成交时间戳对比的系统时钟（秒）
+        """
+        self.snapshot = snapshot
+        self.address = address
+        self.coins = coins or ["BTC", "ETH"]
+        self.indicator_fn = indicator_fn
+        self.price_move_pct = price_move_pct
+        self.rsi_low = rsi_low
+        self.rsi_high = rsi_high
+        self.max_idle = max_idle
+        self.poll_interval = poll_interval
+        self.indicator_interval = indicator_interval
+        self.baseline_interval = baseline_interval
+        self._clock = clock
+        self._sleep = sleep
+        self._wall_clock = wall_clock
+
+        self._reference_prices: Dict[str, float] = {}
+        self._rsi_zones: Dict[str, str] = {}
+        self._positions: Optional[Dict[str, float]] = None
+        self._pending_events: List[str] = []
+        self._last_run: Optional[float] = None
+        self._last_run_ms: Optional[int] = None  # 上次周期结束的系统时间（毫秒），之前的成交已在周期内处理
+        self._last_indicator_check: Optional[float] = None
+        self._started_at: Optional[float] = None
+
+        self.cycles_run = 0
+        self.polls = 0
+        self.trigger_counts: Dict[str, int] = {}
+        self.cycle_seconds = 0.0
+        self.reaction_saved = 0.0
+
+        live_state = getattr(snapshot, "live_state", None)
+        if live_state is not None:
+            live_state.add_fill_listener(self._on_fill)
+
+    # ===== 触发条件 =====
+
+    def _on_fill(self, fill: Dict):
+        """WebSocket 成交回调（在 WebSocket 线程中调用）"""
+        fill_time = fill.get("time")
+        if fill_time is not None and self._last_run_ms is not None and int(fill_time) <= self._last_run_ms:
+            return  # 周期内自己下单的成交（推送晚于周期结束到达）
+        direction = fill.get("dir", "")
+        label = "平仓成交" if direction.startswith("Close") else "成交"
+        self._pending_events.append(f"{label}: {fill.get('coin')} {fill.get('sz')} @ {fill.get('px')}")
+
+    def check_triggers(self) -> List[str]:
+        """
+        检查所有触发条件
+
+        Returns:
+            触发原因列表（为空表示无需运行）
+        """
+        now = self._clock()
+        reasons: List[str] = []
+
+        # 新成交
+        while self._pending_events:
+            reasons.append(self._pending_events.pop(0))
+
+        # 价格变动
+        try:
+            self.snapshot.invalidate("all_mids")
+            mids = self.snapshot.all_mids()
+            for coin in self.coins:
+                if coin not in mids or coin not in self._reference_prices:
+                    continue
+                reference = self._reference_prices[coin]
+                change = (float(mids[coin]) - reference) / reference
+                if abs(change) >= self.price_move_pct:
+                    reasons.append(f"价格变动: {coin} {change:+.2%}")
+        except Exception as e:
+            logger.error(f"价格检查失败: {e}")
+
+        # RSI 穿越区间
+        if self.indicator_fn is not None and (
+            self._last_indicator_check is None or now - self._last_indicator_check >= self.indicator_interval
+        ):
+            self._last_indicator_check = now
+            reasons.extend(self._check_rsi())
+
+        # 持仓变化（止盈止损触发等）；接入 WebSocket 时由成交推送覆盖
+        if self.address and getattr(self.snapshot, "live_state", None) is None:
+            reasons.extend(self._check_positions())
+
+        # 兜底：最长空闲时间
+        if self._last_run is None:
+            reasons.append("首次运行")
+        elif not reasons and now - self._last_run >= self.max_idle:
+            reasons.append(f"空闲超过 {self.max_idle:.0f} 秒")
+
+        return reasons
+
+    def _rsi_zone(self, rsi: float) -> str:
+        if rsi <= self.rsi_low:
+            return "超卖"
+        if rsi >= self.rsi_high:
+            return "超买"
+        return "中性"
+
+    def _check_rsi(self) -> List[str]:
+        reasons = []
+        for coin in self.coins:
+            try:
+                indicators = self.indicator_fn(coin) or {}
+            except Exception as e:
+                logger.error(f"{coin} 指标计算失败: {e}")
+                continue
+            rsi = indicators.get("rsi_14")
+            if rsi is None:
+                continue
+            zone = self._rsi_zone(rsi)
+            previous = self._rsi_zones.get(coin)
+            self._rsi_zones[coin] = zone
+            if previous is not None and zone != previous:
+                reasons.append(f"RSI 穿越: {coin} {previous} → {zone} ({rsi:.1f})")
+        return reasons
+
+    def _current_positions(self) -> Dict[str, float]:
+        user_state = self.snapshot.user_state(self.address)
+        positions = {}
+        for asset_position in user_state.get("assetPositions", []):
+            position = asset_position["position"]
+            size = float(position["szi"])
+            if size != 0:
+                positions[position["coin"]] = size
+        return positions
+
+    def _check_positions(self) -> List[str]:
+        try:
+            self.snapshot.invalidate("user_state")
+            positions = self._current_positions()
+        except Exception as e:
+            logger.error(f"持仓检查失败: {e}")
+            return []
+
+        previous, self._positions = self._positions, positions
+        if previous is None:
+            return []
+        reasons = []
+        for coin in sorted(set(previous) | set(positions)):
+            before, after = previous.get(coin, 0.0), positions.get(coin, 0.0)
+            if before == after:
+                continue
+            if after == 0:
+                reasons.append(f"持仓平仓: {coin}（可能触发止盈止损）")
+            else:
+                reasons.append(f"持仓变化: {coin} {before} → {after}")
+        return reasons
+
+    # ===== 运行 =====
+
+    def mark_cycle(self):
+        """周期运行后记录参考状态（价格、持仓），丢弃周期内到达的成交（周期自己下单产生）"""
+        self._last_run = self._clock()
+        self._last_run_ms = int(self._wall_clock() * 1000)
+        self._pending_events.clear()
+        try:
+            mids = self.snapshot.all_mids()
+            self._reference_prices = {c: float(mids[c]) for c in self.coins if c in mids}
+        except Exception as e:
+            logger.error(f"记录参考价格失败: {e}")
+        if self.address and getattr(self.snapshot, "live_state", None) is None:
+            try:
+                self.snapshot.invalidate("user_state")
+                self._positions = self._current_positions()
+            except Exception as e:
+                logger.error(f"记录持仓失败: {e}")
+
+    def run_forever(self, run_cycle: Callable[[List[str]], Any], max_cycles: Optional[int] = None):
+        """
+        持续运行：有触发时调用 run_cycle(触发原因列表)
+
+        Args:
+            run_cycle: 运行一个交易周期的函数
+            max_cycles: 最多运行周期数（None 表示不限，Ctrl+C 退出）
+        """
+        self._started_at = self._clock()
+        while max_cycles is None or self.cycles_run < max_cycles:
+            self.polls += 1
+            reasons = self.check_triggers()
+            if reasons:
+                self._run(run_cycle, reasons)
+                continue
+            self._sleep(self.poll_interval)
+
+    def _run(self, run_cycle: Callable[[List[str]], Any], reasons: List[str]):
+        now = self._clock()
+        logger.info(f"⚡ 触发交易周期: {'; '.join(reasons)}")
+        for reason in reasons:
+            kind = reason.split(":")[0]
+            self.trigger_counts[kind] = self.trigger_counts.get(kind, 0) + 1
+
+        # 固定间隔循环要等到下一个整周期才会响应
+        if self._last_run is not None and self._started_at is not None:
+            elapsed = now - self._started_at
+            next_tick = -(-elapsed // self.baseline_interval) * self.baseline_interval
+            self.reaction_saved += max(0.0, next_tick - elapsed)
+
+        started = self._clock()
+        try:
+            run_cycle(reasons)
+        finally:
+            self.cycle_seconds += self._clock() - started
+            self.cycles_run += 1
+            self.mark_cycle()
+
+    def stats(self) -> Dict:
+        """
+        调度统计
+
+        Returns:
+            {"cycles_run": 3, "baseline_cycles": 12, "skipped_cycles": 9,
+             "compute_saved": 180.0, "reaction_saved": 95.0, "triggers": {...}, "polls": 100}
+        """
+        elapsed = self._clock() - self._started_at if self._started_at is not None else 0.0
+        baseline_cycles = int(elapsed // self.baseline_interval) + 1 if self._started_at is not None else 0
+        skipped = max(0, baseline_cycles - self.cycles_run)
+        average_cycle = self.cycle_seconds / self.cycles_run if self.cycles_run else 0.0
+        return {
+            "cycles_run": self.cycles_run,
+            "baseline_cycles": baseline_cycles,
+            "skipped_cycles": skipped,
+            "compute_saved": skipped * average_cycle,
+            "reaction_saved": self.reaction_saved,
+            "triggers": dict(self.trigger_counts),
+            "polls": self.polls,
+        }
+
+    def log_stats(self):
+        """输出调度统计"""
+        stats = self.stats()
+        logger.info(
+            f"🗓️  事件调度: 运行 {stats['cycles_run']} 轮, "
+            f"跳过 {stats['skipped_cycles']} 轮（对比固定 {self.baseline_interval:.0f} 秒间隔）, "
+            f"节省运行时间 {stats['compute_saved']:.1f}s, 提前响应 {stats['reaction_saved']:.1f}s"
+        )
+        if stats["triggers"]:
+            logger.info(f"   触发统计: {stats['triggers']}")
+
+
+def create_scheduler(config: Dict, snapshot, address: str, baseline_interval: float,
+                     indicator_fn: Optional[Callable[[str], Dict]] = None) -> Optional[EventScheduler]:
+    """
+    按配置创建调度器（agent.scheduler.mode = "event"）
+
+    Args:
+        config: 完整配置
+        snapshot: MarketSnapshot 实例
+        address: 账户地址
+        baseline_interval: 原固定循环间隔（秒），用于统计对比
+        indicator_fn: coin -> 技术指标字典
+
+    Returns:
+        EventScheduler；固定间隔模式返回 None
+    """
+    agent_config = config.get("agent", {})
+    scheduler_config = agent_config.get("scheduler", {})
+    if scheduler_config.get("mode", "interval") != "event":
+        return None
+
+    scheduler = EventScheduler(
+        snapshot,
+        address=address,
+        coins=agent_config.get("coins") or ["BTC", "ETH"],
+        indicator_fn=indicator_fn,
+        price_move_pct=scheduler_config.get("price_move_pct", 0.01),
+        rsi_low=scheduler_config.get("rsi_low", 30),
+        rsi_high=scheduler_config.get("rsi_high", 70),
+        max_idle=scheduler_config.get("max_idle", 900),
+        poll_interval=scheduler_config.get("poll_interval", 10),
+        indicator_interval=scheduler_config.get("indicator_interval", 60),
+        baseline_interval=baseline_interval
+    )
+    logger.info(
+        f"🗓️  事件驱动调度: 价格变动 ≥{scheduler.price_move_pct:.1%} | "
+        f"RSI {scheduler.rsi_low:.0f}/{scheduler.rsi_high:.0f} | 最长空闲 {scheduler.max_idle:.0f}s"
+    )
+    return scheduler
@@ -0,0 +1,300 @@
+"""
+订单簿滑点估计 - 按 L2 深度确定市价单的滑点上限和拆单方案
+
+市价单原先固定使用 5% 的滑点容忍度：深度不足时 IOC 单以很差的价格成交，
+深度充足时又给了过宽的保护价。这里按订单簿逐档累加（NumPy cumsum）估计：
+- 给定数量的成交均价、最差成交价和相对中间价的冲击（基点）
+- 滑点上限 = 最差成交价的偏离 + 缓冲，限制在 [min_slippage, max_slippage]
+- 冲击超过 max_impact_bps 时拆成多个子订单，每个子订单只吃到冲击阈值以内的深度
+"""
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLIPPAGE = 0.05  # 没有订单簿时的滑点（同 exchange.market_open 默认值）
+
+
+class BookLevels:
+    """
+    解析后的订单簿：两侧价格、数量及其累计和（数量、名义价值）
+
+    同一订单簿多次估计时只解析一次，每次估计只需一次 searchsorted。
+    """
+
+    def __init__(self, book: Optional[Dict]):
+        """
+        Args:
+            book: info.l2_snapshot 格式 {"levels": [[买盘], [卖盘]]}
+        """
+        levels = (book or {}).get("levels") or [[], []]
+        self._sides = {}
+        for is_buy, side in ((False, levels[0]), (True, levels[1])):
+            px = np.array([float(level["px"]) for level in side], dtype=np.float64)
+            sz = np.array([float(level["sz"]) for level in side], dtype=np.float64)
+            # 按成交顺序排列：买单吃卖盘（价格升序），卖单吃买盘（价格降序）
+            order = np.argsort(px) if is_buy else np.argsort(-px)
+            px, sz = px[order], sz[order]
+            self._sides[is_buy] = (px, sz, np.cumsum(sz), np.cumsum(px * sz))
+
+        bids, asks = self._sides[False][0], self._sides[True][0]
+        if len(bids) and len(asks):
+            self.mid: Optional[float] = float(bids[0] + asks[0]) / 2
+        elif len(bids) or len(asks):
+            self.mid = float(bids[0] if len(bids) else asks[0])
+        else:
+            self.mid = None
+
+    def side(self, is_buy: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """成交方向一侧的 (价格, 数量, 累计数量, 累计名义价值)"""
+        return self._sides[is_buy]
+
+
+def estimate_fill(book, is_buy: bool, size: float) -> Dict:
+    """
+    逐档吃单估计成交
+
+    Args:
+        book: l2_snapshot 原始格式或 BookLevels
+
+    Returns:
+        {"mid", "filled", "avg_price", "worst_price", "impact_bps", "levels", "fillable"}
+        深度不足时 filled < size、fillable=False；订单簿为空时价格字段为 None
+    """
+    levels = book if isinstance(book, BookLevels) else BookLevels(book)
+    px, sz, cum_sz, cum_notional = levels.side(is_buy)
+    mid = levels.mid
+    if not len(px) or mid is None or size <= 0:
+        return {"mid": mid, "filled": 0.0, "avg_price": None, "worst_price": None,
+                "impact_bps": None, "levels": 0, "fillable": False}
+
+    # 第一个累计数量 ≥ size 的档位：之前的档位全部吃完，该档吃一部分
+    last = int(np.searchsorted(cum_sz, size, side="left"))
+    fillable = last < len(px)
+    last = min(last, len(px) - 1)
+    before_sz = cum_sz[last - 1] if last else 0.0
+    before_notional = cum_notional[last - 1] if last else 0.0
+    filled = float(min(size, cum_sz[last]))
+    avg_price = float((before_notional + (filled - before_sz) * px[last]) / filled)
+    sign = 1 if is_buy else -1
+    return {
+        "mid": mid,
+        "filled": filled,
+        "avg_price": avg_price,
+        "worst_price": float(px[last]),
+        "impact_bps": round(sign * (avg_price / mid - 1) * 10000, 3),
+        "levels": last + 1,
+        "fillable": bool(fillable),
+    }
+
+
+class SlippageModel:
+    """
+    市价单执行计划
+
+    用法:
+        model = SlippageModel(max_impact_bps=30)
+        plan = model.plan(book, is_buy=True, size=2.5)
+        # plan["slippage"] 传给 market_open；plan["children"] 为子订单数量
+    """
+
+    def __init__(
+        self,
+        max_impact_bps: float = 30.0,
+        buffer_bps: float = 10.0,
+        min_slippage: float = 0.002,
+        max_slippage: float = DEFAULT_SLIPPAGE,
+        max_child_orders: int = 5,
+        child_delay: float = 0.5
+    ):
+        """
+        Args:
+            max_impact_bps: 单个订单可接受的成交均价冲击（基点），超过则拆单
+            buffer_bps: 滑点上限在最差成交价之外的缓冲（基点），覆盖下单前订单簿的变化
+            min_slippage / max_slippage: 滑点上限的范围（比例）
+            max_child_orders: 最多拆成的子订单数
+            child_delay: 子订单之间的间隔（秒），等待订单簿补充
+        """
+        self.max_impact_bps = max_impact_bps
+        self.buffer_bps = buffer_bps
+        self.min_slippage = min_slippage
+        self.max_slippage = max_slippage
+        self.max_child_orders = max_child_orders
+        self.child_delay = child_delay
+
+    def _slippage_for(self, estimate: Dict) -> float:
+        worst = abs(estimate["worst_price"] / estimate["mid"] - 1)
+        return float(np.clip(worst + self.buffer_bps / 10000, self.min_slippage, self.max_slippage))
+
+    def plan(self, book, is_buy: bool, size: float) -> Dict:
+        """
+        估计成交并给出执行计划
+
+        Args:
+            book: l2_snapshot 原始格式或 BookLevels
+
+        Returns:
+            {"size", "slippage": 滑点上限, "children": [子订单数量], "fillable": 最大滑点内能否成交,
+             "estimate": 整单的 estimate_fill 结果, "reason": 不可成交或拆单的原因}
+        """
+        levels = book if isinstance(book, BookLevels) else BookLevels(book)
+        estimate = estimate_fill(levels, is_buy, size)
+        result = {"size": size, "slippage": self.max_slippage, "children": [size], "fillable": True,
+                  "estimate": estimate, "reason": None}
+        if estimate["mid"] is None or estimate["avg_price"] is None:
+            result["reason"] = "没有订单簿，使用默认滑点"
+            return result
+
+        px, sz, _, _ = levels.side(is_buy)
+        mid = estimate["mid"]
+        offset = (px / mid - 1) if is_buy else (1 - px / mid)
+        depth_in_band = float(sz[offset <= self.max_slippage].sum())
+        if depth_in_band <= 0:
+            result.update(fillable=False, reason=f"最大滑点 {self.max_slippage:.2%} 内没有对手盘")
+            return result
+
+        if estimate["impact_bps"] <= self.max_impact_bps and estimate["fillable"]:
+            result["slippage"] = self._slippage_for(estimate)
+            return result
+
+        # 拆单：每个子订单只吃冲击阈值以内的档位（至少一档）
+        child_depth = float(sz[offset * 10000 <= self.max_impact_bps].sum()) or float(sz[0])
+        child_depth = min(child_depth, depth_in_band)
+        count = min(max(math.ceil(size / child_depth), 1), self.max_child_orders)
+        child = size / count
+        child_estimate = estimate_fill(levels, is_buy, child)
+        if not child_estimate["fillable"] or child > depth_in_band:
+            result.update(fillable=False, reason=(
+                f"订单簿深度不足: 最大滑点 {self.max_slippage:.2%} 内只有 {depth_in_band:g}，需要 {size:g}"
+            ))
+            return result
+
+        result.update(
+            slippage=self._slippage_for(child_estimate),
+            children=[child] * count,
+            reason=f"整单冲击 {estimate['impact_bps']:.1f}bps 超过 {self.max_impact_bps:g}bps，拆成 {count} 笔",
+        )
+        return result
+
+    def plan_for(self, tools, coin: str, is_buy: bool, size: float) -> Dict:
+        """读取 tools 的周期快照中的订单簿并生成计划（订单簿获取失败时按默认滑点）"""
+        try:
+            book = tools.snapshot.l2_snapshot(coin)
+        except Exception as e:
+            logger.warning(f"获取 {coin} 订单簿失败，使用默认滑点: {e}")
+            book = None
+        return self.plan(book, is_buy, size)
+
+
+def _round_children(children: List[float], size: float, info, coin: str) -> List[float]:
+    """子订单数量按 szDecimals 取整，最后一笔补齐总数量"""
+    from src.batch_execution import round_size
+
+    if len(children) == 1:
+        return [size]
+    rounded = [round_size(info, coin, child) for child in children[:-1]]
+    rounded.append(round_size(info, coin, size - sum(rounded)))
+    return [child for child in rounded if child > 0]
+
+
+def market_open_outcome(response) -> Tuple[float, Optional[str]]:
+    """
+    市价开仓响应中的成交数量和第一个错误
+
+    拆单时前面的子订单可能已成交、后面的被拒绝：只要有成交就已经开仓，
+    调用方应视为成功并单独报告错误（同 OrderTracker.confirm）。
+
+    Returns:
+        (成交数量, 错误信息；没有错误时为 None)
+    """
+    if not isinstance(response, dict):
+        return 0.0, str(response)
+    statuses = response.get("response", {}).get("data", {}).get("statuses", []) \
+        if isinstance(response.get("response"), dict) else []
+    filled_size = sum(float(s["filled"].get("totalSz", 0)) for s in statuses if isinstance(s, dict) and "filled" in s)
+    error = next((s["error"] for s in statuses if isinstance(s, dict) and "error" in s), None)
+    if error is None and response.get("status") != "ok":
+        error = str(response.get("response", response))
+    return filled_size, error
+
+
+def place_market_open(tools, coin: str, is_buy: bool, size: float, sleep=time.sleep) -> Dict:
+    """
+    按执行计划下市价开仓单
+
+    tools 有 slippage_model 时按订单簿确定滑点并按需拆单，否则等同 market_open(..., 0.05)。
+
+    Args:
+        tools: HyperliquidTools / AdvancedTradingTools（使用其 exchange / snapshot / info / slippage_model）
+
+    Returns:
+        格式同 exchange.market_open 的响应；拆单时各子订单的状态合并到 statuses 中，
+        深度不足时返回 {"status": "ok", "response": {"data": {"statuses": [{"error": 原因}]}}}，
+        另含 "plan": 执行计划（未使用模型时为 None）、"filled_size" / "error": 见 market_open_outcome
+    """
+    model: Optional[SlippageModel] = getattr(tools, "slippage_model", None)
+    if model is None:
+        response = tools.exchange.market_open(coin, is_buy, size, None, DEFAULT_SLIPPAGE)
+        if not isinstance(response, dict):
+            return response
+        filled_size, error = market_open_outcome(response)
+        return {**response, "plan": None, "filled_size": filled_size, "error": error}
+
+    plan = model.plan_for(tools, coin, is_buy, size)
+    if not plan["fillable"]:
+        logger.warning(f"⚠️  {coin} 不下单: {plan['reason']}")
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": [{"error": plan["reason"]}]}},
+                "plan": plan, "filled_size": 0.0, "error": plan["reason"]}
+
+    children = _round_children(plan["children"], size, tools.info, coin)
+    if len(children) > 1:
+        logger.info(f"✂️  {coin} {plan['reason']}: {children}")
+    statuses, status = [], "ok"
+    for n, child in enumerate(children):
+        if n:
+            sleep(model.child_delay)
+            tools.snapshot.invalidate("l2_snapshot")
+        response = tools.exchange.market_open(coin, is_buy, child, None, plan["slippage"])
+        if response.get("status") != "ok":
+            # 前面的子订单已被接受时整体仍为 ok，错误记录在 statuses 中
+            if not statuses:
+                status = response.get("status")
+            statuses.append({"error": str(response.get("response", response))})
+            break
+        child_statuses = response.get("response", {}).get("data", {}).get("statuses", [])
+        statuses.extend(child_statuses)
+        if any("error" in s for s in child_statuses if isinstance(s, dict)):
+            break
+    logger.info(f"📐 {coin} 滑点上限 {plan['slippage']:.2%}（预计冲击 {plan['estimate']['impact_bps']}bps）")
+    result = {"status": status, "response": {"type": "order", "data": {"statuses": statuses}}, "plan": plan}
+    filled_size, error = market_open_outcome(result)
+    if filled_size > 0 and error:
+        logger.warning(f"⚠️  {coin} 拆单部分成交 {filled_size}/{size}，后续子订单失败: {error}")
+    return {**result, "filled_size": filled_size, "error": error}
+
+
+def create_slippage_model(config: Dict) -> Optional[SlippageModel]:
+    """
+    按 agent.slippage 配置创建滑点模型
+
+    {"enabled": true, "max_impact_bps": 30, "buffer_bps": 10, "min_slippage": 0.002,
+     "max_slippage": 0.05, "max_child_orders": 5, "child_delay": 0.5}
+
+    Returns:
+        未启用时返回 None（市价单使用固定 5% 滑点）
+    """
+    settings = config.get("agent", {}).get("slippage", {})
+    if not settings.get("enabled", False):
+        return None
+    return SlippageModel(
+        max_impact_bps=settings.get("max_impact_bps", 30.0),
+        buffer_bps=settings.get("buffer_bps", 10.0),
+        min_slippage=settings.get("min_slippage", 0.002),
+        max_slippage=settings.get("max_slippage", DEFAULT_SLIPPAGE),
+        max_child_orders=settings.get("max_child_orders", 5),
+        child_delay=settings.get("child_delay", 0.5),
+    )
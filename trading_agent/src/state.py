@@ -12,6 +12,8 @@ class TradingState(TypedDict):
     # ===== 市场数据 =====
     current_prices: dict  # {"BTC": 50000.0, "ETH": 3000.0}
     market_data: dict  # 详细市场数据
+    market_analysis_data: dict  # 技术分析数据 {coin: {"indicators": ..., "condition": ...}}
+    market_scan: dict  # 全市场扫描结果（见 market_scanner.MarketScanner.scan）
     
     # ===== 账户信息 =====
     account_value: float  # 账户总价值
@@ -25,11 +27,13 @@ class TradingState(TypedDict):
     target_size: float  # 目标数量
     confidence: float  # 决策置信度 (0-1)
     reasoning: str  # 决策理由
+    prompt_tokens: dict  # 提示词各分段的 token 数（近似值）
     
     # ===== 风险控制 =====
     risk_assessment: dict  # 风险评估结果
     risk_passed: bool  # 是否通过风险检查
     risk_message: str  # 风险检查消息
+    prepared_trades: list  # 流式决策期间提前完成的下单准备（见 batch_execution.prepare_trade）
     
     # ===== 执行结果 =====
     execution_result: dict  # 交易执行结果
@@ -51,6 +55,8 @@ def create_initial_state() -> TradingState:
     return TradingState(
         current_prices={},
         market_data={},
+        market_analysis_data={},
+        market_scan={},
         account_value=0.0,
         positions=[],
         available_balance=0.0,
@@ -60,9 +66,11 @@ def create_initial_state() -> TradingState:
         target_size=0.0,
         confidence=0.0,
         reasoning="",
+        prompt_tokens={},
         risk_assessment={},
         risk_passed=False,
         risk_message="",
+        prepared_trades=[],
         execution_result={},
         success=False,
         portfolio_trades=[],
@@ -0,0 +1,217 @@
+"""
+流式 Function Calling - 边接收 LLM 输出边解析工具参数
+
+LLM 逐段输出 tool call 的 JSON 参数，ToolArgumentsParser 增量扫描：
+- 组合决策（make_portfolio_decisions）：trades 数组中每个交易对象一闭合就交给回调
+- 单个决策（make_trading_decision 等）：decision / coin / size 等字段都已完整时交给回调，
+  不必等待最后的长篇 reasoning
+
+回调里做风控预检和下单前准备（数量取整、杠杆查询），与 LLM 生成重叠执行。
+最终仍返回与 chat.completions.create 结构相同的完整响应，节点的解析逻辑不变。
+"""
+import json
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 单个决策在这些字段完整后即可预处理
+DECISION_READY_KEYS = ("decision", "coin", "size")
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def tool_call_response(name: str, arguments: str, content: Optional[str] = None):
+    """构造与 chat.completions.create 返回值结构相同的响应（只含一个 tool_call）"""
+    function = _Namespace(name=name, arguments=arguments)
+    tool_call = _Namespace(id="streamed", type="function", function=function)
+    message = _Namespace(content=content, tool_calls=[tool_call])
+    return _Namespace(choices=[_Namespace(message=message, finish_reason="tool_calls")])
+
+
+def text_response(content: str):
+    message = _Namespace(content=content, tool_calls=None)
+    return _Namespace(choices=[_Namespace(message=message, finish_reason="stop")])
+
+
+class ToolArgumentsParser:
+    """
+    tool call JSON 参数的增量解析器
+
+    只扫描新到达的字符（跟踪字符串/转义状态和括号栈），不重复解析已处理的部分。
+    """
+
+    def __init__(self, array_key: Optional[str] = None, ready_keys: Iterable[str] = ()):
+        """
+        Args:
+            array_key: 顶层数组字段名（如 "trades"），数组中每个对象闭合时产生 ("item", 对象)
+            ready_keys: 顶层字段都完整（或对象结束）时产生一次 ("ready", 已完整的顶层字段)
+        """
+        self.array_key = array_key
+        self.ready_keys = tuple(ready_keys)
+        self.text = ""
+        self.items: List[Dict] = []
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""
+        self._key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._ready = not self.ready_keys
+
+    def feed(self, fragment: str) -> List[Tuple[str, Dict]]:
+        """
+        追加一段参数文本
+
+        Returns:
+            新产生的事件 [("item", 对象) | ("ready", 字段), ...]
+        """
+        events = []
+        self.text += fragment
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":":
+                if len(self._stack) == 1:
+                    self._key = json.loads(self._last_string)
+            elif ch in "{[":
+                self._stack.append(ch)
+                depth = len(self._stack)
+                if ch == "[" and depth == 2 and self.array_key and self._key == self.array_key:
+                    self._array_depth = depth
+                elif ch == "{" and self._array_depth and depth == self._array_depth + 1:
+                    self._item_start = i
+            elif ch in "}]":
+                depth = len(self._stack)
+                if ch == "}" and self._item_start is not None and depth == self._array_depth + 1:
+                    try:
+                        item = json.loads(text[self._item_start:i + 1])
+                        self.items.append(item)
+                        events.append(("item", item))
+                    except ValueError:
+                        pass
+                    self._item_start = None
+                elif ch == "]" and depth == self._array_depth:
+                    self._array_depth = None
+                if self._stack:
+                    self._stack.pop()
+
+            # 顶层字段结束（逗号或右括号）时检查是否已可预处理
+            if not self._ready and ch in ",}" and len(self._stack) <= 1:
+                prefix = text[:i] + "}" if ch == "," else text[:i + 1]
+                try:
+                    fields = json.loads(prefix)
+                except ValueError:
+                    fields = None
+                # 关键字段都已完整，或整个对象已结束（如 hold/close 没有 size）
+                if isinstance(fields, dict) and (all(key in fields for key in self.ready_keys) or not self._stack):
+                    self._ready = True
+                    events.append(("ready", fields))
+
+        self._pos = len(text)
+        return events
+
+
+class ToolCallStream:
+    """
+    流式调用 LLM，并把增量解析出的交易交给回调
+
+    用法:
+        stream = ToolCallStream(on_trade, array_key="trades")
+        response = stream.create(llm_client, model=..., messages=..., tools=...)
+    """
+
+    def __init__(
+        self,
+        on_trade: Callable[[Dict], None],
+        array_key: Optional[str] = None,
+        ready_keys: Iterable[str] = DECISION_READY_KEYS
+    ):
+        """
+        Args:
+            on_trade: 每个完整交易（或单个决策的关键字段）的回调
+            array_key: 组合决策的交易数组字段（"trades"）；None 表示单个决策
+            ready_keys: 单个决策需要完整的字段
+        """
+        self.on_trade = on_trade
+        self.array_key = array_key
+        self.ready_keys = () if array_key else tuple(ready_keys)
+        self.first_trade_ms: Optional[float] = None
+        self.trades_dispatched = 0
+
+    def _parser(self) -> ToolArgumentsParser:
+        return ToolArgumentsParser(self.array_key, self.ready_keys)
+
+    def _dispatch(self, events: List[Tuple[str, Dict]], started: float):
+        for _, trade in events:
+            if self.first_trade_ms is None:
+                self.first_trade_ms = (time.perf_counter() - started) * 1000
+            self.trades_dispatched += 1
+            try:
+                self.on_trade(trade)
+            except Exception as e:
+                logger.error(f"流式预处理失败: {e}")
+
+    def replay(self, arguments: str):
+        """一次性处理完整参数（缓存命中或客户端不支持流式时）"""
+        self._dispatch(self._parser().feed(arguments), time.perf_counter())
+
+    def create(self, llm_client, **request):
+        """
+        以 stream=True 调用 chat.completions.create
+
+        Returns:
+            与非流式调用结构相同的完整响应
+        """
+        started = time.perf_counter()
+        stream = llm_client.chat.completions.create(stream=True, **request)
+        if hasattr(stream, "choices"):
+            # 客户端忽略了 stream 参数，返回的是完整响应
+            message = stream.choices[0].message
+            if message.tool_calls:
+                self.replay(message.tool_calls[0].function.arguments)
+            return stream
+
+        parser = self._parser()
+        name, content = None, []
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if getattr(delta, "content", None):
+                content.append(delta.content)
+            for call in getattr(delta, "tool_calls", None) or []:
+                if (call.index or 0) != 0:
+                    continue  # 节点只使用第一个 tool call
+                if call.function.name:
+                    name = call.function.name
+                if call.function.arguments:
+                    self._dispatch(parser.feed(call.function.arguments), started)
+
+        elapsed = (time.perf_counter() - started) * 1000
+        if self.first_trade_ms is not None:
+            logger.info(f"⚡ 流式解析: 第一个交易在 {self.first_trade_ms:.0f}ms 时可用（LLM 共 {elapsed:.0f}ms），"
+                        f"共预处理 {self.trades_dispatched} 个")
+        if name is None:
+            return text_response("".join(content))
+        return tool_call_response(name, parser.text, "".join(content) or None)
@@ -0,0 +1,146 @@
+"""
+多周期K线 - 由一条基础周期K线（如 15m）在本地聚合出 1h / 4h / 1d
+
+原先每多看一个周期，每个币种就要多一次 candles_snapshot。这里每个币种只拉取基础周期
+（有本地K线缓存时每轮只补齐新K线），用 NumPy reduceat 按周期起点分组聚合 OHLCV，
+再按周期批量计算技术指标（同一周期的所有币种一次矩阵计算）。
+
+主周期（1h，最近 24 小时）的K线和指标格式与原来相同，其余周期的指标写入
+indicators["timeframes"]，如 {"4h": {...}, "1d": {...}}。
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.candle_store import INTERVAL_MS
+from src.indicators import compute_indicators_batch
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_INTERVAL = "1h"
+
+
+def resample_candles(candles: List[Dict], interval: str) -> List[Dict]:
+    """
+    把基础周期K线聚合为更大周期
+
+    周期起点按 UTC 对齐（与交易所K线一致），最后一根可能未收盘。
+
+    Args:
+        candles: 基础周期K线（get_candles 格式，按时间升序）
+        interval: 目标周期，须为基础周期的整数倍
+
+    Returns:
+        目标周期K线，格式同 get_candles
+    """
+    if not candles:
+        return []
+    step = INTERVAL_MS[interval]
+    times = np.fromiter((c["time"] for c in candles), dtype=np.int64, count=len(candles))
+    ohlcv = np.array([[c["open"], c["high"], c["low"], c["close"], c["volume"]] for c in candles],
+                     dtype=np.float64)
+    buckets, first = np.unique(times // step, return_index=True)
+    last = np.append(first[1:], len(candles)) - 1
+    highs = np.maximum.reduceat(ohlcv[:, 1], first)
+    lows = np.minimum.reduceat(ohlcv[:, 2], first)
+    volumes = np.add.reduceat(ohlcv[:, 4], first)
+    return [
+        {"time": int(bucket * step), "open": float(ohlcv[i, 0]), "high": float(high), "low": float(low),
+         "close": float(ohlcv[j, 3]), "volume": float(volume)}
+        for bucket, i, j, high, low, volume in zip(buckets, first, last, highs, lows, volumes)
+    ]
+
+
+def compute_timeframe_indicators(candles_by_coin: Dict[str, Dict[str, List[Dict]]]) -> Dict[str, Dict[str, Dict]]:
+    """
+    批量计算多个币种、多个周期的技术指标（每个周期一次矩阵计算）
+
+    Args:
+        candles_by_coin: {币种: {周期: K线}}
+
+    Returns:
+        {币种: {周期: 指标字典}}，K线不足 20 根的周期为空字典
+    """
+    intervals = list(dict.fromkeys(interval for frames in candles_by_coin.values() for interval in frames))
+    results: Dict[str, Dict[str, Dict]] = {coin: {} for coin in candles_by_coin}
+    for interval in intervals:
+        batch = compute_indicators_batch({
+            coin: frames[interval] for coin, frames in candles_by_coin.items() if interval in frames
+        })
+        for coin, indicators in batch.items():
+            results[coin][interval] = indicators
+    return results
+
+
+class MultiTimeframe:
+    """
+    多周期配置和K线切分
+
+    用法:
+        frames = MultiTimeframe("15m", ["4h", "1d"], lookback_days=21)
+        base = tools.get_candles(coin, frames.base_interval, frames.lookback_hours)
+        primary, by_interval = frames.split(base)  # 主周期最近 24 小时 + {"4h": [...], "1d": [...]}
+    """
+
+    def __init__(
+        self,
+        base_interval: str = "15m",
+        intervals: Iterable[str] = ("4h", "1d"),
+        lookback_days: float = 21,
+        window_hours: int = 24
+    ):
+        """
+        Args:
+            base_interval: 向交易所请求的基础周期
+            intervals: 额外计算的周期（主周期 1h 始终计算）
+            lookback_days: 基础K线回看天数（1d 指标至少需要 20 根日线）
+            window_hours: 主周期K线窗口（同原来 get_candles(coin, "1h", 24)）
+        """
+        if base_interval not in INTERVAL_MS:
+            raise ValueError(f"不支持的K线周期: {base_interval}")
+        base_step = INTERVAL_MS[base_interval]
+        intervals = [interval for interval in dict.fromkeys(intervals) if interval != PRIMARY_INTERVAL]
+        for interval in [PRIMARY_INTERVAL] + intervals:
+            if INTERVAL_MS.get(interval, 1) % base_step:
+                raise ValueError(f"无法由 {base_interval} K线聚合出 {interval} K线")
+        self.base_interval = base_interval
+        self.intervals = intervals
+        self.lookback_hours = lookback_days * 24
+        self.window_hours = window_hours
+
+    def split(self, base_candles: List[Dict], now_ms: Optional[int] = None) -> Tuple[List[Dict], Dict[str, List[Dict]]]:
+        """
+        基础K线 → (主周期最近 window_hours 小时的K线, {周期: K线})
+
+        Args:
+            base_candles: 基础周期K线（get_candles 格式）
+            now_ms: 当前时间（毫秒），默认取最后一根基础K线的时间
+        """
+        primary = resample_candles(base_candles, PRIMARY_INTERVAL)
+        if primary:
+            step = INTERVAL_MS[PRIMARY_INTERVAL]
+            now_ms = now_ms if now_ms is not None else base_candles[-1]["time"]
+            start = now_ms - self.window_hours * 3_600_000
+            start -= start % step
+            primary = [candle for candle in primary if candle["time"] >= start]
+        return primary, {interval: resample_candles(base_candles, interval) for interval in self.intervals}
+
+
+def create_multi_timeframe(config: Dict) -> Optional[MultiTimeframe]:
+    """
+    按 agent.timeframes 配置创建多周期设置
+
+    {"enabled": true, "base_interval": "15m", "intervals": ["4h", "1d"], "lookback_days": 21}
+
+    Returns:
+        未启用时返回 None（只计算 1h 指标）
+    """
+    settings = config.get("agent", {}).get("timeframes", {})
+    if not settings.get("enabled", False):
+        return None
+    return MultiTimeframe(
+        base_interval=settings.get("base_interval", "15m"),
+        intervals=settings.get("intervals", ["4h", "1d"]),
+        lookback_days=settings.get("lookback_days", 21),
+    )
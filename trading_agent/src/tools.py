@@ -6,6 +6,11 @@ import logging
 from typing import Dict, List, Optional
 from hyperliquid.info import Info
 from hyperliquid.exchange import Exchange
+from src.asset_index import AssetIndex, validate_order
+from src.candle_store import CandleStore
+from src.market_snapshot import MarketSnapshot
+from src.slippage import SlippageModel, market_open_outcome, place_market_open
+from src.transport import HyperliquidTransport
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +18,17 @@ logger = logging.getLogger(__name__)
 class HyperliquidTools:
     """Hyperliquid 交易工具类"""
     
-    def __init__(self, info: Info, exchange: Exchange, address: str):
+    def __init__(
+        self,
+        info: Info,
+        exchange: Exchange,
+        address: str,
+        candle_store: Optional[CandleStore] = None,
+        snapshot: Optional[MarketSnapshot] = None,
+        slippage_model: Optional[SlippageModel] = None,
+        asset_index: Optional[AssetIndex] = None,
+        transport: Optional[HyperliquidTransport] = None
+    ):
         """
         初始化工具类
         
@@ -21,10 +36,22 @@ class HyperliquidTools:
             info: Hyperliquid Info API 实例
             exchange: Hyperliquid Exchange API 实例
             address: 账户地址
+            candle_store: 本地K线缓存（None 表示每次直接请求交易所）
+            snapshot: 周期级行情快照（与其他工具共享时传入同一个实例）
+            slippage_model: 订单簿滑点模型（None 表示市价单固定 5% 滑点）
+            asset_index: 资产元数据索引（下单前本地取整和校验，None 表示交给交易所校验）
+            transport: 共享 HTTP 层（连接池、限流、重试，None 表示使用 SDK 默认的 Session）
         """
         self.info = info
         self.exchange = exchange
         self.address = address
+        self.candle_store = candle_store
+        self.snapshot = snapshot or MarketSnapshot(info)
+        self.slippage_model = slippage_model
+        self.asset_index = asset_index
+        self.transport = transport
+        if transport is not None:
+            transport.attach(info, exchange)
     
     # ===== 市场数据获取 =====
     
@@ -36,7 +63,7 @@ class HyperliquidTools:
             {"BTC": 50000.0, "ETH": 3000.0, ...}
         """
         try:
-            mids = self.info.all_mids()
+            mids = self.snapshot.all_mids()
             return {coin: float(price) for coin, price in mids.items()}
         except Exception as e:
             logger.error(f"获取价格失败: {e}")
@@ -53,8 +80,7 @@ class HyperliquidTools:
             价格或 None
         """
         try:
-            prices = self.get_all_prices()
-            return prices.get(coin)
+            return self.snapshot.price(coin)
         except Exception as e:
             logger.error(f"获取 {coin} 价格失败: {e}")
             return None
@@ -70,7 +96,7 @@ class HyperliquidTools:
             订单簿数据
         """
         try:
-            return self.info.l2_snapshot(coin)
+            return self.snapshot.l2_snapshot(coin)
         except Exception as e:
             logger.error(f"获取 {coin} 订单簿失败: {e}")
             return None
@@ -91,6 +117,11 @@ class HyperliquidTools:
             import time
             end_time = int(time.time() * 1000)
             start_time = end_time - (lookback_hours * 3600 * 1000)
+            live_candles = self.snapshot.live_candles(coin, interval, start_time)
+            if live_candles is not None:
+                return live_candles
+            if self.candle_store is not None:
+                return self.candle_store.get_candles(self.info, coin, interval, start_time, end_time)
             return self.info.candles_snapshot(coin, interval, start_time, end_time)
         except Exception as e:
             logger.error(f"获取 {coin} K线数据失败: {e}")
@@ -111,7 +142,7 @@ class HyperliquidTools:
             }
         """
         try:
-            user_state = self.info.user_state(self.address)
+            user_state = self.snapshot.user_state(self.address)
             margin = user_state["marginSummary"]
             
             return {
@@ -149,7 +180,7 @@ class HyperliquidTools:
             ]
         """
         try:
-            user_state = self.info.user_state(self.address)
+            user_state = self.snapshot.user_state(self.address)
             positions = []
             prices = self.get_all_prices()
             
@@ -185,7 +216,7 @@ class HyperliquidTools:
             订单列表
         """
         try:
-            orders = self.info.open_orders(self.address)
+            orders = self.snapshot.open_orders(self.address)
             return [
                 {
                     "coin": order["coin"],
@@ -207,7 +238,7 @@ class HyperliquidTools:
         coin: str, 
         is_buy: bool, 
         size: float, 
-        slippage: float = 0.05,
+        slippage: Optional[float] = None,
         dry_run: bool = True
     ) -> Dict:
         """
@@ -217,7 +248,7 @@ class HyperliquidTools:
             coin: 币种
             is_buy: True=买入, False=卖出
             size: 数量
-            slippage: 滑点容忍度
+            slippage: 滑点容忍度（None 表示按订单簿估计，未启用滑点模型时为 5%）
             dry_run: 是否仅模拟（不实际执行）
             
         Returns:
@@ -225,23 +256,48 @@ class HyperliquidTools:
         """
         action = "买入" if is_buy else "卖出"
         
+        # 本地校验：注定被拒绝的订单不发送
+        check = validate_order(self, coin, size)
+        if check is not None:
+            if not check["ok"]:
+                return {
+                    "success": False,
+                    "dry_run": dry_run,
+                    "action": action,
+                    "coin": coin,
+                    "size": size,
+                    "error": check["error"]
+                }
+            size = check["size"]
+        
         if dry_run:
             logger.info(f"[模拟] {action} {size} {coin}")
+            plan = None
+            if slippage is None and self.slippage_model is not None:
+                plan = self.slippage_model.plan_for(self, coin, is_buy, size)
             return {
                 "success": True,
                 "dry_run": True,
                 "action": action,
                 "coin": coin,
                 "size": size,
+                "plan": plan,
                 "message": f"模拟{action}成功"
             }
         
         try:
             logger.warning(f"[真实交易] {action} {size} {coin}")
-            # market_open(coin, is_buy, sz, px=None, slippage=0.05)
-            result = self.exchange.market_open(coin, is_buy, size, None, slippage)
+            if slippage is None:
+                # 按订单簿确定滑点上限，冲击过大时拆成子订单
+                result = place_market_open(self, coin, is_buy, size)
+            else:
+                # market_open(coin, is_buy, sz, px=None, slippage=0.05)
+                result = self.exchange.market_open(coin, is_buy, size, None, slippage)
+            self.snapshot.invalidate("user_state")
             
-            success = result["status"] == "ok"
+            # 拆单时前面的子订单成交、后面的失败也已开仓：有成交即成功，错误单独返回
+            filled_size, error = market_open_outcome(result)
+            success = filled_size > 0 or error is None
             
             # 解析执行结果
             if success and "response" in result and "data" in result["response"]:
@@ -266,6 +322,8 @@ class HyperliquidTools:
                 "action": action,
                 "coin": coin,
                 "size": size,
+                "filled_size": filled_size,
+                "error": error,
                 "result": result
             }
         except Exception as e:
@@ -317,6 +375,7 @@ class HyperliquidTools:
                 coin, is_buy, size, price,
                 order_type={"limit": {"tif": "Gtc"}}
             )
+            self.snapshot.invalidate("user_state", "open_orders")
             
             return {
                 "success": result["status"] == "ok",
@@ -350,6 +409,7 @@ class HyperliquidTools:
         try:
             logger.warning(f"[真实交易] 平仓 {coin}")
             result = self.exchange.market_close(coin)
+            self.snapshot.invalidate("user_state")
             
             return {
                 "success": result["status"] == "ok",
@@ -378,6 +438,7 @@ class HyperliquidTools:
         
         try:
             result = self.exchange.cancel(coin, oid)
+            self.snapshot.invalidate("user_state", "open_orders")
             return {"success": result["status"] == "ok", "result": result}
         except Exception as e:
             logger.error(f"取消订单失败: {e}")
@@ -0,0 +1,332 @@
+"""
+共享 HTTP 层 - Info / Exchange 的所有请求经过同一个连接池、限流器和重试策略
+
+SDK 的每个 Info / Exchange（以及 Exchange 内部的 Info）各自创建 requests.Session，
+没有重试、退避和请求权重统计，币种或 Agent 一多就容易触发 429。接入 transport 后:
+- 连接池: 所有客户端共用一个 keep-alive Session（HTTPAdapter 连接池）
+- 限流: 令牌桶按交易所的请求权重扣减（默认每分钟 1200），超出时在本地等待而不是被 429
+- 合并: 相同的 /info 请求同时在途时只发送一次，其余调用等待同一个结果
+- 重试: /info 遇到 429 / 5xx / 网络错误按指数退避 + 随机抖动重试；
+  /exchange 只重试确定未被处理的请求（429 和连接失败），避免重复下单
+- 统计: stats() 返回请求数、权重、合并数、重试数、429 次数和限流等待时间
+"""
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hyperliquid.api import API
+
+logger = logging.getLogger(__name__)
+
+# 交易所的 IP 限额：每分钟 1200 权重
+WEIGHT_PER_MINUTE = 1200
+
+# /info 请求权重（其余类型为 DEFAULT_INFO_WEIGHT）
+INFO_WEIGHTS = {
+    "l2Book": 2,
+    "allMids": 2,
+    "clearinghouseState": 2,
+    "orderStatus": 2,
+    "spotClearinghouseState": 2,
+    "exchangeStatus": 2,
+    "userRole": 60,
+}
+DEFAULT_INFO_WEIGHT = 20
+
+# 返回条目较多的请求按条目数追加权重（每 N 条 +1）
+ITEMS_PER_EXTRA_WEIGHT = {
+    "candleSnapshot": 60,
+    "userFills": 20,
+    "userFillsByTime": 20,
+    "historicalOrders": 20,
+    "fundingHistory": 20,
+    "userFunding": 20,
+}
+
+# /exchange 批量请求每 40 个订单 / 撤单追加 1 权重
+EXCHANGE_BATCH_SIZE = 40
+
+
+def request_weight(url_path: str, payload: Dict) -> int:
+    """请求发送前可确定的权重"""
+    if url_path == "/exchange":
+        action = payload.get("action") or {}
+        batch = action.get("orders") or action.get("cancels") or action.get("modifies") or []
+        return 1 + len(batch) // EXCHANGE_BATCH_SIZE
+    return INFO_WEIGHTS.get(payload.get("type"), DEFAULT_INFO_WEIGHT)
+
+
+def response_weight(payload: Dict, response: Any) -> int:
+    """按返回条目数追加的权重"""
+    per_item = ITEMS_PER_EXTRA_WEIGHT.get(payload.get("type"))
+    if per_item and isinstance(response, list):
+        return len(response) // per_item
+    return 0
+
+
+class TokenBucket:
+    """
+    令牌桶限流器（线程安全）
+
+    reserve() 立即扣减令牌并返回需要等待的秒数（令牌可以为负，等待期间按速率补足），
+    同步和异步调用方各自决定如何等待。
+    """
+
+    def __init__(self, capacity: float, refill_rate: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            capacity: 桶容量（允许的突发权重）
+            refill_rate: 每秒补充的令牌数
+            clock: 时钟（测试时可替换）
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.clock = clock
+        self.tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_rate)
+        self._updated = now
+
+    def reserve(self, weight: float) -> float:
+        """扣减 weight 个令牌，返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            self.tokens -= weight
+            return max(0.0, -self.tokens / self.refill_rate)
+
+    def charge(self, weight: float):
+        """事后追加扣减（响应大小决定的权重），影响之后的请求"""
+        if weight:
+            with self._lock:
+                self._refill()
+                self.tokens -= weight
+
+    def drain(self):
+        """收到 429 时清空令牌：服务端的计数已满，本地估计偏乐观"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class HyperliquidTransport(API):
+    """
+    共享 HTTP 层
+
+    用法:
+        transport = HyperliquidTransport(base_url)
+        transport.attach(info, exchange)  # 之后 info / exchange 的请求都经过 transport
+        transport.stats()
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = 10.0,
+        weight_per_minute: float = WEIGHT_PER_MINUTE,
+        burst: Optional[float] = None,
+        pool_size: int = 16,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        coalesce: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Args:
+            base_url: API 地址（同 Info / Exchange）
+            timeout: 单次请求超时（秒）
+            weight_per_minute: 每分钟允许的请求权重
+            burst: 允许的突发权重，默认等于 weight_per_minute
+            pool_size: 连接池大小（同时保持的 keep-alive 连接数）
+            max_retries: 最多重试次数
+            backoff: 第一次重试的基础等待（秒），之后每次翻倍，实际等待在 [一半, 全部] 之间随机
+            max_backoff: 单次重试的最长等待（秒）
+            coalesce: 是否合并同时在途的相同 /info 请求
+            clock / sleep: 时钟和等待函数（测试时可替换）
+        """
+        super().__init__(base_url, timeout)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = TokenBucket(burst or weight_per_minute, weight_per_minute / 60.0, clock)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.coalesce = coalesce
+        self.sleep = sleep
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+        # 统计
+        self.requests = 0
+        self.weight = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.throttle_wait = 0.0
+        self.by_type: Dict[str, int] = {}
+
+    def attach(self, *clients):
+        """让 SDK 客户端（Info / Exchange 及其内部 Info）改用本 transport 发送请求"""
+        for client in clients:
+            if not isinstance(client, API) or client.post == self.post:
+                continue
+            client.session.close()
+            client.session = self.session
+            client.post = self.post
+            if isinstance(getattr(client, "info", None), API):
+                self.attach(client.info)
+
+    # ===== 请求 =====
+
+    def post(self, url_path: str, payload: Any = None) -> Any:
+        """同 API.post：经过合并、限流和重试"""
+        payload = payload or {}
+        if url_path != "/info" or not self.coalesce:
+            return self._send(url_path, payload)
+
+        key = json.dumps(payload, sort_keys=True)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._send(url_path, payload)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _send(self, url_path: str, payload: Dict) -> Any:
+        weight = request_weight(url_path, payload)
+        kind = payload.get("type") or (payload.get("action") or {}).get("type", url_path)
+        for attempt in range(self.max_retries + 1):
+            wait = self.limiter.reserve(weight)
+            if wait > 0:
+                self.sleep(wait)
+            with self._lock:
+                self.requests += 1
+                self.weight += weight
+                self.throttle_wait += wait
+                self.by_type[kind] = self.by_type.get(kind, 0) + 1
+
+            try:
+                response = self.session.post(self.base_url + url_path, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # 下单请求可能已被处理：只重试确定没有连上的情况
+                retryable = url_path == "/info" or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                self._retry(attempt, kind, str(e))
+                continue
+
+            status = response.status_code
+            if status == 429:
+                with self._lock:
+                    self.rate_limited += 1
+                self.limiter.drain()
+            if (status == 429 or (status >= 500 and url_path == "/info")) and attempt < self.max_retries:
+                self._retry(attempt, kind, f"HTTP {status}", response.headers.get("Retry-After"))
+                continue
+
+            self._handle_exception(response)
+            try:
+                result = response.json()
+            except ValueError:
+                return {"error": f"Could not parse JSON: {response.text}"}
+            self.limiter.charge(response_weight(payload, result))
+            return result
+
+    def _retry(self, attempt: int, kind: str, reason: str, retry_after: Optional[str] = None):
+        """指数退避 + 随机抖动；服务端给出 Retry-After 时至少等待该时长"""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        with self._lock:
+            self.retries += 1
+        logger.warning(f"🔁 {kind} 请求失败（{reason}），{delay:.2f} 秒后第 {attempt + 1} 次重试")
+        self.sleep(delay)
+
+    # ===== 统计 =====
+
+    def stats(self) -> Dict:
+        """请求统计"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "weight": self.weight,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "throttle_wait": round(self.throttle_wait, 3),
+                "by_type": dict(self.by_type),
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def log_transport_stats(transport: Optional[HyperliquidTransport]):
+    """周期总结中打印累计请求统计（未接入 transport 时不打印）"""
+    if transport is None:
+        return
+    stats = transport.stats()
+    logger.info(
+        f"🌐 HTTP 请求: {stats['requests']} 次, 权重 {stats['weight']}, 合并 {stats['coalesced']}, "
+        f"重试 {stats['retries']}, 429 {stats['rate_limited']} 次, 限流等待 {stats['throttle_wait']:.1f}s"
+    )
+
+
+def create_transport(config: Dict, *clients) -> Optional[HyperliquidTransport]:
+    """
+    按 agent.transport 配置创建共享 HTTP 层并接入 SDK 客户端
+
+    {"enabled": true, "weight_per_minute": 1200, "pool_size": 16, "max_retries": 3, "backoff": 0.5, "coalesce": true}
+
+    Args:
+        clients: 要接入的 Info / Exchange（回测的模拟客户端会被忽略）
+
+    Returns:
+        未启用或没有可接入的客户端时返回 None（各客户端使用 SDK 默认的 Session）
+    """
+    settings = config.get("agent", {}).get("transport", {})
+    clients = [client for client in clients if isinstance(client, API)]
+    if not settings.get("enabled", False) or not clients:
+        return None
+    transport = HyperliquidTransport(
+        clients[0].base_url,
+        timeout=settings.get("timeout", 10.0),
+        weight_per_minute=settings.get("weight_per_minute", WEIGHT_PER_MINUTE),
+        pool_size=settings.get("pool_size", 16),
+        max_retries=settings.get("max_retries", 3),
+        backoff=settings.get("backoff", 0.5),
+        coalesce=settings.get("coalesce", True),
+    )
+    transport.attach(*clients)
+    return transport
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+测试资产元数据索引（本地取整、杠杆上限、持仓量上限、最小订单价值、定期刷新、下单集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.asset_index import AssetIndex, create_asset_index
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.portfolio_nodes import execute_portfolio_trades_node
+
+print("=" * 70)
+print("🧪 测试资产元数据索引")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+class FakeInfo:
+    """metaAndAssetCtxs + perpsAtOpenInterestCap，记录请求次数"""
+
+    def __init__(self):
+        self.requests = 0
+        self.capped = ["BTC"]
+        self.fail = False
+        self.universe = [
+            {"name": "BTC", "szDecimals": 5, "maxLeverage": 40},
+            {"name": "ETH", "szDecimals": 4, "maxLeverage": 25},
+            {"name": "DOGE", "szDecimals": 0, "maxLeverage": 10},
+            {"name": "OLD", "szDecimals": 1, "maxLeverage": 3, "isDelisted": True},
+        ]
+        self.marks = {"BTC": "65000.0", "ETH": "3210.5", "DOGE": "0.15432", "OLD": "1.0"}
+
+    def meta_and_asset_ctxs(self):
+        self.requests += 1
+        if self.fail:
+            raise ConnectionError("网络错误")
+        ctxs = [{"markPx": self.marks[a["name"]], "funding": "0.0000125", "openInterest": "100.0",
+                 "dayNtlVlm": "1000000.0", "prevDayPx": self.marks[a["name"]]} for a in self.universe]
+        return [{"universe": self.universe}, ctxs]
+
+    def post(self, path, payload):
+        self.requests += 1
+        assert payload == {"type": "perpsAtOpenInterestCap"}
+        return self.capped
+
+
+now = [0.0]
+info = FakeInfo()
+index = AssetIndex(info, refresh_interval=60, clock=lambda: now[0])
+
+# 1. 取整
+print("\n1️⃣ 取整:")
+check(index.round_size("BTC", 0.0123456) == 0.01235 and index.round_size("DOGE", 123.7) == 124.0,
+      "数量按 szDecimals 取整: BTC 5 位，DOGE 0 位")
+prices = {"BTC": (65432.123, 65432.0), "ETH": (3210.987, 3211.0), "DOGE": (0.1543219, 0.15432)}
+check(all(index.round_price(coin, raw) == expected for coin, (raw, expected) in prices.items()),
+      f"价格 5 位有效数字、6 - szDecimals 位小数: {[index.round_price(c, p[0]) for c, p in prices.items()]}")
+asset = index.get("ETH")
+check(asset["mark_px"] == 3210.5 and asset["funding"] == 0.0000125 and asset["max_leverage"] == 25,
+      "标记价格、资金费率、杠杆上限")
+
+# 2. 校验
+print("\n2️⃣ 下单前校验:")
+result = index.check_order("ETH", 0.012345, leverage=50)
+check(result["ok"] and result["size"] == 0.0123 and result["leverage"] == 25 and len(result["warnings"]) == 2,
+      f"杠杆 50x 调整为 25x，数量取整为 {result['size']}")
+result = index.check_order("BTC", 0.01)
+check(not result["ok"] and "open interest" in result["error"], f"持仓量已达上限: {result['error']}")
+check(index.check_order("BTC", 0.01, reduce_only=True)["ok"], "持仓量上限不限制减仓")
+result = index.check_order("ETH", 0.002)
+check(not result["ok"] and "最小值" in result["error"], f"订单价值过小: {result['error']}")
+check(not index.check_order("DOGE", 0.4)["ok"], "DOGE 0.4 取整后为 0")
+check(not index.check_order("OLD", 100)["ok"] and not index.check_order("XYZ", 1)["ok"], "已下架和未知币种")
+check(index.stats()["local_rejections"] == 5, f"本地拒绝 {index.stats()['local_rejections']} 个订单（均未发送）")
+
+# 3. 刷新
+print("\n3️⃣ 定期刷新:")
+requests = info.requests
+for _ in range(100):
+    index.get("ETH")
+check(info.requests == requests, "刷新间隔内只读本地数据")
+now[0] = 61.0
+info.capped = []
+check(index.check_order("BTC", 0.01)["ok"] and info.requests == requests + 2, "过期后重新加载: BTC 不再受限")
+now[0] = 200.0
+info.fail = True
+check(index.get("ETH") is not None and index.get("BTC")["at_oi_cap"] is False, "加载失败时沿用上次数据")
+check(create_asset_index({}, info) is None, "默认不启用")
+
+# 4. 下单集成
+print("\n4️⃣ 下单集成:")
+server = FakeHyperliquidServer(seed=17).start()
+server.set_open_interest_cap("SOL")
+config = benchmark_config({"agent": {"asset_index": {"enabled": True}}})
+
+_, plain_tools = build_agent("advanced", server, StubLLM(), benchmark_config())
+server.reset_stats()
+result = plain_tools.place_order_with_tpsl("SOL", True, 0.5, dry_run=False)
+check(not result["success"] and "open interest is at cap" in result["error"]
+      and server.stats()["by_type"].get("order") == 1,
+      "未启用索引: 订单发送到交易所后才被拒绝")
+
+_, tools = build_agent("advanced", server, StubLLM(), config)
+server.reset_stats()
+result = tools.place_order_with_tpsl("SOL", True, 0.5, dry_run=False)
+check(not result["success"] and "open interest cap" in result["error"] and not server.stats()["by_type"].get("order"),
+      "启用索引: 本地拒绝，没有下单请求")
+mid = server.mids()["ETH"]
+tp, sl = tools.calculate_tpsl_prices(mid, True, 3.0, 1.5, coin="ETH")
+check(tp == tools.exchange._slippage_price("ETH", True, 0.0, mid * 1.03)
+      and sl == tools.exchange._slippage_price("ETH", True, 0.0, mid * 0.985),
+      f"止盈止损价格与 SDK 的价格取整一致: {tp} / {sl}")
+result = tools.place_order_with_tpsl("ETH", True, 0.012345, take_profit_price=tp, stop_loss_price=sl, dry_run=False)
+check(result["success"] and result["size"] == round(0.012345, tools.info.asset_to_sz_decimals[tools.info.name_to_asset("ETH")]),
+      f"ETH 数量本地取整为 {result['size']} 后成交")
+
+portfolio, portfolio_tools = build_agent("portfolio", server, StubLLM(), config)
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    result = portfolio.run_once()
+by_coin = {r["trade"]["coin"]: r["result"] for r in result["execution_results"]}
+check(by_coin["ETH"]["success"] and not by_coin["SOL"]["success"] and "open interest cap" in by_coin["SOL"]["error"]
+      and server.stats()["by_type"].get("order") == 1,
+      f"组合 Agent: SOL 本地拒绝，ETH 止盈止损订单组照常提交（{server.stats()['by_type'].get('order')} 次下单请求）")
+
+# Info 的 szDecimals 过期（索引已刷新）时，批量提交也使用索引校验后的数量
+eth = portfolio_tools.info.name_to_asset("ETH")
+portfolio_tools.info.asset_to_sz_decimals[eth] += 2
+state = {"portfolio_trades": [{"decision": "buy", "coin": "ETH", "size": 0.0123456, "leverage": 2, "use_tpsl": True}],
+         "current_prices": server.mids()}
+with contextlib.redirect_stdout(io.StringIO()):
+    result = execute_portfolio_trades_node(state, portfolio_tools, dry_run=False)["execution_results"][0]["result"]
+portfolio_tools.info.asset_to_sz_decimals[eth] -= 2
+check(result["success"] and result["size"] == portfolio_tools.asset_index.round_size("ETH", 0.0123456),
+      f"批量提交使用本地校验后的数量 {result['size']}")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
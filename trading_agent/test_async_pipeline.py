@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+测试异步流水线：fetch_market 与 get_account 并行执行（本地模拟 /info 接口，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hyperliquid.info import Info
+
+from src.agent import TradingAgent
+from src.tools import HyperliquidTools
+from src.risk_manager import RiskManager
+
+print("=" * 70)
+print("🧪 测试异步 LangGraph 流水线")
+print("=" * 70)
+
+ADDRESS = "0x0000000000000000000000000000000000000001"
+META = {"universe": [{"name": "BTC", "szDecimals": 5}, {"name": "ETH", "szDecimals": 4}]}
+SPOT_META = {"universe": [], "tokens": []}
+LATENCY = 0.3  # 模拟每个请求 300ms
+
+RESPONSES = {
+    "allMids": {"BTC": "65000.0", "ETH": "3200.0"},
+    "clearinghouseState": {
+        "marginSummary": {"accountValue": "1000.0", "totalNtlPos": "650.0"},
+        "assetPositions": [{"position": {
+            "coin": "BTC", "szi": "0.01", "entryPx": "64000.0", "positionValue": "650.0",
+            "unrealizedPnl": "10.0", "leverage": {"type": "cross", "value": 5}
+        }}],
+    },
+}
+request_log = []
+
+
+class InfoHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        request_log.append(payload["type"])
+        time.sleep(LATENCY)
+        body = json.dumps(RESPONSES[payload["type"]]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HoldLLM:
+    """模拟 LLM：总是返回观望"""
+    class chat:
+        class completions:
+            @staticmethod
+            def create(**kwargs):
+                class Message:
+                    tool_calls = None
+                    content = "市场平稳，继续观望"
+
+                class Choice:
+                    message = Message()
+
+                class Response:
+                    choices = [Choice()]
+                return Response()
+
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), InfoHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+base_url = f"http://127.0.0.1:{server.server_address[1]}"
+info = Info(base_url, skip_ws=True, meta=META, spot_meta=SPOT_META)
+
+failures = 0
+results = {}
+for mode in (False, True):
+    tools = HyperliquidTools(info, None, ADDRESS)
+    agent = TradingAgent(tools, RiskManager({}), HoldLLM(), "策略", dry_run=True, async_pipeline=mode)
+    agent.run_once()  # 预热（建立 HTTP 连接）
+    request_log.clear()
+    started = time.perf_counter()
+    state = agent.run_once()
+    elapsed = time.perf_counter() - started
+    results[mode] = (state, elapsed, dict(agent.timer.timings), list(request_log))
+
+print(f"\n1️⃣ 周期耗时:")
+for mode, (state, elapsed, timings, requests) in results.items():
+    label = "异步" if mode else "同步"
+    nodes = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items())
+    print(f"   {label}: {elapsed:.2f}s  请求 {sorted(requests)}  [{nodes}]")
+
+sync_state, sync_elapsed = results[False][0], results[False][1]
+async_state, async_elapsed = results[True][0], results[True][1]
+
+print("\n2️⃣ 结果一致性:")
+same = all(sync_state[k] == async_state[k] for k in ("current_prices", "account_value", "available_balance", "positions"))
+if same and async_state["trading_decision"] == "hold":
+    print(f"   ✅ 两种模式结果一致 (账户 ${async_state['account_value']:.2f}, 持仓 {len(async_state['positions'])} 个)")
+else:
+    failures += 1
+    print("   ❌ 两种模式结果不一致")
+
+print("\n3️⃣ 并行执行:")
+if async_elapsed < sync_elapsed - LATENCY * 0.5 and sorted(results[True][3]) == ["allMids", "clearinghouseState"]:
+    print(f"   ✅ 异步模式节省 {sync_elapsed - async_elapsed:.2f}s")
+else:
+    failures += 1
+    print("   ❌ 异步模式没有并行执行")
+
+server.shutdown()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
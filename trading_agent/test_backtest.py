@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+测试回测引擎（合成K线，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import json
+import time
+
+import numpy as np
+
+from src.advanced_tools import AdvancedTradingTools
+from src.agent import TradingAgent
+from src.backtest import Backtester, HistoricalMarket, load_history, rule_scores, run_rule_backtest
+from src.candle_store import CandleStore
+from src.risk_manager import RiskManager
+from src.tools import HyperliquidTools
+from main_backtest import backtest_config, load_config
+
+print("=" * 70)
+print("🧪 测试回测引擎")
+print("=" * 70)
+
+HOUR = 3_600_000
+START = 1_700_000_000_000 - 1_700_000_000_000 % HOUR
+COINS = ["BTC", "ETH", "SOL"]
+BARS = 600
+NOTIONAL = 100.0
+
+
+def synthetic_closes(coins: int, bars: int, seed: int = 7) -> np.ndarray:
+    """带趋势切换的随机游走"""
+    rng = np.random.default_rng(seed)
+    drift = np.repeat(rng.normal(0, 0.004, (coins, bars // 50 + 1)), 50, axis=1)[:, :bars]
+    returns = drift + rng.normal(0, 0.01, (coins, bars))
+    return 100 * np.exp(np.cumsum(returns, axis=1)) * np.arange(1, coins + 1)[:, None]
+
+
+class HistoryInfo:
+    """只提供 candles_snapshot，用于把合成K线写入 CandleStore"""
+
+    def __init__(self, closes):
+        self.closes = closes
+
+    def candles_snapshot(self, coin, interval, start, end):
+        row = COINS.index(coin)
+        candles = []
+        for i, close in enumerate(self.closes[row]):
+            t = START + i * HOUR
+            if start <= t <= end:
+                candles.append({"t": t, "T": t + HOUR - 1, "o": close, "h": close * 1.004,
+                                "l": close * 0.996, "c": close, "v": 10, "n": 1})
+        return candles
+
+
+failures = 0
+
+# 1. 从本地K线缓存加载
+print("\n1️⃣ 加载本地K线:")
+closes = synthetic_closes(len(COINS), BARS)
+store = CandleStore(":memory:")
+for coin in COINS:
+    store.get_candles(HistoryInfo(closes), coin, "1h", START, START + (BARS - 1) * HOUR)
+market = load_history(store)
+if market.coins == COINS and market.bars == BARS and np.allclose(market.close, closes):
+    print(f"   ✅ {len(market.coins)} 个币种 × {market.bars} 根K线")
+else:
+    failures += 1
+    print(f"   ❌ 加载结果不正确: {market.coins} × {market.bars}")
+
+# 2. 模拟接口驱动 analyze_market_condition，与 NumPy 评分一致
+print("\n2️⃣ NumPy 评分与 analyze_market_condition 一致:")
+backtester = Backtester(market)
+tools = AdvancedTradingTools(backtester.info, backtester.exchange, backtester.address)
+scores = rule_scores(market.close)
+mismatches = 0
+checked = 0
+for index in range(23, BARS, 37):
+    backtester.exchange.advance(index)
+    tools.snapshot.new_cycle()
+    for row, coin in enumerate(COINS):
+        analysis = tools.analyze_market_condition(coin)
+        checked += 1
+        if analysis["strength"] != scores[row, index]:
+            mismatches += 1
+if mismatches == 0:
+    print(f"   ✅ {checked} 次评分全部一致（模拟接口不泄露未来K线）")
+else:
+    failures += 1
+    print(f"   ❌ {mismatches}/{checked} 次评分不一致")
+
+# 3. 逐根K线驱动决策 vs 向量化回测
+print("\n3️⃣ 逐根K线回测 vs 向量化回测:")
+backtester = Backtester(market)
+tools = AdvancedTradingTools(backtester.info, backtester.exchange, backtester.address)
+direction = {coin: 0 for coin in COINS}
+
+
+def rule_step():
+    """按 analyze_market_condition 建议交易（与 run_rule_backtest 规则相同）"""
+    tools.snapshot.new_cycle()
+    prices = backtester.info.all_mids()
+    for coin in COINS:
+        recommendation = tools.analyze_market_condition(coin)["recommendation"]
+        target = {"buy": 1, "sell": -1}.get(recommendation, 0)
+        if target == 0 or target == direction[coin]:
+            continue
+        if direction[coin] != 0:
+            backtester.exchange.market_close(coin)
+        backtester.exchange.market_open(coin, target > 0, NOTIONAL / float(prices[coin]))
+        direction[coin] = target
+
+
+started = time.perf_counter()
+slow = backtester.run(rule_step)
+slow_elapsed = time.perf_counter() - started
+fast = run_rule_backtest(market, notional=NOTIONAL)
+
+closed_slow = [t for t in slow.trades if not t.get("open")]
+closed_fast = [t for t in fast.trades if not t.get("open")]
+same_curve = np.allclose(slow.equity, fast.equity, rtol=0, atol=1e-6)
+same_trades = len(closed_slow) == len(closed_fast) and np.allclose(
+    sorted(t["pnl"] for t in closed_slow), sorted(t["pnl"] for t in closed_fast), atol=1e-6)
+print(f"   逐根: {slow_elapsed:.2f}s, 最终权益 ${slow.equity[-1]:.4f}, {len(slow.fills)} 笔成交, {len(closed_slow)} 笔交易")
+print(f"   向量: 最终权益 ${fast.equity[-1]:.4f}, {len(fast.fills)} 笔成交, {len(closed_fast)} 笔交易")
+if same_curve and same_trades and closed_slow:
+    print("   ✅ 权益曲线和逐笔交易盈亏一致")
+else:
+    failures += 1
+    print("   ❌ 两种回测结果不一致")
+
+pnl_total = sum(t["pnl"] for t in slow.trades)
+if abs(pnl_total - (slow.equity[-1] - 1000.0)) < 1e-6:
+    print("   ✅ 逐笔盈亏之和等于权益变化")
+else:
+    failures += 1
+    print(f"   ❌ 逐笔盈亏之和 {pnl_total:.4f} != 权益变化 {slow.equity[-1] - 1000.0:.4f}")
+
+# 4. 止盈止损触发单
+print("\n4️⃣ 止盈止损触发:")
+backtester = Backtester(market)
+tools = AdvancedTradingTools(backtester.info, backtester.exchange, backtester.address)
+backtester.exchange.advance(30)
+entry = backtester.exchange.mid("BTC")
+result = tools.place_order_with_tpsl("BTC", True, 0.5, entry * 1.02, entry * 0.99, dry_run=False)
+index = 31
+while backtester.exchange.positions and index < BARS:
+    backtester.exchange.advance(index)
+    index += 1
+last_fill = backtester.exchange.fills[-1]
+expected = entry * 1.02 if last_fill["dir"] == "Close Long" and float(last_fill["closedPnl"]) > 0 else entry * 0.99
+if result["success"] and not backtester.exchange.positions and not backtester.exchange.orders \
+        and abs(float(last_fill["px"]) / expected - 1) < 0.001:
+    kind = "止盈" if float(last_fill["closedPnl"]) > 0 else "止损"
+    print(f"   ✅ 第 {index - 1} 根K线触发{kind} @ ${float(last_fill['px']):.2f}，另一个触发单已撤销")
+else:
+    failures += 1
+    print(f"   ❌ 触发单处理不正确: {backtester.exchange.fills[-1]}")
+
+# 5. TradingAgent 在模拟交易所上运行
+print("\n5️⃣ TradingAgent 回测:")
+
+
+class BuyLLM:
+    """模拟 LLM：每次买入 0.1 ETH"""
+    class chat:
+        class completions:
+            @staticmethod
+            def create(**kwargs):
+                class Function:
+                    arguments = json.dumps({"decision": "buy", "coin": "ETH", "size": 0.1,
+                                            "reasoning": "测试", "confidence": 0.8})
+
+                class ToolCall:
+                    function = Function()
+
+                class Message:
+                    tool_calls = [ToolCall()]
+                    content = None
+
+                class Choice:
+                    message = Message()
+
+                class Response:
+                    choices = [Choice()]
+                return Response()
+
+
+backtester = Backtester(market)
+agent_tools = HyperliquidTools(backtester.info, backtester.exchange, backtester.address)
+risk = RiskManager({"max_usable_capital": 1000, "max_position_size": 1.0, "max_total_exposure": 1.0,
+                    "max_single_trade_value": 1000, "min_account_value": 10, "allowed_coins": ["ETH"],
+                    "enable_execution": True})
+agent = TradingAgent(agent_tools, risk, BuyLLM(), "策略", dry_run=False)
+agent_result = backtester.run(agent.run_once, every=50, end=150)
+eth_fills = [f for f in agent_result.fills if f["coin"] == "ETH"]
+if len(eth_fills) == 3 and len(agent_result.equity) == 150 - 23 + 1:
+    print(f"   ✅ {len(eth_fills)} 次决策全部成交，权益曲线 {len(agent_result.equity)} 个点")
+else:
+    failures += 1
+    print(f"   ❌ 成交 {len(eth_fills)} 笔，权益曲线 {len(agent_result.equity)} 个点")
+
+# 6. 一年 1h K线 × 40 个币种
+print("\n6️⃣ 快速回测性能:")
+big_closes = synthetic_closes(40, 24 * 365, seed=11)
+times = START + np.arange(big_closes.shape[1]) * HOUR
+big = HistoricalMarket([f"C{i}" for i in range(40)], times, big_closes, big_closes * 1.004,
+                       big_closes * 0.996, big_closes)
+started = time.perf_counter()
+big_result = run_rule_backtest(big)
+elapsed = time.perf_counter() - started
+summary = big_result.summary()
+print(f"   40 × {big.bars} 根K线: {elapsed:.2f}s, {summary['fills']} 笔成交, 收益 {summary['total_return_pct']:+.2f}%")
+if elapsed < 5:
+    print("   ✅ 数秒内完成")
+else:
+    failures += 1
+    print("   ❌ 耗时过长")
+
+# 7. 示例配置下的组合 Agent 回测
+print("\n7️⃣ 示例配置回测组合 Agent:")
+from main_portfolio import PortfolioTradingAgent
+from src.benchmark import StubLLM
+
+config = load_config(os.path.join(os.path.dirname(__file__), "config", "config.example.json"))
+backtester = Backtester(market)
+backtester.exchange.advance(200)
+portfolio = PortfolioTradingAgent(backtest_config(config), "策略", dry_run=False, info=backtester.info,
+                                  exchange=backtester.exchange, address=backtester.address, llm_client=StubLLM())
+with contextlib.redirect_stdout(io.StringIO()):
+    state = portfolio.run_once()
+analysis = state.get("market_analysis_data", {})
+if analysis and all(data["indicators"].get("rsi_14") is not None for data in analysis.values()):
+    print(f"   ✅ 多周期和全市场扫描已关闭，{sorted(analysis)} 的 1h 指标来自回测数据")
+else:
+    failures += 1
+    print(f"   ❌ 指标缺失: {analysis}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+测试组合交易批量下单（模拟交易所，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.advanced_tools import AdvancedTradingTools
+from src.portfolio_nodes import execute_portfolio_trades_node
+
+print("=" * 70)
+print("🧪 测试组合交易批量下单")
+print("=" * 70)
+
+ADDRESS = "0x0000000000000000000000000000000000000001"
+PRICES = {"BTC": "65000.0", "ETH": "3200.0", "SOL": "150.0", "AVAX": "30.0"}
+
+
+class FakeInfo:
+    def all_mids(self):
+        return PRICES
+
+    def user_state(self, address):
+        return {
+            "marginSummary": {"accountValue": "1000", "totalNtlPos": "100"},
+            "assetPositions": [{"position": {
+                "coin": "AVAX", "szi": "-2.0", "entryPx": "31", "leverage": {"type": "cross", "value": 3}
+            }}],
+        }
+
+    def open_orders(self, address):
+        return [{"coin": "AVAX", "oid": 11}, {"coin": "AVAX", "oid": 12}, {"coin": "BTC", "oid": 13}]
+
+
+class FakeExchange:
+    """记录每次签名请求；ETH 订单返回保证金不足错误，reject_leverage 中的币种调整杠杆被拒绝"""
+
+    def __init__(self, reject_leverage=()):
+        self.calls = []
+        self.orders = []
+        self.next_oid = 100
+        self.reject_leverage = set(reject_leverage)
+
+    def update_leverage(self, leverage, name, is_cross=True):
+        self.calls.append(("update_leverage", name, leverage))
+        if name in self.reject_leverage:
+            return {"status": "err", "response": "Leverage exceeds max leverage for asset."}
+        return {"status": "ok"}
+
+    def market_open(self, name, is_buy, sz, px=None, slippage=0.05):
+        self.calls.append(("market_open", name, sz))
+        self.orders.append({"coin": name, "is_buy": is_buy, "sz": sz})
+        self.next_oid += 1
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": [
+            {"filled": {"totalSz": str(sz), "avgPx": PRICES[name], "oid": self.next_oid}}]}}}
+
+    def bulk_cancel(self, cancels):
+        self.calls.append(("bulk_cancel", [c["oid"] for c in cancels]))
+        return {"status": "ok"}
+
+    def bulk_orders(self, orders, builder=None, grouping="na"):
+        self.calls.append(("bulk_orders", grouping, [(o["coin"], o["is_buy"], o["sz"]) for o in orders]))
+        self.orders.extend(orders)
+        statuses = []
+        for order in orders:
+            if order["coin"] == "ETH":
+                statuses.append({"error": "Insufficient margin to place order."})
+            elif "trigger" in order["order_type"]:
+                statuses.append("waitingForTrigger")
+            else:
+                self.next_oid += 1
+                statuses.append({"filled": {"totalSz": str(order["sz"]), "avgPx": str(order["limit_px"]), "oid": self.next_oid}})
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+
+exchange = FakeExchange()
+tools = AdvancedTradingTools(FakeInfo(), exchange, ADDRESS)
+trades = [
+    {"decision": "buy", "coin": "BTC", "size": 0.001, "leverage": 5, "use_tpsl": True,
+     "take_profit_pct": 3.0, "stop_loss_pct": 1.5},
+    {"decision": "sell", "coin": "ETH", "size": 0.1, "leverage": 3},
+    {"decision": "buy", "coin": "SOL", "size": 1.0, "leverage": 1},
+    {"decision": "close", "coin": "AVAX"},
+]
+state = {"portfolio_trades": trades, "current_prices": PRICES, "messages": []}
+state = execute_portfolio_trades_node(state, tools, dry_run=False, batch=True)
+
+failures = 0
+
+print("\n1️⃣ 签名请求:")
+for call in exchange.calls:
+    print(f"   {call}")
+order_calls = [c for c in exchange.calls if c[0] == "bulk_orders"]
+# BTC 订单组 + (ETH, SOL, AVAX 平仓) 一批；BTC、ETH 调整杠杆；AVAX 撤两个旧挂单
+expected_calls = 2 + 2 + 1
+if len(exchange.calls) == expected_calls and len(order_calls) == 2:
+    # 逐笔执行: 2 次杠杆 + BTC 开仓/止盈/止损 3 次 + ETH、SOL 开仓 2 次 + AVAX 平仓 1 次
+    print(f"   ✅ {len(exchange.calls)} 次签名请求（逐笔执行需要 8 次）")
+else:
+    failures += 1
+    print(f"   ❌ 请求次数不正确: {len(exchange.calls)}")
+
+tpsl_call = next(c for c in order_calls if c[1] == "normalTpsl")
+close_order = next(o for o in next(c for c in order_calls if c[1] == "na")[2] if o[0] == "AVAX")
+if len(tpsl_call[2]) == 3 and close_order == ("AVAX", True, 2.0):
+    print("   ✅ 止盈止损作为订单组提交，空单平仓方向和数量正确")
+else:
+    failures += 1
+    print("   ❌ 订单内容不正确")
+
+sol_order = next(o for o in exchange.orders if o["coin"] == "SOL")
+if sol_order["limit_px"] == 157.5 and all(o["limit_px"] == float(f"{o['limit_px']:.5g}") for o in exchange.orders):
+    print("   ✅ 市价单保护价按中间价 ± 滑点计算，取 5 位有效数字")
+else:
+    failures += 1
+    print(f"   ❌ 保护价不正确: {[(o['coin'], o['limit_px']) for o in exchange.orders]}")
+
+print("\n2️⃣ 执行结果映射:")
+results = state["execution_results"]
+for r in results:
+    print(f"   {r['trade']['decision']:5s} {r['trade']['coin']:5s} → success={r['result']['success']} "
+          f"{r['result'].get('error', '')}")
+ok = (
+    [r["result"]["success"] for r in results] == [True, False, True, True]
+    and results[0]["result"]["tp_result"]["response"]["data"]["statuses"] == ["waitingForTrigger"]
+    and "Insufficient margin" in results[1]["result"]["error"]
+    and state["success"] is False
+)
+if ok:
+    print("   ✅ 每个交易的结果格式与逐笔执行一致")
+else:
+    failures += 1
+    print("   ❌ 结果映射不正确")
+
+print("\n3️⃣ 调整杠杆被拒绝:")
+trades = [
+    {"decision": "buy", "coin": "BTC", "size": 0.001, "leverage": 50, "use_tpsl": True},
+    {"decision": "buy", "coin": "SOL", "size": 1.0, "leverage": 2},
+]
+for batch in (True, False):
+    exchange = FakeExchange(reject_leverage={"BTC"})
+    tools = AdvancedTradingTools(FakeInfo(), exchange, ADDRESS)
+    state = execute_portfolio_trades_node({"portfolio_trades": trades, "current_prices": PRICES, "messages": []},
+                                          tools, dry_run=False, batch=batch)
+    results = [r["result"] for r in state["execution_results"]]
+    if not results[0]["success"] and "调整杠杆失败" in results[0]["error"] and results[1]["success"] \
+            and [o["coin"] for o in exchange.orders] == ["SOL"]:
+        print(f"   ✅ {'批量' if batch else '逐笔'}执行: BTC 杠杆调整失败时不下单，SOL 照常执行")
+    else:
+        failures += 1
+        print(f"   ❌ 结果不正确: {results} {exchange.calls}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+测试交易周期基准测试（模拟交易所 + 模拟 LLM，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import copy
+import json
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import AGENTS, StubLLM, compare_reports, run_agent_benchmark, run_benchmarks
+
+print("=" * 70)
+print("🧪 测试交易周期基准测试")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+# 1. 模拟 LLM
+print("\n1️⃣ 模拟 LLM:")
+llm = StubLLM()
+tool = lambda name: [{"type": "function", "function": {"name": name}}]
+decisions = []
+for _ in range(4):
+    response = llm.chat.completions.create(messages=[{"role": "user", "content": "x" * 10}],
+                                           tools=tool("make_advanced_trading_decision"))
+    decisions.append(json.loads(response.choices[0].message.tool_calls[0].function.arguments)["decision"])
+portfolio = llm.chat.completions.create(messages=[], tools=tool("make_portfolio_decisions"))
+trades = json.loads(portfolio.choices[0].message.tool_calls[0].function.arguments)["trades"]
+check(decisions == ["buy", "close", "sell", "close"], f"开仓/平仓交替: {decisions}")
+check(len(trades) == 2 and llm.calls == 5 and llm.prompt_chars[0] == 10, "组合决策和调用统计")
+
+# 2. 三种 Agent 的完整报告
+print("\n2️⃣ 基准测试报告:")
+report = run_benchmarks(cycles=5, warmup=1, memory_cycles=2)
+expected_nodes = {
+    "simple": {"fetch_market", "get_account", "llm_analysis", "risk_check", "execute"},
+    "advanced": {"fetch_market", "get_account", "llm_analysis", "risk_check", "execute"},
+    "portfolio": {"fetch_market", "get_account", "portfolio_analysis", "risk_check", "execute_portfolio"},
+}
+check(list(report["agents"]) == AGENTS, f"覆盖 {AGENTS}")
+for kind, result in report["agents"].items():
+    nodes = result["nodes"]
+    ordered = all(s["p50"] <= s["p95"] <= s["p99"] <= s["max"] for s in nodes.values())
+    check(set(nodes) == expected_nodes[kind] and ordered and result["cycles"] == 5,
+          f"{kind}: 节点 {len(nodes)} 个, 周期 p50 {result['cycle_ms']['p50']:.1f}ms", str(set(nodes)))
+    check(result["api_calls"]["per_cycle"] > 0 and result["llm"]["calls_per_cycle"] == 1
+          and result["memory"]["peak_kb"]["count"] == 2,
+          f"{kind}: API {result['api_calls']['per_cycle']:g} 次/周期, 内存峰值 {result['memory']['peak_kb']['p50']:.0f}KB")
+orders = report["agents"]["portfolio"]["api_calls"]["by_type"].get("order", 0)
+check(orders >= 1, f"组合 Agent 执行真实下单: {orders:g} 次/周期")
+try:
+    json.loads(json.dumps(report))
+    check(True, "报告可序列化为 JSON")
+except (TypeError, ValueError) as e:
+    check(False, "报告可序列化为 JSON", str(e))
+
+# 3. 请求延迟计入对应节点
+print("\n3️⃣ 节点耗时归因:")
+slow = run_agent_benchmark("simple", cycles=3, warmup=1, memory_cycles=0, api_latency_ms=20)
+account_p50 = slow["nodes"]["get_account"]["p50"]
+llm_p50 = slow["nodes"]["llm_analysis"]["p50"]
+check(account_p50 >= 20 and llm_p50 < 20 and "memory" not in slow,
+      f"get_account p50 {account_p50:.1f}ms（1 次 20ms 请求），llm_analysis p50 {llm_p50:.1f}ms")
+
+# 4. 回退检测
+print("\n4️⃣ 回退检测:")
+check(compare_reports(report, report) == [], "与自身对比没有回退")
+regressed = copy.deepcopy(report)
+node = regressed["agents"]["advanced"]["nodes"]["fetch_market"]
+node["p95"] = node["p95"] * 2 + 5
+regressed["agents"]["portfolio"]["api_calls"]["per_cycle"] += 2
+found = compare_reports(report, regressed)
+check(len(found) == 2 and any("advanced.fetch_market" in r for r in found) and any("API" in r for r in found),
+      f"发现 {len(found)} 项回退: {found}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+测试本地K线缓存（缺口补齐、覆盖范围合并、交易所延迟时不留永久缺口），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import logging
+import time
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.candle_store import INTERVAL_MS, CandleStore
+
+print("=" * 70)
+print("🧪 测试本地K线缓存")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+STEP = INTERVAL_MS["1h"]
+HOUR = STEP
+NOW = int(time.time() * 1000)
+CURRENT = NOW - NOW % STEP  # 当前未收盘K线的开盘时间
+
+
+class FakeInfo:
+    """
+    按请求范围生成 1h K线，记录每次请求的时间段
+
+    listed_at 之前没有K线（上线前）；published_until 之后的K线交易所尚未生成（模拟延迟）
+    """
+
+    def __init__(self, listed_at: int = 0, published_until: int = CURRENT):
+        self.listed_at = listed_at
+        self.published_until = published_until
+        self.requests = []
+
+    def candles_snapshot(self, coin, interval, start, end):
+        self.requests.append((start, end))
+        first = max(start + (-start) % STEP, self.listed_at)
+        return [
+            {"t": t, "T": t + STEP - 1, "s": coin, "i": interval,
+             "o": "100", "h": "101", "l": "99", "c": "100.5", "v": "10", "n": 5}
+            for t in range(first, min(end, self.published_until) + 1, STEP)
+        ]
+
+
+def times(candles):
+    return [c["t"] for c in candles]
+
+
+# 1. 缺口补齐：只请求未覆盖的时间段，结果连续
+print("\n1️⃣ 缺口补齐:")
+store, info = CandleStore(":memory:"), FakeInfo()
+start = CURRENT - 100 * HOUR
+store.get_candles(info, "BTC", "1h", start, start + 10 * HOUR - 1)
+store.get_candles(info, "BTC", "1h", start + 20 * HOUR, start + 30 * HOUR - 1)
+info.requests.clear()
+candles = store.get_candles(info, "BTC", "1h", start, start + 30 * HOUR - 1)
+check(info.requests == [(start + 10 * HOUR, start + 20 * HOUR - 1)], "第三次只请求中间的缺口", f"{info.requests}")
+check(times(candles) == list(range(start, start + 30 * HOUR, STEP)), f"补齐后连续 {len(candles)} 根")
+check(store.missing_ranges("BTC", "1h", start, start + 30 * HOUR - 1) == [], "覆盖范围合并后无缺口")
+info.requests.clear()
+store.get_candles(info, "BTC", "1h", start + 5 * HOUR, start + 25 * HOUR - 1)
+check(info.requests == [] and store.stats()["api_requests"] == 3, "已覆盖的范围不再请求")
+
+# 2. 上线前的历史空页计入覆盖，不重复请求
+print("\n2️⃣ 历史空页:")
+store, info = CandleStore(":memory:"), FakeInfo(listed_at=start + 5 * HOUR)
+candles = store.get_candles(info, "NEW", "1h", start, start + 10 * HOUR - 1)
+store.get_candles(info, "NEW", "1h", start, start + 10 * HOUR - 1)
+check(len(candles) == 5 and len(info.requests) == 1, "上线前没有K线的历史范围只请求一次", f"{info.requests}")
+
+# 3. 最近范围：交易所还没生成最新收盘K线时不留永久缺口
+print("\n3️⃣ 交易所延迟:")
+store, info = CandleStore(":memory:"), FakeInfo(published_until=CURRENT - 2 * HOUR)
+start = CURRENT - 48 * HOUR
+candles = store.get_candles(info, "BTC", "1h", start, NOW)
+check(times(candles)[-1] == CURRENT - 2 * HOUR, f"延迟时最新只到 {(CURRENT - times(candles)[-1]) // HOUR}h 前")
+info.published_until = CURRENT
+info.requests.clear()
+candles = store.get_candles(info, "BTC", "1h", start, NOW)
+check(len(info.requests) == 1 and info.requests[0][0] == CURRENT - HOUR,
+      "第二次只从最后一根已收盘K线之后请求", f"{info.requests}")
+check(times(candles) == list(range(start, CURRENT + 1, STEP)), f"缺口已补齐（{len(candles)} 根，含未收盘K线）")
+info.requests.clear()
+store.get_candles(info, "BTC", "1h", start, NOW)
+check(len(info.requests) == 1 and info.requests[0][0] == CURRENT, "未收盘K线每次重新请求", f"{info.requests}")
+
+store, info = CandleStore(":memory:"), FakeInfo(published_until=CURRENT - 2 * HOUR)
+store.get_candles(info, "BTC", "1h", CURRENT - HOUR, NOW)
+store.get_candles(info, "BTC", "1h", CURRENT - HOUR, NOW)
+check(len(info.requests) == 2 and info.requests[0] == info.requests[1], "最近范围的空页不计入覆盖", f"{info.requests}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
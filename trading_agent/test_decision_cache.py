@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+测试 LLM 决策缓存（量化指纹、TTL、LRU、持久化、节点集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+import logging
+import tempfile
+import time
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM
+from src.decision_cache import DecisionCache, create_decision_cache, market_fingerprint
+from src.nodes import llm_analysis_node
+from src.state import create_initial_state
+
+print("=" * 70)
+print("🧪 测试 LLM 决策缓存")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+def make_state(btc: float = 60100.0, rsi: float = 55.0, size: float = 0.01) -> dict:
+    state = create_initial_state()
+    state["current_prices"] = {"BTC": btc, "ETH": 3000.0}
+    state["market_analysis_data"] = {
+        "BTC": {"indicators": {"rsi_14": rsi, "price_change_24h": 1.2},
+                "condition": {"trend": "bullish", "recommendation": "buy"}},
+    }
+    state["positions"] = [{"coin": "BTC", "size": size, "entry_price": 59000.0, "unrealized_pnl": 10.0,
+                           "leverage": 2}]
+    state["account_value"] = 1000.0
+    return state
+
+
+# 1. 量化指纹
+print("\n1️⃣ 量化指纹:")
+base = market_fingerprint(make_state())
+check(market_fingerprint(make_state(btc=60150.0, rsi=56.0, size=0.0101)) == base,
+      "价格 +0.08%、RSI +1、持仓 +1% → 指纹不变")
+check(market_fingerprint(make_state(btc=60700.0)) != base, "价格 +1% → 指纹变化")
+check(market_fingerprint(make_state(rsi=71.0)) != base, "RSI 55 → 71 → 指纹变化")
+check(market_fingerprint(make_state(size=-0.01)) != base, "持仓方向反转 → 指纹变化")
+check(set(base["market"]) == {"BTC"}, f"默认只使用分析/持仓币种: {list(base['market'])}")
+
+# 2. TTL 与 LRU
+print("\n2️⃣ TTL 与 LRU:")
+cache = DecisionCache(":memory:", ttl=0.2, max_entries=3)
+cache.put("a", '{"decision": "buy"}', "make_trading_decision")
+check(cache.get("a") is not None, "TTL 内命中")
+time.sleep(0.25)
+check(cache.get("a") is None and cache.stats()["expired"] == 1, "超过 TTL 失效")
+
+cache = DecisionCache(":memory:", ttl=60, max_entries=3)
+for key in "abc":
+    cache.put(key, "{}", "t")
+    time.sleep(0.01)
+cache.get("a")  # a 最近使用过，b 最久未使用
+cache.put("d", "{}", "t")
+check(cache.get("b") is None and cache.get("a") and cache.get("d") and cache.stats()["stored"] == 3,
+      "超过容量淘汰最久未使用的条目", str(cache.stats()))
+
+# 3. 持久化
+print("\n3️⃣ 重启后仍然有效:")
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "decisions.db")
+    first = DecisionCache(path, ttl=60)
+    first.put("k", '{"decision": "sell"}', "make_trading_decision")
+    first.close()
+    second = DecisionCache(path, ttl=60)
+    cached = second.get("k")
+    check(cached is not None and json.loads(cached["arguments"])["decision"] == "sell", "重新打开数据库后命中")
+    second.close()
+
+    config = {"agent": {"decision_cache": {"enabled": True, "path": path, "ttl": 30}}}
+    created = create_decision_cache(config)
+    check(created is not None and created.ttl == 30 and create_decision_cache({}) is None, "按配置开启，默认关闭")
+    created.close()
+
+# 4. 节点集成
+print("\n4️⃣ llm_analysis_node 集成:")
+llm = StubLLM()
+cache = DecisionCache(":memory:", ttl=60)
+first = llm_analysis_node(make_state(), llm, "策略A", cache)
+second = llm_analysis_node(make_state(btc=60110.0), llm, "策略A", cache)
+check(llm.calls == 1 and second["trading_decision"] == first["trading_decision"],
+      f"市场几乎没变 → 复用决策 {second['trading_decision']}，LLM 调用 {llm.calls} 次")
+llm_analysis_node(make_state(btc=61000.0), llm, "策略A", cache)
+check(llm.calls == 2, "价格明显变化 → 重新调用 LLM")
+llm_analysis_node(make_state(), llm, "策略B", cache)
+check(llm.calls == 3, "提示词变化 → 重新调用 LLM")
+llm_analysis_node(make_state(), llm, "策略A")
+check(llm.calls == 4, "不传缓存时每次都调用 LLM")
+stats = cache.stats()
+check(stats["hits"] == 1 and stats["misses"] == 3, f"统计: {stats}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
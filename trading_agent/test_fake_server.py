@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+测试本地模拟 Hyperliquid 服务器（真实 SDK Info/Exchange 指向本地，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+
+import eth_account
+from hyperliquid.exchange import Exchange
+from hyperliquid.info import Info
+from hyperliquid.utils.error import ClientError, ServerError
+
+from src.advanced_tools import AdvancedTradingTools
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.tools import HyperliquidTools
+
+print("=" * 70)
+print("🧪 测试模拟 Hyperliquid 服务器")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+def connect(server: FakeHyperliquidServer):
+    wallet = eth_account.Account.from_key("0x" + "11" * 32)
+    info = Info(server.base_url, skip_ws=True)
+    exchange = Exchange(wallet, server.base_url, account_address=server.address)
+    return info, exchange
+
+
+server = FakeHyperliquidServer(seed=42).start()
+info, exchange = connect(server)
+tools = HyperliquidTools(info, exchange, server.address)
+advanced = AdvancedTradingTools(info, exchange, server.address)
+
+# 1. 确定性价格路径
+print("\n1️⃣ 行情数据:")
+prices = tools.get_all_prices()
+twin = FakeHyperliquidServer(seed=42)
+other = FakeHyperliquidServer(seed=43)
+check(prices == twin.mids() and prices != other.mids(), f"同一种子价格路径一致: BTC ${prices.get('BTC', 0):,.2f}")
+twin.stop()
+other.stop()
+
+candles = advanced.get_candles("BTC", "1h", 24)
+check(candles is not None and len(candles) >= 24 and candles[-1]["close"] == prices["BTC"],
+      f"1h K线由 1m K线聚合: {len(candles or [])} 根，最后收盘价等于当前价")
+orderbook = tools.get_orderbook("ETH")
+bids, asks = orderbook["levels"]
+check(float(bids[0]["px"]) < prices["ETH"] < float(asks[0]["px"]), "订单簿买一 < 中间价 < 卖一")
+analysis = advanced.analyze_market_condition("SOL")
+check(analysis.get("recommendation") in ("buy", "sell", "hold"), f"市场分析: {analysis.get('recommendation')}")
+
+# 2. 下单、持仓、平仓
+print("\n2️⃣ 交易接口:")
+leverage = advanced.adjust_leverage("BTC", 5, dry_run=False)
+check(leverage.get("success"), "update_leverage")
+order = tools.place_market_order("BTC", True, 0.01, dry_run=False)
+statuses = order["result"]["response"]["data"]["statuses"]
+check(order["success"] and "filled" in statuses[0], f"market_open 成交 @ ${float(statuses[0].get('filled', {}).get('avgPx', 0)):,.2f}")
+positions = tools.get_positions()
+check(len(positions) == 1 and positions[0]["coin"] == "BTC" and positions[0]["leverage"] == 5,
+      "user_state 显示 BTC 多仓 5x", str(positions))
+closed = tools.close_position("BTC", dry_run=False)
+check(closed["success"] and not tools.get_positions(), "market_close 平仓")
+fills = info.user_fills(server.address)
+check(len(fills) == 2 and fills[0]["dir"] == "Close Long", f"user_fills 返回 {len(fills)} 笔成交")
+
+# 3. 止盈止损随时钟推进触发
+print("\n3️⃣ 推进时钟:")
+entry = server.mids()["ETH"]
+result = advanced.place_order_with_tpsl("ETH", True, 0.1, None, round(entry * 1.003, 1), round(entry * 0.997, 1),
+                                        dry_run=False)
+check(result.get("success") and len(tools.get_open_orders()) == 2, "开仓并挂出止盈止损单")
+before = server.exchange.index
+while server.exchange.positions and server.exchange.index < server.market.bars - 1:
+    server.advance(10)
+tools.snapshot.new_cycle()
+check(not server.exchange.positions and not tools.get_open_orders(),
+      f"推进 {server.exchange.index - before} 根K线后触发平仓，另一个触发单已撤销")
+
+# 4. 故障注入
+print("\n4️⃣ 故障注入:")
+server.fail_next(1, 500)
+try:
+    info.all_mids()
+    check(False, "5xx 注入")
+except ServerError:
+    check(True, "fail_next(500) → ServerError")
+server.fail_next(1, 429, request_type="l2Book")
+info.all_mids()  # 其他类型不受影响
+try:
+    info.l2_snapshot("BTC")
+    check(False, "429 注入")
+except ClientError as e:
+    check(e.status_code == 429, "按请求类型注入 429 → ClientError")
+tools.snapshot.new_cycle()
+check(tools.get_all_prices() == server.mids(), "注入结束后恢复正常")
+check(server.stats()["injected_errors"] == 2, "注入次数已统计")
+server.stop()
+
+flaky = FakeHyperliquidServer(seed=1, error_rate=0.3, error_types={"allMids"}).start()
+flaky_info, _ = connect(flaky)
+errors = 0
+for _ in range(50):
+    try:
+        flaky_info.all_mids()
+    except ServerError:
+        errors += 1
+check(5 <= errors <= 25 and flaky.stats()["injected_errors"] == errors, f"按概率注入: 50 次请求 {errors} 次失败")
+flaky.stop()
+
+# 5. 延迟
+print("\n5️⃣ 延迟:")
+slow = FakeHyperliquidServer(seed=1, latency_ms=40, jitter_ms=10).start()
+slow_info, _ = connect(slow)
+started = time.perf_counter()
+for _ in range(5):
+    slow_info.all_mids()
+elapsed = (time.perf_counter() - started) / 5 * 1000
+check(40 <= elapsed < 200, f"平均请求耗时 {elapsed:.0f}ms（配置 40ms + 抖动 10ms）")
+stats = slow.stats()
+check(stats["by_type"].get("allMids") == 5, f"请求计数: {stats['by_type']}")
+slow.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+测试本地成交账本（增量同步、分页、去重、按币种汇总、持久化、Agent 集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import tempfile
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.fill_ledger import MAX_FILLS_PER_REQUEST, FillLedger
+
+print("=" * 70)
+print("🧪 测试本地成交账本")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+ADDRESS = "0xabc"
+COINS = ["BTC", "ETH", "SOL"]
+rng = np.random.default_rng(3)
+
+
+def make_fills(n: int, start_tid: int = 0, start_time: int = 1_700_000_000_000) -> list:
+    """n 笔成交，每 3 笔同一毫秒（测试游标停在同一时间时的去重）"""
+    return [
+        {"coin": COINS[i % 3], "px": str(round(float(rng.uniform(10, 100)), 2)), "sz": str(round(float(rng.uniform(0.1, 2)), 3)),
+         "side": "B" if rng.random() < 0.5 else "A", "time": start_time + (start_tid + i) // 3 * 1000,
+         "closedPnl": str(round(float(rng.normal(0, 5)), 4)), "fee": str(round(float(rng.uniform(0, 0.1)), 5)),
+         "oid": start_tid + i, "hash": f"0x{start_tid + i:x}", "tid": start_tid + i}
+        for i in range(n)
+    ]
+
+
+class CountingInfo:
+    """按时间升序分页返回成交（同 user_fills_by_time），记录请求数和返回的成交数"""
+
+    def __init__(self, fills: list):
+        self.fills = fills
+        self.requests = []
+
+    def user_fills_by_time(self, address, start_time, end_time=None):
+        page = [f for f in self.fills if f["time"] >= start_time][:MAX_FILLS_PER_REQUEST]
+        self.requests.append(len(page))
+        return page
+
+
+# 1. 首次同步（分页）与汇总
+print("\n1️⃣ 首次同步:")
+fills = make_fills(5000)
+info = CountingInfo(fills)
+ledger = FillLedger(":memory:")
+added = ledger.sync(info, ADDRESS)
+check(added == 5000 and len(info.requests) == 3, f"5000 笔成交分 {len(info.requests)} 页同步: {info.requests}")
+stats = ledger.coin_stats(ADDRESS)
+ok = True
+for coin in COINS:
+    rows = [f for f in fills if f["coin"] == coin]
+    pnl = sum(float(f["closedPnl"]) for f in rows)
+    fees = sum(float(f["fee"]) for f in rows)
+    volume = sum(float(f["px"]) * float(f["sz"]) for f in rows)
+    bought = sum(float(f["sz"]) for f in rows if f["side"] == "B")
+    s = stats[coin]
+    ok &= (s["fills"] == len(rows) and abs(s["realized_pnl"] - pnl) < 1e-6 and abs(s["fees"] - fees) < 1e-6
+           and abs(s["volume"] - volume) < 1e-6 and abs(s["bought"] - bought) < 1e-6)
+check(ok, "按币种的已实现盈亏、手续费、成交额、买入量与逐笔求和一致")
+perf = ledger.performance(ADDRESS)
+wins = sum(float(f["closedPnl"]) > 0 for f in fills)
+check(perf["fills"] == 5000 and perf["wins"] == wins and abs(perf["net_pnl"] - (perf["realized_pnl"] - perf["fees"])) < 1e-6,
+      f"整体表现: 净盈亏 ${perf['net_pnl']:.2f}，胜率 {perf['win_rate']:.1%}，最好 {perf['best_coin']}")
+
+# 2. 增量同步
+print("\n2️⃣ 增量同步:")
+info.requests.clear()
+check(ledger.sync(info, ADDRESS) == 0 and info.requests[0] < 5, f"没有新成交: 只返回游标时刻的 {info.requests[0]} 笔，全部去重")
+info.fills = fills + make_fills(30, start_tid=5000)
+info.requests.clear()
+check(ledger.sync(info, ADDRESS) == 30 and sum(info.requests) < 40, f"新增 30 笔: 本次只下载 {sum(info.requests)} 笔")
+check(ledger.record_fills(ADDRESS, info.fills[-10:]) == 0, "WebSocket 推送的重复成交不重复计入")
+
+# 3. 最近成交
+print("\n3️⃣ 最近成交:")
+recent = ledger.recent(ADDRESS, 5)
+newest = sorted(info.fills, key=lambda f: (f["time"], f["tid"]), reverse=True)[:5]
+check([r["size"] for r in recent] == [float(f["sz"]) for f in newest]
+      and set(recent[0]) == {"time", "coin", "side", "size", "price", "fee", "closed_pnl"},
+      "按时间倒序，字段与 get_trading_history 一致")
+check(all(r["coin"] == "ETH" for r in ledger.recent(ADDRESS, 20, coin="ETH")), "按币种过滤")
+
+# 4. 持久化
+print("\n4️⃣ 持久化:")
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "fills.db")
+    first = FillLedger(path)
+    first.sync(CountingInfo(fills[:100]), ADDRESS)
+    first.close()
+    reopened = FillLedger(path)
+    later = CountingInfo(fills[:200])
+    reopened.sync(later, ADDRESS)
+    check(reopened.performance(ADDRESS)["fills"] == 200 and later.requests[0] < 110,
+          f"重新打开后从游标继续: 只下载 {later.requests[0]} 笔")
+    reopened.close()
+
+# 5. Agent 集成
+print("\n5️⃣ Agent 集成:")
+server = FakeHyperliquidServer(seed=13).start()
+agent, tools = build_agent("advanced", server, StubLLM(), benchmark_config())
+for _ in range(3):
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent.run_once()
+    server.advance(5)
+legacy = [{"coin": f["coin"], "size": float(f["sz"]), "price": float(f["px"])} for f in tools.info.user_fills(tools.address)]
+history = tools.get_trading_history(limit=50)
+check(history and [{"coin": h["coin"], "size": h["size"], "price": h["price"]} for h in history] == legacy[:50],
+      f"get_trading_history 读取本地账本: {len(history)} 笔，与 user_fills 一致")
+performance = tools.get_performance()
+check(performance["fills"] == len(legacy) and set(performance["coins"]) == {f["coin"] for f in legacy},
+      f"get_performance: {performance['fills']} 笔成交，手续费 ${performance['fees']:.4f}，"
+      f"账本同步 {tools.fill_ledger.stats()['api_requests']} 次")
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
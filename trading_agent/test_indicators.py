@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+测试 NumPy 批量技术指标引擎（离线，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import random
+import statistics
+from src.indicators import compute_indicators_batch, compute_indicators, IncrementalIndicators
+
+print("=" * 70)
+print("🧪 测试批量技术指标引擎")
+print("=" * 70)
+
+
+def reference_indicators(closes):
+    """逐根循环的参考实现（与旧版 calculate_technical_indicators 一致）"""
+    ema = closes[0]
+    multiplier = 2 / 13
+    for price in closes[1:]:
+        ema = (price - ema) * multiplier + ema
+
+    gains, losses = [], []
+    for i in range(1, len(closes)):
+        change = closes[i] - closes[i - 1]
+        gains.append(max(change, 0))
+        losses.append(max(-change, 0))
+    avg_gain = sum(gains[-14:]) / 14
+    avg_loss = sum(losses[-14:]) / 14
+    rsi = 100 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+
+    base = closes[-24] if len(closes) >= 24 else closes[0]
+    return {
+        "sma_20": round(sum(closes[-20:]) / 20, 2),
+        "ema_12": round(ema, 2),
+        "rsi_14": round(rsi, 2),
+        "price_change_24h": round((closes[-1] - base) / base * 100, 2),
+        "volatility": round(statistics.stdev(closes[-20:]) / statistics.mean(closes[-20:]), 4),
+        "highest_24h": max(closes[-24:]),
+        "lowest_24h": min(closes[-24:]),
+    }
+
+
+# 1. 生成随机K线（不同长度，测试分组计算）
+print("\n1️⃣ 生成测试K线...")
+random.seed(42)
+candles_by_coin = {}
+for i in range(30):
+    length = random.choice([10, 20, 24, 36, 100])
+    price = random.uniform(1, 50000)
+    candles = []
+    for _ in range(length):
+        price *= 1 + random.gauss(0, 0.01)
+        candles.append({"close": price})
+    candles_by_coin[f"COIN{i}"] = candles
+print(f"   ✅ 生成 {len(candles_by_coin)} 个币种")
+
+# 2. 批量计算并与参考实现对比
+print("\n2️⃣ 对比参考实现...")
+batch = compute_indicators_batch(candles_by_coin)
+mismatches = 0
+for coin, candles in candles_by_coin.items():
+    closes = [c["close"] for c in candles]
+    if len(closes) < 20:
+        if batch[coin] != {}:
+            mismatches += 1
+            print(f"   ❌ {coin}: K线不足应返回空字典")
+        continue
+    expected = reference_indicators(closes)
+    for key, value in expected.items():
+        if abs(batch[coin][key] - value) > 1e-6 * max(1, abs(value)):
+            mismatches += 1
+            print(f"   ❌ {coin} {key}: 期望 {value}, 实际 {batch[coin][key]}")
+
+if mismatches == 0:
+    print("   ✅ 所有指标与参考实现一致")
+
+# 3. 单币种接口
+print("\n3️⃣ 测试单币种接口...")
+single = compute_indicators(candles_by_coin["COIN0"])
+print(f"   {'✅' if single == batch['COIN0'] else '❌'} 单币种结果与批量结果一致")
+
+# 4. 增量指标：分批喂入K线（含未收盘K线被替换），结果应与全量计算一致
+print("\n4️⃣ 测试增量指标...")
+price = 100.0
+candles = []
+for t in range(200):
+    price *= 1 + random.gauss(0, 0.01)
+    candles.append({"time": t, "close": price})
+
+incremental = IncrementalIndicators("TEST", "1h")
+incremental.update([dict(c) for c in candles[:50]])
+incremental.pending["close"] = 999.0  # 模拟未收盘K线，之后应被收盘版本替换
+for end in range(50, 200, 7):
+    incremental.update(candles[incremental.latest_time:end])
+incremental.update(candles[incremental.latest_time:])
+
+streaming = incremental.indicators()
+full = compute_indicators(candles[-24:])
+# RSI 使用 Wilder 平滑，与简单平均版本不同，不参与对比
+for key in ["sma_20", "price_change_24h", "volatility", "current_price", "highest_24h", "lowest_24h"]:
+    if abs(streaming[key] - full[key]) > 1e-6 * max(1, abs(full[key])):
+        mismatches += 1
+        print(f"   ❌ {key}: 全量 {full[key]}, 增量 {streaming[key]}")
+print(f"   已确认K线: {incremental.count}, RSI(Wilder): {streaming['rsi_14']}")
+if mismatches == 0:
+    print("   ✅ 增量指标与全量计算一致")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if mismatches == 0 and single == batch['COIN0'] else '❌ 测试失败'}")
+print("=" * 70)
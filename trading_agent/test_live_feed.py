@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+测试 WebSocket 实时行情（使用本地模拟 WebSocket 服务器，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+from hyperliquid.info import Info
+
+from src.fake_ws_server import FakeWebsocketServer
+from src.live_feed import LiveMarketFeed
+from src.market_snapshot import MarketSnapshot
+from src.advanced_tools import AdvancedTradingTools
+
+print("=" * 70)
+print("🧪 测试 WebSocket 实时行情")
+print("=" * 70)
+
+ADDRESS = "0x0000000000000000000000000000000000000001"
+META = {"universe": [{"name": "BTC", "szDecimals": 5}, {"name": "ETH", "szDecimals": 4}]}
+SPOT_META = {"universe": [], "tokens": []}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class NoRestInfo:
+    """REST 接口被调用即失败（验证实时模式下不走 REST）"""
+    def __getattr__(self, name):
+        raise AssertionError(f"不应调用 REST 接口: {name}")
+
+
+failures = 0
+
+# 1. 启动模拟服务器并订阅
+print("\n1️⃣ 启动模拟 WebSocket 服务器...")
+server = FakeWebsocketServer().start()
+info = Info(server.base_url, skip_ws=False, meta=META, spot_meta=SPOT_META)
+feed = LiveMarketFeed(info, address=ADDRESS, coins=["BTC", "ETH"], intervals=["1h"])
+state = feed.start()
+
+# allMids + 2×candle + 2×l2Book + userFills
+if wait_for(lambda: server.subscription_count() == 6):
+    print(f"   ✅ 订阅完成: {server.subscription_count()} 个数据流")
+else:
+    failures += 1
+    print(f"   ❌ 订阅数量不正确: {server.subscription_count()}")
+
+# 2. 推送行情
+print("\n2️⃣ 推送行情数据...")
+now = int(time.time() * 1000)
+hour = 3_600_000
+server.publish("allMids", {"mids": {"BTC": "65000.5", "ETH": "3200.1"}})
+for i in range(3):
+    t = now - now % hour - (2 - i) * hour
+    server.publish("candle", {
+        "t": t, "T": t + hour - 1, "s": "BTC", "i": "1h",
+        "o": "65000", "h": "65500", "l": "64800", "c": str(65000 + i * 10), "v": "12.5", "n": 100
+    })
+server.publish("l2Book", {
+    "coin": "BTC", "time": now,
+    "levels": [[{"px": "64999", "sz": "1.5", "n": 3}], [{"px": "65001", "sz": "2.0", "n": 4}]]
+})
+
+if wait_for(lambda: state.stats()["messages"].get("candle", 0) == 3 and "BTC" in state.books):
+    print(f"   ✅ 收到消息: {state.stats()['messages']}")
+else:
+    failures += 1
+    print(f"   ❌ 消息未全部到达: {state.stats()['messages']}")
+
+# 3. 节点通过 MarketSnapshot 读取实时数据，不调用 REST
+print("\n3️⃣ 通过 MarketSnapshot 读取...")
+snapshot = MarketSnapshot(NoRestInfo())
+snapshot.attach_live_state(state)
+tools = AdvancedTradingTools(NoRestInfo(), None, ADDRESS, snapshot=snapshot)
+try:
+    mids = snapshot.all_mids()
+    book = snapshot.l2_snapshot("BTC")
+    candles = tools.get_candles("BTC", "1h", lookback_hours=2)
+    print(f"   ✅ BTC 价格: {mids['BTC']}, 买一: {book['levels'][0][0]['px']}, K线: {len(candles)} 根")
+    print(f"   ✅ 实时命中: {snapshot.stats()['live_hits']}")
+except AssertionError as e:
+    failures += 1
+    print(f"   ❌ {e}")
+
+# 4. 成交推送：通知监听者并使 user_state 缓存失效
+print("\n4️⃣ 推送成交...")
+received_fills = []
+state.add_fill_listener(received_fills.append)
+server.publish("userFills", {"user": ADDRESS, "isSnapshot": False, "fills": [
+    {"coin": "BTC", "px": "65000", "sz": "0.01", "side": "B", "time": now, "oid": 42}
+]})
+if wait_for(lambda: len(received_fills) == 1):
+    print(f"   ✅ 成交回调: oid={received_fills[0]['oid']}")
+else:
+    failures += 1
+    print("   ❌ 未收到成交回调")
+
+# 5. K线超过 live_max_age 未更新：返回 None，回退到 REST
+print("\n5️⃣ 实时K线过期...")
+start_time = now - 2 * 3600 * 1000
+fresh = snapshot.live_candles("BTC", "1h", start_time)
+state.candle_updated_at[("BTC", "1h")] -= snapshot.live_max_age + 1
+stale = snapshot.live_candles("BTC", "1h", start_time)
+if fresh is not None and stale is None and state.get_candles("BTC", "1h", start_time, max_age=snapshot.live_max_age) is None:
+    print("   ✅ 过期K线不再返回，调用方回退到 REST")
+else:
+    failures += 1
+    print(f"   ❌ 过期判断错误: fresh={fresh is not None}, stale={stale is not None}")
+
+feed.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
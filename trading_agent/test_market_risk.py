@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+测试市场风险模型（增量协方差、参数法/历史法 VaR 与 ES、风控节点集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.candle_store import CandleStore
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.market_risk import MarketRiskModel
+from src.risk_manager import RiskManager
+
+print("=" * 70)
+print("🧪 测试市场风险模型")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+STEP = 3_600_000
+T0 = (int(time.time() * 1000) // STEP - 401) * STEP
+COINS = ["BTC", "ETH", "SOL"]
+
+# 相关的合成收盘价：401 根已收盘的 1h K线
+rng = np.random.default_rng(7)
+corr = np.array([[1.0, 0.8, 0.5], [0.8, 1.0, 0.6], [0.5, 0.6, 1.0]])
+vols = np.array([0.006, 0.008, 0.012])
+shocks = rng.multivariate_normal(np.zeros(3), corr * np.outer(vols, vols), 400)
+closes = np.array([60000.0, 3000.0, 150.0]) * np.exp(np.vstack([np.zeros(3), np.cumsum(shocks, axis=0)]))
+
+
+def candles(coin: int, start: int, end: int) -> list:
+    return [{"t": T0 + i * STEP, "T": T0 + (i + 1) * STEP - 1, "c": str(closes[i, coin])} for i in range(start, end)]
+
+
+class SyntheticInfo:
+    """按合成收盘价返回 candles_snapshot"""
+
+    def __init__(self):
+        self.requests = 0
+
+    def candles_snapshot(self, name: str, interval: str, start: int, end: int) -> list:
+        self.requests += 1
+        first, last = max(-(-(start - T0) // STEP), 0), min((end - T0) // STEP + 1, len(closes))
+        return [{**candle, "o": candle["c"], "h": candle["c"], "l": candle["c"], "v": "1", "n": 1}
+                for candle in candles(COINS.index(name), first, last)]
+
+
+def feed(model: MarketRiskModel, start: int, end: int):
+    model.update({coin: candles(j, start, end) for j, coin in enumerate(COINS)})
+
+
+# 1. 协方差与 VaR
+print("\n1️⃣ 协方差与 VaR:")
+model = MarketRiskModel(window=168)
+feed(model, 0, 200)
+coins, cov, returns = model.covariance(COINS)
+expected = np.diff(np.log(closes[200 - 169:200]), axis=0)
+check(coins == COINS and np.allclose(cov, np.cov(expected, rowvar=False)) and np.allclose(returns, expected),
+      f"窗口 {len(returns)} 根收益率，协方差与 np.cov 一致")
+positions = [{"coin": "BTC", "size": 0.01, "current_price": closes[199, 0], "leverage": 1},
+             {"coin": "ETH", "size": -0.1, "current_price": closes[199, 1], "leverage": 1}]
+prices = dict(zip(COINS, closes[199]))
+risk = model.assess(positions, prices, 1000.0)
+w = np.array([0.01 * closes[199, 0], -0.1 * closes[199, 1], 0.0])[:2]
+sigma = np.sqrt(w @ cov[:2, :2] @ w)
+losses = -(np.expm1(expected[:, :2]) @ w)
+check(abs(risk["parametric"]["var"] - NormalDist().inv_cdf(0.95) * sigma) < 0.01
+      and abs(risk["historical"]["var"] - np.quantile(losses, 0.95)) < 0.01,
+      f"参数法 VaR ${risk['parametric']['var']}，历史法 VaR ${risk['historical']['var']}")
+check(risk["parametric"]["es"] > risk["parametric"]["var"] and risk["historical"]["es"] >= risk["historical"]["var"]
+      and abs(sum(risk["contributions"].values()) - 1) < 1e-3,
+      f"ES ≥ VaR，VaR 贡献 {risk['contributions']}")
+check(risk["max_correlation"]["pair"] == ["BTC", "ETH"] and risk["max_correlation"]["value"] > 0.6,
+      f"最大相关性 {risk['max_correlation']}")
+
+# 2. 增量更新
+print("\n2️⃣ 增量更新:")
+started = time.perf_counter()
+for i in range(200, 400):
+    feed(model, i, i + 1)
+    model.covariance(COINS)
+elapsed = (time.perf_counter() - started) * 1000 / 200
+_, cov, returns = model.covariance(COINS)
+expected = np.diff(np.log(closes[400 - 169:400]), axis=0)
+check(model.full_rebuilds == 1 and model.incremental_updates == 200,
+      f"200 根新K线: {model.incremental_updates} 次增量更新，{model.full_rebuilds} 次重建，每根 {elapsed:.2f}ms")
+check(len(returns) == 168 and np.allclose(cov, np.cov(expected, rowvar=False)), "滚动窗口结果与重新计算一致")
+model.covariance(["BTC", "ETH"])
+check(model.full_rebuilds == 1, "请求已缓存币种的子集不触发重建")
+model.update({"DOGE": [{"t": T0, "T": T0 + STEP - 1, "c": "0.1"}]})
+coins, _, _ = model.covariance(COINS + ["DOGE"])
+check(coins == COINS and model.full_rebuilds == 1, "历史不足的币种被排除")
+
+synced = MarketRiskModel(CandleStore(":memory:"), window=168)
+feed(synced, 0, 400)
+synced.covariance(COINS)
+synced.info = SyntheticInfo()
+coins, cov, _ = synced.covariance(["BTC", "ETH"])
+expected = np.diff(np.log(closes[401 - 169:401, :2]), axis=0)
+check(coins == ["BTC", "ETH"] and synced.stats()["coins"] == 2 and synced.incremental_updates == 1
+      and np.allclose(cov, np.cov(expected, rowvar=False)) and synced.info.requests == 2,
+      f"SOL 平仓后新K线经 CandleStore 从交易所补齐，窗口继续前进（{synced.stats()}）")
+
+# 3. 拟执行交易与 VaR 上限
+print("\n3️⃣ 交易与 VaR 上限:")
+prices = dict(zip(COINS, closes[399]))
+manager = RiskManager({"market_risk": {"max_var_pct": 0.01}}, market_risk=model)
+state = {"positions": positions, "current_prices": prices, "account_value": 1000.0}
+hedge = manager.assess_market_risk(state, trades=[{"decision": "close", "coin": "ETH"}])
+bigger = manager.assess_market_risk(state, trades=[{"decision": "buy", "coin": "SOL", "size": 5}])
+check(bigger["var_pct"] > bigger["var_pct_before"] and bigger["blocked_reason"] is not None,
+      f"加仓 SOL: VaR {bigger['var_pct_before']:.2%} → {bigger['var_pct']:.2%}，被拒绝")
+check(hedge["blocked_reason"] is None, f"平仓 ETH 不被拒绝: VaR → {hedge['var_pct']:.2%}")
+check(RiskManager({}).assess_market_risk(state)["available"] is False, "未配置模型时返回默认评估")
+
+# 4. CandleStore + 风控节点
+print("\n4️⃣ Agent 集成:")
+server = FakeHyperliquidServer(seed=11).start()
+config = benchmark_config({"risk": {"market_risk": {"enabled": True, "max_var_pct": 0.5}}})
+agent, tools = build_agent("advanced", server, StubLLM(), config)
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+market = result["risk_assessment"].get("market_risk", {})
+model = agent.risk_manager.market_risk
+check(market.get("available") and market["observations"] >= 20 and "ETH" in market["coins"],
+      f"高级 Agent: {market.get('observations')} 根K线，VaR {market.get('var_pct', 0):.2%}")
+requests = tools.candle_store.api_requests
+with contextlib.redirect_stdout(io.StringIO()):
+    agent.run_once()
+check(model.full_rebuilds == 1 and tools.candle_store.api_requests - requests <= len(config["agent"]["coins"]),
+      f"第二个周期复用缓存的协方差: {model.stats()}")
+
+portfolio, _ = build_agent("portfolio", server, StubLLM(), config)
+with contextlib.redirect_stdout(io.StringIO()):
+    result = portfolio.run_once()
+market = result["risk_assessment"].get("market_risk", {})
+check(market.get("available") and set(market["coins"]) >= {"ETH", "SOL"},
+      f"组合 Agent: VaR {market.get('var_pct', 0):.2%}，币种 {market.get('coins')}")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
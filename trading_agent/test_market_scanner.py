@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+测试全市场扫描（向量化排名、过滤、扫描间波动、提示词、Agent 集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import time
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.market_scanner import DEFAULT_WEIGHTS, MarketScanner, create_market_scanner
+from src.prompt_builder import PromptBuilder, select_coins
+
+print("=" * 70)
+print("🧪 测试全市场扫描")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+rng = np.random.default_rng(5)
+N = 300
+COINS = [f"C{i:03d}" for i in range(N)]
+
+
+def make_ctxs(marks: np.ndarray, prev: np.ndarray, volume: np.ndarray, funding: np.ndarray, delisted=()):
+    universe = [{"name": coin, "szDecimals": 2, "maxLeverage": 20, **({"isDelisted": True} if coin in delisted else {})}
+                for coin in COINS]
+    ctxs = [{"markPx": str(m), "prevDayPx": str(p), "dayNtlVlm": str(v), "funding": str(f), "openInterest": "100"}
+            for m, p, v, f in zip(marks, prev, volume, funding)]
+    return [{"universe": universe}, ctxs]
+
+
+marks = rng.uniform(0.1, 1000, N)
+prev = marks / (1 + rng.normal(0, 0.05, N))
+volume = 10 ** rng.uniform(4, 9, N)
+funding = rng.normal(0, 0.0001, N)
+response = make_ctxs(marks, prev, volume, funding, delisted={"C007"})
+
+
+def naive_scores(eligible: list, vol=None) -> dict:
+    """逐个币种求百分位排名的参考实现"""
+    change = {c: marks[COINS.index(c)] / prev[COINS.index(c)] - 1 for c in eligible}
+    factors = {
+        "momentum": {c: abs(change[c]) for c in eligible},
+        "volume": {c: np.log1p(volume[COINS.index(c)]) for c in eligible},
+        "funding": {c: abs(funding[COINS.index(c)]) for c in eligible},
+        "volatility": vol or {c: abs(change[c]) for c in eligible},
+    }
+    scores = {c: 0.0 for c in eligible}
+    for name, values in factors.items():
+        ordered = sorted(eligible, key=lambda c: values[c])
+        for rank, c in enumerate(ordered):
+            scores[c] += DEFAULT_WEIGHTS[name] * rank / (len(eligible) - 1)
+    return {c: s / sum(DEFAULT_WEIGHTS.values()) for c, s in scores.items()}
+
+
+# 1. 排名
+print("\n1️⃣ 排名与过滤:")
+scanner = MarketScanner(top_k=8, min_day_volume=1e6)
+started = time.perf_counter()
+scan = scanner.scan(response, include=["C001", "C002"], exclude=["C003"])
+elapsed = (time.perf_counter() - started) * 1000
+eligible = [c for i, c in enumerate(COINS) if volume[i] >= 1e6 and c not in ("C001", "C002", "C003", "C007")]
+expected = sorted(naive_scores(eligible).items(), key=lambda item: -item[1])[:8]
+check([row["coin"] for row in scan["ranked"]] == [c for c, _ in expected]
+      and all(abs(row["score"] - round(s, 3)) < 1e-9 for row, (_, s) in zip(scan["ranked"], expected)),
+      f"{N} 个合约一次排名 {elapsed:.1f}ms，与逐个计算的参考实现一致")
+check(scan["universe"] == N and scan["eligible"] == len(eligible) and scan["candidates"][:2] == ["C001", "C002"]
+      and len(scan["candidates"]) == 10, f"必选币种在前，另选 {len(scan['ranked'])} 个（{scan['eligible']} 个参与排名）")
+ranked = {row["coin"] for row in scan["ranked"]}
+check(not ranked & {"C003", "C007"} and all(volume[COINS.index(c)] >= 1e6 for c in ranked),
+      "排除持仓量上限、已下架、成交额过低的币种")
+allowed = MarketScanner(top_k=3, min_day_volume=0, allowed_coins=["C010", "C020", "C030", "C040"]).scan(response)
+check({row["coin"] for row in allowed["ranked"]} <= {"C010", "C020", "C030", "C040"}, "只在 allowed_coins 中选择")
+
+# 2. 扫描间波动
+print("\n2️⃣ 扫描间波动:")
+scanner = MarketScanner(top_k=5, min_day_volume=0)
+history = [marks]
+for _ in range(4):
+    history.append(history[-1] * np.exp(rng.normal(0, rng.uniform(0.001, 0.05, N))))
+for snapshot in history:
+    scan = scanner.scan(make_ctxs(snapshot, prev, volume, funding))
+vol = np.std(np.diff(np.log(np.vstack(history)), axis=0), axis=0)
+marks = history[-1]
+expected = sorted(naive_scores(COINS, dict(zip(COINS, vol))).items(), key=lambda item: -item[1])[:5]
+check([row["coin"] for row in scan["ranked"]] == [c for c, _ in expected]
+      and abs(scan["ranked"][0]["volatility"] - vol[COINS.index(scan["ranked"][0]["coin"])]) < 1e-12,
+      f"5 次扫描后按标记价格的已实现波动排名: {[row['coin'] for row in scan['ranked']]}")
+check(create_market_scanner({}) is None
+      and create_market_scanner({"agent": {"scanner": {"enabled": True, "top_k": 3}}}).top_k == 3, "按配置创建，默认不启用")
+
+# 3. 提示词
+print("\n3️⃣ 提示词:")
+state = {
+    "current_prices": {"BTC": 65000, "ETH": 3200, "SOL": 150, "DOGE": 0.15},
+    "market_analysis_data": {coin: {"indicators": {"price_change_24h": change}, "condition": {}}
+                             for coin, change in (("BTC", 1.0), ("ETH", 0.5), ("SOL", 2.0), ("DOGE", 9.0))},
+    "market_scan": {"universe": 229, "eligible": 140, "candidates": ["ETH", "SOL", "DOGE"], "ranked": [
+        {"coin": "SOL", "volume": 2.5e8, "funding": 0.00002, "score": 0.9},
+        {"coin": "DOGE", "volume": 8e7, "funding": -0.00001, "score": 0.8}]},
+    "positions": [],
+}
+check(select_coins(state["current_prices"], state["market_analysis_data"], [], 3, ["ETH"], ["SOL", "DOGE"])
+      == ["ETH", "SOL", "DOGE"], "关注币种 → 扫描排名 → 涨跌幅")
+text, _ = PromptBuilder(max_coins=3, preferred_coins=["ETH"]).build(state)
+check("扫描 229 个合约" in text and "vlm24h$M|fund%" in text and "SOL|150|+2.00" in text and "|250|+0.0020" in text,
+      "市场表带扫描摘要、成交额和资金费率列")
+
+# 4. Agent 集成
+print("\n4️⃣ Agent 集成:")
+server = FakeHyperliquidServer(seed=21).start()
+baseline, _ = build_agent("advanced", server, StubLLM(), benchmark_config({"agent": {"coins": ["ETH"]}}))
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    baseline.run_once()
+account_requests = server.stats()["by_type"].get("clearinghouseState")
+
+config = benchmark_config({"agent": {"coins": ["ETH"], "scanner": {"enabled": True, "top_k": 2, "min_day_volume": 0}}})
+agent, tools = build_agent("advanced", server, StubLLM(), config)
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+scan = result["market_scan"]
+by_type = server.stats()["by_type"]
+check(len(scan["ranked"]) == 2 and set(result["market_analysis_data"]) == set(scan["candidates"])
+      and by_type.get("metaAndAssetCtxs") == 1 and by_type.get("clearinghouseState") == account_requests,
+      f"高级 Agent: 1 次 metaAndAssetCtxs 选出 {scan['candidates']}，持仓复用账户快照（无额外请求）")
+check(by_type.get("candleSnapshot", 0) <= len(scan["candidates"]),
+      f"只为 {len(scan['candidates'])} 个候选币种请求K线（{len(server.market.coins)} 个合约）")
+
+config["agent"]["async_pipeline"] = True
+portfolio, _ = build_agent("portfolio", server, StubLLM(), config)
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    result = portfolio.run_once()
+scan = result.get("market_scan") or {}
+check(scan.get("candidates") and "ETH" in scan["candidates"] and set(result["market_analysis_data"]) == set(scan["candidates"])
+      and server.stats()["by_type"].get("clearinghouseState") == 1,
+      f"组合 Agent（异步流水线）: 候选 {scan.get('candidates')}，账户状态请求与 get_account 合并")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
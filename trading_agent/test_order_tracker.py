@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+测试订单成交跟踪（模拟成交推送和 user_fills 接口，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+import time
+
+from src.live_feed import LiveMarketState
+from src.market_snapshot import MarketSnapshot
+from src.order_tracker import OrderTracker
+
+print("=" * 70)
+print("🧪 测试订单成交跟踪")
+print("=" * 70)
+
+ADDRESS = "0x0000000000000000000000000000000000000001"
+
+
+def order_response(*statuses):
+    return {"status": "ok", "response": {"type": "order", "data": {"statuses": list(statuses)}}}
+
+
+def make_fill(oid, sz, px, tid):
+    return {"coin": "BTC", "oid": oid, "sz": str(sz), "px": str(px), "tid": tid,
+            "time": int(time.time() * 1000), "side": "B", "dir": "Open Long", "hash": f"0x{tid}"}
+
+
+class PollingInfo:
+    """user_fills_by_time: 第 2 次请求返回部分成交，第 4 次返回剩余成交"""
+
+    def __init__(self):
+        self.start_times = []
+
+    def user_fills_by_time(self, address, start_time, end_time=None, aggregate_by_time=False):
+        self.start_times.append(start_time)
+        fills = []
+        if len(self.start_times) >= 2:
+            fills.append(self._first)
+        if len(self.start_times) >= 4:
+            fills.append(self._second)
+        return [f for f in fills if f["time"] >= start_time]
+
+    def prepare(self, oid):
+        self._first = make_fill(oid, 0.004, 65000, 1)
+        self._second = make_fill(oid, 0.006, 65010, 2)
+        self._second["time"] += 1
+
+
+class NoRestInfo:
+    """REST 接口被调用即失败（验证实时模式下不轮询）"""
+    def __getattr__(self, name):
+        raise AssertionError(f"不应调用 REST 接口: {name}")
+
+
+failures = 0
+
+# 1. 下单响应已报告完整成交
+print("\n1️⃣ IoC 订单已成交:")
+tracker = OrderTracker(NoRestInfo(), ADDRESS)
+fill = tracker.confirm(order_response({"filled": {"oid": 7, "totalSz": "0.01", "avgPx": "65000.0"}}), 0.01)
+if fill["filled"] and fill["source"] == "response" and fill["avg_price"] == 65000.0:
+    print(f"   ✅ 直接从响应确认成交，不等待")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+fill = tracker.confirm(order_response({"error": "Insufficient margin to place order."}), 0.01)
+if not fill["filled"] and "Insufficient margin" in fill["error"]:
+    print(f"   ✅ 下单失败时立即返回错误")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+fill = tracker.confirm(order_response({"filled": {"oid": 12, "totalSz": "0.004", "avgPx": "65000.0"}},
+                                      {"filled": {"oid": 13, "totalSz": "0.006", "avgPx": "65010.0"}}), 0.01)
+expected_px = (0.004 * 65000 + 0.006 * 65010) / 0.01
+if fill["filled"] and not fill["partial"] and fill["oids"] == [12, 13] and abs(fill["filled_size"] - 0.01) < 1e-12 \
+        and abs(fill["avg_price"] - expected_px) < 1e-6 and fill["latency"] < 0.1:
+    print(f"   ✅ 拆单的子订单合计确认成交: {fill['filled_size']:.4f} @ ${fill['avg_price']:,.2f}")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+fill = tracker.confirm(order_response({"filled": {"oid": 14, "totalSz": "0.006", "avgPx": "65000.0"}}), 0.01)
+if fill["filled"] and fill["partial"] and fill["filled_size"] == 0.006 and fill["latency"] < 0.1:
+    print(f"   ✅ IoC 部分成交（剩余已撤销）立即返回部分成交，不等待超时")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+# 2. 增量轮询
+print("\n2️⃣ 轮询 user_fills（挂单分两次成交）:")
+info = PollingInfo()
+info.prepare(oid=8)
+tracker = OrderTracker(info, ADDRESS, poll_interval=0.05)
+fill = tracker.confirm(order_response({"resting": {"oid": 8}}), 0.01, timeout=2.0)
+expected_px = (0.004 * 65000 + 0.006 * 65010) / 0.01
+if fill["filled"] and abs(fill["avg_price"] - expected_px) < 1e-6 and fill["source"] == "poll":
+    print(f"   ✅ 第 {tracker.poll_count} 次轮询确认成交: {fill['filled_size']:.4f} @ ${fill['avg_price']:,.2f}, "
+          f"{fill['latency'] * 1000:.0f}ms")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+if info.start_times[-1] > info.start_times[0] and tracker.poll_count == 4:
+    print(f"   ✅ 游标随成交推进，只拉取新成交")
+else:
+    failures += 1
+    print(f"   ❌ 游标未推进: {info.start_times}")
+
+# 3. WebSocket 推送
+print("\n3️⃣ WebSocket 成交推送:")
+live_state = LiveMarketState()
+snapshot = MarketSnapshot(NoRestInfo())
+snapshot.attach_live_state(live_state)
+tracker = OrderTracker(NoRestInfo(), ADDRESS, snapshot)
+
+
+def push_fill():
+    time.sleep(0.1)
+    live_state.on_user_fills({"data": {"user": ADDRESS, "isSnapshot": False,
+                                       "fills": [make_fill(9, 0.01, 64990, 3)]}})
+
+
+threading.Thread(target=push_fill).start()
+fill = tracker.confirm(order_response({"resting": {"oid": 9}}), 0.01, timeout=2.0)
+if fill["filled"] and fill["source"] == "websocket" and fill["latency"] < 0.5:
+    print(f"   ✅ 推送到达即确认: {fill['latency'] * 1000:.0f}ms（原流程固定等待 2000ms）")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+# 等待开始前已到达的推送
+live_state.on_user_fills({"data": {"user": ADDRESS, "isSnapshot": False,
+                                   "fills": [make_fill(10, 0.02, 64980, 4)]}})
+fill = OrderTracker(NoRestInfo(), ADDRESS, snapshot).wait_for_fill(10, 0.02, timeout=1.0)
+if fill["filled"] and fill["latency"] < 0.1:
+    print(f"   ✅ 等待前已到达的成交也能关联")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+# 4. 超时
+print("\n4️⃣ 超时:")
+fill = tracker.wait_for_fill(11, 0.01, timeout=0.2)
+if not fill["filled"] and 0.2 <= fill["latency"] < 0.5:
+    print(f"   ✅ 无成交时 {fill['latency'] * 1000:.0f}ms 后超时返回")
+else:
+    failures += 1
+    print(f"   ❌ 结果不正确: {fill}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
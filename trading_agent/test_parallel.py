@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试多币种并发获取（单币种超时、部分失败、总体截止时间），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.parallel import run_per_coin
+
+print("=" * 70)
+print("🧪 测试多币种并发获取")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+release = threading.Event()  # 测试结束时释放卡住的线程
+
+
+def fetch(coin: str):
+    if coin.startswith("SLOW"):
+        release.wait(5.0)
+    if coin == "BAD":
+        raise RuntimeError("candles_snapshot 500")
+    return f"{coin}-data"
+
+
+# 1. 慢币种超时被跳过，其余币种正常返回
+print("\n1️⃣ 慢币种超时:")
+started = time.monotonic()
+results, errors = run_per_coin(fetch, ["BTC", "SLOW", "ETH", "SOL"], max_workers=4, timeout=0.3)
+elapsed = time.monotonic() - started
+check(results == {"BTC": "BTC-data", "ETH": "ETH-data", "SOL": "SOL-data"}, "其余币种正常返回", f"{results}")
+check(list(errors) == ["SLOW"] and "超时" in errors["SLOW"], f"SLOW 超时: {errors.get('SLOW')}")
+check(elapsed < 1.0, f"不等待慢币种: {elapsed:.2f}s")
+
+# 2. 单币种异常记录到 errors
+print("\n2️⃣ 单币种异常:")
+results, errors = run_per_coin(fetch, ["BTC", "BAD", "ETH", "BTC"], max_workers=2, timeout=1.0)
+check(set(results) == {"BTC", "ETH"}, "其余币种正常返回（重复币种只执行一次）", f"{results}")
+check(errors == {"BAD": "candles_snapshot 500"}, f"BAD 失败: {errors.get('BAD')}")
+
+# 3. 线程全部卡住时，排队的币种在总体截止时间后放弃
+print("\n3️⃣ 总体截止时间:")
+started = time.monotonic()
+results, errors = run_per_coin(fetch, ["SLOW1", "SLOW2", "SLOW3"], max_workers=1, timeout=0.2)
+elapsed = time.monotonic() - started
+# 1 个线程、3 个币种：截止时间 = 0.2 × (3 + 1) = 0.8s
+check(not results and set(errors) == {"SLOW1", "SLOW2", "SLOW3"}, "全部记为超时", f"{errors}")
+check(0.7 <= elapsed < 1.3, f"在总体截止时间返回: {elapsed:.2f}s")
+
+release.set()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
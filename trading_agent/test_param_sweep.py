@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+测试评分规则参数寻优（合成K线，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+
+import numpy as np
+
+from src.backtest import HistoricalMarket, run_rule_backtest
+from src.param_sweep import grid_search, print_results, random_search, run_sweep
+
+print("=" * 70)
+print("🧪 测试评分规则参数寻优")
+print("=" * 70)
+
+HOUR = 3_600_000
+rng = np.random.default_rng(3)
+drift = np.repeat(rng.normal(0, 0.001, (20, 24 * 90 // 50 + 1)), 50, axis=1)[:, :24 * 90]
+closes = 100 * np.exp(np.cumsum(drift + rng.normal(0, 0.01, drift.shape), axis=1))
+times = 1_700_000_000_000 - 1_700_000_000_000 % HOUR + np.arange(closes.shape[1]) * HOUR
+market = HistoricalMarket([f"C{i}" for i in range(20)], times, closes, closes * 1.004, closes * 0.996, closes)
+
+failures = 0
+
+# 1. 搜索空间
+print("\n1️⃣ 搜索空间:")
+grid = grid_search({"rsi_low": [25, 30], "rsi_high": [70, 75], "change_pct": [2.0, 3.0], "buy_above": [55, 60]})
+samples = random_search({"rsi_low": (20, 35), "change_pct": (1.0, 5.0), "buy_above": [55, 60, 65]}, samples=30, seed=1)
+if len(grid) == 16 and len(samples) == 30 and all(20 <= p["rsi_low"] <= 35 and isinstance(p["rsi_low"], int)
+                                                  for p in samples):
+    print(f"   ✅ 网格 {len(grid)} 组, 随机 {len(samples)} 组")
+else:
+    failures += 1
+    print("   ❌ 搜索空间不正确")
+
+# 2. 多进程（共享内存）与单进程结果一致
+print("\n2️⃣ 多进程 vs 单进程:")
+param_sets = grid + samples
+started = time.perf_counter()
+serial = run_sweep(market, param_sets, workers=1)
+serial_elapsed = time.perf_counter() - started
+started = time.perf_counter()
+parallel = run_sweep(market, param_sets, workers=2)
+parallel_elapsed = time.perf_counter() - started
+print(f"   单进程 {serial_elapsed:.2f}s, 2 进程 {parallel_elapsed:.2f}s（{os.cpu_count()} 核）")
+if serial == parallel:
+    print(f"   ✅ {len(param_sets)} 组参数结果完全一致")
+else:
+    failures += 1
+    print("   ❌ 结果不一致")
+
+leaked = [name for name in os.listdir("/dev/shm") if name.startswith("psm_")] if os.path.isdir("/dev/shm") else []
+if not leaked:
+    print("   ✅ 共享内存已释放")
+else:
+    failures += 1
+    print(f"   ❌ 共享内存未释放: {leaked}")
+
+# 3. 排名与单次回测一致
+print("\n3️⃣ 排名结果:")
+sharpes = [row["sharpe"] for row in parallel]
+best = parallel[0]
+params = {k: best[k] for k in grid[0]}
+check = run_rule_backtest(market, scoring=params).summary()
+if sharpes == sorted(sharpes, reverse=True) and abs(check["sharpe"] - best["sharpe"]) < 1e-9 \
+        and abs(check["total_return_pct"] - best["total_return_pct"]) < 1e-9 and check["trades"] == best["trades"]:
+    print(f"   ✅ 按夏普比率排序，第一名与单独回测结果一致 ({params})")
+else:
+    failures += 1
+    print(f"   ❌ 排名或指标不正确: {check} vs {best}")
+print_results(parallel, top=5)
+
+by_drawdown = run_sweep(market, grid, workers=1, rank_by="max_drawdown_pct")
+drawdowns = [row["max_drawdown_pct"] for row in by_drawdown]
+if drawdowns == sorted(drawdowns):
+    print("   ✅ 按最大回撤升序排序")
+else:
+    failures += 1
+    print("   ❌ 回撤排序不正确")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试组合风控（批量评估、接受/裁剪/拒绝、组合 Agent 集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import time
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.risk_manager import RiskManager
+
+print("=" * 70)
+print("🧪 测试组合风控")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+RISK = {
+    "max_usable_capital": 1000,
+    "max_position_size": 0.2,
+    "max_total_exposure": 0.5,
+    "max_single_trade_value": 300,
+    "min_account_value": 10,
+    "min_trade_value": 10,
+    "allowed_coins": [],
+    "max_leverage": 3,
+}
+PRICES = {"BTC": 60000.0, "ETH": 3000.0, "SOL": 150.0, "DOGE": 0.2}
+risk_manager = RiskManager(RISK)
+
+
+def position(coin: str, size: float, leverage: int = 1) -> dict:
+    return {"coin": coin, "size": size, "entry_price": PRICES[coin], "current_price": PRICES[coin],
+            "unrealized_pnl": 0.0, "leverage": leverage}
+
+
+# 1. 接受 / 裁剪 / 拒绝
+print("\n1️⃣ 逐笔结果:")
+trades = [
+    {"decision": "buy", "coin": "ETH", "size": 0.02},                  # $60，接受
+    {"decision": "buy", "coin": "SOL", "size": 3, "leverage": 5},       # $450 → 单笔 $300 → 单币种 $200，杠杆 3x
+    {"decision": "close", "coin": "DOGE"},                              # 没有持仓
+    {"decision": "hold", "coin": "BTC"},                                # 未知决策
+    {"decision": "buy", "coin": "BTC", "size": 0.0001},                 # $6 低于最小金额
+    {"decision": "close", "coin": "BTC"},                               # 平掉 BTC 多仓
+]
+assessment = risk_manager.check_portfolio_trades(trades, [position("BTC", 0.002)], 1000.0, PRICES)
+actions = [r["action"] for r in assessment["results"]]
+check(actions == ["accept", "trim", "reject", "reject", "reject", "accept"], f"结果: {actions}")
+sol = assessment["results"][1]
+check(abs(sol["size"] * PRICES["SOL"] - 200) < 1e-6 and sol["leverage"] == 3,
+      f"SOL 裁剪到单币种上限 ${sol['size'] * PRICES['SOL']:.0f}，杠杆 5x → 3x")
+reasons = [r["blocked_reason"] for r in assessment["results"][2:5]]
+check("没有 DOGE" in reasons[0] and "未知决策" in reasons[1] and "最小交易金额" in reasons[2], "拒绝原因", str(reasons))
+exposure = assessment["exposure"]
+check(exposure["gross_before"] == 120.0 and exposure["gross_after"] == 260.0 and exposure["concentration"]["SOL"] == 0.2,
+      f"敞口 ${exposure['gross_before']} → ${exposure['gross_after']}，集中度 {exposure['concentration']}")
+
+# 2. 组合超额：逐笔检查都通过，合在一起超过总敞口上限
+print("\n2️⃣ 组合超额:")
+trades = [{"decision": "buy", "coin": coin, "size": 190 / PRICES[coin]} for coin in ("BTC", "ETH", "SOL")]
+singles = [risk_manager.check_trading_decision("buy", t["coin"], t["size"], 1000.0, [], PRICES[t["coin"]])["passed"]
+           for t in trades]
+assessment = risk_manager.check_portfolio_trades(trades, [], 1000.0, PRICES)
+check(all(singles) and all(r["action"] == "trim" for r in assessment["results"])
+      and abs(assessment["exposure"]["gross_after"] - 500) < 0.01,
+      f"逐笔均通过，批量检查后总敞口 $570 → ${assessment['exposure']['gross_after']:.2f}（上限 $500）")
+hedge = trades + [{"decision": "sell", "coin": "BTC", "size": 0.001}]
+assessment = risk_manager.check_portfolio_trades(hedge, [], 1000.0, PRICES)
+check(assessment["results"][3]["action"] == "accept" and assessment["results"][3]["size"] == 0.001
+      and abs(assessment["exposure"]["gross_after"] - 500) < 0.01, "减少敞口的交易不被裁剪，且计入总敞口")
+
+# 3. 大规模币种池
+print("\n3️⃣ 大规模:")
+rng = np.random.default_rng(0)
+universe = {f"C{i:04d}": float(rng.uniform(0.1, 1000)) for i in range(2000)}
+big_risk = RiskManager({**RISK, "max_usable_capital": 1_000_000, "max_position_size": 0.01, "max_total_exposure": 1.0,
+                        "max_single_trade_value": 50_000})
+positions = [{"coin": c, "size": float(rng.normal()) * 100 / p, "current_price": p, "leverage": 1}
+             for c, p in list(universe.items())[:1000]]
+trades = [{"decision": ["buy", "sell"][i % 2], "coin": c, "size": 20_000 / p}
+          for i, (c, p) in enumerate(list(universe.items())[500:1500])]
+started = time.perf_counter()
+assessment = big_risk.check_portfolio_trades(trades, positions, 1_000_000, universe)
+elapsed = (time.perf_counter() - started) * 1000
+max_concentration = max(assessment["exposure"]["concentration"].values())
+check(elapsed < 1000 and assessment["exposure"]["gross_after"] <= 1_000_000 + 1 and max_concentration <= 0.01 + 1e-6,
+      f"2000 币种 / 1000 持仓 / 1000 交易: {elapsed:.0f}ms，最大集中度 {max_concentration:.2%}")
+
+# 4. 组合 Agent 集成
+print("\n4️⃣ 组合 Agent:")
+server = FakeHyperliquidServer(seed=5).start()
+config = benchmark_config({"risk": {"max_position_size": 0.05, "max_total_exposure": 0.08, "min_trade_value": 5}})
+agent, _ = build_agent("portfolio", server, StubLLM(), config)
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+results = result["risk_assessment"]["results"]
+check(len(results) == 2 and "risk_check" in agent.timer.timings, f"风控节点已加入工作流: {result['risk_message']}")
+check(result["risk_assessment"]["exposure"]["gross_after"] <= 0.08 * 1000 + 0.01,
+      f"交易后总敞口 ${result['risk_assessment']['exposure']['gross_after']:.2f} ≤ $80")
+check(len(result["execution_results"]) == len(result["portfolio_trades"]) == sum(r["passed"] for r in results),
+      "只执行通过风控的交易")
+agent.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
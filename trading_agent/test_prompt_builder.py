@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+测试紧凑提示词构建（币种选择、表格渲染、token 预算），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import logging
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM
+from src.nodes import llm_analysis_node
+from src.prompt_builder import PromptBuilder, create_prompt_builder, estimate_tokens, select_coins
+from src.state import create_initial_state
+
+print("=" * 70)
+print("🧪 测试紧凑提示词构建")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+def make_state(n_coins: int = 200) -> dict:
+    """200 个币种的中间价，其中 20 个有技术分析，持仓 1 个冷门币种"""
+    state = create_initial_state()
+    coins = ["BTC", "ETH"] + [f"C{i:03d}" for i in range(n_coins - 2)]
+    state["current_prices"] = {coin: 100.0 + i for i, coin in enumerate(coins)}
+    state["market_analysis_data"] = {
+        coin: {"indicators": {"current_price": 100.0 + i, "price_change_24h": (i % 7) - 3 + i / 100,
+                              "rsi_14": 50.0, "sma_20": 99.0, "volatility": 0.02},
+               "condition": {"trend": "neutral", "recommendation": "hold", "reasons": ["震荡"]}}
+        for i, coin in enumerate(coins[:20])
+    }
+    state["positions"] = [{"coin": "C150", "size": -2.5, "entry_price": 250.0, "current_price": 252.0,
+                           "unrealized_pnl": -5.0, "leverage": 3}]
+    state["account_value"] = 1000.0
+    state["available_balance"] = 800.0
+    return state
+
+
+# 1. token 估算
+print("\n1️⃣ token 估算:")
+check(estimate_tokens("abcd" * 10) == 10 and estimate_tokens("交易决策") == 4 and estimate_tokens("") == 0,
+      "ASCII 约 4 字符/token，中文约 1 字/token")
+
+# 2. 币种选择
+print("\n2️⃣ 币种选择:")
+state = make_state()
+coins = select_coins(state["current_prices"], state["market_analysis_data"], state["positions"], max_coins=6)
+changes = {c: abs(d["indicators"]["price_change_24h"]) for c, d in state["market_analysis_data"].items()}
+movers = [c for c in sorted(changes, key=lambda c: -changes[c]) if c not in ("BTC", "ETH")][:3]
+check(coins[:3] == ["C150", "BTC", "ETH"] and coins[3:] == movers,
+      f"持仓 → 关注币种 → 涨跌幅最大: {coins}", str(movers))
+check(select_coins({"BTC": 1.0}, None, [{"coin": c} for c in "ABC"], max_coins=2) == ["A", "B", "C"],
+      "持仓币种不受 max_coins 限制")
+
+# 3. 分段与 token 统计
+print("\n3️⃣ 分段渲染:")
+builder = PromptBuilder(max_coins=8, token_budget=2000)
+history = [{"time": "2026-01-02 03:04:05", "coin": "BTC", "side": "B", "size": 0.01, "price": 101.0}] * 10
+text, tokens = builder.build(state, instructions="请做出交易决策。", history=history)
+check(text.count("\n") < 30 and "C150|short|2.5|250|252|-5.00|3" in text, "持仓表紧凑渲染")
+check(text.count("01-02 03:04") == builder.history_limit, f"成交历史最多 {builder.history_limit} 条")
+check(set(tokens) == {"market", "account", "positions", "history", "instructions", "total"}
+      and tokens["total"] == estimate_tokens(text), f"分段 token: {tokens}")
+
+# 4. token 预算
+print("\n4️⃣ token 预算:")
+tight = PromptBuilder(max_coins=20, token_budget=tokens["total"] - 40)
+trimmed, trimmed_tokens = tight.build(state, instructions="请做出交易决策。", history=history)
+check(trimmed_tokens["total"] <= tight.token_budget and "C150|" in trimmed,
+      f"超出预算时裁剪市场表: {tokens['total']} → {trimmed_tokens['total']} tokens，持仓币种保留")
+config = {"agent": {"coins": ["SOL"], "prompt": {"max_coins": 3, "token_budget": 500}}}
+created = create_prompt_builder(config)
+check(created.preferred_coins == ["SOL"] and created.max_coins == 3 and created.token_budget == 500,
+      "按配置创建，关注币种默认取 agent.coins")
+
+# 5. 节点集成：200 个中间价不再全部写入提示词
+print("\n5️⃣ llm_analysis_node 集成:")
+llm = StubLLM()
+state = make_state()
+legacy_chars = sum(len(f"  {coin}: ${price:.2f}\n") for coin, price in state["current_prices"].items())
+result = llm_analysis_node(state, llm, "策略")
+check(llm.prompt_chars[0] < legacy_chars / 5 and result["prompt_tokens"]["total"] > 0,
+      f"提示词 {llm.prompt_chars[0]} 字符（逐行列出全部价格需 {legacy_chars} 字符）")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
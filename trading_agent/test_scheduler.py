@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+测试事件驱动调度器（模拟行情和时钟，无需网络）
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from src.scheduler import EventScheduler
+
+print("=" * 70)
+print("🧪 测试事件驱动调度器")
+print("=" * 70)
+
+ADDRESS = "0x0000000000000000000000000000000000000001"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeSnapshot:
+    """模拟 MarketSnapshot：价格和持仓按时间变化"""
+    live_state = None
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.events = {}  # 时间 -> 回调
+
+    def invalidate(self, *endpoints):
+        pass
+
+    def all_mids(self):
+        # 前 1000 秒价格平稳，之后 BTC 上涨 2%
+        btc = 65000.0 if self.clock.now < 1000 else 66300.0
+        return {"BTC": str(btc), "ETH": "3200.0"}
+
+    def user_state(self, address):
+        # 1500 秒后 ETH 仓位被止损平仓
+        positions = [{"position": {"coin": "BTC", "szi": "0.01"}}]
+        if self.clock.now < 1500:
+            positions.append({"position": {"coin": "ETH", "szi": "0.5"}})
+        return {"assetPositions": positions}
+
+
+def rsi_fn(clock):
+    # 2000 秒后 ETH RSI 进入超卖区
+    def fn(coin):
+        if coin == "ETH" and clock.now >= 2000:
+            return {"rsi_14": 25.0}
+        return {"rsi_14": 50.0}
+    return fn
+
+
+failures = 0
+clock = FakeClock()
+snapshot = FakeSnapshot(clock)
+scheduler = EventScheduler(
+    snapshot, address=ADDRESS, coins=["BTC", "ETH"], indicator_fn=rsi_fn(clock),
+    price_move_pct=0.01, max_idle=900, poll_interval=10, indicator_interval=60,
+    baseline_interval=60, clock=clock, sleep=clock.sleep
+)
+
+runs = []
+
+
+def run_cycle(reasons):
+    runs.append((clock.now, reasons))
+    clock.now += 5  # 模拟一个周期耗时 5 秒
+
+
+scheduler.run_forever(run_cycle, max_cycles=6)
+
+print("\n1️⃣ 触发记录:")
+for at, reasons in runs:
+    print(f"   t={at:6.0f}s  {'; '.join(reasons)}")
+
+expected = ["首次运行", "空闲超过", "价格变动", "持仓平仓", "RSI 穿越", "空闲超过"]
+actual = [reasons[0] for _, reasons in runs]
+if all(a.startswith(e) for a, e in zip(actual, expected)) and len(actual) == len(expected):
+    print("   ✅ 触发顺序正确")
+else:
+    failures += 1
+    print(f"   ❌ 触发顺序不正确: {actual}")
+
+print("\n2️⃣ 调度统计:")
+stats = scheduler.stats()
+print(f"   运行 {stats['cycles_run']} 轮, 固定间隔需运行 {stats['baseline_cycles']} 轮, "
+      f"跳过 {stats['skipped_cycles']} 轮")
+print(f"   节省运行时间 {stats['compute_saved']:.0f}s, 提前响应 {stats['reaction_saved']:.0f}s")
+if stats["skipped_cycles"] > 0 and stats["compute_saved"] == stats["skipped_cycles"] * 5:
+    print("   ✅ 统计正确")
+else:
+    failures += 1
+    print("   ❌ 统计不正确")
+
+print("\n3️⃣ 周期内自己的成交:")
+
+
+class FakeLiveState:
+    def __init__(self):
+        self.listeners = []
+
+    def add_fill_listener(self, listener):
+        self.listeners.append(listener)
+
+    def push(self, coin, at):
+        for listener in self.listeners:
+            listener({"coin": coin, "sz": "0.1", "px": "100", "dir": "Open Long", "time": int(at * 1000)})
+
+
+class LiveSnapshot(FakeSnapshot):
+    def __init__(self, clock):
+        super().__init__(clock)
+        self.live_state = FakeLiveState()
+
+
+clock = FakeClock()
+snapshot = LiveSnapshot(clock)
+external = {"at": 300.0, "sent": False}
+
+
+def sleep_and_push(seconds):
+    clock.sleep(seconds)
+    if not external["sent"] and clock.now >= external["at"]:
+        external["sent"] = True
+        snapshot.live_state.push("ETH", clock.now)  # 周期外的成交（如止损触发）
+
+
+scheduler = EventScheduler(snapshot, coins=["BTC"], max_idle=900, poll_interval=10, clock=clock,
+                           sleep=sleep_and_push, wall_clock=clock)
+runs = []
+
+
+def trading_cycle(reasons):
+    runs.append((clock.now, reasons))
+    snapshot.live_state.push("BTC", clock.now)  # 本周期下单的成交，推送在周期内到达
+    clock.now += 5
+
+
+scheduler.run_forever(trading_cycle, max_cycles=3)
+snapshot.live_state.push("BTC", clock.now - 1)  # 推送晚于周期结束到达
+for at, reasons in runs:
+    print(f"   t={at:6.0f}s  {'; '.join(reasons)}")
+if [at for at, _ in runs] == [0, 305, 1000] and runs[1][1][0].startswith("成交: ETH") \
+        and runs[2][1] == ["价格变动: BTC +2.00%"] and not scheduler._pending_events:
+    print("   ✅ 周期内下单产生的成交不触发下一周期，周期外的成交照常触发")
+else:
+    failures += 1
+    print(f"   ❌ 触发不正确: {runs}")
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+测试订单簿滑点估计（逐档成交估计、滑点上限、拆单、下单集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import time
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.slippage import BookLevels, SlippageModel, create_slippage_model, estimate_fill, place_market_open
+
+print("=" * 70)
+print("🧪 测试订单簿滑点估计")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+def make_book(mid: float, tick: float, sizes) -> dict:
+    """中间价两侧对称的订单簿，第 i 档距中间价 (i + 0.5) 个 tick"""
+    bids = [{"px": str(mid - (i + 0.5) * tick), "sz": str(sz), "n": 1} for i, sz in enumerate(sizes)]
+    asks = [{"px": str(mid + (i + 0.5) * tick), "sz": str(sz), "n": 1} for i, sz in enumerate(sizes)]
+    return {"coin": "ETH", "time": 0, "levels": [bids, list(reversed(asks))]}  # 卖盘故意乱序
+
+
+BOOK = make_book(3000.0, 1.0, [1.0, 2.0, 3.0, 4.0, 5.0])
+
+# 1. 逐档成交估计
+print("\n1️⃣ 成交估计:")
+fill = estimate_fill(BOOK, True, 2.5)
+expected_avg = (1.0 * 3000.5 + 1.5 * 3001.5) / 2.5
+check(abs(fill["avg_price"] - expected_avg) < 1e-9 and fill["worst_price"] == 3001.5 and fill["levels"] == 2,
+      f"买入 2.5: 均价 {fill['avg_price']:.2f}，最差 {fill['worst_price']}，冲击 {fill['impact_bps']}bps")
+fill = estimate_fill(BOOK, False, 6.0)
+check(fill["worst_price"] == 2997.5 and fill["impact_bps"] > 0 and fill["fillable"], f"卖出 6: 冲击 {fill['impact_bps']}bps")
+fill = estimate_fill(BOOK, True, 100.0)
+check(not fill["fillable"] and fill["filled"] == 15.0, "超过全部深度: fillable=False")
+check(estimate_fill({"levels": [[], []]}, True, 1.0)["avg_price"] is None, "空订单簿")
+
+deep = make_book(100.0, 0.01, np.random.default_rng(0).uniform(1, 10, 2000))
+started = time.perf_counter()
+levels = BookLevels(deep)
+sizes = np.linspace(1, 9000, 2000)
+fills = [estimate_fill(levels, True, float(size)) for size in sizes]
+elapsed = (time.perf_counter() - started) * 1000
+px = np.array(sorted(float(level["px"]) for level in deep["levels"][1]))
+sz = np.array([float(level["sz"]) for level in sorted(deep["levels"][1], key=lambda level: float(level["px"]))])
+naive = []
+for size in sizes[::100]:
+    remaining, cost = size, 0.0
+    for p, q in zip(px, sz):
+        take = min(q, remaining)
+        cost, remaining = cost + take * p, remaining - take
+        if remaining <= 0:
+            break
+    naive.append(cost / size)
+check(np.allclose([f["avg_price"] for f in fills[::100]], naive) and elapsed < 1000,
+      f"2000 档订单簿解析一次、估计 2000 次: {elapsed:.0f}ms，与逐档循环结果一致")
+
+# 2. 执行计划
+print("\n2️⃣ 执行计划:")
+model = SlippageModel(max_impact_bps=5, buffer_bps=10, min_slippage=0.001, max_slippage=0.01, max_child_orders=5)
+small = model.plan(BOOK, True, 0.5)
+check(small["children"] == [0.5] and abs(small["slippage"] - (0.5 / 3000 + 0.001)) < 1e-9,
+      f"小单不拆: 滑点上限 {small['slippage']:.4%}（原固定 5%）")
+large = model.plan(BOOK, True, 6.0)
+child_impacts = [estimate_fill(BOOK, True, c)["impact_bps"] for c in large["children"]]
+check(len(large["children"]) == 2 and abs(sum(large["children"]) - 6.0) < 1e-9 and max(child_impacts) <= 5,
+      f"大单拆分: {large['reason']}，子订单冲击 {child_impacts}bps")
+thin = make_book(3000.0, 10.0, [0.1, 0.1, 50.0])  # 第三档距中间价 0.83%
+tight = SlippageModel(max_impact_bps=5, max_slippage=0.003, max_child_orders=2)
+blocked = tight.plan(thin, True, 5.0)
+check(not blocked["fillable"] and "深度不足" in blocked["reason"], f"最大滑点内深度不足: {blocked['reason']}")
+check(model.plan(None, True, 1.0)["slippage"] == 0.01, "没有订单簿时使用最大滑点")
+config = {"agent": {"slippage": {"enabled": True, "max_impact_bps": 20, "child_delay": 0}}}
+check(create_slippage_model(config).max_impact_bps == 20 and create_slippage_model({}) is None, "按配置创建，默认不启用")
+
+
+# 3. 下单
+print("\n3️⃣ 下单:")
+class FakeExchange:
+    def __init__(self, reject_from: int = 0):
+        self.calls = []
+        self.reject_from = reject_from  # 从第几个子订单开始拒绝（0 表示不拒绝）
+
+    def market_open(self, coin, is_buy, sz, px=None, slippage=0.05):
+        self.calls.append((coin, is_buy, sz, slippage))
+        if self.reject_from and len(self.calls) >= self.reject_from:
+            return {"status": "ok", "response": {"type": "order", "data": {"statuses": [
+                {"error": "Insufficient margin to place order."}]}}}
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": [
+            {"filled": {"totalSz": str(sz), "avgPx": "3000", "oid": len(self.calls)}}]}}}
+
+
+class FakeSnapshot:
+    def l2_snapshot(self, coin):
+        return BOOK
+
+    def invalidate(self, *endpoints):
+        pass
+
+
+class FakeTools:
+    def __init__(self, slippage_model):
+        self.exchange, self.snapshot, self.info, self.slippage_model = FakeExchange(), FakeSnapshot(), None, slippage_model
+
+
+tools = FakeTools(SlippageModel(max_impact_bps=5, max_slippage=0.01, child_delay=0))
+response = place_market_open(tools, "ETH", True, 6.0)
+statuses = response["response"]["data"]["statuses"]
+check(len(tools.exchange.calls) == 2 and len(statuses) == 2
+      and all(call[3] == response["plan"]["slippage"] for call in tools.exchange.calls),
+      f"拆成 {len(tools.exchange.calls)} 个子订单，滑点上限 {response['plan']['slippage']:.4%}")
+tools = FakeTools(SlippageModel(max_impact_bps=5, max_slippage=0.01, child_delay=0))
+tools.exchange = FakeExchange(reject_from=2)
+response = place_market_open(tools, "ETH", True, 6.0)
+check(len(tools.exchange.calls) == 2 and response["status"] == "ok"
+      and response["filled_size"] == tools.exchange.calls[0][2] and "Insufficient margin" in response["error"],
+      f"第二个子订单被拒: 已成交 {response['filled_size']}，错误单独返回")
+tools = FakeTools(SlippageModel(max_impact_bps=5, max_slippage=0.0001))
+response = place_market_open(tools, "ETH", True, 1.0)
+check(not tools.exchange.calls and "error" in response["response"]["data"]["statuses"][0], "不可成交时不下单，返回错误状态")
+tools = FakeTools(None)
+place_market_open(tools, "ETH", False, 1.0)
+check(tools.exchange.calls == [("ETH", False, 1.0, 0.05)], "未启用模型时等同 market_open(..., 0.05)")
+
+# 4. Agent 集成
+print("\n4️⃣ Agent 集成:")
+server = FakeHyperliquidServer(seed=9).start()
+config = benchmark_config({"agent": {"slippage": {"enabled": True, "child_delay": 0}}})
+simple, tools = build_agent("simple", server, StubLLM(), config)
+result = tools.place_market_order("ETH", True, 0.01, dry_run=False)
+check(result["success"] and result["result"]["plan"]["slippage"] == 0.002,
+      f"place_market_order: 滑点上限 {result['result']['plan']['slippage']:.2%}（模拟盘价差 2bps）")
+tools.exchange, tools.snapshot = FakeExchange(reject_from=2), FakeSnapshot()
+tools.slippage_model = SlippageModel(max_impact_bps=5, max_slippage=0.01, child_delay=0)
+result = tools.place_market_order("ETH", True, 6.0, dry_run=False)
+check(result["success"] and 0 < result["filled_size"] < 6.0 and "Insufficient margin" in result["error"],
+      f"place_market_order 拆单部分成交: success=True，成交 {result['filled_size']}，错误: {result['error']}")
+portfolio, _ = build_agent("portfolio", server, StubLLM(), config)
+with contextlib.redirect_stdout(io.StringIO()):
+    result = portfolio.run_once()
+check(result["execution_results"] and all(r["result"]["success"] for r in result["execution_results"]),
+      f"组合 Agent 批量下单: {len(result['execution_results'])} 个交易全部成功")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
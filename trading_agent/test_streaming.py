@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+测试流式 Function Calling 解析（增量解析、提前预处理、与缓存/Agent 集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import json
+import logging
+import time
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.batch_execution import prepare_trade, round_size
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.decision_cache import DecisionCache, llm_completion
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.streaming import ToolArgumentsParser, ToolCallStream
+
+print("=" * 70)
+print("🧪 测试流式 Function Calling 解析")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+# 1. 组合决策：trades 中的每个对象一闭合就产出
+print("\n1️⃣ 增量解析 trades 数组:")
+portfolio = {
+    "trades": [
+        {"decision": "buy", "coin": "ETH", "size": 0.5, "reasoning": "突破 {阻力位} \"确认\"", "confidence": 0.7},
+        {"decision": "close", "coin": "SOL", "reasoning": "止盈 [部分]", "confidence": 0.6},
+    ],
+    "portfolio_analysis": "分散 {风险}" + "。" * 200,
+}
+text = json.dumps(portfolio, ensure_ascii=False)
+parser = ToolArgumentsParser(array_key="trades")
+emitted_at = []
+for i, ch in enumerate(text):
+    for kind, item in parser.feed(ch):
+        emitted_at.append((i, kind, item))
+check([item for _, _, item in emitted_at] == portfolio["trades"], "逐字符输入，交易对象与完整解析一致（含字符串中的括号和转义）")
+check(emitted_at[-1][0] < len(text) - 200, f"最后一个交易在第 {emitted_at[-1][0]} 个字符产出（共 {len(text)} 个）")
+
+# 2. 单个决策：关键字段完整即产出
+print("\n2️⃣ 单个决策的关键字段:")
+decision = {"decision": "sell", "coin": "BTC", "size": 0.01, "reasoning": "长篇分析" * 50, "confidence": 0.8}
+text = json.dumps(decision, ensure_ascii=False)
+parser = ToolArgumentsParser(ready_keys=("decision", "coin", "size"))
+ready = [(i, fields) for i in range(len(text)) for kind, fields in parser.feed(text[i])]
+check(len(ready) == 1 and ready[0][1] == {"decision": "sell", "coin": "BTC", "size": 0.01}
+      and ready[0][0] < text.index("reasoning"), "decision/coin/size 完整后、reasoning 之前产出")
+parser = ToolArgumentsParser(ready_keys=("decision", "coin", "size"))
+events = parser.feed('{"decision": "hold", "reasoning": "观望"}')
+check(events == [("ready", {"decision": "hold", "reasoning": "观望"})], "没有 size 的决策在对象结束时产出")
+
+# 3. 流式调用：预处理与 LLM 生成重叠
+print("\n3️⃣ 流式调用模拟 LLM:")
+tool = [{"type": "function", "function": {"name": "make_portfolio_decisions"}}]
+received = []
+llm = StubLLM(latency_ms=300)
+stream = ToolCallStream(lambda trade: received.append((time.perf_counter(), trade)), array_key="trades")
+started = time.perf_counter()
+response = stream.create(llm, model="m", messages=[], tools=tool)
+elapsed = time.perf_counter() - started
+arguments = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
+check([trade for _, trade in received] == arguments["trades"], f"流式产出 {len(received)} 个交易，与完整响应一致")
+check(received[0][0] - started < elapsed * 0.8, f"第一个交易在 {stream.first_trade_ms:.0f}ms 时可用（LLM 共 {elapsed * 1000:.0f}ms）")
+
+plain = StubLLM()
+plain.chat.completions.create = lambda stream=False, **kw: StubLLM.create(plain, **kw)  # 忽略 stream 参数
+received_plain = []
+ToolCallStream(received_plain.append, array_key="trades").create(plain, model="m", messages=[], tools=tool)
+check(len(received_plain) == 2, "客户端不支持流式时，完整响应一次性交给回调")
+
+cache = DecisionCache(":memory:")
+state = {"current_prices": {"ETH": 3000.0}, "positions": [], "account_value": 1000.0}
+llm, replayed = StubLLM(), []
+for _ in range(2):
+    llm_completion(llm, cache, state, stream=ToolCallStream(replayed.append, array_key="trades"),
+                   model="m", messages=[], tools=tool)
+check(llm.calls == 1 and len(replayed) == 4, "决策缓存命中时，缓存的交易同样交给回调")
+
+# 4. 下单前准备
+print("\n4️⃣ 下单前准备:")
+server = FakeHyperliquidServer(seed=3).start()
+agent, tools = build_agent("portfolio", server, StubLLM(), benchmark_config({"agent": {"stream_decisions": True}}))
+eth_decimals = tools.info.asset_to_sz_decimals[tools.info.name_to_asset("ETH")]
+check(round_size(tools.info, "ETH", 0.0123456789) == round(0.0123456789, eth_decimals)
+      and round_size(tools.info, "NOPE", 0.123) == 0.123, f"数量按 szDecimals={eth_decimals} 取整，未知币种原样返回")
+state = {"account_value": 1000.0, "positions": [], "current_prices": server.mids()}
+prepared = prepare_trade({"decision": "buy", "coin": "ETH", "size": 0.0123456789}, tools, state, agent.risk_manager)
+check(prepared["risk"] is not None and prepared["current_leverage"] is None and prepared["size"] < 0.0123456789,
+      f"风控预检: {prepared['risk']['message']}")
+
+# 5. Agent 集成
+print("\n5️⃣ Agent 集成:")
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+check(len(result["prepared_trades"]) == len(result["portfolio_trades"]) == 2
+      and all(p["risk"] is not None for p in result["prepared_trades"]),
+      f"组合 Agent: {len(result['prepared_trades'])} 个交易在 LLM 输出期间完成准备")
+agent.stop()
+
+advanced, _ = build_agent("advanced", server, StubLLM(), benchmark_config({"agent": {"stream_decisions": True}}))
+with contextlib.redirect_stdout(io.StringIO()):
+    result = advanced.run_once()
+check(len(result["prepared_trades"]) == 1 and result["risk_assessment"] == result["prepared_trades"][0]["risk"],
+      "高级 Agent: 风控节点复用流式预检结果")
+simple, _ = build_agent("simple", server, StubLLM(), benchmark_config())
+with contextlib.redirect_stdout(io.StringIO()):
+    result = simple.run_once()
+check(result["prepared_trades"] == [] and result["risk_assessment"], "未开启时不做预处理")
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
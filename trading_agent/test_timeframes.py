@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+测试多周期K线（本地聚合、多周期指标、提示词、同步 / 异步获取节点的请求次数），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import json
+import logging
+import time
+
+logging.basicConfig(level=logging.WARNING)
+
+from src.advanced_tools import AdvancedTradingTools
+from src.benchmark import StubLLM, benchmark_config, build_agent
+from src.candle_store import page_ranges
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.indicators import compute_indicators
+from src.prompt_builder import PromptBuilder
+from src.timeframes import MultiTimeframe, compute_timeframe_indicators, create_multi_timeframe, resample_candles
+
+print("=" * 70)
+print("🧪 测试多周期K线")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+DAYS = 22
+server = FakeHyperliquidServer(seed=24, interval="15m", history_bars=DAYS * 96).start()
+now = int(time.time() * 1000)
+coins = ["BTC", "ETH", "SOL", "AVAX"]
+base = {coin: AdvancedTradingTools.format_candles(server.info.candles_snapshot(coin, "15m", now - DAYS * 86_400_000, now))
+        for coin in coins}
+
+
+def naive_resample(candles, step):
+    """逐根循环的参考实现"""
+    out = []
+    for candle in candles:
+        bucket = candle["time"] // step * step
+        if out and out[-1]["time"] == bucket:
+            last = out[-1]
+            last["high"] = max(last["high"], candle["high"])
+            last["low"] = min(last["low"], candle["low"])
+            last["close"] = candle["close"]
+            last["volume"] += candle["volume"]
+        else:
+            out.append({**candle, "time": bucket})
+    return out
+
+
+# 1. 聚合
+print("\n1️⃣ 本地聚合:")
+started = time.perf_counter()
+four_hour = resample_candles(base["BTC"], "4h")
+elapsed = (time.perf_counter() - started) * 1000
+expected = naive_resample(base["BTC"], 4 * 3_600_000)
+check(len(four_hour) == len(expected) and all(
+    a["time"] == b["time"] and abs(a["high"] - b["high"]) < 1e-9 and abs(a["close"] - b["close"]) < 1e-9
+    and abs(a["volume"] - b["volume"]) < 1e-6 for a, b in zip(four_hour, expected)),
+    f"{len(base['BTC'])} 根 15m → {len(four_hour)} 根 4h（{elapsed:.1f}ms），与逐根循环一致")
+exchange_daily = AdvancedTradingTools.format_candles(server.info.candles_snapshot("BTC", "15m", 0, now))
+daily = resample_candles(exchange_daily, "1d")
+check(all(candle["time"] % 86_400_000 == 0 for candle in daily) and daily[-1]["close"] == base["BTC"][-1]["close"],
+      f"日线按 UTC 零点对齐，最后一根为未收盘K线（{len(daily)} 根）")
+check(resample_candles([], "1h") == [], "空K线")
+for bad in (("1h", ["30m"]), ("7h", [])):
+    try:
+        MultiTimeframe(bad[0], bad[1])
+        check(False, f"{bad} 应报错")
+    except ValueError as e:
+        check(True, f"无法聚合的周期报错: {e}")
+
+# 2. 指标
+print("\n2️⃣ 多周期指标:")
+frames = MultiTimeframe("15m", ["1h", "4h", "1d"], lookback_days=21)
+primary, by_interval = frames.split(base["ETH"], now_ms=now)
+check(frames.intervals == ["4h", "1d"] and 24 <= len(primary) <= 25
+      and primary[-1]["time"] == base["ETH"][-1]["time"] // 3_600_000 * 3_600_000,
+      f"主周期 1h 取最近 24 小时（{len(primary)} 根），额外周期 {frames.intervals}")
+split = {coin: frames.split(candles, now_ms=now)[1] for coin, candles in base.items()}
+batch = compute_timeframe_indicators(split)
+check(all(batch[coin][interval] == compute_indicators(split[coin][interval]) for coin in coins for interval in ("4h", "1d")),
+      "每个周期所有币种一次矩阵计算，结果与逐个计算一致")
+check(batch["BTC"]["1d"].get("rsi_14") is not None and compute_timeframe_indicators({"X": {"1d": daily[:5]}})["X"]["1d"] == {},
+      "日线不足 20 根时为空")
+_, tools = build_agent("advanced", server, StubLLM(), benchmark_config())
+indicators = tools.calculate_technical_indicators(primary, by_interval)
+check(set(indicators["timeframes"]) == {"4h", "1d"} and indicators["rsi_14"] == compute_indicators(primary)["rsi_14"],
+      "calculate_technical_indicators 返回 1h 指标和 timeframes")
+check(create_multi_timeframe({}) is None
+      and create_multi_timeframe({"agent": {"timeframes": {"enabled": True, "base_interval": "5m"}}}).base_interval == "5m",
+      "按配置创建，默认不启用")
+check(page_ranges("5m", 0, 21 * 86_400_000 - 1) == [(0, 5000 * 300_000 - 1), (5000 * 300_000, 21 * 86_400_000 - 1)],
+      "5m 回看 21 天分 2 页请求")
+
+# 3. 同步获取节点
+print("\n3️⃣ 高级 Agent:")
+baseline, _ = build_agent("advanced", server, StubLLM(), benchmark_config({"agent": {"streaming_indicators": False}}))
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    before = baseline.run_once()["market_analysis_data"]
+
+config = benchmark_config({"agent": {"timeframes": {"enabled": True, "base_interval": "15m", "lookback_days": 21}}})
+agent, tools = build_agent("advanced", server, StubLLM(), config)
+shipped = json.load(open(os.path.join(os.path.dirname(__file__), "config", "config.example.json")))["agent"]
+check(config["agent"]["streaming_indicators"] and not tools.streaming_indicators
+      and not (shipped["timeframes"]["enabled"] and shipped["streaming_indicators"]),
+      "多周期优先于增量指标模式（启动时警告并关闭），示例配置不同时启用")
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+after = result["market_analysis_data"]
+check(server.stats()["by_type"].get("candleSnapshot") == len(coins),
+      f"{len(coins)} 个币种 × 3 个周期只请求 {server.stats()['by_type'].get('candleSnapshot')} 次K线")
+check(all(after[coin]["indicators"]["timeframes"]["1d"] and after[coin]["indicators"]["timeframes"]["4h"] for coin in coins),
+      "每个币种都有 4h / 1d 指标")
+keys = ("current_price", "sma_20", "rsi_14", "price_change_24h", "highest_24h")
+check(all(abs(after[coin]["indicators"][key] - before[coin]["indicators"][key]) < 1e-6 for coin in coins for key in keys),
+      "1h 指标与直接请求 1h K线时相同")
+text, _ = PromptBuilder().build(result)
+check("rsi14@4h|px/sma20@4h%|rsi14@1d|px/sma20@1d%" in text, "提示词市场表带 4h / 1d 列")
+server.advance(4)
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    agent.run_once()
+check(server.stats()["by_type"].get("candleSnapshot") == len(coins) and tools.candle_store.stats()["api_requests"] == 2 * len(coins),
+      "下一轮每个币种仍只请求 1 次（本地缓存只补齐新K线）")
+
+# 4. 异步流水线
+print("\n4️⃣ 异步流水线:")
+config["agent"]["async_pipeline"] = True
+portfolio, portfolio_tools = build_agent("portfolio", server, StubLLM(), config)
+client = portfolio.async_runner.client
+spans = []
+request_candles = client.candles_snapshot
+
+
+async def record_candles(coin, interval, start_time, end_time):
+    spans.append(end_time - start_time)
+    return await request_candles(coin, interval, start_time, end_time)
+
+
+client.candles_snapshot = record_candles
+server.reset_stats()
+with contextlib.redirect_stdout(io.StringIO()):
+    result = portfolio.run_once()
+analysis = result["market_analysis_data"]
+check(server.stats()["by_type"].get("candleSnapshot") == len(coins)
+      and all(set(analysis[coin]["indicators"].get("timeframes", {})) == {"4h", "1d"} for coin in coins),
+      f"组合 Agent: {server.stats()['by_type'].get('candleSnapshot')} 次K线请求得到 1h / 4h / 1d 指标")
+server.reset_stats()
+first, spans = spans, []
+with contextlib.redirect_stdout(io.StringIO()):
+    again = portfolio.run_once()["market_analysis_data"]
+check(server.stats()["by_type"].get("candleSnapshot") == len(coins) and min(first) >= 20 * 86_400_000
+      and max(spans) <= 3_600_000
+      and all(again[coin]["indicators"]["timeframes"] == analysis[coin]["indicators"]["timeframes"] for coin in coins),
+      f"下一轮只请求 CandleStore 未覆盖的部分（{max(spans) // 60_000} 分钟，首轮 {min(first) // 86_400_000} 天），"
+      "其余从本地读取")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+测试共享 HTTP 层（请求权重、令牌桶限流、合并在途请求、抖动重试、连接复用、Agent 集成），无需网络
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import contextlib
+import io
+import logging
+import threading
+
+logging.basicConfig(level=logging.ERROR)
+
+from hyperliquid.utils.error import ServerError
+
+from src.benchmark import StubLLM, _connect, benchmark_config, build_agent
+from src.fake_hyperliquid_server import FakeHyperliquidServer
+from src.transport import HyperliquidTransport, TokenBucket, create_transport, request_weight
+
+print("=" * 70)
+print("🧪 测试共享 HTTP 层")
+print("=" * 70)
+
+failures = 0
+
+
+def check(ok: bool, message: str, detail: str = ""):
+    global failures
+    if ok:
+        print(f"   ✅ {message}")
+    else:
+        failures += 1
+        print(f"   ❌ {message} {detail}")
+
+
+class FakeClock:
+    """sleep 只推进时钟，不真正等待"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+# 1. 权重和令牌桶
+print("\n1️⃣ 请求权重和令牌桶:")
+weights = {
+    "allMids": request_weight("/info", {"type": "allMids"}),
+    "candleSnapshot": request_weight("/info", {"type": "candleSnapshot"}),
+    "order x85": request_weight("/exchange", {"action": {"type": "order", "orders": [{}] * 85}}),
+}
+check(weights == {"allMids": 2, "candleSnapshot": 20, "order x85": 3}, f"按交易所规则计算权重: {weights}")
+clock = FakeClock()
+bucket = TokenBucket(capacity=100, refill_rate=10, clock=clock)
+waits = [bucket.reserve(60), bucket.reserve(60)]
+clock.now += 2.0
+check(waits == [0.0, 2.0] and bucket.reserve(0) == 0.0, f"突发 100 后按 10/s 补充: 等待 {waits}")
+bucket.charge(30)
+check(abs(bucket.reserve(0) - 3.0) < 1e-9, "响应条目数追加的权重影响之后的请求")
+
+server = FakeHyperliquidServer(seed=25).start()
+
+# 2. 限流
+print("\n2️⃣ 限流:")
+clock = FakeClock()
+info, exchange = _connect(server)
+transport = HyperliquidTransport(server.base_url, weight_per_minute=600, burst=40, clock=clock, sleep=clock.sleep)
+transport.attach(info, exchange)
+server.reset_stats()
+for _ in range(10):
+    info.meta()
+stats = transport.stats()
+check(abs(stats["throttle_wait"] - 16.0) < 1e-6 and server.stats()["total"] == 10,
+      f"10 次 meta（权重 200）超出突发 40，按 10/s 在本地等待 {stats['throttle_wait']:.1f}s，没有 429")
+check(info.session is transport.session and exchange.session is transport.session
+      and exchange.info.session is transport.session, "Info / Exchange / Exchange 内部的 Info 共用一个 Session")
+
+# 3. 合并与复用
+print("\n3️⃣ 合并在途请求、连接复用:")
+clock = FakeClock()
+transport = HyperliquidTransport(server.base_url, clock=clock, sleep=clock.sleep)
+info, exchange = _connect(server)
+transport.attach(info, exchange)
+server.latency_ms = 100
+server.reset_stats()
+barrier = threading.Barrier(8)
+results = []
+
+
+def fetch_book():
+    barrier.wait()
+    results.append(info.l2_snapshot("ETH"))
+
+
+threads = [threading.Thread(target=fetch_book) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+server.latency_ms = 0
+check(server.stats()["by_type"].get("l2Book") == 1 and transport.stats()["coalesced"] == 7
+      and all(result == results[0] for result in results),
+      "8 个线程同时请求同一订单簿，只发送 1 次")
+info.all_mids()
+info.all_mids()
+check(server.stats()["by_type"].get("allMids") == 2, "先后发出的相同请求不合并（只合并同时在途的请求）")
+pools = transport.session.get_adapter(server.base_url).poolmanager.pools
+pool = pools[list(pools.keys())[0]]
+connections, requests_sent = pool.num_connections, pool.num_requests
+for _ in range(20):
+    info.all_mids()
+    exchange.info.all_mids()
+check(len(pools.keys()) == 1 and pool.num_connections == connections and pool.num_requests == requests_sent + 40,
+      f"Info 和 Exchange 内部 Info 的 40 次请求复用同一个 keep-alive 连接池（共建立 {pool.num_connections} 个连接）")
+
+# 4. 重试
+print("\n4️⃣ 抖动重试:")
+backoffs = []
+
+
+class RetryLog(logging.Handler):
+    """从重试日志中取出退避时长"""
+
+    def emit(self, record):
+        message = record.getMessage()
+        if "秒后第" in message:
+            backoffs.append(float(message.split("，")[-1].split(" ")[0]))
+
+
+retry_logger = logging.getLogger("src.transport")
+retry_logger.addHandler(RetryLog())
+retry_logger.setLevel(logging.WARNING)
+retry_logger.propagate = False
+transport.retries = 0
+server.fail_next(2, 429, "allMids")
+server.fail_next(1, 502, "metaAndAssetCtxs")
+mids = info.all_mids()
+info.meta_and_asset_ctxs()
+stats = transport.stats()
+check("ETH" in mids and stats["retries"] == 3 and stats["rate_limited"] == 2,
+      f"429 ×2 和 502 ×1 重试后成功（重试 {stats['retries']} 次）")
+check(len(backoffs) == 3 and 0.25 <= backoffs[0] <= 0.5 and 0.5 <= backoffs[1] <= 1.0 and 0.25 <= backoffs[2] <= 0.5,
+      f"指数退避带随机抖动: {[round(s, 3) for s in backoffs]}")
+server.reset_stats()
+server.fail_next(1, 500, "order")
+try:
+    exchange.market_open("ETH", True, 0.01)
+    check(False, "下单 500 应抛出异常")
+except ServerError:
+    check(server.stats()["by_type"].get("order") == 1, "下单返回 500 不重试（可能已被处理，避免重复下单）")
+server.fail_next(1, 429, "order")
+result = exchange.market_open("ETH", True, 0.01)
+check(result["status"] == "ok" and server.stats()["by_type"].get("order") == 3, "下单返回 429 重试（确定未被处理）")
+
+# 5. Agent 集成
+print("\n5️⃣ Agent 集成:")
+config = benchmark_config({"agent": {"transport": {"enabled": True}}})
+check(create_transport(benchmark_config(), info) is None and create_transport(config, object()) is None,
+      "默认不启用；回测的模拟客户端不接入")
+agent, tools = build_agent("advanced", server, StubLLM(), config)
+server.reset_stats()
+server.fail_next(1, 429, "clearinghouseState")
+with contextlib.redirect_stdout(io.StringIO()):
+    result = agent.run_once()
+stats = tools.transport.stats()
+check(result.get("account_value") and stats["requests"] == server.stats()["total"] and stats["retries"] == 1,
+      f"高级 Agent: 周期内 {stats['requests']} 次请求全部经过 transport，429 自动重试")
+
+config["agent"]["async_pipeline"] = True
+portfolio, portfolio_tools = build_agent("portfolio", server, StubLLM(), config)
+with contextlib.redirect_stdout(io.StringIO()):
+    portfolio.run_once()
+check(portfolio_tools.transport is not None and portfolio.async_runner.client.limiter is portfolio_tools.transport.limiter,
+      "组合 Agent: 异步流水线与同步请求共用限流器")
+portfolio.stop()
+server.stop()
+
+print("\n" + "=" * 70)
+print(f"{'✅ 测试通过' if failures == 0 else f'❌ 测试失败 ({failures} 项)'}")
+print("=" * 70)